@@ -1,13 +1,18 @@
+from decimal import Decimal
 from rest_framework import serializers
 from banking.models import PaymentEntry, CashAccountTransfer
+from customer.models import Party
+from base.api.serializers import PrefetchedPrimaryKeyRelatedField, PrefetchingListSerializer
 
 
 class PaymentEntrySerializer(serializers.ModelSerializer):
     created_by = serializers.ReadOnlyField(source='created_by.username')
     modified_by = serializers.ReadOnlyField(source='modified_by.username')
+    party = PrefetchedPrimaryKeyRelatedField(queryset=Party.objects.all(), required=False, allow_null=True)
 
     class Meta:
         model = PaymentEntry
+        list_serializer_class = PrefetchingListSerializer
         fields = [
             'id',
             'invoice_id',
@@ -38,3 +43,21 @@ class CashAccountTransferSerializer(serializers.ModelSerializer):
             'amount', 'created_by', 'created_at', 'note', "transfer_date"
         ]
         read_only_fields = ['created_by', 'created_at']
+
+
+class PaymentAllocationSerializer(serializers.Serializer):
+    """One amount to spread over a party's open invoices, oldest first."""
+    party = serializers.PrimaryKeyRelatedField(queryset=Party.objects.all())
+    invoice_type = serializers.ChoiceField(choices=PaymentEntry._meta.get_field('invoice_type').choices)
+    payment_type = serializers.ChoiceField(choices=PaymentEntry.PAYMENT_TYPE_CHOICES)
+    amount = serializers.DecimalField(max_digits=14, decimal_places=2, min_value=Decimal('0.01'))
+    cheque_number = serializers.CharField(max_length=100, required=False, allow_null=True, allow_blank=True)
+    payment_date = serializers.DateField(required=False, allow_null=True)
+
+
+class ChequeClearingSerializer(serializers.Serializer):
+    """One cheque of a bulk clearing, see CheckApproveAPIView for the actions."""
+    payment_entry_id = serializers.IntegerField()
+    action = serializers.ChoiceField(choices=['credit', 'debit'])
+    cheque_cleared_date = serializers.DateField(required=False, allow_null=True)
+    amount = serializers.DecimalField(max_digits=14, decimal_places=2, min_value=Decimal('0.01'), required=False)
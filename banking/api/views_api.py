@@ -10,9 +10,11 @@ from .filters import PaymentEntryFilter, CashAccountTransferFilter
 from banking.models import CashAccount
 from django.utils import timezone
 from banking.models import PaymentEntry
-from django.db.models import Sum
+from django.db.models import Sum, Q
 from banking.models import CashAccountTransfer
 from .serializers import CashAccountTransferSerializer
+from rest_framework.decorators import action
+from banking.services import allocate_payment, clear_cheques, missing_invoices, post_payment_entries
 
 
 
@@ -20,31 +22,19 @@ class PaymentEntryViewSet(viewsets.ModelViewSet):
     queryset = PaymentEntry.objects.all().order_by('-created_at')
     serializer_class = PaymentEntrySerializer
     permission_classes = [permissions.IsAuthenticated]
+    cursor_ordering = '-created_at'
     filter_backends = [DjangoFilterBackend]
     filterset_class = PaymentEntryFilter
 
+    @transaction.atomic
     def perform_create(self, serializer):
         instance = serializer.save(created_by=self.request.user)
-        cash_account = CashAccount.objects.first()
-        if cash_account:
-            note = f"PaymentEntry #{instance.id} ({instance.invoice_type})"
-            # For sale invoices, deposit money into appropriate account
-            if instance.invoice_type == 'sale':
-                if instance.payment_type == 'hand':
-                    cash_account.deposit(instance.amount, 'cash_in_hand', created_by=self.request.user, note=note)
-                elif instance.payment_type == 'bank':
-                    cash_account.deposit(instance.amount, 'cash_in_bank', created_by=self.request.user, note=note)
-                elif instance.payment_type == 'check':
-                    cash_account.deposit(instance.amount, 'cash_in_check', created_by=self.request.user, note=note)
-            # For purchase invoices, withdraw money from appropriate account
-            elif instance.invoice_type == 'purchase':
-                if instance.payment_type == 'hand':
-                    cash_account.withdraw(instance.amount, 'cash_in_hand', created_by=self.request.user, note=note)
-                elif instance.payment_type == 'bank':
-                    cash_account.withdraw(instance.amount, 'cash_in_bank', created_by=self.request.user, note=note)
-                elif instance.payment_type == 'check':
-                    cash_account.deposit(instance.amount, 'cash_in_check', created_by=self.request.user, note=note)
+        note = f"PaymentEntry #{instance.id} ({instance.invoice_type})"
+        # Sale payments deposit into the account, purchase payments withdraw from it
+        account_type, amount = instance.cash_movement()
+        CashAccount.get_main().post({account_type: amount}, created_by=self.request.user, note=note)
 
+    @transaction.atomic
     def perform_update(self, serializer):
         old_instance = self.get_object()
         old_amount = old_instance.amount
@@ -55,7 +45,7 @@ class PaymentEntryViewSet(viewsets.ModelViewSet):
         
         # Only update cash accounts if amount or payment type changed
         if old_amount != instance.amount or old_payment_type != instance.payment_type:
-            cash_account = CashAccount.objects.first()
+            cash_account = CashAccount.get_main()
             if cash_account:
                 with transaction.atomic():
                     note = f"PaymentEntry Update #{instance.id} ({instance.invoice_type})"
@@ -92,24 +82,65 @@ class PaymentEntryViewSet(viewsets.ModelViewSet):
                             cash_account.withdraw(instance.amount, 'cash_in_check', created_by=self.request.user, note=note)
 
 
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk(self, request):
+        """
+        Record many payments at once, either a list of entries
+        {"payments": [...]} or one amount spread over a party's open
+        invoices, oldest first {"party", "invoice_type", "payment_type",
+        "amount", "cheque_number", "payment_date"}. All entries are saved
+        together with one cash movement per account type, or none are.
+        """
+        if 'payments' in request.data:
+            serializer = PaymentEntrySerializer(data=request.data['payments'], many=True)
+            if not serializer.is_valid():
+                return Response({"error": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+            if not serializer.validated_data:
+                return Response({"error": "payments must not be empty."}, status=status.HTTP_400_BAD_REQUEST)
+            entries = [PaymentEntry(**data) for data in serializer.validated_data]
+            missing = missing_invoices(entries)
+            if missing:
+                return Response({"error": "Invoice not found.",
+                                 "invoices": [{"invoice_type": t, "invoice_id": i} for t, i in missing]},
+                                status=status.HTTP_400_BAD_REQUEST)
+            entries = post_payment_entries(entries, user=request.user)
+        else:
+            serializer = PaymentAllocationSerializer(data=request.data)
+            if not serializer.is_valid():
+                return Response({"error": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+            data = dict(serializer.validated_data)
+            with transaction.atomic():
+                entries, remaining = allocate_payment(data.pop('party'), data.pop('invoice_type'),
+                                                      data.pop('amount'), **data)
+                if remaining > 0:
+                    return Response({"error": "Amount exceeds the open balance of the party's invoices.",
+                                     "unallocated": float(remaining)}, status=status.HTTP_400_BAD_REQUEST)
+                entries = post_payment_entries(entries, user=request.user)
+
+        return Response({
+            "created_count": len(entries),
+            "total_amount": float(sum(entry.amount for entry in entries)),
+            "payments": PaymentEntrySerializer(entries, many=True).data,
+        }, status=status.HTTP_201_CREATED)
+
 
 class CashAccountAPIView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
         response = {}
+        # Balances are kept up to date by every posting, nothing is summed here
         cash_accounts = CashAccount.objects.all()
-        # Calculate pending cheques for sales and purchases
-        pending_sales_cheques = PaymentEntry.objects.filter(
-            payment_type='check',
-            invoice_type='sale',
-            is_cheque_cleared=False
-        ).aggregate(total=Sum('amount'))['total'] or 0
-        pending_purchase_cheques = PaymentEntry.objects.filter(
+        # Pending cheques for sales and purchases, read through the pending cheque index
+        pending = PaymentEntry.objects.filter(
             payment_type='check',
-            invoice_type='purchase',
             is_cheque_cleared=False
-        ).aggregate(total=Sum('amount'))['total'] or 0
+        ).aggregate(
+            sales=Sum('amount', filter=Q(invoice_type='sale')),
+            purchases=Sum('amount', filter=Q(invoice_type='purchase')),
+        )
+        pending_sales_cheques = pending['sales'] or 0
+        pending_purchase_cheques = pending['purchases'] or 0
 
         if not cash_accounts:
             return Response({"error": "No cash account found."}, status=status.HTTP_404_NOT_FOUND)
@@ -132,10 +163,6 @@ class CheckApproveAPIView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request):
-        cash_account = CashAccount.objects.filter(type='main').first()
-        if not cash_account:
-            return Response({"error": "No main cash account found."}, status=status.HTTP_404_NOT_FOUND)
-
         payment_entry_id = request.data.get('payment_entry_id')
         amount = request.data.get('amount')
         action = request.data.get('action')
@@ -153,22 +180,24 @@ class CheckApproveAPIView(APIView):
         if amount <= 0:
             return Response({"error": "Amount must be positive."}, status=status.HTTP_400_BAD_REQUEST)
 
-        try:
-            payment_entry = PaymentEntry.objects.get(id=payment_entry_id)
-        except PaymentEntry.DoesNotExist:
-            return Response({"error": "PaymentEntry not found."}, status=status.HTTP_404_NOT_FOUND)
+        with transaction.atomic():
+            # Locked so a cheque is never cleared twice by parallel requests
+            try:
+                payment_entry = PaymentEntry.objects.select_for_update().get(id=payment_entry_id)
+            except PaymentEntry.DoesNotExist:
+                return Response({"error": "PaymentEntry not found."}, status=status.HTTP_404_NOT_FOUND)
 
-        if payment_entry.is_cheque_cleared:
-            return Response({"error": "Cheque already cleared for this payment entry."}, status=status.HTTP_400_BAD_REQUEST)
+            if payment_entry.is_cheque_cleared:
+                return Response({"error": "Cheque already cleared for this payment entry."}, status=status.HTTP_400_BAD_REQUEST)
 
-        with transaction.atomic():
+            cash_account = CashAccount.get_main()
+            note = f"Cheque cleared for PaymentEntry #{payment_entry.id}"
             if action == 'credit':
-                cash_account.check_cash -= amount
-                cash_account.cash_in_bank += amount
+                cash_account.transfer('cash_in_check', 'cash_in_bank', amount,
+                                      created_by=request.user, note=note)
             elif action == 'debit':
-                cash_account.check_cash -= amount
-                cash_account.cash_in_bank -= amount
-            cash_account.save()
+                cash_account.withdraw(amount, 'cash_in_check', created_by=request.user, note=note)
+                cash_account.withdraw(amount, 'cash_in_bank', created_by=request.user, note=note)
             payment_entry.is_cheque_cleared = True
             payment_entry.cheque_cleared_date = cheque_cleared_date
             payment_entry.save()
@@ -185,6 +214,35 @@ class CheckApproveAPIView(APIView):
         }, status=status.HTTP_200_OK)
 
 
+class CheckApproveBulkAPIView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        """
+        Clear many cheques in one request:
+        {"entries": [{"payment_entry_id", "action", "cheque_cleared_date", "amount"}]}.
+        amount defaults to the payment's. Cheques already cleared are
+        reported and skipped, so the same batch can safely be sent again.
+        """
+        entries = request.data.get('entries')
+        if not isinstance(entries, list) or not entries:
+            return Response({"error": "entries must be a non-empty list."}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = ChequeClearingSerializer(data=entries, many=True)
+        if not serializer.is_valid():
+            return Response({"error": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = clear_cheques(serializer.validated_data, user=request.user)
+        cash_account = CashAccount.get_main()
+        return Response({
+            "cleared_count": sum(result['status'] == 'cleared' for result in results),
+            "results": results,
+            "cash_in_hand": float(cash_account.cash_in_hand),
+            "cash_in_bank": float(cash_account.cash_in_bank),
+            "check_cash": float(cash_account.check_cash),
+            "updated_at": cash_account.updated_at,
+        }, status=status.HTTP_200_OK)
+
+
 class CashAccountTransferViewSet(viewsets.ModelViewSet):
     queryset = CashAccountTransfer.objects.all().order_by('-created_at')
     serializer_class = CashAccountTransferSerializer
@@ -192,6 +250,7 @@ class CashAccountTransferViewSet(viewsets.ModelViewSet):
     filter_backends = [DjangoFilterBackend]
     filterset_class = CashAccountTransferFilter
 
+    @transaction.atomic
     def perform_create(self, serializer):
         from_account = serializer.validated_data['from_account']
         to_account = serializer.validated_data['to_account']
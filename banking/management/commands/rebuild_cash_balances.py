@@ -0,0 +1,115 @@
+from collections import defaultdict
+from decimal import Decimal
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, Max, Min, Sum, When
+from django.utils import timezone
+from base.signals import post_bulk_save
+from banking.models import CashAccount, CashTransaction, PaymentEntry
+
+
+def ledger_balances(chunk_size):
+    """
+    {account_id: {account_type: balance}} summed in the database, one
+    range of ledger ids at a time so a long history is never read at once.
+    Transfer rows are skipped: their withdraw and deposit are recorded
+    next to them.
+    """
+    balances = defaultdict(lambda: defaultdict(Decimal))
+    bounds = CashTransaction.objects.aggregate(first=Min('id'), last=Max('id'))
+    if bounds['first'] is None:
+        return balances
+    signed = Case(
+        When(transaction_type='withdraw', then=-F('amount')),
+        default=F('amount'),
+        output_field=DecimalField(max_digits=14, decimal_places=2),
+    )
+    for start in range(bounds['first'], bounds['last'] + 1, chunk_size):
+        rows = CashTransaction.objects.filter(
+            id__gte=start, id__lt=start + chunk_size
+        ).exclude(transaction_type='transfer').order_by().values(
+            'cash_account_id', 'account_type'
+        ).annotate(total=Sum(signed))
+        for row in rows:
+            balances[row['cash_account_id']][row['account_type']] += row['total']
+    return balances
+
+
+class Command(BaseCommand):
+    help = "Recompute CashAccount balances from the CashTransaction ledger"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only print the differences')
+        parser.add_argument('--chunk-size', type=int, default=50000,
+                            help='Number of ledger rows summed per query')
+        parser.add_argument('--check', action='store_true',
+                            help='Fail, changing nothing, when a stored balance differs from the ledger '
+                                 'instead of overwriting it')
+        parser.add_argument('--record-opening', action='store_true',
+                            help='For accounts without an opening row, record the part of the '
+                                 'current balance the ledger does not explain as the opening '
+                                 'balance instead of removing it')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            # Locked so no posting lands between the sums and the update
+            accounts = list(CashAccount.objects.select_for_update().order_by('pk'))
+            ledger = ledger_balances(options['chunk_size'])
+            opened = set(CashTransaction.objects.filter(transaction_type='opening').values_list(
+                'cash_account_id', flat=True))
+
+            changes = defaultdict(dict)
+            openings = []
+            for account in accounts:
+                for account_type, field in CashAccount.BALANCE_FIELDS.items():
+                    stored = getattr(account, field)
+                    expected = ledger[account.pk][account_type].quantize(Decimal('0.01'))
+                    if stored == expected:
+                        continue
+                    if options['record_opening'] and account.pk not in opened:
+                        self.stdout.write(f"{account.type} {field}: opening balance {stored - expected}")
+                        openings.append(CashTransaction(
+                            cash_account=account, transaction_type='opening', account_type=account_type,
+                            amount=stored - expected, note="Balance before the cash ledger"))
+                        continue
+                    self.stdout.write(f"{account.type} {field}: stored {stored}, ledger {expected} "
+                                      f"({expected - stored:+})")
+                    changes[account][field] = expected
+
+            self._check_cheques(accounts, changes)
+
+            if not changes and not openings:
+                self.stdout.write(self.style.SUCCESS("Cash balances match the ledger"))
+                return
+            if changes and options['check']:
+                raise CommandError(
+                    f"{sum(len(fields) for fields in changes.values())} cash balances differ from the ledger, "
+                    f"nothing changed. Run without --check to overwrite them with the ledger")
+            if options['dry_run']:
+                self.stdout.write(self.style.WARNING("Dry run, nothing changed"))
+                return
+
+            CashTransaction.objects.bulk_create(openings)
+            post_bulk_save.send(sender=CashTransaction, instances=openings, created=True)
+            now = timezone.now()
+            for account, fields in changes.items():
+                CashAccount.objects.filter(pk=account.pk).update(updated_at=now, **fields)
+                for field, value in fields.items():
+                    setattr(account, field, value)
+            post_bulk_save.send(sender=CashAccount, instances=list(changes), created=False)
+        self.stdout.write(self.style.SUCCESS(
+            f"Updated {len(changes)} accounts, recorded {len(openings)} opening balances"))
+
+    def _check_cheques(self, accounts, changes):
+        # Every uncleared cheque sits in the main account's check_cash until it clears
+        main = next((account for account in accounts if account.type == 'main'), None)
+        if main is None:
+            return
+        pending = PaymentEntry.objects.filter(
+            payment_type='check', is_cheque_cleared=False
+        ).aggregate(total=Sum('amount'))['total'] or Decimal('0')
+        check_cash = changes.get(main, {}).get('check_cash', main.check_cash)
+        if pending != check_cash:
+            self.stdout.write(self.style.WARNING(
+                f"Uncleared cheques total {pending}, main check_cash is {check_cash}"))
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.23 on 2026-10-18 05:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('banking', '0010_cashtransaction'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='paymententry',
+            index=models.Index(condition=models.Q(('is_cheque_cleared', False), ('payment_type', 'check')), fields=['invoice_type'], name='pending_cheque_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.23 on 2026-10-18 06:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('banking', '0011_paymententry_pending_cheque_idx'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='cashtransaction',
+            name='transaction_type',
+            field=models.CharField(choices=[('deposit', 'Deposit'), ('withdraw', 'Withdraw'), ('transfer', 'Transfer'), ('opening', 'Opening Balance')], max_length=10),
+        ),
+    ]
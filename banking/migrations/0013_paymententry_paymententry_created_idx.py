@@ -0,0 +1,17 @@
+# Generated by Django 4.2.23 on 2026-10-18 06:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('banking', '0012_cashtransaction_opening'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='paymententry',
+            index=models.Index(fields=['created_at', 'id'], name='paymententry_created_idx'),
+        ),
+    ]
@@ -1,5 +1,8 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
 from django.contrib.auth.models import User
+from django.utils import timezone
+from base.signals import post_bulk_save
 from customer.models import Party
 
 
@@ -8,6 +11,8 @@ class CashTransaction(models.Model):
         ('deposit', 'Deposit'),
         ('withdraw', 'Withdraw'),
         ('transfer', 'Transfer'),
+        # Signed balance carried over from before the ledger, see rebuild_cash_balances
+        ('opening', 'Opening Balance'),
     )
     cash_account = models.ForeignKey('CashAccount', on_delete=models.CASCADE, related_name='transactions')
     transaction_type = models.CharField(max_length=10, choices=TRANSACTION_TYPE_CHOICES)
@@ -56,6 +61,21 @@ class PaymentEntry(models.Model):
 
     class Meta:
         verbose_name_plural = "Payment Entries"
+        indexes = [
+            # Only the cheques still waiting to clear, summed on every balance read
+            models.Index(fields=['invoice_type'], name='pending_cheque_idx',
+                         condition=models.Q(payment_type='check', is_cheque_cleared=False)),
+            # Order of the ?cursor= pages of due-payments/
+            models.Index(fields=['created_at', 'id'], name='paymententry_created_idx'),
+        ]
+
+    def cash_movement(self):
+        """The (account_type, signed amount) this payment posts to the main cash account."""
+        account_type = f'cash_in_{self.payment_type}'
+        # Purchase cheques are held in check_cash until they clear, like sale cheques
+        if self.invoice_type == 'purchase' and self.payment_type != 'check':
+            return account_type, -self.amount
+        return account_type, self.amount
 
     def __str__(self):
         return f"{self.payment_type} payment of {self.amount} for {self.invoice_type} invoice #{self.invoice_id}"
@@ -71,68 +91,97 @@ class CashAccount(models.Model):
         default='main', unique=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Balance column behind each account_type of a CashTransaction
+    BALANCE_FIELDS = {
+        'cash_in_hand': 'cash_in_hand',
+        'cash_in_bank': 'cash_in_bank',
+        'cash_in_check': 'check_cash',
+    }
+
+    @classmethod
+    def get_main(cls):
+        """The company's main account, created on first use."""
+        account, _ = cls.objects.get_or_create(type='main')
+        return account
+
+    def apply_deltas(self, deltas):
+        """
+        Add signed amounts {account_type: amount} to the balances with a
+        single UPDATE ... SET field = field + amount, so concurrent postings
+        never overwrite each other, then reload the changed balances.
+        """
+        changes = {}
+        for account_type, amount in deltas.items():
+            if account_type not in self.BALANCE_FIELDS:
+                raise ValueError("Invalid account type")
+            if amount:
+                field = self.BALANCE_FIELDS[account_type]
+                changes[field] = changes.get(field, F(field)) + amount
+        if not changes:
+            return
+        CashAccount.objects.filter(pk=self.pk).update(updated_at=timezone.now(), **changes)
+        self.refresh_from_db(fields=[*changes, 'updated_at'])
+
+    @transaction.atomic
     def deposit(self, amount, account_type, created_by=None, note=None):
-        if account_type == 'cash_in_hand':
-            self.cash_in_hand += amount
-        elif account_type == 'cash_in_bank':
-            self.cash_in_bank += amount
-        elif account_type == 'cash_in_check':
-            self.check_cash += amount
-        else:
-            raise ValueError("Invalid account type")
-        self.save()
-        try:
-            CashTransaction.objects.create(
-                cash_account=self,
-                transaction_type='deposit',
-                account_type=account_type,
-                amount=amount,
-                created_by=created_by,
-                note=note
-            )
-        except:
-            print("Error creating CashTransaction:")
-
+        self.apply_deltas({account_type: amount})
+        return CashTransaction.objects.create(
+            cash_account=self,
+            transaction_type='deposit',
+            account_type=account_type,
+            amount=amount,
+            created_by=created_by,
+            note=note
+        )
+
+    @transaction.atomic
     def withdraw(self, amount, account_type, created_by=None, note=None):
-        if account_type == 'cash_in_hand':
-            self.cash_in_hand -= amount
-        elif account_type == 'cash_in_bank':
-            self.cash_in_bank -= amount
-        elif account_type == 'cash_in_check':
-            self.check_cash -= amount
-        else:
-            raise ValueError("Invalid account type")
-        self.save()
-        try:
-            CashTransaction.objects.create(
-                cash_account=self,
-                transaction_type='withdraw',
-                account_type=account_type,
-                amount=amount,
-                created_by=created_by,
-                note=note
-            )
-        except:
-            print("Error creating CashTransaction:")
-
+        self.apply_deltas({account_type: -amount})
+        return CashTransaction.objects.create(
+            cash_account=self,
+            transaction_type='withdraw',
+            account_type=account_type,
+            amount=amount,
+            created_by=created_by,
+            note=note
+        )
+
+    @transaction.atomic
+    def post(self, deltas, created_by=None, note=None):
+        """
+        Apply netted amounts {account_type: signed amount} in one UPDATE and
+        record one deposit or withdraw per account type.
+        """
+        self.apply_deltas(deltas)
+        rows = [
+            CashTransaction(cash_account=self,
+                            transaction_type='deposit' if amount > 0 else 'withdraw',
+                            account_type=account_type, amount=abs(amount),
+                            created_by=created_by, note=note)
+            for account_type, amount in deltas.items() if amount
+        ]
+        CashTransaction.objects.bulk_create(rows)
+        post_bulk_save.send(sender=CashTransaction, instances=rows, created=True)
+        return rows
+
+    @transaction.atomic
     def transfer(self, from_type, to_type, amount, created_by=None, note=None):
         if from_type == to_type:
             raise ValueError("Cannot transfer to the same account type!")
-        self.withdraw(amount, from_type, created_by=created_by, note=note)
-        self.deposit(amount, to_type, created_by=created_by, note=note)
-        try:
-            CashTransaction.objects.create(
-                cash_account=self,
-                transaction_type='transfer',
-                account_type=from_type,
-                amount=amount,
-                related_account=self,
-                related_account_type=to_type,
-                created_by=created_by,
-                note=note
-            )
-        except:
-            print("Error creating CashTransaction:")
+        self.apply_deltas({from_type: -amount, to_type: amount})
+        # Same ledger rows as a withdraw and a deposit, plus the transfer itself
+        rows = [
+            CashTransaction(cash_account=self, transaction_type='withdraw', account_type=from_type,
+                            amount=amount, created_by=created_by, note=note),
+            CashTransaction(cash_account=self, transaction_type='deposit', account_type=to_type,
+                            amount=amount, created_by=created_by, note=note),
+            CashTransaction(cash_account=self, transaction_type='transfer', account_type=from_type,
+                            amount=amount, related_account=self, related_account_type=to_type,
+                            created_by=created_by, note=note),
+        ]
+        CashTransaction.objects.bulk_create(rows)
+        post_bulk_save.send(sender=CashTransaction, instances=rows, created=True)
+        return rows[-1]
 
     def __str__(self):
         return f"CashAccount — Cash: ₹{self.cash_in_hand}, Bank: ₹{self.cash_in_bank}, Check: ₹{self.check_cash}"
@@ -0,0 +1,152 @@
+from collections import defaultdict
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Case, DateField, DecimalField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from base.signals import post_bulk_save
+from banking.models import CashAccount, PaymentEntry
+from purchase.models import PurchaseInvoice
+from sale.models import SaleInvoice
+
+
+# Invoices that can still take a payment, per invoice_type
+OPEN_INVOICES = {
+    'sale': lambda: SaleInvoice.objects.exclude(status__in=[
+        SaleInvoice.STATUS_SALES_TEAM_PENDING,
+        SaleInvoice.STATUS_SALES_TEAM_APPROVED,
+        SaleInvoice.STATUS_CANCELLED,
+        SaleInvoice.STATUS_RETURNED,
+    ]).order_by('sale_date', 'id'),
+    'purchase': lambda: PurchaseInvoice.objects.exclude(status__in=[
+        PurchaseInvoice.STATUS_CANCELLED,
+        PurchaseInvoice.STATUS_Returned,
+    ]).order_by('purchase_date', 'id'),
+}
+
+INVOICE_MODELS = {'sale': SaleInvoice, 'purchase': PurchaseInvoice}
+
+
+def missing_invoices(entries):
+    """The (invoice_type, invoice_id) pairs of entries whose invoice does not exist."""
+    wanted = defaultdict(set)
+    for entry in entries:
+        wanted[entry.invoice_type].add(entry.invoice_id)
+    missing = []
+    for invoice_type, ids in wanted.items():
+        found = set(INVOICE_MODELS[invoice_type].objects.filter(pk__in=ids).values_list('pk', flat=True))
+        missing += [(invoice_type, pk) for pk in sorted(ids - found)]
+    return missing
+
+
+def allocate_payment(party, invoice_type, amount, **fields):
+    """
+    Spread amount over the party's open invoices, oldest first, each taking
+    at most what is still due on it. The invoices are locked until the
+    transaction ends, so parallel allocations never pay the same balance.
+
+    Returns:
+        tuple: (unsaved PaymentEntry list, amount left over)
+    """
+    paid = PaymentEntry.objects.filter(
+        invoice_type=invoice_type, invoice_id=OuterRef('pk')
+    ).values('invoice_id').annotate(total=Sum('amount')).values('total')
+    zero = Value(Decimal('0'), output_field=DecimalField(max_digits=14, decimal_places=2))
+    invoices = OPEN_INVOICES[invoice_type]().filter(party=party).select_for_update().annotate(
+        paid=Coalesce(Subquery(paid), zero)
+    ).values_list('pk', 'total_with_vat_aed', 'paid')
+
+    entries = []
+    remaining = amount
+    for invoice_id, total, paid_amount in invoices:
+        if remaining <= 0:
+            break
+        due = total - paid_amount
+        if due <= 0:
+            continue
+        share = min(due, remaining)
+        entries.append(PaymentEntry(invoice_type=invoice_type, invoice_id=invoice_id,
+                                    party=party, amount=share, **fields))
+        remaining -= share
+    return entries, remaining
+
+
+@transaction.atomic
+def post_payment_entries(entries, user=None):
+    """
+    Save payment entries with one bulk_create and post their cash in one
+    netted movement per account type on the main cash account.
+    """
+    for entry in entries:
+        entry.created_by = user
+    entries = PaymentEntry.objects.bulk_create(entries)
+    post_bulk_save.send(sender=PaymentEntry, instances=entries, created=True)
+
+    deltas = defaultdict(Decimal)
+    for entry in entries:
+        account_type, amount = entry.cash_movement()
+        deltas[account_type] += amount
+    ids = ', '.join(f'#{entry.id}' for entry in entries)
+    CashAccount.get_main().post(dict(deltas), created_by=user, note=f"PaymentEntry {ids} (bulk)")
+    return entries
+
+
+# Cash each cleared cheque moves, per action: (check_cash, cash_in_bank) signs
+CHEQUE_CLEARING = {
+    'credit': (-1, 1),
+    'debit': (-1, -1),
+}
+
+
+@transaction.atomic
+def clear_cheques(clearings, user=None):
+    """
+    Clear many cheques at once, as CheckApproveAPIView does for one. The
+    entries are locked, the uncleared ones marked with a single update()
+    and their netted movement posted once on the main cash account.
+    Entries already cleared are skipped, so a batch can be sent again.
+
+    Args:
+        clearings: dicts with payment_entry_id, action ('credit'|'debit'),
+            cheque_cleared_date and an optional amount (the entry's by default)
+
+    Returns:
+        list: {'payment_entry_id', 'status': 'cleared'|'already_cleared'|'not_found'}
+            per clearing, in the order given
+    """
+    ids = {clearing['payment_entry_id'] for clearing in clearings}
+    entries = PaymentEntry.objects.select_for_update().in_bulk(ids)
+
+    results = []
+    cleared = {}
+    deltas = defaultdict(Decimal)
+    for clearing in clearings:
+        entry_id = clearing['payment_entry_id']
+        entry = entries.get(entry_id)
+        if entry is None:
+            status = 'not_found'
+        elif entry.is_cheque_cleared or entry_id in cleared:
+            status = 'already_cleared'
+        else:
+            status = 'cleared'
+            entry.is_cheque_cleared = True
+            entry.cheque_cleared_date = clearing.get('cheque_cleared_date')
+            cleared[entry_id] = entry.cheque_cleared_date
+            amount = clearing.get('amount') or entry.amount
+            check_sign, bank_sign = CHEQUE_CLEARING[clearing['action']]
+            deltas['cash_in_check'] += check_sign * amount
+            deltas['cash_in_bank'] += bank_sign * amount
+        results.append({'payment_entry_id': entry_id, 'status': status})
+
+    if cleared:
+        PaymentEntry.objects.filter(pk__in=cleared).update(
+            is_cheque_cleared=True,
+            cheque_cleared_date=Case(
+                *[When(pk=pk, then=Value(cleared_date)) for pk, cleared_date in cleared.items()],
+                output_field=DateField(),
+            ),
+        )
+        # update() sends no post_save, replay it for the cleared entries
+        post_bulk_save.send(sender=PaymentEntry, instances=[entries[pk] for pk in cleared], created=False)
+        ids = ', '.join(f'#{pk}' for pk in cleared)
+        CashAccount.get_main().post(dict(deltas), created_by=user, note=f"Cheques cleared for PaymentEntry {ids}")
+    return results
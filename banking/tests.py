@@ -1,3 +1,380 @@
-from django.test import TestCase
+from datetime import date
+from decimal import Decimal
+from io import StringIO
+from threading import Barrier, Thread
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import F
+from django.test import TestCase, TransactionTestCase, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from banking.management.commands.rebuild_cash_balances import ledger_balances
+from banking.models import CashAccount, CashTransaction, PaymentEntry
+from banking.services import allocate_payment
+from customer.models import Party
+from purchase.models import PurchaseInvoice
+from sale.models import SaleInvoice
 
-# Create your tests here.
+
+class CashLedgerTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='cashier')
+        cls.account = CashAccount.get_main()
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assertBalances(self, cash_in_hand, cash_in_bank, check_cash):
+        """The stored balances are the given ones and the sums of the ledger."""
+        self.account.refresh_from_db()
+        self.assertEqual((self.account.cash_in_hand, self.account.cash_in_bank, self.account.check_cash),
+                         (Decimal(cash_in_hand), Decimal(cash_in_bank), Decimal(check_cash)))
+        # Two rows per chunk, so the sums cross chunks
+        ledger = ledger_balances(chunk_size=2)[self.account.pk]
+        for account_type, field in CashAccount.BALANCE_FIELDS.items():
+            self.assertEqual(getattr(self.account, field), ledger[account_type], field)
+
+    def assertRows(self, rows):
+        self.assertEqual(
+            list(CashTransaction.objects.order_by('id').values_list('transaction_type', 'account_type', 'amount')),
+            [(transaction_type, account_type, Decimal(amount)) for transaction_type, account_type, amount in rows])
+
+
+class CashPostingTests(CashLedgerTestCase):
+    """Every posting moves the balances by single updates and writes its ledger rows."""
+
+    def test_deposit_and_withdraw(self):
+        self.account.deposit(Decimal('100.00'), 'cash_in_hand', created_by=self.user)
+        self.account.withdraw(Decimal('30.25'), 'cash_in_bank', created_by=self.user)
+        # The instance holds the stored balances
+        self.assertEqual((self.account.cash_in_hand, self.account.cash_in_bank), (100, Decimal('-30.25')))
+        self.assertBalances('100.00', '-30.25', '0')
+        self.assertRows([('deposit', 'cash_in_hand', '100.00'), ('withdraw', 'cash_in_bank', '30.25')])
+
+    def test_transfer_records_both_sides(self):
+        self.account.deposit(Decimal('50'), 'cash_in_hand')
+        self.account.transfer('cash_in_hand', 'cash_in_bank', Decimal('12.50'))
+        self.assertBalances('37.50', '12.50', '0')
+        self.assertRows([('deposit', 'cash_in_hand', '50'), ('withdraw', 'cash_in_hand', '12.50'),
+                         ('deposit', 'cash_in_bank', '12.50'), ('transfer', 'cash_in_hand', '12.50')])
+        transfer = CashTransaction.objects.get(transaction_type='transfer')
+        self.assertEqual((transfer.related_account, transfer.related_account_type), (self.account, 'cash_in_bank'))
+
+    def test_transfer_to_the_same_type_is_refused(self):
+        with self.assertRaises(ValueError):
+            self.account.transfer('cash_in_hand', 'cash_in_hand', Decimal('1'))
+        self.assertBalances('0', '0', '0')
+
+    def test_post_writes_one_row_per_changed_type(self):
+        self.account.post({'cash_in_check': Decimal('7.10'), 'cash_in_hand': Decimal('-2.05'),
+                           'cash_in_bank': Decimal('0')})
+        self.assertBalances('-2.05', '0', '7.10')
+        self.assertRows([('deposit', 'cash_in_check', '7.10'), ('withdraw', 'cash_in_hand', '2.05')])
+
+    def test_unknown_account_type_changes_nothing(self):
+        with self.assertRaises(ValueError):
+            self.account.apply_deltas({'cash_in_hand': Decimal('5'), 'cash_in_safe': Decimal('5')})
+        self.assertBalances('0', '0', '0')
+
+
+class CheckApproveTests(CashLedgerTestCase):
+    """Clearing a cheque moves it out of check_cash, once."""
+
+    def setUp(self):
+        super().setUp()
+        self.cheque = PaymentEntry.objects.create(invoice_type='sale', invoice_id=1, payment_type='check',
+                                                  amount=Decimal('40'), cheque_number='000123')
+        self.account.post({'cash_in_check': self.cheque.amount})
+
+    def approve(self, action, status=200):
+        response = self.client.post('/api/check-approve/', {
+            'payment_entry_id': self.cheque.pk, 'amount': '40', 'action': action,
+            'cheque_cleared_date': '2024-06-01'}, format='json')
+        self.assertEqual(response.status_code, status, response.content)
+        return response.json()
+
+    def test_credit_moves_the_cheque_to_the_bank(self):
+        data = self.approve('credit')
+        self.assertEqual((data['check_cash'], data['cash_in_bank'], data['is_cheque_cleared']), (0, 40, True))
+        self.assertBalances('0', '40', '0')
+        self.cheque.refresh_from_db()
+        self.assertEqual(str(self.cheque.cheque_cleared_date), '2024-06-01')
+
+    def test_debit_takes_the_cheque_from_check_cash_and_the_bank(self):
+        self.approve('debit')
+        self.assertBalances('0', '-40', '0')
+        self.assertRows([('deposit', 'cash_in_check', '40'), ('withdraw', 'cash_in_check', '40'),
+                         ('withdraw', 'cash_in_bank', '40')])
+
+    def test_a_cheque_clears_once(self):
+        self.approve('credit')
+        self.assertEqual(self.approve('credit', status=400)['error'],
+                         'Cheque already cleared for this payment entry.')
+        self.assertBalances('0', '40', '0')
+
+
+class BulkPaymentTests(CashLedgerTestCase):
+    """Bulk payments are saved together and posted as one netted movement per account type."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.customer = Party.objects.create(name='Customer', type='customer')
+        other = Party.objects.create(name='Other', type='customer')
+
+        def invoice(party, day, total, status=SaleInvoice.STATUS_APPROVED, paid=None):
+            sale = SaleInvoice.objects.create(party=party, sale_date=day, status=status)
+            SaleInvoice.objects.filter(pk=sale.pk).update(total_with_vat_aed=Decimal(total))
+            if paid:
+                PaymentEntry.objects.create(invoice_type='sale', invoice_id=sale.pk, party=party,
+                                            payment_type='hand', amount=Decimal(paid))
+            return sale.pk
+
+        cls.march = invoice(cls.customer, date(2024, 3, 1), 100, status=SaleInvoice.STATUS_PENDING)
+        cls.january = invoice(cls.customer, date(2024, 1, 1), 50, paid=20)
+        cls.february = invoice(cls.customer, date(2024, 2, 1), 40)
+        # Not payable: paid in full, cancelled, a proforma and another party's
+        invoice(cls.customer, date(2023, 6, 1), 25, paid=25)
+        invoice(cls.customer, date(2023, 12, 1), 80, status=SaleInvoice.STATUS_CANCELLED)
+        invoice(cls.customer, date(2023, 11, 1), 60, status=SaleInvoice.STATUS_SALES_TEAM_PENDING)
+        invoice(other, date(2023, 1, 1), 10)
+
+    def bulk(self, data, status=201):
+        response = self.client.post('/api/due-payments/bulk/', data, format='json')
+        self.assertEqual(response.status_code, status, response.content)
+        return response.json()
+
+    def test_allocation_pays_the_oldest_invoices_first(self):
+        entries, remaining = allocate_payment(self.customer, 'sale', Decimal('90'), payment_type='hand')
+        self.assertEqual([(entry.invoice_id, entry.amount) for entry in entries],
+                         [(self.january, 30), (self.february, 40), (self.march, 20)])
+        self.assertEqual(remaining, 0)
+        entries, remaining = allocate_payment(self.customer, 'sale', Decimal('200'), payment_type='hand')
+        self.assertEqual(sum(entry.amount for entry in entries), 170)
+        self.assertEqual(remaining, 30)
+
+    def test_allocated_payment_is_posted_once(self):
+        data = self.bulk({'party': self.customer.pk, 'invoice_type': 'sale', 'payment_type': 'bank',
+                          'amount': '90', 'payment_date': '2024-04-01'})
+        self.assertEqual((data['created_count'], data['total_amount']), (3, 90.0))
+        self.assertEqual([(p['invoice_id'], p['amount'], p['payment_date']) for p in data['payments']],
+                         [(self.january, '30.00', '2024-04-01'), (self.february, '40.00', '2024-04-01'),
+                          (self.march, '20.00', '2024-04-01')])
+        self.assertRows([('deposit', 'cash_in_bank', '90')])
+        self.assertBalances('0', '90', '0')
+        # Nothing is left on the first two
+        entries, _ = allocate_payment(self.customer, 'sale', Decimal('80'), payment_type='hand')
+        self.assertEqual([(entry.invoice_id, entry.amount) for entry in entries], [(self.march, 80)])
+
+    def test_amount_above_the_open_balance_saves_nothing(self):
+        data = self.bulk({'party': self.customer.pk, 'invoice_type': 'sale', 'payment_type': 'hand',
+                          'amount': '200'}, status=400)
+        self.assertEqual(data['unallocated'], 30.0)
+        self.assertEqual(PaymentEntry.objects.count(), 2)
+        self.assertRows([])
+
+    def test_payments_are_netted_per_account_type(self):
+        purchase = PurchaseInvoice.objects.create(invoice_no='P-1', purchase_date=date(2024, 1, 1))
+        lines = [('sale', self.january, 'hand', '10'), ('sale', self.february, 'check', '5'),
+                 ('purchase', purchase.pk, 'hand', '4'), ('purchase', purchase.pk, 'bank', '3'),
+                 ('purchase', purchase.pk, 'check', '2')]
+        data = self.bulk({'payments': [{'invoice_type': t, 'invoice_id': i, 'payment_type': p, 'amount': a}
+                                       for t, i, p, a in lines]})
+        self.assertEqual((data['created_count'], data['total_amount']), (5, 24.0))
+        # Purchase cheques are held in check_cash like sale cheques
+        self.assertRows([('deposit', 'cash_in_hand', '6'), ('deposit', 'cash_in_check', '7'),
+                         ('withdraw', 'cash_in_bank', '3')])
+        self.assertBalances('6', '-3', '7')
+        ids = ', '.join(f"#{payment['id']}" for payment in data['payments'])
+        self.assertEqual(set(CashTransaction.objects.values_list('note', flat=True)), {f"PaymentEntry {ids} (bulk)"})
+
+    def test_payments_for_missing_invoices_save_nothing(self):
+        data = self.bulk({'payments': [
+            {'invoice_type': 'sale', 'invoice_id': self.january, 'payment_type': 'hand', 'amount': '10'},
+            {'invoice_type': 'purchase', 'invoice_id': 999, 'payment_type': 'hand', 'amount': '10'}]}, status=400)
+        self.assertEqual(data['invoices'], [{'invoice_type': 'purchase', 'invoice_id': 999}])
+        self.bulk({'payments': []}, status=400)
+        self.assertEqual(PaymentEntry.objects.count(), 2)
+        self.assertRows([])
+
+
+class ChequeClearingTests(CashLedgerTestCase):
+    """Bulk clearing moves what clearing each cheque would, in one update and one posting."""
+
+    def setUp(self):
+        super().setUp()
+        self.cheques = [
+            PaymentEntry.objects.create(invoice_type=invoice_type, invoice_id=1, payment_type='check',
+                                        amount=Decimal(amount), cheque_number=f'00{n}')
+            for n, (invoice_type, amount) in enumerate([('sale', '40'), ('sale', '25'), ('purchase', '10')])]
+        self.account.post({'cash_in_check': Decimal('75')})
+
+    def clear(self, entries, status=200):
+        response = self.client.post('/api/check-approve/bulk/', {'entries': entries}, format='json')
+        self.assertEqual(response.status_code, status, response.content)
+        return response.json()
+
+    def test_each_cheque_gets_its_date_from_one_update(self):
+        first, second, third = self.cheques
+        with CaptureQueriesContext(connection) as queries:
+            data = self.clear([
+                {'payment_entry_id': first.pk, 'action': 'credit', 'cheque_cleared_date': '2024-06-01'},
+                # A part of the cheque
+                {'payment_entry_id': second.pk, 'action': 'credit', 'cheque_cleared_date': '2024-06-02',
+                 'amount': '20'},
+                {'payment_entry_id': third.pk, 'action': 'debit', 'cheque_cleared_date': '2024-06-03'},
+            ])
+        updates = [q['sql'] for q in queries if q['sql'].startswith(f'UPDATE "{PaymentEntry._meta.db_table}"')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('CASE', updates[0])
+        self.assertEqual(data['cleared_count'], 3)
+        self.assertEqual(
+            sorted(PaymentEntry.objects.values_list('pk', 'is_cheque_cleared', 'cheque_cleared_date')),
+            [(first.pk, True, date(2024, 6, 1)), (second.pk, True, date(2024, 6, 2)),
+             (third.pk, True, date(2024, 6, 3))])
+        # 40 + 20 credited to the bank, 10 debited from it, 70 out of check_cash
+        self.assertEqual((data['cash_in_hand'], data['cash_in_bank'], data['check_cash']), (0, 50, 5))
+        self.assertBalances('0', '50', '5')
+        self.assertRows([('deposit', 'cash_in_check', '75'), ('withdraw', 'cash_in_check', '70'),
+                         ('deposit', 'cash_in_bank', '50')])
+
+    def test_same_balances_as_clearing_one_at_a_time(self):
+        first, second, third = self.cheques
+        for cheque, action in ((first, 'credit'), (third, 'debit')):
+            self.client.post('/api/check-approve/', {'payment_entry_id': cheque.pk, 'amount': str(cheque.amount),
+                                                     'action': action}, format='json')
+        self.clear([{'payment_entry_id': second.pk, 'action': 'credit'}])
+        self.assertBalances('0', '55', '0')
+
+    def test_a_batch_can_be_sent_again(self):
+        entries = [{'payment_entry_id': cheque.pk, 'action': 'credit', 'cheque_cleared_date': '2024-06-01'}
+                   for cheque in self.cheques[:2]]
+        self.clear(entries)
+        data = self.clear(entries + [{'payment_entry_id': self.cheques[2].pk, 'action': 'credit'},
+                                     {'payment_entry_id': self.cheques[2].pk, 'action': 'credit'},
+                                     {'payment_entry_id': 999, 'action': 'credit'}])
+        self.assertEqual([result['status'] for result in data['results']],
+                         ['already_cleared', 'already_cleared', 'cleared', 'already_cleared', 'not_found'])
+        self.assertBalances('0', '75', '0')
+        self.assertEqual(self.clear(entries)['cleared_count'], 0)
+        self.assertEqual(CashTransaction.objects.count(), 5)
+
+    def test_invalid_batches_change_nothing(self):
+        self.clear([], status=400)
+        self.clear([{'payment_entry_id': self.cheques[0].pk, 'action': 'credit'},
+                    {'payment_entry_id': self.cheques[1].pk, 'action': 'refund'}], status=400)
+        self.assertFalse(PaymentEntry.objects.filter(is_cheque_cleared=True).exists())
+        self.assertBalances('0', '0', '75')
+
+
+class RebuildCashBalancesTests(CashLedgerTestCase):
+    """Balances from before the ledger become opening rows once, later differences are never overwritten."""
+
+    def setUp(self):
+        super().setUp()
+        # 100 in hand and 5 in the bank from before the ledger, then a deposit it recorded
+        CashAccount.objects.filter(pk=self.account.pk).update(cash_in_hand=Decimal('100'), cash_in_bank=Decimal('5'))
+        self.account.deposit(Decimal('10'), 'cash_in_hand')
+
+    def rebuild(self, **options):
+        out = StringIO()
+        call_command('rebuild_cash_balances', stdout=out, **options)
+        return out.getvalue()
+
+    def drift(self, amount):
+        CashAccount.objects.filter(pk=self.account.pk).update(cash_in_hand=F('cash_in_hand') + amount)
+
+    def test_opening_rows_are_recorded_once(self):
+        self.assertIn('Updated 0 accounts, recorded 2 opening balances', self.rebuild(record_opening=True, check=True))
+        self.assertRows([('deposit', 'cash_in_hand', '10'), ('opening', 'cash_in_hand', '100'),
+                         ('opening', 'cash_in_bank', '5')])
+        self.assertBalances('110', '5', '0')
+        self.assertIn('Cash balances match the ledger', self.rebuild(record_opening=True, check=True))
+        self.assertEqual(CashTransaction.objects.count(), 3)
+
+    def test_balance_below_the_ledger_opens_negative(self):
+        CashAccount.objects.filter(pk=self.account.pk).update(cash_in_hand=Decimal('4'), cash_in_bank=Decimal('0'))
+        self.rebuild(record_opening=True)
+        self.assertRows([('deposit', 'cash_in_hand', '10'), ('opening', 'cash_in_hand', '-6')])
+        self.assertBalances('4', '0', '0')
+
+    def test_difference_after_the_opening_fails_the_check(self):
+        self.rebuild(record_opening=True, check=True)
+        self.drift(Decimal('7'))
+        with self.assertRaisesMessage(CommandError, '1 cash balances differ from the ledger, nothing changed'):
+            self.rebuild(record_opening=True, check=True)
+        # No second opening row and the balance left as it is
+        self.assertEqual(CashTransaction.objects.filter(transaction_type='opening').count(), 2)
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.cash_in_hand, Decimal('117'))
+
+    def test_failed_check_records_no_opening_either(self):
+        profit = CashAccount.objects.create(type='profit', cash_in_bank=Decimal('3'))
+        self.rebuild(record_opening=True, check=True)
+        CashTransaction.objects.filter(cash_account=profit).delete()
+        self.drift(Decimal('7'))
+        with self.assertRaises(CommandError):
+            self.rebuild(record_opening=True, check=True)
+        self.assertFalse(CashTransaction.objects.filter(cash_account=profit).exists())
+
+    def test_dry_run_and_overwrite(self):
+        self.rebuild(record_opening=True)
+        self.drift(Decimal('-2.50'))
+        self.assertIn('main cash_in_hand: stored 107.50, ledger 110.00 (+2.50)', self.rebuild(dry_run=True))
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.cash_in_hand, Decimal('107.50'))
+        # Overwriting with the ledger is only done when asked for
+        self.assertIn('Updated 1 accounts', self.rebuild())
+        self.assertBalances('110', '5', '0')
+
+
+# SQLite locks the whole database, run these against PostgreSQL or MySQL (DB_ENGINE)
+@skipUnlessDBFeature('test_db_allows_multiple_connections')
+class ConcurrentPostingTests(TransactionTestCase):
+    """The cash_in_* balances equal the sum of the ledger after postings made at once."""
+    rounds = 5
+
+    def setUp(self):
+        self.account = CashAccount.get_main()
+
+    def run_together(self, postings):
+        """Run every posting on its own thread, connection and copy of the account."""
+        start = Barrier(len(postings))
+        errors = []
+
+        def run(posting):
+            try:
+                account = CashAccount.objects.get(pk=self.account.pk)
+                start.wait()
+                posting(account)
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        threads = [Thread(target=run, args=(posting,)) for posting in postings]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_parallel_postings_match_the_ledger(self):
+        postings = [
+            lambda account: account.deposit(Decimal('100.00'), 'cash_in_hand'),
+            lambda account: account.withdraw(Decimal('30.25'), 'cash_in_bank'),
+            lambda account: account.transfer('cash_in_hand', 'cash_in_bank', Decimal('12.50')),
+            lambda account: account.post({'cash_in_check': Decimal('7.10'), 'cash_in_hand': Decimal('-2.05')}),
+        ]
+        self.run_together(postings * self.rounds)
+
+        self.account.refresh_from_db()
+        ledger = ledger_balances(chunk_size=1000)[self.account.pk]
+        for account_type, field in CashAccount.BALANCE_FIELDS.items():
+            self.assertEqual(getattr(self.account, field), ledger[account_type], field)
+        self.assertEqual(self.account.cash_in_hand, self.rounds * Decimal('85.45'))
+        self.assertEqual(self.account.cash_in_bank, self.rounds * Decimal('-17.75'))
+        self.assertEqual(self.account.check_cash, self.rounds * Decimal('7.10'))
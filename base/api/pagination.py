@@ -1,10 +1,42 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import connection
+from django.db.models import Q
+from rest_framework.exceptions import ParseError
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 class CustomPagination(PageNumberPagination):
+    """
+    Page numbers by default. Views with a cursor_ordering (e.g. '-created_at')
+    also page by cursor when ?cursor= is sent: rows come ordered on
+    (that field, id) and each page starts after the last row of the one
+    before, so deep pages cost the same as the first and rows entered
+    meanwhile do not shift them. The count is only run with ?with_total=1.
+    """
     page_size = 10
+    cursor_query_param = 'cursor'
+    total_query_param = 'with_total'
+    cursor = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        ordering = getattr(view, 'cursor_ordering', None)
+        if ordering and self.cursor_query_param in request.query_params:
+            return self.paginate_cursor(queryset, request, ordering)
+        return super().paginate_queryset(queryset, request, view)
 
     def get_paginated_response(self, data):
+        if self.cursor is not None:
+            return Response({
+                'total': self.total,
+                'per_page': self.page_size,
+                'current_page_count': len(data),
+                'next': self.next_link,
+                'previous': self.previous_link,
+                'data': data
+            })
         return Response({
             'total': self.page.paginator.count,
             'per_page': self.page_size,
@@ -13,3 +45,67 @@ class CustomPagination(PageNumberPagination):
             'previous': self.get_previous_link(),
             'data': data
         })
+
+    def paginate_cursor(self, queryset, request, ordering):
+        self.request = request
+        self.cursor = self.decode_cursor(request.query_params[self.cursor_query_param])
+        self.total = queryset.count() if request.query_params.get(self.total_query_param) in ('1', 'true') else None
+
+        name = ordering.lstrip('-')
+        field = queryset.model._meta.get_field(name)
+        # A previous link reads the rows before the page in the reverse order
+        descending = ordering.startswith('-') != self.cursor.get('r', False)
+        direction = '-' if descending else ''
+        queryset = queryset.order_by(f'{direction}{name}', f'{direction}pk')
+        if 'i' in self.cursor:
+            queryset = queryset.filter(self._after(field, self.cursor['v'], self.cursor['i'], descending))
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if self.cursor.get('r'):
+            rows.reverse()
+            has_next, has_previous = 'i' in self.cursor, has_more
+        else:
+            has_next, has_previous = has_more, 'i' in self.cursor
+        self.next_link = self._link(field, rows[-1], reverse=False) if has_next and rows else None
+        self.previous_link = self._link(field, rows[0], reverse=True) if has_previous and rows else None
+        return rows
+
+    def decode_cursor(self, value):
+        if not value:
+            return {}
+        try:
+            cursor = json.loads(urlsafe_b64decode(value.encode('ascii')))
+            if not isinstance(cursor, dict) or type(cursor['i']) is not int or 'v' not in cursor:
+                raise ValueError
+            return cursor
+        except (ValueError, KeyError, TypeError, UnicodeError):
+            raise ParseError("Invalid cursor")
+
+    def _link(self, field, row, reverse):
+        value = getattr(row, field.attname)
+        cursor = {'v': value.isoformat() if hasattr(value, 'isoformat') else value, 'i': row.pk}
+        if reverse:
+            cursor['r'] = True
+        url = remove_query_param(self.request.build_absolute_uri(), self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param,
+                                   urlsafe_b64encode(json.dumps(cursor).encode()).decode('ascii'))
+
+    def _after(self, field, value, pk, descending):
+        """Rows after (value, pk) in the (field, pk) order, with NULLs where the database sorts them."""
+        name = field.name
+        if value is not None:
+            try:
+                value = field.to_python(value)
+            except (DjangoValidationError, TypeError, ValueError):
+                raise ParseError("Invalid cursor")
+        before = 'lt' if descending else 'gt'
+        nulls_after = connection.features.nulls_order_largest != descending
+        if value is None:
+            after = Q(**{f'{name}__isnull': True, f'pk__{before}': pk})
+            return after if nulls_after else after | Q(**{f'{name}__isnull': False})
+        after = Q(**{f'{name}__{before}': value}) | Q(**{name: value, f'pk__{before}': pk})
+        if field.null and nulls_after:
+            after |= Q(**{f'{name}__isnull': True})
+        return after
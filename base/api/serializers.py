@@ -0,0 +1,32 @@
+from rest_framework import serializers
+
+
+class PrefetchedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """Takes the instance from the ones its list serializer fetched for all items."""
+
+    def to_internal_value(self, data):
+        prefetched = getattr(self.parent, 'prefetched', {}).get(self.field_name, {})
+        try:
+            return prefetched[int(data)]
+        except (KeyError, TypeError, ValueError):
+            return super().to_internal_value(data)
+
+
+class PrefetchingListSerializer(serializers.ListSerializer):
+    """Fetches the related rows of every item with one query per PrefetchedPrimaryKeyRelatedField."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            prefetched = {}
+            for name, field in self.child.fields.items():
+                if not isinstance(field, PrefetchedPrimaryKeyRelatedField):
+                    continue
+                ids = set()
+                for row in data:
+                    try:
+                        ids.add(int(row.get(name)))
+                    except (AttributeError, TypeError, ValueError):
+                        pass
+                prefetched[name] = field.get_queryset().in_bulk(ids)
+            self.child.prefetched = prefetched
+        return super().to_internal_value(data)
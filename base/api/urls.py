@@ -12,6 +12,7 @@ from common.api.views_api import *
 from banking.api.views_api import *
 from user.api.views_api import *
 from inventory.api.views_api import *
+from core.api.views_api import *
 
 router = DefaultRouter()
 router.register(r'products', ProductViewSet)
@@ -47,6 +48,7 @@ router.register(r'asset-sell', AssetSaleViewSet)
 urlpatterns = [
     path('', include(router.urls)),
     path('inventory-report/', InventoryReportAPIView.as_view()),
+    path('search/', SearchAPIView.as_view(), name='search'),
     path('api-token-auth/', CustomAuthToken.as_view()),
     path('api-token-auth/users/', UserCreateAPIView.as_view(), name='user-create'),
     path('product/bulk-create/', ProductItemBulkCreateAPIView.as_view(),
@@ -58,6 +60,7 @@ urlpatterns = [
     # path('reminders/', RemindersAPIView.as_view(), name='reminders'),
     path('cash-account/', CashAccountAPIView.as_view(), name='cash-account'),
     path('check-approve/', CheckApproveAPIView.as_view(), name='check-approve'),
+    path('check-approve/bulk/', CheckApproveBulkAPIView.as_view(), name='check-approve-bulk'),
     path('reminders/', RemindersAPIView.as_view(), name='reminders'),
     path('add-stock/', AddStockAPIView.as_view(), name='add-stock'),
     path('edit-stock/', EditStockAPIView.as_view(), name='edit-stock'),
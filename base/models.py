@@ -0,0 +1,26 @@
+class LoadedDateMixin:
+    """
+    Remembers the date a row was loaded with, read from its
+    loaded_date_field, so a save moving the row to another date can tell
+    the date it leaves without reading the row again.
+    """
+    loaded_date_field = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if cls.loaded_date_field in instance.__dict__:
+            instance._loaded_date = instance.__dict__[cls.loaded_date_field]
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._loaded_date = getattr(self, self.loaded_date_field)
+
+    def get_previous_date(self):
+        """The stored date before this save, None for a new row."""
+        if self.pk is None:
+            return None
+        if hasattr(self, '_loaded_date'):
+            return self._loaded_date
+        return type(self).objects.filter(pk=self.pk).values_list(self.loaded_date_field, flat=True).first()
@@ -0,0 +1,6 @@
+from django.dispatch import Signal
+
+# Sent after rows are written with bulk_create/bulk_update, which skip
+# post_save. Arguments: sender (the model), instances, created, and
+# optionally previous: the values updated rows had before, one dict per row.
+post_bulk_save = Signal()
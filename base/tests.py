@@ -1,3 +1,126 @@
+import json
+from base64 import urlsafe_b64encode
+from datetime import timedelta
+from decimal import Decimal
+from django.contrib.auth.models import User
+from django.db import transaction
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from banking.models import PaymentEntry
+from base.utils import defer_until_commit
+
+
+class DeferUntilCommitTests(TestCase):
+    def setUp(self):
+        self.flushed = []
+
+    def defer(self, values):
+        defer_until_commit('test', values, self.flushed.append)
+
+    def test_values_of_one_block_are_flushed_once(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.defer([1, 2])
+            self.defer([2, 3, None])
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(self.flushed, [{1, 2, 3}])
+
+    def test_rolled_back_values_are_dropped(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    self.defer([1])
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+            self.defer([2])
+        self.assertEqual(self.flushed, [{2}])
+
+    def test_released_savepoint_values_join_the_outer_block(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with transaction.atomic():
+                self.defer([1])
+            self.defer([2])
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(self.flushed, [{1, 2}])
+
+
+class CursorPaginationTests(TestCase):
+    """due-payments/ pages on (created_at, id) with ?cursor=, on page numbers otherwise."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='cashier')
+        entries = PaymentEntry.objects.bulk_create([
+            PaymentEntry(invoice_type='sale', invoice_id=n, payment_type='hand', amount=Decimal(n + 1))
+            for n in range(25)])
+        # Seven entries per timestamp, so ties run across the pages
+        start = timezone.now() - timedelta(days=1)
+        for n, entry in enumerate(entries):
+            PaymentEntry.objects.filter(pk=entry.pk).update(created_at=start + timedelta(minutes=n // 7))
+        cls.expected = list(PaymentEntry.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get(self, url, params=None, status=200):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status, response.content)
+        return response.json()
+
+    def walk(self, page, link):
+        """Ids of page and of the pages reached by following link."""
+        pages = [[row['id'] for row in page['data']]]
+        while page[link]:
+            page = self.get(page[link])
+            pages.append([row['id'] for row in page['data']])
+        return pages
+
+    def test_pages_follow_created_at_then_id(self):
+        first = self.get('/api/due-payments/', {'cursor': ''})
+        self.assertEqual((first['total'], first['per_page'], first['previous']), (None, 10, None))
+        pages = self.walk(first, 'next')
+        self.assertEqual([len(ids) for ids in pages], [10, 10, 5])
+        self.assertEqual(sum(pages, []), self.expected)
+
+    def test_previous_links_go_back_over_the_same_pages(self):
+        page = self.get('/api/due-payments/', {'cursor': ''})
+        while page['next']:
+            page = self.get(page['next'])
+        pages = self.walk(page, 'previous')
+        self.assertEqual(sum(reversed(pages), []), self.expected)
+
+    def test_entries_added_meanwhile_do_not_shift_the_pages(self):
+        first = self.get('/api/due-payments/', {'cursor': ''})
+        PaymentEntry.objects.create(invoice_type='sale', invoice_id=99, payment_type='hand', amount=Decimal(1))
+        self.assertEqual(sum(self.walk(self.get(first['next']), 'next'), []), self.expected[10:])
+
+    def test_total_only_on_request(self):
+        page = self.get('/api/due-payments/', {'cursor': '', 'with_total': '1'})
+        self.assertEqual(page['total'], 25)
+        # Kept on the links
+        self.assertEqual(self.get(page['next'])['total'], 25)
+
+    def test_malformed_cursors_are_bad_requests(self):
+        def encode(value):
+            return urlsafe_b64encode(json.dumps(value).encode()).decode('ascii')
+
+        for cursor in ['not base64!', urlsafe_b64encode(b'not json').decode('ascii'), encode([1, 2]),
+                       encode({'v': '2024-01-01T00:00:00+00:00'}), encode({'i': 'x', 'v': None}),
+                       encode({'i': True, 'v': None}), encode({'i': 1}), encode({'i': 1, 'v': 'yesterday'}),
+                       encode({'i': 1, 'v': 5}), 'é']:
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.get('/api/due-payments/', {'cursor': cursor}, status=400),
+                                 {'detail': 'Invalid cursor'})
+
+    def test_page_numbers_are_unchanged(self):
+        page = self.get('/api/due-payments/', {'page': 2})
+        self.assertEqual(set(page), {'total', 'per_page', 'current_page_count', 'next', 'previous', 'data'})
+        self.assertEqual((page['total'], page['per_page'], page['current_page_count']), (25, 10, 10))
+        self.assertIn('page=3', page['next'])
+        self.assertNotIn('cursor', page['next'])
+        self.assertEqual([row['id'] for row in page['data']],
+                         list(PaymentEntry.objects.order_by('-created_at').values_list('id', flat=True))[10:20])
+        self.get('/api/due-payments/', {'page': 4}, status=404)
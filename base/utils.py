@@ -1,8 +1,13 @@
 import json
+from collections import namedtuple
 from decimal import Decimal
 from datetime import date, datetime
 from django.contrib.contenttypes.models import ContentType
+from django.db import models, router, transaction
+from django.db.models.deletion import Collector
 from django.forms.models import model_to_dict
+from django.utils import timezone
+from base.signals import post_bulk_save
 from user.models import UserActivity
 
 
@@ -18,6 +23,44 @@ class DjangoJSONEncoder(json.JSONEncoder):
         return super().default(obj)
 
 
+class _DeferredValues:
+    """on_commit callback handing the values deferred under one name to flush."""
+
+    def __init__(self, name, flush):
+        self.name = name
+        self.flush = flush
+        self.values = set()
+
+    def __call__(self):
+        values, self.values = self.values, None
+        if values:
+            self.flush(values)
+
+
+def defer_until_commit(name, values, flush, using=None):
+    """
+    Collect values under `name` and hand them to `flush` once the current
+    transaction commits, so a multi-line invoice save is processed once.
+    The values live on an on_commit callback, one per name that the
+    enclosing blocks reuse once inner savepoints are released. When a block
+    rolls back Django drops the callbacks registered in it, values included.
+    """
+    values = {v for v in values if v is not None}
+    if not values:
+        return
+    connection = transaction.get_connection(using)
+    if connection.in_atomic_block:
+        savepoint_ids = set(connection.savepoint_ids)
+        for callback_savepoint_ids, callback, *_ in connection.run_on_commit:
+            if (isinstance(callback, _DeferredValues) and callback.name == name
+                    and callback.values is not None and savepoint_ids <= callback_savepoint_ids):
+                callback.values.update(values)
+                return
+    callback = _DeferredValues(name, flush)
+    callback.values.update(values)
+    transaction.on_commit(callback, using=using)
+
+
 def log_activity(request, action, instance, changes=None):
     content_type = ContentType.objects.get_for_model(instance)
 
@@ -41,3 +84,91 @@ def log_activity(request, action, instance, changes=None):
         ip_address=request.META.get('REMOTE_ADDR'),
         user_agent=request.META.get('HTTP_USER_AGENT')
     )
+
+
+RowChanges = namedtuple('RowChanges', ['created', 'updated', 'removed', 'rows'])
+
+
+def _stored_value(field, value):
+    # Compare values as the column keeps them, e.g. decimals rounded to their places
+    if isinstance(field, models.DecimalField) and value is not None:
+        return Decimal(value).quantize(Decimal(1).scaleb(-field.decimal_places))
+    return value
+
+
+def _row_values(row):
+    return {field.attname: getattr(row, field.attname) for field in row._meta.concrete_fields}
+
+
+@transaction.atomic
+def sync_rows(model, existing, rows_data, build, prepare=None, attnames=None):
+    """
+    Bring stored rows in line with the sent ones. Sent rows are matched to
+    stored ones by 'id' and written only when a value differs, the others
+    are created and stored rows that were not sent are deleted, with one
+    bulk_create, one bulk_update and one delete().
+
+    Args:
+        model: the model of the rows
+        existing: {pk: row} of the stored rows
+        rows_data: list of sent dicts
+        build: function(data) returning the unsaved row for unmatched data
+        prepare: optional function(row) run on every matched row before it
+            is compared, e.g. to recompute its totals
+        attnames: {key: attribute} for sent keys setting another attribute,
+            e.g. {'item': 'item_id'}
+
+    Returns:
+        RowChanges: created rows, updated rows as (row, values before),
+        removed rows and every row left, in the sent order
+    """
+    attnames = attnames or {}
+    sent_ids = {data.get('id') for data in rows_data if data.get('id')}
+    removed = [row for pk, row in existing.items() if pk not in sent_ids]
+
+    created, updated, rows = [], [], []
+    fields = set()
+    for data in rows_data:
+        row = existing.get(data.get('id'))
+        if row is None:
+            row = build(data)
+            created.append(row)
+            rows.append(row)
+            continue
+        before = _row_values(row)
+        for key, value in data.items():
+            if key == 'id':
+                continue
+            attname = attnames.get(key, key)
+            setattr(row, attname, getattr(value, 'pk', value))
+        if prepare:
+            prepare(row)
+        changed = [field.attname for field in model._meta.concrete_fields
+                   if _stored_value(field, getattr(row, field.attname)) != _stored_value(field, before[field.attname])]
+        if changed:
+            fields.update(changed)
+            updated.append((row, before))
+        rows.append(row)
+
+    if removed:
+        # Delete the loaded rows, so their post_delete receivers get them
+        # with the relations already cached, like the invoice of a line
+        collector = Collector(using=router.db_for_write(model))
+        collector.collect(removed)
+        collector.delete()
+    if created:
+        model.objects.bulk_create(created)
+    if updated:
+        # bulk_update does not run auto_now
+        now = timezone.now()
+        for field in model._meta.concrete_fields:
+            if getattr(field, 'auto_now', False):
+                fields.add(field.attname)
+                for row, _ in updated:
+                    setattr(row, field.attname, now)
+        model.objects.bulk_update([row for row, _ in updated], fields)
+
+    post_bulk_save.send(sender=model, instances=created, created=True)
+    post_bulk_save.send(sender=model, instances=[row for row, _ in updated], created=False,
+                        previous=[before for _, before in updated])
+    return RowChanges(created, updated, removed, rows)
@@ -3,18 +3,16 @@ from rest_framework.views import APIView
 from django.forms.models import model_to_dict
 from .serializers import *
 from django.db.models import Sum
-from decimal import Decimal
 from datetime import date
 from rest_framework.response import Response
 from rest_framework import permissions
-from django.db.models import Q
+from django.db import transaction
 from base.utils import log_activity
 from common.api.serializers import WageSerializer
 from django.utils import timezone
 from banking.models import CashAccount
-from purchase.models import PurchaseInvoice, PurchaseItem
-from sale.models import SaleItem,SaleInvoice
-from employee.models import SalaryEntry
+from report.helpers.tax_summary import get_tax_summary
+from report.cache import cached_report
 from common.api.filters import ExpenseFilter, WageFilter
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.decorators import action
@@ -57,12 +55,14 @@ class ExpenseViewSet(viewsets.ModelViewSet):
     queryset = Expense.objects.all().order_by('-created_at')
     serializer_class = ExpenseSerializer
     permission_classes = [permissions.IsAuthenticated]
+    cursor_ordering = '-created_at'
     filter_backends = [DjangoFilterBackend]
     filterset_class = ExpenseFilter
 
+    @transaction.atomic
     def perform_create(self, serializer):
         instance = serializer.save(created_by=self.request.user)
-        cash_account = CashAccount.objects.first()
+        cash_account = CashAccount.get_main()
         cash_account.withdraw(
             instance.amount_aed, f'cash_in_{instance.payment_type}',
             note=f'Expense #{instance.id}')
@@ -96,102 +96,13 @@ class TaxSummaryAPIView(APIView):
     def get(self, request):
         start_date = request.query_params.get('start_date')
         end_date = request.query_params.get('end_date')
+        period = request.query_params.get('period')
 
-        sale_invoice_filter = Q()
-        purchase_invoice_filter = Q()
-        sale_item_filter = Q()
-        purchase_item_filter = Q()
-        expense_filter = Q()
-        salary_filter = Q()
-
-        if start_date:
-            sale_invoice_filter &= Q(sale_date__gte=start_date)
-            purchase_invoice_filter &= Q(purchase_date__gte=start_date)
-            sale_item_filter &= Q(invoice__sale_date__gte=start_date)
-            purchase_item_filter &= Q(invoice__purchase_date__gte=start_date)
-            expense_filter &= Q(date__gte=start_date)
-            salary_filter &= Q(date__gte=start_date)
-        if end_date:
-            sale_invoice_filter &= Q(sale_date__lte=end_date)
-            purchase_invoice_filter &= Q(purchase_date__lte=end_date)
-            sale_item_filter &= Q(invoice__sale_date__lte=end_date)
-            purchase_item_filter &= Q(invoice__purchase_date__lte=end_date)
-            expense_filter &= Q(date__lte=end_date)
-            salary_filter &= Q(date__lte=end_date)
-
-        # VAT aggregation
-        total_sales_vat_usd = \
-        SaleInvoice.objects.filter(status=SaleInvoice.STATUS_APPROVED).filter(
-            sale_invoice_filter).aggregate(total=Sum('vat_amount_usd'))['total'] or Decimal('0')
-        total_sales_vat_aed = SaleInvoice.objects.filter(sale_invoice_filter).aggregate(
-            total=Sum('vat_amount_aed'))['total'] or Decimal('0')
-
-        total_purchase_vat_usd = PurchaseInvoice.objects.filter(
-            status=PurchaseInvoice.STATUS_APPROVED).filter(
-            purchase_invoice_filter).aggregate(total=Sum('vat_amount_usd'))['total'] or Decimal('0')
-        total_purchase_vat_aed = PurchaseInvoice.objects.filter(purchase_invoice_filter).aggregate(
-            total=Sum('vat_amount_aed'))['total'] or Decimal('0')
-
-        # Sales base amount (qty * price + shipping), carefully cast to Decimal
-        sales_items = SaleItem.objects.filter(
-            invoice__status=SaleInvoice.STATUS_APPROVED).filter(
-            sale_item_filter)
-        total_sales_base_usd = sum(
-            (Decimal(item.sale_price_usd) * item.qty) + Decimal(item.shipping_usd)
-            for item in sales_items
-        )
-        total_sales_base_aed = sum(
-            (Decimal(item.sale_price_aed) * item.qty) + Decimal(item.shipping_aed)
-            for item in sales_items
-        )
-
-        # Purchase base amount (qty * price + shipping)
-        purchase_items = PurchaseItem.objects.filter(
-            invoice__status=PurchaseInvoice.STATUS_APPROVED).filter(
-            purchase_item_filter)
-        total_purchase_base_usd = sum(
-            (Decimal(item.unit_price_usd) * item.qty) + (Decimal(item.shipping_per_unit_usd) * item.qty)
-            for item in purchase_items
-        )
-        total_purchase_base_aed = sum(
-            (Decimal(item.unit_price_aed) * item.qty) + (Decimal(item.shipping_per_unit_aed) * item.qty)
-            for item in purchase_items
-        )
-
-        # Expenses & Salary
-        total_expenses_usd = Expense.objects.filter(expense_filter).aggregate(
-            total=Sum('amount_usd'))['total'] or Decimal('0')
-        total_expenses_aed = Expense.objects.filter(expense_filter).aggregate(
-            total=Sum('amount_aed'))['total'] or Decimal('0')
-
-        total_salary_usd = SalaryEntry.objects.filter(salary_filter).aggregate(
-            total=Sum('amount_usd'))['total'] or Decimal('0')
-        total_salary_aed = SalaryEntry.objects.filter(salary_filter).aggregate(
-            total=Sum('amount_aed'))['total'] or Decimal('0')
-
-        # Corporate tax calculation (Decimal math)
-        corporate_tax_usd = total_sales_base_usd - (
-            total_purchase_base_usd + total_expenses_usd + total_salary_usd
-        )
-        corporate_tax_aed = total_sales_base_aed - (
-            total_purchase_base_aed + total_expenses_aed + total_salary_aed
-        )
-
-        # Build response, convert Decimals to float for JSON
-        data = {
-            "sales": {
-                "total_vat_usd": float(total_sales_vat_usd),
-                "total_vat_aed": float(total_sales_vat_aed),
-            },
-            "purchase": {
-                "total_vat_usd": float(total_purchase_vat_usd),
-                "total_vat_aed": float(total_purchase_vat_aed),
-            },
-            "corporate_tax": {
-                "usd": float(corporate_tax_usd),
-                "aed": float(corporate_tax_aed),
-            }
-        }
+        try:
+            data = cached_report('tax_summary', request,
+                                 lambda: get_tax_summary(start_date, end_date, period=period))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
         return Response(data)
 
 
@@ -208,7 +119,7 @@ class ServiceFeeViewSet(viewsets.ModelViewSet):
                         modified_at=timezone.now())
 
         instance = serializer.save(created_by=self.request.user)
-        cash_account = CashAccount.objects.first()
+        cash_account = CashAccount.get_main()
         cash_account.deposit(instance.amount_aed, CashAccount.ACCOUNT_TYPE_CASH)
         log_activity(self.request, 'create', instance)
     def get(self, request):
@@ -256,9 +167,10 @@ class WageViewSet(viewsets.ModelViewSet):
     filter_backends = [DjangoFilterBackend]
     filterset_class = WageFilter
 
+    @transaction.atomic
     def perform_create(self, serializer):
         instance = serializer.save(created_by=self.request.user)
-        cash_account = CashAccount.objects.first()
+        cash_account = CashAccount.get_main()
         cash_account.withdraw(instance.amount_aed, f'cash_in_{instance.payment_type}')
     def perform_update(self, serializer):
         old_instance = self.get_object()
@@ -335,12 +247,10 @@ class AssetSaleViewSet(viewsets.ModelViewSet):
     serializer_class = AssetSaleSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    @transaction.atomic
     def perform_create(self, serializer):
         instance = serializer.save(created_by=self.request.user)
-        from banking.models import CashAccount
-        cash_account = CashAccount.objects.first()
-        if cash_account:
-            cash_account.deposit(instance.sale_price, f'cash_in_{instance.payment_type}')
+        CashAccount.get_main().deposit(instance.sale_price, f'cash_in_{instance.payment_type}')
 
     def perform_update(self, serializer):
         serializer.save(modified_by=self.request.user, modified_at=timezone.now())
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.23 on 2026-10-18 06:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0009_assetsale_party_assetsale_vat'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['created_at', 'id'], name='expense_created_idx'),
+        ),
+    ]
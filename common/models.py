@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
+from base.models import LoadedDateMixin
 from django.utils import timezone
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
@@ -100,7 +101,8 @@ class ExpenseType(models.Model):
         return self.name
 
 
-class Expense(models.Model):
+class Expense(LoadedDateMixin, models.Model):
+    loaded_date_field = 'date'
     PAYMENT_TYPE_CHOICES = (('hand', 'Cash'), ('bank', 'Bank'),
                             ('check', 'Check'),)
     type = models.ForeignKey(ExpenseType, on_delete=models.CASCADE)
@@ -120,11 +122,18 @@ class Expense(models.Model):
     modified_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True,
                                     related_name='+')
 
+    class Meta:
+        indexes = [
+            # Order of the ?cursor= pages of expenses/
+            models.Index(fields=['created_at', 'id'], name='expense_created_idx'),
+        ]
+
     def __str__(self):
         return f"{self.type.name} AED {self.amount_aed} / USD {self.amount_usd} on {self.date}"
 
 
-class Wage(models.Model):
+class Wage(LoadedDateMixin, models.Model):
+    loaded_date_field = 'date'
     PAYMENT_TYPE_CHOICES = (('hand', 'Cash'), ('bank', 'Bank'),
                             ('check', 'Check'),)
     amount_aed = models.DecimalField(max_digits=12, decimal_places=2)
@@ -0,0 +1,47 @@
+from django.contrib.contenttypes.models import ContentType
+from base.utils import sync_rows
+from common.models import ExtraCharges, ExtraPurchase
+
+
+def sync_extra_charges(invoice, charges_data, user):
+    """
+    Bring the extra charges of a sale or purchase invoice in line with the
+    sent ones, matched by 'id'; unchanged charges are not written.
+    """
+    content_type = ContentType.objects.get_for_model(invoice)
+    existing = ExtraCharges.objects.filter(content_type=content_type, object_id=invoice.id)
+    return sync_rows(
+        ExtraCharges,
+        {charge.pk: charge for charge in existing},
+        charges_data,
+        build=lambda charge: ExtraCharges(
+            content_type=content_type,
+            object_id=invoice.id,
+            amount=charge.get('amount'),
+            description=charge.get('description', ''),
+            vat=charge.get('vat', 0),
+            created_by=user
+        ),
+    )
+
+
+def sync_extra_purchases(invoice, purchases_data, user):
+    """
+    Bring the extra purchases of a purchase invoice in line with the sent
+    ones, matched by 'id'; unchanged entries are not written.
+    """
+    changes = sync_rows(
+        ExtraPurchase,
+        {purchase.pk: purchase for purchase in invoice.extra_purchases.all()},
+        purchases_data,
+        build=lambda purchase: ExtraPurchase(
+            purchase_invoice=invoice,
+            amount=purchase.get('amount'),
+            description=purchase.get('description', ''),
+            vat=purchase.get('vat', 0),
+            created_by=user
+        ),
+    )
+    if changes.created:
+        invoice.extra_purchases.add(*changes.created)
+    return changes
@@ -0,0 +1,12 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from common import tax_cache
+from common.models import Tax
+
+
+@receiver([post_save, post_delete], sender=Tax)
+def tax_changed(sender, **kwargs):
+    tax_cache.clear()
+    # Other workers must not reload before the change is visible to them
+    transaction.on_commit(tax_cache.invalidate)
@@ -0,0 +1,81 @@
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+
+# Bumped whenever a Tax changes, so every worker reloads its copy
+VERSION_KEY = 'tax_cache:version'
+
+# Seconds a worker trusts its copy before looking at the shared version, or
+# reloading it when the cache is per process and never shows other workers' bumps
+CHECK_INTERVAL = 1.0
+
+_lock = threading.Lock()
+_snapshot = None
+
+
+def _new_version():
+    # Unique across cache evictions, so a reset never matches an old copy
+    return int(time.time() * 1000)
+
+
+def _shared_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, _new_version(), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def _load(version):
+    from common.models import Tax
+    taxes = {tax.pk: tax for tax in Tax.objects.order_by('pk')}
+    # Same choice as Tax.objects.filter(active=True).first()
+    active = next((tax for tax in taxes.values() if tax.active), None)
+    return {'taxes': taxes, 'active': active, 'version': version, 'checked_at': time.monotonic()}
+
+
+def _get_snapshot(reload=False):
+    global _snapshot
+    snapshot = _snapshot
+    if not reload and snapshot and time.monotonic() - snapshot['checked_at'] < CHECK_INTERVAL:
+        return snapshot
+    version = _shared_version()
+    reload = reload or not settings.SHARED_CACHE
+    with _lock:
+        if reload or not _snapshot or _snapshot['version'] != version:
+            _snapshot = _load(version)
+        else:
+            _snapshot = dict(_snapshot, checked_at=time.monotonic())
+        return _snapshot
+
+
+def get_active_tax():
+    """The active Tax (lowest id first), or None."""
+    return _get_snapshot()['active']
+
+
+def get_tax(tax_id):
+    """The Tax with this id, or None."""
+    if tax_id is None:
+        return None
+    taxes = _get_snapshot()['taxes']
+    if tax_id not in taxes:
+        # Created by another worker since this copy was loaded
+        taxes = _get_snapshot(reload=True)['taxes']
+    return taxes.get(tax_id)
+
+
+def clear():
+    """Drop this process's copy, it is reloaded on the next read."""
+    global _snapshot
+    _snapshot = None
+
+
+def invalidate():
+    """Make every worker reload the taxes on its next read."""
+    clear()
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, _new_version(), timeout=None)
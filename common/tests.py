@@ -1,3 +1,91 @@
-from django.test import TestCase
+import time
+from decimal import Decimal
+from unittest import mock
+from django.core.cache import cache
+from django.db import transaction
+from django.test import TestCase, override_settings
+from common import tax_cache
+from common.models import Tax
 
-# Create your tests here.
+
+@override_settings(SHARED_CACHE=True)
+class TaxCacheTests(TestCase):
+    """
+    The cache is shared by the workers of a test run, the changes they make
+    are written to the table and the version directly, without signals.
+    """
+
+    def setUp(self):
+        cache.clear()
+        tax_cache.clear()
+        self.addCleanup(tax_cache.clear)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tax = Tax.objects.create(name='VAT', vat_percent=Decimal(5))
+
+    def after_check_interval(self):
+        return mock.patch.object(tax_cache.time, 'monotonic',
+                                 return_value=time.monotonic() + tax_cache.CHECK_INTERVAL)
+
+    def test_snapshot_is_read_once(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(tax_cache.get_active_tax(), self.tax)
+            self.assertEqual(tax_cache.get_tax(self.tax.pk).vat_percent, Decimal(5))
+        with self.after_check_interval(), self.assertNumQueries(0):
+            # Only the version is compared
+            self.assertEqual(tax_cache.get_active_tax(), self.tax)
+
+    def test_none_and_missing_ids(self):
+        with self.assertNumQueries(0):
+            self.assertIsNone(tax_cache.get_tax(None))
+        tax_cache.get_active_tax()
+        # An unknown id reloads once, in case another worker created it
+        with self.assertNumQueries(1):
+            self.assertIsNone(tax_cache.get_tax(self.tax.pk + 1))
+
+    def test_no_active_tax(self):
+        Tax.objects.update(active=False)
+        self.assertIsNone(tax_cache.get_active_tax())
+
+    def test_tax_created_elsewhere_is_found_by_id(self):
+        tax_cache.get_active_tax()
+        other, = Tax.objects.bulk_create([Tax(name='Other', vat_percent=Decimal(0))])
+        self.assertEqual(tax_cache.get_tax(other.pk), other)
+
+    def test_save_in_this_process(self):
+        tax_cache.get_active_tax()
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            self.tax.vat_percent = Decimal(7)
+            self.tax.save()
+        self.assertEqual(tax_cache.get_active_tax().vat_percent, Decimal(7))
+
+    def test_save_elsewhere_is_seen_after_check_interval(self):
+        self.assertEqual(tax_cache.get_active_tax().vat_percent, Decimal(5))
+        version = cache.get(tax_cache.VERSION_KEY)
+        # Another worker saves the tax and invalidates on commit
+        Tax.objects.filter(pk=self.tax.pk).update(vat_percent=Decimal(7))
+        cache.incr(tax_cache.VERSION_KEY)
+        self.assertEqual(tax_cache.get_active_tax().vat_percent, Decimal(5))
+        with self.after_check_interval():
+            self.assertEqual(tax_cache.get_active_tax().vat_percent, Decimal(7))
+        self.assertEqual(cache.get(tax_cache.VERSION_KEY), version + 1)
+
+    def test_invalidate(self):
+        tax_cache.get_active_tax()
+        version = cache.get(tax_cache.VERSION_KEY)
+        Tax.objects.filter(pk=self.tax.pk).update(vat_percent=Decimal(7))
+        tax_cache.invalidate()
+        self.assertEqual(cache.get(tax_cache.VERSION_KEY), version + 1)
+        self.assertEqual(tax_cache.get_active_tax().vat_percent, Decimal(7))
+        # A version evicted from the cache is set again
+        cache.clear()
+        tax_cache.invalidate()
+        self.assertIsNotNone(cache.get(tax_cache.VERSION_KEY))
+
+    @override_settings(SHARED_CACHE=False)
+    def test_without_a_shared_cache_reloads_after_check_interval(self):
+        tax_cache.get_active_tax()
+        # A per process cache never sees the other workers' versions
+        Tax.objects.filter(pk=self.tax.pk).update(vat_percent=Decimal(7))
+        self.assertEqual(tax_cache.get_active_tax().vat_percent, Decimal(5))
+        with self.after_check_interval(), self.assertNumQueries(1):
+            self.assertEqual(tax_cache.get_active_tax().vat_percent, Decimal(7))
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import CapitalAccount
+from .models import CapitalAccount, DocumentSequence, SearchEntry
 
 
 @admin.register(CapitalAccount)
@@ -7,3 +7,17 @@ class CapitalAccountAdmin(admin.ModelAdmin):
     list_display = ('name', 'balance', 'created_at', 'modified_at')
     search_fields = ('name',)
     readonly_fields = ('created_at', 'modified_at')
+
+
+@admin.register(DocumentSequence)
+class DocumentSequenceAdmin(admin.ModelAdmin):
+    list_display = ('prefix', 'last_value', 'modified_at')
+    readonly_fields = ('modified_at',)
+
+
+@admin.register(SearchEntry)
+class SearchEntryAdmin(admin.ModelAdmin):
+    list_display = ('kind', 'object_id', 'title', 'subtitle', 'modified_at')
+    list_filter = ('kind',)
+    search_fields = ('title',)
+    readonly_fields = ('modified_at',)
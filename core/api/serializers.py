@@ -0,0 +1,12 @@
+from rest_framework import serializers
+from core.models import SearchEntry
+
+
+class SearchHitSerializer(serializers.ModelSerializer):
+    type = serializers.CharField(source='kind')
+    id = serializers.IntegerField(source='object_id')
+    rank = serializers.IntegerField()
+
+    class Meta:
+        model = SearchEntry
+        fields = ['type', 'id', 'title', 'subtitle', 'rank']
@@ -0,0 +1,32 @@
+from rest_framework import permissions
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from core.api.serializers import SearchHitSerializer
+from core.search import INDEXED, search_entries
+
+SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+
+
+class SearchAPIView(APIView):
+    """
+    One search over invoices, delivery notes, parties and products:
+    /search/?q=ajm-20&type=sale_invoice,party&limit=20
+    Returns typed hits, best first, from the search index.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        query = request.query_params.get('q', '')
+        kinds = [kind for kind in request.query_params.get('type', '').split(',') if kind]
+        unknown = sorted(set(kinds) - set(INDEXED))
+        if unknown:
+            return Response({"error": f"Unknown type: {', '.join(unknown)}",
+                             "types": list(INDEXED)}, status=400)
+        try:
+            limit = min(int(request.query_params.get('limit', SEARCH_LIMIT)), MAX_SEARCH_LIMIT)
+        except ValueError:
+            return Response({"error": "limit must be a number"}, status=400)
+
+        hits = SearchHitSerializer(search_entries(query, kinds)[:max(limit, 1)], many=True).data
+        return Response({'query': query, 'count': len(hits), 'data': hits})
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from core.models import SearchEntry, SearchToken
+from core.search import INDEX_BATCH_SIZE, INDEXED, index_objects
+
+
+class Command(BaseCommand):
+    help = "Rebuild the unified search index from the invoices, parties and products"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kind', action='append', choices=list(INDEXED),
+                            help='Only rebuild this kind of entry, can be repeated')
+        parser.add_argument('--batch-size', type=int, default=INDEX_BATCH_SIZE,
+                            help='Number of objects indexed per batch')
+
+    def handle(self, *args, **options):
+        for kind in options['kind'] or INDEXED:
+            ids = INDEXED[kind].model.objects.order_by('pk').values_list('pk', flat=True)
+            # One transaction per kind, so searches never see it half built
+            with transaction.atomic():
+                SearchToken.objects.filter(entry__kind=kind).delete()
+                SearchEntry.objects.filter(kind=kind).delete()
+                batch = []
+                count = 0
+                for pk in ids.iterator(chunk_size=options['batch_size']):
+                    batch.append(pk)
+                    if len(batch) >= options['batch_size']:
+                        index_objects(kind, batch)
+                        count += len(batch)
+                        batch = []
+                if batch:
+                    index_objects(kind, batch)
+                    count += len(batch)
+            self.stdout.write(f"{kind}: indexed {count}")
+        self.stdout.write(self.style.SUCCESS("Search index rebuilt"))
@@ -0,0 +1,47 @@
+# Generated by Django 4.2.23 on 2026-10-18 05:43
+
+from django.db import migrations, models
+
+# prefix: (app, model, field, value of the series before its first document)
+SERIES = {
+    'AJM-': ('sale', 'SaleInvoice', 'invoice_no', 2000),
+    'QN': ('sale', 'SaleInvoice', 'quotation_number', 1),
+    'PI-': ('sale', 'SaleInvoice', 'perfoma_invoice_number', 1),
+    'DO-': ('sale', 'DeliveryNote', 'DO_id', 199),
+    'AJM-P-': ('products', 'ProductItem', 'product_code', 0),
+}
+
+
+def seed_sequences(apps, schema_editor):
+    DocumentSequence = apps.get_model('core', 'DocumentSequence')
+    for prefix, (app_label, model_name, field, start) in SERIES.items():
+        model = apps.get_model(app_label, model_name)
+        last_value = start
+        numbers = model.objects.filter(**{f'{field}__startswith': prefix}).values_list(field, flat=True)
+        for number in numbers.iterator():
+            suffix = number[len(prefix):]
+            if suffix.isdigit():
+                last_value = max(last_value, int(suffix))
+        DocumentSequence.objects.update_or_create(prefix=prefix, defaults={'last_value': last_value})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+        ('sale', '0017_saleinvoice_payment_method'),
+        ('products', '0003_productitem_product_productitem_product_type_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('prefix', models.CharField(max_length=20, unique=True)),
+                ('last_value', models.PositiveIntegerField(default=0)),
+                ('modified_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(seed_sequences, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.23 on 2026-10-18 06:16
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_documentsequence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('sale_invoice', 'Sale Invoice'), ('purchase_invoice', 'Purchase Invoice'), ('delivery_note', 'Delivery Note'), ('party', 'Party'), ('product_item', 'Product Item')], max_length=30)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('title', models.CharField(max_length=300)),
+                ('subtitle', models.CharField(blank=True, max_length=300)),
+                ('modified_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(db_index=True, max_length=100)),
+                ('weight', models.PositiveSmallIntegerField(default=1)),
+                ('entry', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tokens', to='core.searchentry')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='searchentry',
+            constraint=models.UniqueConstraint(fields=('kind', 'object_id'), name='unique_search_entry'),
+        ),
+    ]
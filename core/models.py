@@ -1,4 +1,5 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
 
 
 class CapitalAccount(models.Model):
@@ -8,4 +9,97 @@ class CapitalAccount(models.Model):
     modified_at = models.DateTimeField(auto_now=True, null=True, blank=True)
 
     def __str__(self):
-        return self.name
\ No newline at end of file
+        return self.name
+
+
+class DocumentSequence(models.Model):
+    """
+    Last number handed out in each document numbering series. The counter
+    is incremented in place and stays locked until the transaction ends,
+    so concurrent saves never share a number, a rolled back save gives its
+    number back, and the cost does not grow with the document tables.
+    """
+    SALE_INVOICE = 'AJM-'
+    QUOTATION = 'QN'
+    PERFOMA_INVOICE = 'PI-'
+    DELIVERY_NOTE = 'DO-'
+    PRODUCT_CODE = 'AJM-P-'
+
+    # Value of a series before its first document, so numbering continues
+    # from where the old generators started
+    START_VALUES = {
+        SALE_INVOICE: 2000,
+        QUOTATION: 1,
+        PERFOMA_INVOICE: 1,
+        DELIVERY_NOTE: 199,
+        PRODUCT_CODE: 0,
+    }
+
+    prefix = models.CharField(max_length=20, unique=True)
+    last_value = models.PositiveIntegerField(default=0)
+    modified_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.prefix}{self.last_value}"
+
+    @classmethod
+    def reserve(cls, prefix, count):
+        """
+        Allocate a block of count consecutive numbers of a series at once.
+
+        Returns:
+            range: the allocated values
+        """
+        with transaction.atomic():
+            sequence = cls.objects.filter(prefix=prefix)
+            if not sequence.update(last_value=F('last_value') + count):
+                cls.objects.get_or_create(prefix=prefix, defaults={
+                    'last_value': cls.START_VALUES.get(prefix, 0)})
+                sequence.update(last_value=F('last_value') + count)
+            last_value = sequence.values_list('last_value', flat=True).get()
+        return range(last_value - count + 1, last_value + 1)
+
+    @classmethod
+    def next_value(cls, prefix):
+        """Allocate the next number of a series."""
+        return cls.reserve(prefix, 1)[0]
+
+    @classmethod
+    def next_number(cls, prefix):
+        """Allocate the next document number of a series, e.g. 'AJM-2001'."""
+        return f"{prefix}{cls.next_value(prefix)}"
+
+
+class SearchEntry(models.Model):
+    """
+    A document of the unified search: a sale or purchase invoice, delivery
+    note, party or product item, with the text shown for it. Kept up to
+    date by core.signals, rebuilt with the rebuild_search_index command.
+    """
+    KIND_CHOICES = (
+        ('sale_invoice', 'Sale Invoice'),
+        ('purchase_invoice', 'Purchase Invoice'),
+        ('delivery_note', 'Delivery Note'),
+        ('party', 'Party'),
+        ('product_item', 'Product Item'),
+    )
+    kind = models.CharField(max_length=30, choices=KIND_CHOICES)
+    object_id = models.PositiveBigIntegerField()
+    title = models.CharField(max_length=300)
+    subtitle = models.CharField(max_length=300, blank=True)
+    modified_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id'], name='unique_search_entry'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.object_id}: {self.title}"
+
+
+class SearchToken(models.Model):
+    """A word of a SearchEntry; document numbers and codes weigh more than names."""
+    entry = models.ForeignKey(SearchEntry, on_delete=models.CASCADE, related_name='tokens')
+    token = models.CharField(max_length=100, db_index=True)
+    weight = models.PositiveSmallIntegerField(default=1)
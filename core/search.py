@@ -0,0 +1,170 @@
+from collections import namedtuple
+from django.db import transaction
+from django.db.models import IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from core.models import SearchEntry, SearchToken
+from customer.models import Party
+from products.models import ProductItem, normalize_search
+from products.search import token_prefix
+from purchase.models import PurchaseInvoice
+from sale.models import DeliveryNote, SaleInvoice
+
+# Objects indexed per batch, by the signals and the rebuild command
+INDEX_BATCH_SIZE = 1000
+
+# Words of a query looked up, the rest are ignored
+MAX_QUERY_WORDS = 8
+
+# Weight of an indexed value: document numbers and codes rank above names
+NUMBER, NAME, DETAIL = 3, 2, 1
+
+# model, queryset(): the rows joined to what the texts read,
+# values(obj): [(text, weight)], title(obj), subtitle(obj),
+# dependents: {kind: function(ids) -> queryset} of entries showing these objects
+Indexed = namedtuple('Indexed', ['model', 'queryset', 'values', 'title', 'subtitle', 'dependents'])
+
+
+def _join(*parts):
+    return ' - '.join(str(part) for part in parts if part)
+
+
+def _party_name(obj):
+    return obj.party.name if obj.party else None
+
+
+INDEXED = {
+    'sale_invoice': Indexed(
+        SaleInvoice,
+        lambda: SaleInvoice.objects.select_related('party'),
+        lambda invoice: [(invoice.invoice_no, NUMBER), (invoice.quotation_number, NUMBER),
+                         (invoice.perfoma_invoice_number, NUMBER), (invoice.purchase_order_number, NUMBER),
+                         (_party_name(invoice), DETAIL)],
+        lambda invoice: invoice.invoice_no or invoice.quotation_number or f"Sale Invoice #{invoice.pk}",
+        lambda invoice: _join(_party_name(invoice), invoice.sale_date, invoice.get_status_display()),
+        {'delivery_note': lambda ids: DeliveryNote.objects.filter(sale_invoice_id__in=ids)},
+    ),
+    'purchase_invoice': Indexed(
+        PurchaseInvoice,
+        lambda: PurchaseInvoice.objects.select_related('party'),
+        lambda invoice: [(invoice.invoice_no, NUMBER), (_party_name(invoice), DETAIL)],
+        lambda invoice: invoice.invoice_no,
+        lambda invoice: _join(_party_name(invoice), invoice.purchase_date, invoice.get_status_display()),
+        {},
+    ),
+    'delivery_note': Indexed(
+        DeliveryNote,
+        lambda: DeliveryNote.objects.select_related('sale_invoice__party'),
+        lambda note: [(note.DO_id, NUMBER), (note.sale_invoice.invoice_no, DETAIL)],
+        lambda note: note.DO_id,
+        lambda note: _join(note.sale_invoice.invoice_no, _party_name(note.sale_invoice)),
+        {},
+    ),
+    'party': Indexed(
+        Party,
+        lambda: Party.objects.all(),
+        lambda party: [(party.name, NAME), (party.company_name, NAME),
+                       (party.trn, NUMBER), (party.phone, NUMBER)],
+        lambda party: party.name,
+        lambda party: _join(party.company_name, party.get_type_display()),
+        {'sale_invoice': lambda ids: SaleInvoice.objects.filter(party_id__in=ids),
+         'purchase_invoice': lambda ids: PurchaseInvoice.objects.filter(party_id__in=ids)},
+    ),
+    'product_item': Indexed(
+        ProductItem,
+        lambda: ProductItem.objects.only('product_code', 'full_name'),
+        lambda item: [(item.product_code, NUMBER), (item.full_name, NAME)],
+        lambda item: item.full_name or item.product_code,
+        lambda item: item.product_code or '',
+        {},
+    ),
+}
+
+KIND_BY_MODEL = {indexed.model: kind for kind, indexed in INDEXED.items()}
+
+
+def value_tokens(text, weight):
+    words = normalize_search(str(text)).split() if text else []
+    tokens = set(words)
+    if weight == NUMBER and len(words) > 1:
+        # AJM-2001 is also found as ajm2001, a phone number without its spaces
+        tokens.add(''.join(words))
+    return {token[:100] for token in tokens}
+
+
+def entry_tokens(values):
+    """{token: weight} of an object's values, a token keeping its highest weight."""
+    tokens = {}
+    for text, weight in values:
+        for token in value_tokens(text, weight):
+            tokens[token] = max(weight, tokens.get(token, 0))
+    return tokens
+
+
+def remove_objects(kind, ids):
+    SearchToken.objects.filter(entry__kind=kind, entry__object_id__in=ids).delete()
+    SearchEntry.objects.filter(kind=kind, object_id__in=ids).delete()
+
+
+@transaction.atomic
+def index_objects(kind, ids):
+    """
+    Rewrite the search entries of these objects of a kind: their old
+    entries are deleted and the new ones written with one bulk_create of
+    entries and one of tokens per batch. The ids of the new entries are
+    read back with one query, as not every database returns them from a
+    bulk insert. Ids of deleted objects just lose their entry.
+    """
+    indexed = INDEXED[kind]
+    ids = list(ids)
+    for start in range(0, len(ids), INDEX_BATCH_SIZE):
+        batch = ids[start:start + INDEX_BATCH_SIZE]
+        remove_objects(kind, batch)
+        objects = list(indexed.queryset().filter(pk__in=batch))
+        SearchEntry.objects.bulk_create([
+            SearchEntry(kind=kind, object_id=obj.pk, title=(indexed.title(obj) or '')[:300],
+                        subtitle=(indexed.subtitle(obj) or '')[:300])
+            for obj in objects
+        ])
+        entry_ids = dict(SearchEntry.objects.filter(kind=kind, object_id__in=batch).values_list('object_id', 'id'))
+        SearchToken.objects.bulk_create([
+            SearchToken(entry_id=entry_ids[obj.pk], token=token, weight=weight)
+            for obj in objects
+            for token, weight in entry_tokens(indexed.values(obj)).items()
+        ], batch_size=INDEX_BATCH_SIZE)
+
+
+def dependent_ids(kind, ids):
+    """{kind: ids} of the entries showing text of these objects, e.g. the invoices of a party."""
+    return {
+        dependent: list(objects(ids).values_list('pk', flat=True))
+        for dependent, objects in INDEXED[kind].dependents.items()
+    }
+
+
+def reindex(kind, ids):
+    """index_objects() these objects and every entry showing their text."""
+    index_objects(kind, ids)
+    for dependent, dependent_pks in dependent_ids(kind, ids).items():
+        reindex(dependent, dependent_pks)
+
+
+def search_entries(query, kinds=None):
+    """
+    Entries with a token starting with every word of query, best first.
+    A word scores the weight of its best matching token, plus the weight
+    of the token equal to it, so exact document numbers come out on top.
+    The hits, their kind and text come from one query.
+    """
+    words = list(dict.fromkeys(normalize_search(query).split()))[:MAX_QUERY_WORDS]
+    if not words:
+        return SearchEntry.objects.none()
+    entries = SearchEntry.objects.all()
+    if kinds:
+        entries = entries.filter(kind__in=kinds)
+    tokens = SearchToken.objects.filter(entry=OuterRef('pk')).order_by('-weight').values('weight')
+    rank = Value(0, output_field=IntegerField())
+    for word in words:
+        entries = entries.filter(pk__in=SearchToken.objects.filter(token_prefix(word)).values('entry'))
+        rank = rank + Coalesce(Subquery(tokens.filter(token_prefix(word))[:1]), 0) \
+            + Coalesce(Subquery(tokens.filter(token=word)[:1]), 0)
+    return entries.annotate(rank=rank).order_by('-rank', '-modified_at', '-pk')
@@ -0,0 +1,33 @@
+from functools import partial
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from base.utils import defer_until_commit
+from core.search import KIND_BY_MODEL, dependent_ids, reindex, remove_objects
+
+
+def index_later(kind, ids):
+    # Indexed once per transaction, so a bulk import or posting is one batch
+    defer_until_commit(f'search_index:{kind}', ids, partial(reindex, kind))
+
+
+@receiver(post_save)
+def index_saved(sender, instance, raw=False, **kwargs):
+    kind = KIND_BY_MODEL.get(sender)
+    if kind is not None and not raw:
+        index_later(kind, [instance.pk])
+
+
+@receiver(pre_delete)
+def reindex_dependents(sender, instance, **kwargs):
+    # Read before the delete, which unlinks them (invoices of a deleted party)
+    kind = KIND_BY_MODEL.get(sender)
+    if kind is not None:
+        for dependent, ids in dependent_ids(kind, [instance.pk]).items():
+            index_later(dependent, ids)
+
+
+@receiver(post_delete)
+def unindex_deleted(sender, instance, **kwargs):
+    kind = KIND_BY_MODEL.get(sender)
+    if kind is not None:
+        remove_objects(kind, [instance.pk])
@@ -1,3 +1,106 @@
-from django.test import TestCase
+from importlib import import_module
+from threading import Barrier, Thread
+from unittest import mock
+from django.apps import apps
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, skipUnlessDBFeature
+from core.models import DocumentSequence, SearchEntry, SearchToken
+from core.search import index_objects, search_entries
+from customer.models import Party
+from products.models import Product, ProductItem
+from sale.models import SaleInvoice
 
-# Create your tests here.
+
+class IndexObjectsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.parties = [Party.objects.create(name=name, type='customer') for name in ('Acme Steel', 'Gulf Pipes')]
+
+    def test_tokens_point_to_their_entries_without_returned_ids(self):
+        # As on databases whose bulk inserts do not return the new ids
+        with mock.patch.object(type(connection.features), 'can_return_rows_from_bulk_insert', False):
+            index_objects('party', [party.pk for party in self.parties])
+
+        entries = dict(SearchEntry.objects.filter(kind='party').values_list('object_id', 'id'))
+        self.assertEqual(set(entries), {party.pk for party in self.parties})
+        self.assertEqual(
+            set(SearchToken.objects.filter(entry__kind='party').values_list('entry_id', 'token')),
+            {(entries[self.parties[0].pk], 'acme'), (entries[self.parties[0].pk], 'steel'),
+             (entries[self.parties[1].pk], 'gulf'), (entries[self.parties[1].pk], 'pipes')})
+        self.assertEqual([entry.object_id for entry in search_entries('gul')], [self.parties[1].pk])
+
+
+class DocumentSequenceTests(TestCase):
+    """Numbers of a series are handed out once each, without gaps."""
+    prefix = DocumentSequence.SALE_INVOICE
+
+    def test_single_numbers_and_blocks_are_unique_and_contiguous(self):
+        values = []
+        for size in (1, 3, 1, 1, 5, 2, 1):
+            if size == 1:
+                values.append(DocumentSequence.next_value(self.prefix))
+            else:
+                values += DocumentSequence.reserve(self.prefix, size)
+        # The series continues after its start value
+        self.assertEqual(values, list(range(2001, 2001 + 14)))
+        self.assertEqual(DocumentSequence.next_number(self.prefix), 'AJM-2015')
+
+    def test_series_are_independent(self):
+        self.assertEqual(DocumentSequence.next_number(DocumentSequence.DELIVERY_NOTE), 'DO-200')
+        self.assertEqual(DocumentSequence.next_number(DocumentSequence.PRODUCT_CODE), 'AJM-P-1')
+        self.assertEqual(DocumentSequence.next_number(DocumentSequence.DELIVERY_NOTE), 'DO-201')
+
+    def test_rolled_back_numbers_are_handed_out_again(self):
+        DocumentSequence.next_value(self.prefix)
+        with self.assertRaises(ZeroDivisionError), transaction.atomic():
+            DocumentSequence.reserve(self.prefix, 10)
+            1 / 0
+        self.assertEqual(DocumentSequence.next_value(self.prefix), 2002)
+
+    def test_documents_take_the_next_numbers(self):
+        customer = Party.objects.create(name='Customer', type='customer')
+        invoices = [SaleInvoice.objects.create(party=customer, status='approved') for _ in range(5)]
+        self.assertEqual([invoice.invoice_no for invoice in invoices], [f'AJM-{n}' for n in range(2001, 2006)])
+
+    def test_migration_continues_after_the_highest_existing_number(self):
+        customer = Party.objects.create(name='Customer', type='customer')
+        for invoice_no in ('AJM-2150', 'AJM-2090', 'AJM-OLD', 'X-9999'):
+            SaleInvoice.objects.create(party=customer, status='approved', invoice_no=invoice_no)
+        product = Product.objects.create(name='Pipe')
+        for code in ('AJM-P-41', 'AJM-P-7'):
+            ProductItem.objects.create(product=product, size=code, product_code=code)
+        DocumentSequence.objects.all().delete()
+
+        import_module('core.migrations.0002_documentsequence').seed_sequences(apps, None)
+        self.assertEqual(dict(DocumentSequence.objects.values_list('prefix', 'last_value')), {
+            'AJM-': 2150, 'QN': 1, 'PI-': 1, 'DO-': 199, 'AJM-P-': 41})
+        self.assertEqual(DocumentSequence.next_number(self.prefix), 'AJM-2151')
+        self.assertEqual(ProductItem.objects.create(product=product, size='new').product_code, 'AJM-P-42')
+
+
+# SQLite locks the whole database, run these against PostgreSQL or MySQL (DB_ENGINE)
+@skipUnlessDBFeature('test_db_allows_multiple_connections')
+class ConcurrentDocumentSequenceTests(TransactionTestCase):
+    writers = 8
+
+    def test_parallel_reservations_never_share_a_number(self):
+        start = Barrier(self.writers)
+        values, errors = [], []
+
+        def run(size):
+            try:
+                start.wait()
+                for _ in range(5):
+                    values.extend(DocumentSequence.reserve(DocumentSequence.SALE_INVOICE, size))
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        threads = [Thread(target=run, args=(1 + n % 3,)) for n in range(self.writers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted(values), list(range(2001, 2001 + len(values))))
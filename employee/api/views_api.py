@@ -8,6 +8,7 @@ from base.utils import log_activity
 from banking.models import CashAccount
 from employee.models import SalaryEntry, Account, Designation, EmployeeLeave
 from django.utils import timezone
+from django.db import transaction
 from rest_framework.decorators import action
 from django.db.models import Sum
 from rest_framework.response import Response
@@ -97,11 +98,12 @@ class SalaryPaymentViewSet(viewsets.ModelViewSet):
     filter_backends = [DjangoFilterBackend]
     filterset_class = SalaryPaymentFilter
 
+    @transaction.atomic
     def perform_create(self, serializer):
         instance = serializer.save(created_by=self.request.user)
         # Payment logic: affect cash/bank/check account here as needed
         from banking.models import CashAccount
-        cash_account = CashAccount.objects.first()
+        cash_account = CashAccount.get_main()
         if cash_account:
             cash_account.withdraw(instance.amount_aed, f'cash_in_{instance.payment_type}')
 
@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
+from base.models import LoadedDateMixin
 from django.utils import timezone
 
 
@@ -32,7 +33,8 @@ class Account(models.Model):
         return self.name
 
 
-class SalaryEntry(models.Model):
+class SalaryEntry(LoadedDateMixin, models.Model):
+    loaded_date_field = 'date'
     account = models.ForeignKey(Account, on_delete=models.CASCADE)
     amount_aed = models.DecimalField(max_digits=12, decimal_places=2)
     amount_usd = models.DecimalField(max_digits=12, decimal_places=2)
@@ -4,3 +4,9 @@ from .models import *
 @admin.register(Stock)
 class StockAdmin(admin.ModelAdmin):
     list_display = ('product_item', 'quantity', 'last_updated')
+
+
+@admin.register(StockMovement)
+class StockMovementAdmin(admin.ModelAdmin):
+    list_display = ('product_item', 'qty', 'balance', 'movement_type', 'source_id', 'moved_at')
+    list_filter = ('movement_type',)
@@ -4,7 +4,7 @@ from rest_framework import status, permissions
 from products.models import ProductItem
 from purchase.models import PurchaseInvoice, PurchaseItem
 from common.models import Tax
-from inventory.models import Stock
+from inventory.services import set_stock
 
 class AddStockAPIView(APIView):
     permission_classes = [permissions.IsAuthenticated]
@@ -78,18 +78,8 @@ class EditStockAPIView(APIView):
             return Response({'error': 'Invalid quantity format.'},
                           status=status.HTTP_400_BAD_REQUEST)
 
-        # Get or create stock record
-        stock, created = Stock.objects.get_or_create(
-            product_item=product_item,
-            defaults={'quantity': new_quantity}
-        )
-
-        if not created:
-            old_quantity = stock.quantity
-            stock.quantity = new_quantity
-            stock.save()
-        else:
-            old_quantity = 0
+        # Set the stock record, logging the difference in the stock ledger
+        stock, old_quantity = set_stock(product_item, new_quantity, user=request.user)
 
         return Response({
             'product_item_id': product_item.id,
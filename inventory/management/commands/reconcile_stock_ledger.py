@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum, OuterRef, Subquery
+from products.models import ProductItem
+from inventory.models import Stock, StockMovement
+from inventory.services import record_stock_movement
+
+
+class Command(BaseCommand):
+    help = "Check the stock movement ledger against Stock.quantity"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true',
+                            help='Append an adjustment movement for every product that differs')
+
+    def handle(self, *args, **options):
+        quantities = dict(Stock.objects.values_list('product_item_id', 'quantity'))
+        # Balance of the last movement recorded for each product
+        balances = dict(ProductItem.objects.annotate(balance=Subquery(
+            StockMovement.objects.filter(product_item=OuterRef('pk')).order_by('-id').values('balance')[:1]
+        )).values_list('pk', 'balance'))
+        totals = dict(StockMovement.objects.order_by().values('product_item').annotate(
+            total=Sum('qty')).values_list('product_item', 'total'))
+
+        broken = [pk for pk, total in totals.items() if total != balances.get(pk)]
+        if broken:
+            self.stdout.write(self.style.ERROR(
+                f"{len(broken)} products whose movements do not add up to their balance: {broken[:50]}"))
+
+        mismatched = {pk: quantity - totals.get(pk, 0) for pk, quantity in quantities.items()
+                      if quantity != totals.get(pk, 0)}
+        mismatched.update({pk: -total for pk, total in totals.items() if pk not in quantities and total})
+        if not mismatched:
+            self.stdout.write(self.style.SUCCESS("Stock ledger matches Stock.quantity"))
+            return
+
+        for pk, difference in list(mismatched.items())[:50]:
+            self.stdout.write(f"Product {pk}: stock {quantities.get(pk, 0)}, ledger {totals.get(pk, 0)}")
+        if not options['fix']:
+            self.stdout.write(self.style.ERROR(f"{len(mismatched)} products differ from the ledger"))
+            return
+
+        with transaction.atomic():
+            for pk, difference in mismatched.items():
+                record_stock_movement(pk, difference, StockMovement.TYPE_ADJUSTMENT)
+        self.stdout.write(self.style.SUCCESS(f"Recorded adjustments for {len(mismatched)} products"))
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.23 on 2026-10-18 05:29
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_productitem_product_productitem_product_type_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('inventory', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('qty', models.IntegerField()),
+                ('balance', models.IntegerField()),
+                ('movement_type', models.CharField(choices=[('purchase', 'Purchase'), ('sale', 'Sale'), ('sale_return', 'Sale Return'), ('purchase_return', 'Purchase Return'), ('adjustment', 'Adjustment')], max_length=20)),
+                ('source_id', models.PositiveIntegerField(blank=True, null=True)),
+                ('moved_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('product_item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_movements', to='products.productitem')),
+            ],
+            options={
+                'ordering': ['moved_at', 'id'],
+                'indexes': [models.Index(fields=['product_item', 'moved_at', 'id'], name='stock_move_product_time_idx'), models.Index(fields=['movement_type', 'source_id'], name='stock_move_source_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.23 on 2026-10-18 07:03
+
+from django.db import migrations, models
+from django.db.models import Sum
+from django.utils import timezone
+
+
+def seed_openings(apps, schema_editor):
+    """
+    One opening movement per product for the part of Stock.quantity its
+    movements do not explain, so the ledger adds up to the stock. The
+    ledger has no history before it, the openings are dated now.
+    """
+    Stock = apps.get_model('inventory', 'Stock')
+    StockMovement = apps.get_model('inventory', 'StockMovement')
+    recorded = dict(StockMovement.objects.order_by().values('product_item').annotate(
+        total=Sum('qty')).values_list('product_item', 'total'))
+    now = timezone.now()
+    openings = []
+    for product_item_id, quantity in Stock.objects.values_list('product_item_id', 'quantity').iterator():
+        qty = quantity - (recorded.get(product_item_id) or 0)
+        if qty:
+            openings.append(StockMovement(product_item_id=product_item_id, qty=qty, balance=quantity,
+                                          movement_type='opening', moved_at=now))
+    StockMovement.objects.bulk_create(openings, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0002_stockmovement'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='stockmovement',
+            name='movement_type',
+            field=models.CharField(choices=[('purchase', 'Purchase'), ('sale', 'Sale'), ('sale_return', 'Sale Return'), ('purchase_return', 'Purchase Return'), ('adjustment', 'Adjustment'), ('opening', 'Opening Balance')], max_length=20),
+        ),
+        migrations.RunPython(seed_openings, migrations.RunPython.noop),
+    ]
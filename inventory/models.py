@@ -1,8 +1,31 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 from products.models import ProductItem
 
 
+class LoadedQtyMixin:
+    """
+    Remembers the qty a row was loaded with, so a save can apply the stock
+    delta without reading the row again.
+    """
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_qty = instance.__dict__.get('qty')
+        return instance
+
+    def get_previous_qty(self):
+        """The stored qty before this save, 0 for a new row."""
+        if self.pk is None:
+            return 0
+        loaded_qty = getattr(self, '_loaded_qty', None)
+        if loaded_qty is None:
+            loaded_qty = type(self).objects.filter(pk=self.pk).values_list('qty', flat=True).first() or 0
+        return loaded_qty
+
+
 class Stock(models.Model):
     product_item = models.OneToOneField(ProductItem, on_delete=models.CASCADE, related_name='stock')
     quantity = models.IntegerField(default=0)
@@ -10,3 +33,47 @@ class Stock(models.Model):
 
     def __str__(self):
         return f"Stock for {self.product_item}: {self.quantity}"
+
+
+class StockMovement(models.Model):
+    """
+    Append-only ledger of every change to Stock.quantity, written by
+    inventory.services together with the Stock update. `moved_at` is the
+    date of the document that caused the movement, so the stock as of any
+    moment is the sum of the movements dated up to it; `balance` is the
+    stock of the product after the movement, in the order recorded.
+    """
+    TYPE_PURCHASE = 'purchase'
+    TYPE_SALE = 'sale'
+    TYPE_SALE_RETURN = 'sale_return'
+    TYPE_PURCHASE_RETURN = 'purchase_return'
+    TYPE_ADJUSTMENT = 'adjustment'
+    # Stock.quantity from before the ledger, see migration 0003
+    TYPE_OPENING = 'opening'
+    TYPE_CHOICES = [
+        (TYPE_PURCHASE, 'Purchase'),
+        (TYPE_SALE, 'Sale'),
+        (TYPE_SALE_RETURN, 'Sale Return'),
+        (TYPE_PURCHASE_RETURN, 'Purchase Return'),
+        (TYPE_ADJUSTMENT, 'Adjustment'),
+        (TYPE_OPENING, 'Opening Balance'),
+    ]
+
+    product_item = models.ForeignKey(ProductItem, on_delete=models.CASCADE, related_name='stock_movements')
+    qty = models.IntegerField()
+    balance = models.IntegerField()
+    movement_type = models.CharField(max_length=20, choices=TYPE_CHOICES)
+    # Id of the PurchaseItem, SaleItem or return entry that caused the movement
+    source_id = models.PositiveIntegerField(null=True, blank=True)
+    moved_at = models.DateTimeField(default=timezone.now)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+
+    class Meta:
+        ordering = ['moved_at', 'id']
+        indexes = [
+            models.Index(fields=['product_item', 'moved_at', 'id'], name='stock_move_product_time_idx'),
+            models.Index(fields=['movement_type', 'source_id'], name='stock_move_source_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.qty:+d} {self.product_item} ({self.movement_type}) -> {self.balance}"
@@ -0,0 +1,196 @@
+from collections import defaultdict
+from datetime import date, datetime, time
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery, Sum, Case, When, Value, IntegerField
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils import timezone
+from products.models import ProductItem
+from inventory.models import Stock, StockMovement
+from base.signals import post_bulk_save
+
+
+def _recorded_balances(products):
+    """{product_item_id: balance} of the last movement recorded for each product."""
+    balances = products.annotate(balance=Subquery(
+        StockMovement.objects.filter(product_item=OuterRef('pk')).order_by('-id').values('balance')[:1]
+    )).values_list('pk', 'balance')
+    return {pk: balance or 0 for pk, balance in balances}
+
+
+def _recorded_balance(product_item_id):
+    return StockMovement.objects.filter(product_item_id=product_item_id).order_by(
+        '-id').values_list('balance', flat=True).first() or 0
+
+
+def movement_time(day):
+    """
+    moved_at of a movement caused by a document dated day: a date is the
+    start of that day, a datetime itself and None (no document) now.
+    """
+    if day is None:
+        return timezone.now()
+    if isinstance(day, str):
+        day = parse_datetime(day) or parse_date(day)
+    if not isinstance(day, datetime):
+        day = datetime.combine(day, time.min)
+    if timezone.is_naive(day):
+        day = timezone.make_aware(day)
+    return day
+
+
+def record_stock_movement(product_item_id, qty, movement_type, source_id=None, user=None, moved_at=None):
+    """
+    Append a movement of qty to the ledger, balanced on the last movement
+    recorded for the product and dated moved_at (now by default).
+    """
+    if not qty:
+        return None
+    return StockMovement.objects.create(
+        product_item_id=product_item_id,
+        qty=qty,
+        balance=_recorded_balance(product_item_id) + qty,
+        movement_type=movement_type,
+        source_id=source_id,
+        moved_at=moved_at or timezone.now(),
+        created_by=user,
+    )
+
+
+def redate_stock_movements(movement_type, source_ids, day):
+    """Move the movements of documents whose date changed to day, see movement_time."""
+    StockMovement.objects.filter(movement_type=movement_type, source_id__in=source_ids).update(
+        moved_at=movement_time(day))
+
+
+def apply_stock_delta(product_item_id, qty, movement_type, source_id=None, user=None, create=True,
+                      moved_at=None):
+    """
+    Add qty (negative to remove) to the stock of a product with a single
+    UPDATE ... SET quantity = quantity + qty, so concurrent writers never
+    overwrite each other, and record the movement in the same transaction.
+
+    Args:
+        create: When False a product without a Stock row is left untouched,
+            as the delete paths have always done
+        moved_at: the date of the movement, see movement_time
+
+    Returns:
+        bool: whether the stock was changed
+    """
+    if not qty:
+        return False
+    with transaction.atomic():
+        stock = Stock.objects.filter(product_item_id=product_item_id)
+        if not stock.update(quantity=F('quantity') + qty, last_updated=timezone.now()):
+            if not create:
+                return False
+            Stock.objects.get_or_create(product_item_id=product_item_id)
+            stock.update(quantity=F('quantity') + qty, last_updated=timezone.now())
+        # The updated Stock row stays locked until commit, which keeps the
+        # ledger balances of one product in order
+        record_stock_movement(product_item_id, qty, movement_type, source_id, user, moved_at)
+    return True
+
+
+def apply_sold_qty_delta(purchase_item_id, qty):
+    """Add qty to PurchaseItem.sold_qty of a batch with a single UPDATE."""
+    from purchase.models import PurchaseItem
+
+    if purchase_item_id and qty:
+        PurchaseItem.objects.filter(pk=purchase_item_id).update(sold_qty=F('sold_qty') + qty)
+
+
+def _net_by_key(changes):
+    net = defaultdict(int)
+    for key, qty in changes:
+        if key and qty:
+            net[key] += qty
+    return {key: qty for key, qty in net.items() if qty}
+
+
+def _add_case(field, net):
+    """F(field) plus the delta of each row, as one CASE over the primary keys."""
+    return F(field) + Case(*[When(pk=pk, then=Value(qty)) for pk, qty in net.items()],
+                           default=Value(0), output_field=IntegerField())
+
+
+def apply_stock_deltas(changes, movement_type, user=None, create=True, moved_at=None):
+    """
+    Apply many stock changes at once: one UPDATE for the net delta of every
+    product and one INSERT for the ledger movements, whatever the number of
+    lines.
+
+    Args:
+        changes: iterable of (product_item_id, qty, source_id)
+        create: When False products without a Stock row are skipped
+        moved_at: the date of every movement, see movement_time
+    """
+    changes = [change for change in changes if change[1]]
+    if not changes:
+        return
+    with transaction.atomic():
+        product_ids = {product_item_id for product_item_id, _, _ in changes}
+        existing = set(Stock.objects.filter(product_item_id__in=product_ids).values_list(
+            'product_item_id', flat=True))
+        if create:
+            Stock.objects.bulk_create([Stock(product_item_id=pk) for pk in product_ids - existing],
+                                      ignore_conflicts=True)
+        else:
+            changes = [change for change in changes if change[0] in existing]
+            if not changes:
+                return
+        net = _net_by_key((product_item_id, qty) for product_item_id, qty, _ in changes)
+        if net:
+            stock_ids = dict(Stock.objects.filter(product_item_id__in=net).values_list('product_item_id', 'pk'))
+            Stock.objects.filter(pk__in=stock_ids.values()).update(
+                quantity=_add_case('quantity', {stock_ids[pk]: qty for pk, qty in net.items()}),
+                last_updated=timezone.now())
+
+        # Balances are read after the UPDATE has locked the stock rows
+        balances = _recorded_balances(ProductItem.objects.filter(pk__in={change[0] for change in changes}))
+        moved_at = moved_at or timezone.now()
+        movements = []
+        for product_item_id, qty, source_id in changes:
+            balances[product_item_id] += qty
+            movements.append(StockMovement(
+                product_item_id=product_item_id, qty=qty, balance=balances[product_item_id],
+                movement_type=movement_type, source_id=source_id, moved_at=moved_at, created_by=user))
+        StockMovement.objects.bulk_create(movements)
+    post_bulk_save.send(sender=StockMovement, instances=movements, created=True)
+
+
+def apply_sold_qty_deltas(changes):
+    """Add qty to PurchaseItem.sold_qty for many (purchase_item_id, qty) pairs in one UPDATE."""
+    from purchase.models import PurchaseItem
+
+    net = _net_by_key(changes)
+    if net:
+        PurchaseItem.objects.filter(pk__in=net).update(sold_qty=_add_case('sold_qty', net))
+
+
+def set_stock(product_item, quantity, user=None):
+    """Set the stock of a product to quantity, recording the difference as an adjustment."""
+    with transaction.atomic():
+        stock, _ = Stock.objects.select_for_update().get_or_create(product_item=product_item)
+        old_quantity = stock.quantity
+        stock.quantity = quantity
+        stock.save()
+        record_stock_movement(stock.product_item_id, quantity - old_quantity,
+                              StockMovement.TYPE_ADJUSTMENT, user=user)
+    return stock, old_quantity
+
+
+def _moment(as_of):
+    # A date means the end of that day
+    if isinstance(as_of, date) and not isinstance(as_of, datetime):
+        as_of = timezone.make_aware(datetime.combine(as_of, time.max))
+    return as_of
+
+
+def get_stock_as_of(product_item_id, as_of):
+    """
+    Stock of one product at a date (end of day) or datetime: the sum of the
+    movements dated up to then, whatever order they were recorded in.
+    """
+    return StockMovement.objects.filter(product_item_id=product_item_id, moved_at__lte=_moment(as_of)).aggregate(
+        total=Sum('qty'))['total'] or 0
@@ -1,3 +1,212 @@
-from django.test import TestCase
+from datetime import date, datetime
+from decimal import Decimal
+from importlib import import_module
+from io import StringIO
+from threading import Barrier, Thread
+from django.apps import apps
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F, Sum
+from django.test import TestCase, TransactionTestCase, skipUnlessDBFeature
+from django.utils import timezone
+from customer.models import Party
+from inventory.models import Stock, StockMovement
+from inventory.services import apply_sold_qty_deltas, apply_stock_delta, get_stock_as_of, set_stock
+from products.models import Product, ProductType, ProductItem
+from purchase.models import PurchaseInvoice, PurchaseItem
+from sale.models import SaleInvoice, SaleItem, SaleReturnItem, SaleReturnItemEntry
 
-# Create your tests here.
+
+def add_lot(test):
+    """Set up a product, a purchase of 100 of it and an empty approved sale on test."""
+    product = Product.objects.create(name='Pipe')
+    product_type = ProductType.objects.create(product=product, type_name='Seamless')
+    test.item = ProductItem.objects.create(product=product, product_type=product_type, size='2')
+    supplier = Party.objects.create(name='Supplier', type='supplier')
+    purchase = PurchaseInvoice.objects.create(invoice_no='P-1', party=supplier, purchase_date='2024-05-01',
+                                              status='approved')
+    test.lot = PurchaseItem.objects.create(
+        invoice=purchase, item=test.item, qty=100, unit_price_usd=Decimal('2'), unit_price_aed=Decimal('7.34'),
+        amount_usd=Decimal('200'), amount_aed=Decimal('734'), vat_amount=Decimal('36.7'))
+    customer = Party.objects.create(name='Customer', type='customer')
+    test.sale = SaleInvoice.objects.create(party=customer, sale_date='2024-05-02', status='approved')
+
+
+def sell(test, qty=2):
+    return SaleItem.objects.create(
+        invoice=test.sale, item=test.item, purchase_item=test.lot, qty=qty, sale_price_usd=Decimal('3'),
+        sale_price_aed=Decimal('11.01'), amount_usd=3 * qty, amount_aed=Decimal('11.01') * qty,
+        vat_amount=Decimal('1.1'))
+
+
+class StaleWriteTests(TestCase):
+    """Writes from copies loaded before another change keep that change, on one connection."""
+
+    @classmethod
+    def setUpTestData(cls):
+        add_lot(cls)
+
+    def assertLedger(self, quantity):
+        self.assertEqual(Stock.objects.get(product_item=self.item).quantity, quantity)
+        movements = StockMovement.objects.filter(product_item=self.item)
+        self.assertEqual(movements.aggregate(total=Sum('qty'))['total'], quantity)
+
+    def test_stale_purchase_item_keeps_sales_made_after_it_was_loaded(self):
+        stale = PurchaseItem.objects.get(pk=self.lot.pk)
+        sell(self, 3)
+        apply_sold_qty_deltas([(self.lot.pk, 4)])
+        stale.qty = 110
+        stale.save()
+
+        self.lot.refresh_from_db()
+        self.assertEqual((self.lot.qty, self.lot.sold_qty), (110, 7))
+        self.assertLedger(110 - 3)
+
+    def test_stale_stock_deltas_and_a_set_add_up(self):
+        stale = PurchaseItem.objects.get(pk=self.lot.pk)
+        apply_stock_delta(self.item.pk, 5, StockMovement.TYPE_PURCHASE)
+        sell(self)
+        stale.qty = 90
+        stale.save()
+        self.assertLedger(100 + 5 - 2 - 10)
+
+        # The adjustment is the difference from the stock at the time of the set
+        set_stock(self.item, 50)
+        self.assertLedger(50)
+        self.assertEqual(StockMovement.objects.filter(product_item=self.item).order_by('id').last().qty, 50 - 93)
+
+
+class StockLedgerTests(TestCase):
+    """Movements are dated by their documents, stock as of a date sums them."""
+
+    @classmethod
+    def setUpTestData(cls):
+        add_lot(cls)
+
+    def assertStock(self, expected):
+        """expected is {date: stock at the end of it}."""
+        self.assertEqual({day: get_stock_as_of(self.item.pk, day) for day in expected}, expected)
+
+    def test_movements_carry_the_document_dates(self):
+        sell(self)
+        self.assertStock({date(2024, 4, 30): 0, date(2024, 5, 1): 100, date(2024, 5, 2): 98})
+        # A datetime is the moment itself, a date the start of its day
+        self.assertEqual(get_stock_as_of(self.item.pk, timezone.make_aware(datetime(2024, 5, 1, 23, 59))), 100)
+
+    def test_backdated_documents_count_from_their_date(self):
+        sell(self)
+        purchase = PurchaseInvoice.objects.create(invoice_no='P-0', party=self.lot.invoice.party,
+                                                  purchase_date=date(2024, 3, 1), status='approved')
+        PurchaseItem.objects.create(invoice=purchase, item=self.item, qty=10, unit_price_usd=Decimal('2'),
+                                    unit_price_aed=Decimal('7.34'))
+        self.assertStock({date(2024, 2, 29): 0, date(2024, 3, 1): 10, date(2024, 5, 1): 110, date(2024, 5, 2): 108})
+        # The balances follow the order the movements were recorded in
+        self.assertEqual(StockMovement.objects.filter(product_item=self.item).order_by('id').last().balance, 108)
+
+    def test_moving_an_invoice_moves_its_stock(self):
+        sell(self)
+        self.sale.sale_date = date(2024, 6, 1)
+        self.sale.save()
+        self.assertStock({date(2024, 5, 2): 100, date(2024, 6, 1): 98})
+
+        purchase = PurchaseInvoice.objects.get(pk=self.lot.invoice_id)
+        purchase.purchase_date = date(2024, 4, 1)
+        purchase.save()
+        self.assertStock({date(2024, 3, 31): 0, date(2024, 4, 1): 100, date(2024, 6, 1): 98})
+
+    def test_deleting_a_document_takes_it_off_every_date(self):
+        sell(self).delete()
+        self.assertStock({date(2024, 5, 2): 100, timezone.localdate(): 100})
+        self.sale.delete()
+        PurchaseInvoice.objects.get(pk=self.lot.invoice_id).delete()
+        self.assertStock({date(2024, 5, 1): 0, timezone.localdate(): 0})
+
+    def test_returns_carry_the_return_date(self):
+        line = sell(self, 3)
+        sale_return = SaleReturnItem.objects.create(
+            sale_invoice=self.sale, return_date=timezone.make_aware(datetime(2024, 5, 10, 12)))
+        SaleReturnItemEntry.objects.create(sale_return=sale_return, sale_item=line, qty=1)
+        self.assertStock({date(2024, 5, 9): 97, date(2024, 5, 10): 98})
+
+        sale_return.return_date = timezone.make_aware(datetime(2024, 5, 20, 12))
+        sale_return.save()
+        self.assertStock({date(2024, 5, 10): 97, date(2024, 5, 20): 98})
+
+    def test_reconcile_reports_and_fixes_differences(self):
+        sell(self)
+        self.assertIn('Stock ledger matches Stock.quantity', self.reconcile())
+
+        Stock.objects.filter(product_item=self.item).update(quantity=F('quantity') + 3)
+        self.assertIn(f'Product {self.item.pk}: stock 101, ledger 98', self.reconcile())
+        self.assertEqual(StockMovement.objects.filter(movement_type=StockMovement.TYPE_ADJUSTMENT).count(), 0)
+
+        self.assertIn('Recorded adjustments for 1 products', self.reconcile('--fix'))
+        adjustment = StockMovement.objects.get(movement_type=StockMovement.TYPE_ADJUSTMENT)
+        self.assertEqual((adjustment.qty, adjustment.balance), (3, 101))
+        self.assertIn('Stock ledger matches Stock.quantity', self.reconcile())
+
+    def reconcile(self, *args):
+        out = StringIO()
+        call_command('reconcile_stock_ledger', *args, stdout=out)
+        return out.getvalue()
+
+    def test_migration_opens_the_stock_the_ledger_does_not_explain(self):
+        # Stock counted before the ledger existed
+        older = ProductItem.objects.create(product=self.item.product, size='3')
+        Stock.objects.create(product_item=older, quantity=7)
+        Stock.objects.filter(product_item=self.item).update(quantity=F('quantity') + 4)
+
+        import_module('inventory.migrations.0003_stock_opening').seed_openings(apps, None)
+        openings = StockMovement.objects.filter(movement_type=StockMovement.TYPE_OPENING)
+        self.assertEqual(set(openings.values_list('product_item', 'qty', 'balance')),
+                         {(older.pk, 7, 7), (self.item.pk, 4, 104)})
+        self.assertEqual(get_stock_as_of(older.pk, timezone.now()), 7)
+        self.assertIn('Stock ledger matches Stock.quantity', self.reconcile())
+
+
+# SQLite locks the whole database, run these against PostgreSQL or MySQL (DB_ENGINE)
+@skipUnlessDBFeature('test_db_allows_multiple_connections')
+class ConcurrentStockTests(TransactionTestCase):
+    """Stock, sold_qty and the ledger add up when threads write one product at once."""
+    writers = 6
+
+    def setUp(self):
+        add_lot(self)
+
+    def run_together(self, *targets):
+        """Run every target in its own thread and connection, started at the same time."""
+        start = Barrier(len(targets))
+        errors = []
+
+        def run(target):
+            try:
+                start.wait()
+                target()
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        threads = [Thread(target=run, args=(target,)) for target in targets]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def receive(self):
+        apply_stock_delta(self.item.pk, 5, StockMovement.TYPE_PURCHASE)
+
+    def sell(self):
+        sell(self)
+
+    def test_parallel_deltas_and_sales_add_up(self):
+        self.run_together(*[self.receive] * self.writers, *[self.sell] * self.writers)
+
+        quantity = Stock.objects.get(product_item=self.item).quantity
+        self.assertEqual(quantity, 100 + 5 * self.writers - 2 * self.writers)
+        self.lot.refresh_from_db()
+        self.assertEqual(self.lot.sold_qty, 2 * self.writers)
+        movements = StockMovement.objects.filter(product_item=self.item)
+        self.assertEqual(movements.aggregate(total=Sum('qty'))['total'], quantity)
+        self.assertEqual(movements.order_by('-moved_at', '-id').first().balance, quantity)
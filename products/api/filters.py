@@ -1,18 +1,14 @@
 import django_filters
-from django.db import models
 from products.models import ProductItem
+from products.search import search_product_items
 
 class ProductItemFilter(django_filters.FilterSet):
     search = django_filters.CharFilter(method='filter_search')
     is_stock = django_filters.BooleanFilter(method='filter_is_stock')
 
     def filter_search(self, queryset, name, value):
-        return queryset.filter(
-            models.Q(product_code__icontains=value) |
-            models.Q(grade__grade__icontains=value) |
-            models.Q(product_type__type_name__icontains=value) |
-            models.Q(product__name__icontains=value)
-        )
+        # Prefix match on the words of the name and code, through the token index
+        return search_product_items(value, queryset)
 
     def filter_is_stock(self, queryset, name, value):
         if value:
@@ -0,0 +1,18 @@
+import codecs
+import csv
+from rest_framework.parsers import BaseParser
+
+
+def csv_rows(stream, encoding='utf-8-sig'):
+    """Read CSV rows lazily as dicts keyed by the header, leaving out empty cells."""
+    for row in csv.DictReader(codecs.iterdecode(stream, encoding)):
+        yield {key.strip(): value.strip() for key, value in row.items()
+               if key and isinstance(value, str) and value.strip()}
+
+
+class CSVParser(BaseParser):
+    """text/csv request bodies, parsed into a lazy iterator of row dicts."""
+    media_type = 'text/csv'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        return csv_rows(stream)
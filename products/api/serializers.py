@@ -46,30 +46,8 @@ class ProductItemSerializer(serializers.ModelSerializer):
         return None
 
     def get_product_full_name(self, obj):
-        # Build name based on available data
-        product_name = ''
-        product_type_name = ''
-        grade_name = ''
-
-        # Get product name
-        if obj.product:
-            product_name = obj.product.name
-        elif obj.grade and obj.grade.product_type and obj.grade.product_type.product:
-            product_name = obj.grade.product_type.product.name
-
-        # Get product type name
-        if obj.product_type:
-            product_type_name = obj.product_type.type_name
-        elif obj.grade and obj.grade.product_type:
-            product_type_name = obj.grade.product_type.type_name
-
-        # Get grade name
-        if obj.grade:
-            grade_name = obj.grade.grade
-
-        # Build full name
-        parts = [product_name, product_type_name, grade_name, f"Size {obj.size}"]
-        return " - ".join([part for part in parts if part])
+        # Stored on the item, kept up to date when the hierarchy is renamed
+        return obj.full_name or obj.build_full_name()
 
 class ProductItemCreateSerializer(serializers.Serializer):
     product = serializers.CharField()
@@ -134,43 +112,3 @@ class ProductItemUpdateSerializer(serializers.ModelSerializer):
         instance.save()
 
         return instance
-
-class ProductItemBulkCreateSerializer(serializers.Serializer):
-    items = ProductItemCreateSerializer(many=True)
-
-    def create(self, validated_data):
-        items_data = validated_data['items']
-        created_items = []
-        for item_data in items_data:
-            # Create/get product (required)
-            prod_obj, _ = Product.objects.get_or_create(name=item_data['product'].strip())
-
-            # Create/get product type (optional)
-            prodtype_obj = None
-            if item_data.get('product_type') and item_data['product_type'].strip():
-                prodtype_obj, _ = ProductType.objects.get_or_create(
-                    product=prod_obj,
-                    type_name=item_data['product_type'].strip()
-                )
-
-            # Create/get grade (optional)
-            grade_obj = None
-            if item_data.get('grade') and item_data['grade'].strip() and prodtype_obj:
-                grade_obj, _ = ProductGrade.objects.get_or_create(
-                    product_type=prodtype_obj,
-                    grade=item_data['grade'].strip()
-                )
-
-            product_item_obj, created = ProductItem.objects.get_or_create(
-                product=prod_obj,
-                product_type=prodtype_obj,
-                grade=grade_obj,
-                size=item_data.get('size'),
-                defaults={
-                    'unit': item_data['unit'],
-                    'weight_kg_each': item_data.get('weight_kg_each'),
-                    'product_code': item_data.get('product_code', '').strip() or None
-                }
-            )
-            created_items.append(product_item_obj)
-        return created_items
@@ -1,3 +1,4 @@
+from collections import Counter
 from rest_framework import viewsets, status
 from rest_framework.views import APIView
 from django.forms.models import model_to_dict
@@ -5,6 +6,8 @@ from .serializers import *
 from django.utils import timezone
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
+from rest_framework.parsers import JSONParser, MultiPartParser
 from rest_framework import permissions
 from base.utils import log_activity
 from sale.models import SaleInvoice
@@ -12,6 +15,9 @@ from purchase.models import PurchaseInvoice, PurchaseItem
 from common.models import ServiceFee, Tax, Expense
 from employee.models import SalaryEntry
 from .filters import ProductItemFilter
+from .parsers import CSVParser, csv_rows
+from products.services import import_product_items
+from products.search import search_product_items
 
 class ProductViewSet(viewsets.ModelViewSet):
     queryset = Product.objects.all().order_by('-created_at')
@@ -132,6 +138,8 @@ class ProductItemViewSet(viewsets.ModelViewSet):
     queryset = ProductItem.objects.all().order_by('-created_at')
     permission_classes = [permissions.IsAuthenticated]
     filterset_class = ProductItemFilter
+    # Most rows of the deprecated unpaginated ?search= list
+    legacy_search_limit = 100
 
     def perform_create(self, serializer):
         instance = serializer.save(created_by=self.request.user)
@@ -152,15 +160,43 @@ class ProductItemViewSet(viewsets.ModelViewSet):
             return ProductItemUpdateSerializer
         return ProductItemSerializer
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ['list', 'retrieve', 'search']:
+            # Everything ProductItemSerializer walks
+            queryset = queryset.select_related(
+                'product', 'product_type__product', 'grade__product_type__product')
+        return queryset
+
     def list(self, request, *args, **kwargs):
+        """
+        Paginated product items. ?search= is deprecated: it still returns a
+        bare list for existing clients, capped at legacy_search_limit rows
+        and marked with Deprecation and Link headers pointing to search/,
+        which pages its results.
+        """
         search_query = request.query_params.get('search')
         if search_query:
-            print(search_query, "sh")
-            queryset = self.filter_queryset(self.get_queryset())
+            queryset = self.filter_queryset(self.get_queryset())[:self.legacy_search_limit]
             serializer = self.get_serializer(queryset, many=True)
-            return Response(serializer.data)
+            response = Response(serializer.data)
+            response['Deprecation'] = 'true'
+            response['Link'] = f'<{reverse("productitem-search", request=request)}>; rel="successor-version"'
+            return response
         return super().list(request, *args, **kwargs)
 
+    @action(detail=False, methods=['get'], url_path='search')
+    def search(self, request):
+        """
+        Ranked, paginated product search for typeahead: /product-items/search/?q=pipe a1
+        Every word must start a word of the item's name or product code.
+        """
+        items = search_product_items(request.query_params.get('q', ''),
+                                     self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(items)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
     @action(detail=False, methods=['get'], url_path='purchase-info')
     def full_info(self, request):
         """
@@ -243,13 +279,30 @@ class ProductItemViewSet(viewsets.ModelViewSet):
 
 
 class ProductItemBulkCreateAPIView(APIView):
+    """
+    Import catalog rows as JSON {"items": [...]}, as a text/csv body or as
+    a CSV file uploaded under "file". Re-uploading the same rows creates
+    nothing new.
+    """
     permission_classes = [permissions.IsAuthenticated]
+    parser_classes = [JSONParser, CSVParser, MultiPartParser]
 
     def post(self, request):
-        serializer = ProductItemBulkCreateSerializer(data=request.data)
-        if serializer.is_valid():
-            created_items = serializer.save()
-            return Response({
-                "created_count": len(created_items)
-            }, status=status.HTTP_201_CREATED)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        if 'file' in request.FILES:
+            rows = csv_rows(request.FILES['file'])
+        elif request.content_type.startswith(CSVParser.media_type):
+            rows = request.data
+        else:
+            rows = request.data.get('items') if isinstance(request.data, dict) else None
+            if not isinstance(rows, list):
+                return Response({"items": ["A list of items is required."]},
+                                status=status.HTTP_400_BAD_REQUEST)
+
+        results = import_product_items(rows, user=request.user)
+        counts = Counter(result['status'] for result in results)
+        return Response({
+            "created_count": counts['created'],
+            "existing_count": counts['exists'],
+            "error_count": counts['error'],
+            "results": results,
+        }, status=status.HTTP_201_CREATED)
@@ -0,0 +1,47 @@
+# Generated by Django 4.2.23 on 2026-10-18 06:06
+
+import re
+from django.db import migrations, models
+
+
+def backfill_names(apps, schema_editor):
+    # Same names as ProductItem.set_names(), the model methods are not available here
+    ProductItem = apps.get_model('products', 'ProductItem')
+    items = ProductItem.objects.select_related('product', 'product_type', 'grade__product_type').order_by('pk')
+    batch = []
+    for item in items.iterator(chunk_size=1000):
+        product_type = item.product_type or (item.grade.product_type if item.grade else None)
+        parts = [
+            item.product.name,
+            product_type.type_name if product_type else '',
+            item.grade.grade if item.grade else '',
+            f"Size {item.size}",
+        ]
+        item.full_name = " - ".join([part for part in parts if part])
+        item.search_key = ' '.join(re.findall(r'[a-z0-9]+', f"{item.full_name} {item.product_code or ''}".lower()))
+        batch.append(item)
+        if len(batch) >= 1000:
+            ProductItem.objects.bulk_update(batch, ['full_name', 'search_key'])
+            batch = []
+    ProductItem.objects.bulk_update(batch, ['full_name', 'search_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_productitem_product_productitem_product_type_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productitem',
+            name='full_name',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=300),
+        ),
+        migrations.AddField(
+            model_name='productitem',
+            name='search_key',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=350),
+        ),
+        migrations.RunPython(backfill_names, migrations.RunPython.noop),
+    ]
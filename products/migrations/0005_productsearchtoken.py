@@ -0,0 +1,35 @@
+# Generated by Django 4.2.23 on 2026-10-18 06:08
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def index_items(apps, schema_editor):
+    ProductItem = apps.get_model('products', 'ProductItem')
+    ProductSearchToken = apps.get_model('products', 'ProductSearchToken')
+    tokens = []
+    for pk, search_key in ProductItem.objects.values_list('pk', 'search_key').iterator(chunk_size=1000):
+        tokens += [ProductSearchToken(product_item_id=pk, token=word[:100]) for word in set(search_key.split())]
+        if len(tokens) >= 1000:
+            ProductSearchToken.objects.bulk_create(tokens)
+            tokens = []
+    ProductSearchToken.objects.bulk_create(tokens)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_productitem_full_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(db_index=True, max_length=100)),
+                ('product_item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to='products.productitem')),
+            ],
+        ),
+        migrations.RunPython(index_items, migrations.RunPython.noop),
+    ]
@@ -1,9 +1,15 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.db.models import Max
+from core.models import DocumentSequence
 import re
 
 
+def normalize_search(text):
+    """Lower-case words of text separated by single spaces, as stored in ProductItem.search_key."""
+    return ' '.join(re.findall(r'[a-z0-9]+', (text or '').lower()))
+
+
 class Product(models.Model):
     name = models.CharField(max_length=100)
     created_at = models.DateTimeField(auto_now_add=True, null=True, blank=True)
@@ -53,6 +59,9 @@ class ProductItem(models.Model):
     unit = models.CharField(max_length=20, default='PCs')
     weight_kg_each = models.FloatField(null=True, blank=True)
     product_code = models.CharField(max_length=20, blank=True, null=True)
+    # Stored by set_names() so lists and reports never walk the hierarchy
+    full_name = models.CharField(max_length=300, blank=True, default='', db_index=True)
+    search_key = models.CharField(max_length=350, blank=True, default='', db_index=True)
     created_at = models.DateTimeField(auto_now_add=True, null=True, blank=True)
     modified_at = models.DateTimeField(auto_now=True, null=True, blank=True)
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True,
@@ -60,36 +69,48 @@ class ProductItem(models.Model):
     modified_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True,
                                     related_name='+')
 
+    # Fields written by set_names()
+    NAME_FIELDS = ['full_name', 'search_key']
+
+    def build_full_name(self):
+        """'Product - Type - Grade - Size X', the type taken from the grade when the item has none."""
+        product_type = self.product_type
+        if product_type is None and self.grade:
+            product_type = self.grade.product_type
+        parts = [
+            self.product.name if self.product_id else '',
+            product_type.type_name if product_type else '',
+            self.grade.grade if self.grade else '',
+            f"Size {self.size}",
+        ]
+        return " - ".join([part for part in parts if part])
+
+    def set_names(self):
+        self.full_name = self.build_full_name()
+        self.search_key = normalize_search(f"{self.full_name} {self.product_code or ''}")
+
     def generate_product_code(self):
-        """Generate a unique product code with format 'AJM-<number>'"""
-        prefix = "AJM-P"
-
-        # Get all existing AJM codes and extract the highest number
-        existing_codes = ProductItem.objects.filter(
-            product_code__startswith=f"{prefix}-"
-        ).exclude(pk=self.pk).values_list('product_code', flat=True)
-
-        max_number = 0
-        for code in existing_codes:
-            try:
-                # Extract number after AJM-
-                number_part = code.replace(f"{prefix}-", "")
-                if number_part.isdigit():
-                    max_number = max(max_number, int(number_part))
-            except (ValueError, AttributeError):
-                continue
-
-        return f"{prefix}-{max_number + 1}"
+        """Generate a unique product code with format 'AJM-P-<number>'"""
+        return DocumentSequence.next_number(DocumentSequence.PRODUCT_CODE)
 
+    @transaction.atomic
     def save(self, *args, **kwargs):
+        # The code is only taken from its series if the row is saved
         if not self.product_code:
             self.product_code = self.generate_product_code()
+        self.set_names()
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], *self.NAME_FIELDS}
         super().save(*args, **kwargs)
 
     def __str__(self):
-        if self.grade:
-            return f"{self.grade} - Size {self.size}"
-        elif self.product_type:
-            return f"{self.product_type} - Size {self.size}"
-        else:
-            return f"{self.product} - Size {self.size}"
+        return self.full_name or self.build_full_name()
+
+
+class ProductSearchToken(models.Model):
+    """One word of a ProductItem's search_key, looked up by prefix through its index."""
+    product_item = models.ForeignKey(ProductItem, on_delete=models.CASCADE, related_name='search_tokens')
+    token = models.CharField(max_length=100, db_index=True)
+
+    def __str__(self):
+        return self.token
@@ -0,0 +1,64 @@
+from django.db import connection, transaction
+from django.db.models import Exists, IntegerField, OuterRef, Q
+from django.db.models.functions import Cast, Length
+from products.models import ProductItem, ProductSearchToken, normalize_search
+
+# Words of a query looked up, the rest are ignored
+MAX_QUERY_WORDS = 8
+
+
+def item_tokens(item):
+    return {word[:100] for word in item.search_key.split()}
+
+
+@transaction.atomic
+def index_items(product_item_ids):
+    """Replace the search tokens of these items with one DELETE and one bulk INSERT."""
+    ProductSearchToken.objects.filter(product_item_id__in=product_item_ids).delete()
+    items = ProductItem.objects.filter(pk__in=product_item_ids).only('search_key')
+    ProductSearchToken.objects.bulk_create([
+        ProductSearchToken(product_item_id=item.pk, token=token)
+        for item in items for token in item_tokens(item)
+    ], batch_size=1000)
+
+
+def token_prefix(word):
+    """Q matching the `token` column values that start with word."""
+    if connection.vendor == 'sqlite':
+        # SQLite only uses the index for a range, never for LIKE; tokens are
+        # [a-z0-9] so '~' sorts after any of their continuations
+        return Q(token__gte=word, token__lt=word + '~')
+    return Q(token__startswith=word)
+
+
+def _words(query):
+    return list(dict.fromkeys(normalize_search(query).split()))[:MAX_QUERY_WORDS]
+
+
+def filter_product_items(query, queryset):
+    """Items of queryset with a search token starting with every word of query."""
+    words = _words(query)
+    if not words:
+        return queryset.none()
+    for word in words:
+        queryset = queryset.filter(pk__in=ProductSearchToken.objects.filter(token_prefix(word)).values('product_item'))
+    return queryset
+
+
+def search_product_items(query, queryset=None):
+    """
+    filter_product_items() ranked best first: most words matched exactly,
+    then the shortest name.
+    """
+    if queryset is None:
+        queryset = ProductItem.objects.all()
+    queryset = filter_product_items(query, queryset)
+    rank = None
+    for word in _words(query):
+        exact = Cast(Exists(ProductSearchToken.objects.filter(product_item=OuterRef('pk'), token=word)),
+                     IntegerField())
+        rank = exact if rank is None else rank + exact
+    if rank is None:
+        return queryset
+    return queryset.annotate(search_rank=rank, name_length=Length('full_name')).order_by(
+        '-search_rank', 'name_length', 'full_name', 'pk')
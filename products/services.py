@@ -0,0 +1,179 @@
+from django.db import transaction
+from base.signals import post_bulk_save
+from core.models import DocumentSequence
+from products.models import Product, ProductType, ProductGrade, ProductItem
+
+IMPORT_CHUNK_SIZE = 1000
+
+# Items renamed per bulk UPDATE when a product, type or grade is renamed
+RENAME_BATCH_SIZE = 1000
+
+
+def _clean(value):
+    value = value.strip() if isinstance(value, str) else value
+    return value or None
+
+
+def _get_or_create_many(model, existing, wanted, key, build):
+    """
+    Map each wanted key to its row: the stored one when it exists (the
+    oldest, as get_or_create would), a new one created in a single
+    bulk_create otherwise.
+
+    Args:
+        existing: queryset of the candidate rows
+        wanted: keys to resolve
+        key: function(row) returning the key of a stored row
+        build: function(key) returning the unsaved row for a missing key
+    """
+    rows = {}
+    for row in existing.order_by('pk'):
+        rows.setdefault(key(row), row)
+    missing = [key for key in wanted if key not in rows]
+    created = model.objects.bulk_create([build(key) for key in missing])
+    rows.update(zip(missing, created))
+    post_bulk_save.send(sender=model, instances=created, created=True)
+    return rows
+
+
+@transaction.atomic
+def _import_chunk(rows, user):
+    from products.api.serializers import ProductItemCreateSerializer
+
+    results = []
+    valid = []
+    for number, row in rows:
+        serializer = ProductItemCreateSerializer(data=row)
+        if not serializer.is_valid():
+            results.append({'row': number, 'status': 'error', 'errors': serializer.errors})
+            continue
+        data = serializer.validated_data
+        product = _clean(data['product'])
+        product_type = _clean(data.get('product_type'))
+        # A grade belongs to a product type
+        grade = _clean(data.get('grade')) if product_type else None
+        valid.append((number, data, product, product_type, grade))
+
+    products = _get_or_create_many(
+        Product, Product.objects.filter(name__in={v[2] for v in valid}),
+        {v[2] for v in valid},
+        key=lambda row: row.name,
+        build=lambda name: Product(name=name, created_by=user))
+
+    type_keys = {(products[v[2]].pk, v[3]) for v in valid if v[3]}
+    types = _get_or_create_many(
+        ProductType, ProductType.objects.filter(product_id__in={key[0] for key in type_keys},
+                                                type_name__in={key[1] for key in type_keys}),
+        type_keys,
+        key=lambda row: (row.product_id, row.type_name),
+        build=lambda key: ProductType(product_id=key[0], type_name=key[1], created_by=user))
+
+    grade_keys = {(types[(products[v[2]].pk, v[3])].pk, v[4]) for v in valid if v[4]}
+    grades = _get_or_create_many(
+        ProductGrade, ProductGrade.objects.filter(product_type_id__in={key[0] for key in grade_keys},
+                                                  grade__in={key[1] for key in grade_keys}),
+        grade_keys,
+        key=lambda row: (row.product_type_id, row.grade),
+        build=lambda key: ProductGrade(product_type_id=key[0], grade=key[1], created_by=user))
+
+    def item_key(row):
+        return row.product_id, row.product_type_id, row.grade_id, row.size
+
+    existing = {}
+    for item in ProductItem.objects.filter(product_id__in={p.pk for p in products.values()}).order_by('pk'):
+        existing.setdefault(item_key(item), item)
+
+    new_items = []
+    pending = []
+    for number, data, product, product_type, grade in valid:
+        product_obj = products[product]
+        type_obj = types[(product_obj.pk, product_type)] if product_type else None
+        grade_obj = grades[(type_obj.pk, grade)] if grade else None
+        item = ProductItem(
+            product=product_obj,
+            product_type=type_obj,
+            grade=grade_obj,
+            size=data.get('size'),
+            unit=data['unit'],
+            weight_kg_each=data.get('weight_kg_each'),
+            product_code=_clean(data.get('product_code')),
+            created_by=user,
+        )
+        key = item_key(item)
+        # Rows already imported, before or earlier in this upload, are left as they are
+        if key not in existing:
+            existing[key] = item
+            new_items.append(item)
+        pending.append((number, existing[key], item is existing[key]))
+
+    uncoded = [item for item in new_items if not item.product_code]
+    if uncoded:
+        block = DocumentSequence.reserve(DocumentSequence.PRODUCT_CODE, len(uncoded))
+        for item, value in zip(uncoded, block):
+            item.product_code = f"{DocumentSequence.PRODUCT_CODE}{value}"
+    for item in new_items:
+        item.set_names()
+    ProductItem.objects.bulk_create(new_items)
+    post_bulk_save.send(sender=ProductItem, instances=new_items, created=True)
+
+    for number, item, created in pending:
+        results.append({'row': number, 'status': 'created' if created else 'exists',
+                        'id': item.pk, 'product_code': item.product_code})
+    return sorted(results, key=lambda result: result['row'])
+
+
+def import_product_items(rows, user=None, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Import catalog rows (dicts with product, product_type, grade, size,
+    unit, weight_kg_each, product_code). Rows are read lazily and imported
+    a chunk at a time: names are resolved with one query per model, the
+    missing products, types, grades and items created with bulk_create and
+    product codes taken from one reserved block. Rows matching an existing
+    item are reported, not created again, so re-uploading a file is safe.
+
+    Returns:
+        list: one result per row, {'row', 'status': 'created'|'exists'|'error',
+        'id', 'product_code'} or {'row', 'status', 'errors'}
+    """
+    results = []
+    chunk = []
+    for number, row in enumerate(rows, start=1):
+        chunk.append((number, row))
+        if len(chunk) >= chunk_size:
+            results += _import_chunk(chunk, user)
+            chunk = []
+    if chunk:
+        results += _import_chunk(chunk, user)
+    return results
+
+
+def _save_names(items):
+    count = ProductItem.objects.bulk_update(items, ProductItem.NAME_FIELDS)
+    post_bulk_save.send(sender=ProductItem, instances=items, created=False)
+    return count
+
+
+def refresh_item_names(items, batch_size=RENAME_BATCH_SIZE):
+    """
+    Recompute the stored full_name and search_key of the items in a
+    queryset, after a product, type or grade they show was renamed. Items
+    are read a batch at a time with their hierarchy joined, and the ones
+    whose name changed are written with one bulk UPDATE per batch.
+
+    Returns:
+        int: number of items renamed
+    """
+    items = items.select_related('product', 'product_type', 'grade__product_type').order_by('pk')
+    renamed = 0
+    batch = []
+    for item in items.iterator(chunk_size=batch_size):
+        names = (item.full_name, item.search_key)
+        item.set_names()
+        if (item.full_name, item.search_key) != names:
+            batch.append(item)
+        if len(batch) >= batch_size:
+            renamed += _save_names(batch)
+            batch = []
+    if batch:
+        renamed += _save_names(batch)
+    return renamed
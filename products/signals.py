@@ -0,0 +1,39 @@
+from django.db.models import Q
+from django.db.models.signals import pre_save, post_save
+from django.dispatch import receiver
+from base.utils import defer_until_commit
+from products.models import Product, ProductType, ProductGrade, ProductItem
+from products.search import index_items
+from products.services import refresh_item_names
+
+# Fields of each model that show in ProductItem.full_name, and the items showing them
+NAMED_MODELS = {
+    Product: (['name'], lambda row: Q(product=row)),
+    ProductType: (['type_name'], lambda row: Q(product_type=row) | Q(product_type__isnull=True,
+                                                                      grade__product_type=row)),
+    ProductGrade: (['grade', 'product_type'], lambda row: Q(grade=row)),
+}
+
+
+@receiver(pre_save)
+def remember_previous_name(sender, instance, raw=False, **kwargs):
+    if sender in NAMED_MODELS and instance.pk and not raw:
+        fields = [sender._meta.get_field(name).attname for name in NAMED_MODELS[sender][0]]
+        instance._previous_name = sender.objects.filter(pk=instance.pk).values_list(*fields).first()
+
+
+@receiver(post_save)
+def refresh_names_on_rename(sender, instance, created=False, raw=False, **kwargs):
+    if sender not in NAMED_MODELS or created or raw:
+        return
+    fields, affected = NAMED_MODELS[sender]
+    current = tuple(getattr(instance, sender._meta.get_field(name).attname) for name in fields)
+    if current != getattr(instance, '_previous_name', None):
+        refresh_item_names(ProductItem.objects.filter(affected(instance)))
+
+
+@receiver(post_save, sender=ProductItem)
+def product_item_saved(sender, instance, raw=False, **kwargs):
+    # Indexed once per transaction, so a bulk import or rename is one batch
+    if not raw:
+        defer_until_commit('product_search', [instance.pk], index_items)
@@ -1,3 +1,285 @@
+import time
+from unittest import mock
+from django.contrib.auth.models import User
+from django.db import connection, transaction
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from core.models import DocumentSequence
+from products.api.views_api import ProductItemViewSet
+from products.models import Product, ProductGrade, ProductType, ProductItem, ProductSearchToken, normalize_search
+from products.search import item_tokens, search_product_items
+from products.services import import_product_items, refresh_item_names
 
-# Create your tests here.
+
+class ProductItemSearchTests(TestCase):
+    """Product searches cost the same number of queries for 1 match and for many."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='clerk')
+        # Items are indexed on commit
+        with cls.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            pipe = Product.objects.create(name='Pipe')
+            seamless = ProductType.objects.create(product=pipe, type_name='Seamless')
+            ProductItem.objects.create(product=pipe, product_type=seamless, size='1')
+            flange = Product.objects.create(name='Flange')
+            for size in range(30):
+                ProductItem.objects.create(product=flange, size=str(size))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get(self, url, params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response
+
+    def assertSameQueries(self, url, one, many):
+        self.get(url, one)
+        with CaptureQueriesContext(connection) as queries:
+            self.get(url, one)
+        with self.assertNumQueries(len(queries)):
+            return self.get(url, many)
+
+    def test_search_queries_do_not_grow_with_matches(self):
+        page = self.assertSameQueries('/api/product-items/search/', {'q': 'pipe'}, {'q': 'flange'}).json()
+        self.assertEqual(page['total'], 30)
+        self.assertEqual(page['current_page_count'], 10)
+
+    def test_legacy_search_is_capped_and_deprecated(self):
+        with mock.patch.object(ProductItemViewSet, 'legacy_search_limit', 20):
+            response = self.assertSameQueries('/api/product-items/', {'search': 'pipe'}, {'search': 'flange'})
+        self.assertEqual(len(response.json()), 20)
+        self.assertEqual(response['Deprecation'], 'true')
+        self.assertIn('/api/product-items/search/', response['Link'])
+
+
+class ProductSearchLatencyTests(TestCase):
+    """Typeahead searches over a 50k item catalog stay on the token index."""
+    item_count = 50000
+    # Seconds a search request may take, far above what the index needs
+    max_seconds = 0.5
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='clerk')
+        products = [Product.objects.create(name=name) for name in ('Pipe', 'Flange', 'Valve', 'Elbow', 'Tee')]
+        items = []
+        for n in range(cls.item_count):
+            item = ProductItem(product=products[n % 5], size=f'{n % 997}x{n // 997}', product_code=f'AJM-P-{n + 1}')
+            item.set_names()
+            items.append(item)
+        ProductItem.objects.bulk_create(items, batch_size=5000)
+        # The same rows index_items() writes, without building 250k model instances
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {ProductSearchToken._meta.db_table} (product_item_id, token) VALUES (%s, %s)',
+                [(item.pk, token) for item in items for token in item_tokens(item)])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def search(self, q):
+        started = time.monotonic()
+        response = self.client.get('/api/product-items/search/', {'q': q})
+        elapsed = time.monotonic() - started
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertLess(elapsed, self.max_seconds, q)
+        return response.json()
+
+    def test_searches_answer_within_the_budget(self):
+        # From a word matching a fifth of the catalog down to a single code
+        self.assertEqual(self.search('pipe')['total'], self.item_count // 5)
+        self.assertEqual(self.search('flange 12x')['total'], 10)
+        page = self.search('ajm p 49999')
+        self.assertEqual(page['total'], 1)
+        self.assertEqual(page['data'][0]['product_code'], 'AJM-P-49999')
+        self.assertEqual(self.search('zzz')['total'], 0)
+
+    def test_words_are_looked_up_through_the_token_index(self):
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            self.skipTest('Plan format of this database is not checked')
+        plan = search_product_items('flange 12x').explain()
+        self.assertIn(ProductSearchToken._meta.db_table + '_token', plan)
+        if connection.vendor == 'sqlite':
+            self.assertNotIn(f'SCAN {ProductSearchToken._meta.db_table}', plan)
+
+
+class ProductImportTests(TestCase):
+    """Catalog imports are idempotent and take their product codes from one block per chunk."""
+    ROWS = [
+        {'product': 'Pipe', 'product_type': 'Seamless', 'grade': 'A106', 'size': '2"', 'unit': 'pcs'},
+        {'product': 'Pipe', 'size': '3"', 'unit': 'pcs', 'weight_kg_each': '4.5'},
+        {'product': 'Flange', 'size': '2"', 'unit': 'pcs', 'product_code': 'FL-2'},
+    ]
+
+    def setUp(self):
+        self.user = User.objects.create(username='clerk')
+
+    def counts(self):
+        return (Product.objects.count(), ProductType.objects.count(), ProductGrade.objects.count(),
+                ProductItem.objects.count())
+
+    def codes(self, results):
+        return [int(result['product_code'][len(DocumentSequence.PRODUCT_CODE):]) for result in results]
+
+    def test_reupload_creates_nothing_new(self):
+        first = import_product_items(self.ROWS, user=self.user)
+        self.assertEqual([(r['row'], r['status']) for r in first], [(1, 'created'), (2, 'created'), (3, 'created')])
+        self.assertEqual(self.counts(), (2, 1, 1, 3))
+        item = ProductItem.objects.get(pk=first[0]['id'])
+        self.assertEqual((item.product_type.type_name, item.grade.grade, item.unit), ('Seamless', 'A106', 'pcs'))
+        self.assertEqual(first[2]['product_code'], 'FL-2')
+        sequence = DocumentSequence.objects.get(prefix=DocumentSequence.PRODUCT_CODE).last_value
+
+        second = import_product_items(self.ROWS, user=self.user)
+        self.assertEqual([r['status'] for r in second], ['exists'] * 3)
+        self.assertEqual([(r['id'], r['product_code']) for r in second],
+                         [(r['id'], r['product_code']) for r in first])
+        self.assertEqual(self.counts(), (2, 1, 1, 3))
+        # No codes were taken for the rows already imported
+        self.assertEqual(DocumentSequence.objects.get(prefix=DocumentSequence.PRODUCT_CODE).last_value, sequence)
+
+    def test_items_created_outside_an_import_are_matched(self):
+        pipe = Product.objects.create(name='Pipe')
+        item = ProductItem.objects.create(product=pipe, size='3"', unit='pcs')
+        result, = import_product_items([{'product': ' Pipe ', 'size': '3"', 'unit': 'pcs'}])
+        self.assertEqual((result['status'], result['id']), ('exists', item.pk))
+
+    def test_duplicates_within_one_upload(self):
+        rows = self.ROWS[:2] + [dict(self.ROWS[0], product=' Pipe ', grade='A106 '), self.ROWS[1]]
+        results = import_product_items(rows, user=self.user)
+        self.assertEqual([r['status'] for r in results], ['created', 'created', 'exists', 'exists'])
+        self.assertEqual([r['id'] for r in results[2:]], [r['id'] for r in results[:2]])
+        self.assertEqual(self.counts(), (1, 1, 1, 2))
+
+    def test_duplicates_across_chunks(self):
+        results = import_product_items(self.ROWS + self.ROWS, user=self.user, chunk_size=2)
+        self.assertEqual([r['status'] for r in results], ['created'] * 3 + ['exists'] * 3)
+        self.assertEqual(self.counts(), (2, 1, 1, 3))
+
+    def test_row_errors(self):
+        rows = [{'size': '1"', 'unit': 'pcs'}, self.ROWS[1], {'product': 'Pipe', 'unit': 'pcs', 'weight_kg_each': 'x'},
+                {'product': 'Elbow'}]
+        results = import_product_items(rows, user=self.user)
+        self.assertEqual([(r['row'], r['status']) for r in results],
+                         [(1, 'error'), (2, 'created'), (3, 'error'), (4, 'error')])
+        self.assertEqual(set(results[0]['errors']), {'product'})
+        self.assertEqual(set(results[2]['errors']), {'weight_kg_each'})
+        self.assertEqual(set(results[3]['errors']), {'unit'})
+        self.assertEqual(self.counts(), (1, 0, 0, 1))
+
+    def test_codes_from_one_reserved_block(self):
+        rows = [{'product': 'Bolt', 'size': str(size), 'unit': 'pcs'} for size in range(5)]
+        rows.insert(2, {'product': 'Bolt', 'size': 'M8', 'unit': 'pcs', 'product_code': 'B-8'})
+        with mock.patch.object(DocumentSequence, 'reserve', wraps=DocumentSequence.reserve) as reserve:
+            results = import_product_items(rows, user=self.user)
+        reserve.assert_called_once_with(DocumentSequence.PRODUCT_CODE, 5)
+        del results[2]
+        codes = self.codes(results)
+        self.assertEqual(codes, list(range(codes[0], codes[0] + 5)))
+
+    def test_one_block_per_chunk(self):
+        rows = [{'product': 'Bolt', 'size': str(size), 'unit': 'pcs'} for size in range(5)]
+        with mock.patch.object(DocumentSequence, 'reserve', wraps=DocumentSequence.reserve) as reserve:
+            results = import_product_items(rows, user=self.user, chunk_size=2)
+        self.assertEqual([call.args[1] for call in reserve.call_args_list], [2, 2, 1])
+        codes = self.codes(results)
+        self.assertEqual(codes, list(range(codes[0], codes[0] + 5)))
+
+    def test_csv_upload(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        body = 'product,product_type,grade,size,unit\nPipe,Seamless,A106,2",pcs\nPipe,,,3",pcs\n,,,,pcs\n'
+        response = client.post('/api/product/bulk-create/', body, content_type='text/csv')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual({key: response.json()[key] for key in ('created_count', 'existing_count', 'error_count')},
+                         {'created_count': 2, 'existing_count': 0, 'error_count': 1})
+        response = client.post('/api/product/bulk-create/', body, content_type='text/csv')
+        self.assertEqual({key: response.json()[key] for key in ('created_count', 'existing_count', 'error_count')},
+                         {'created_count': 0, 'existing_count': 2, 'error_count': 1})
+
+
+class ItemRenameTests(TestCase):
+    """Renaming a product, type or grade rewrites the stored names of its items."""
+
+    @classmethod
+    def setUpTestData(cls):
+        with cls.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            cls.pipe = Product.objects.create(name='Pipe')
+            cls.seamless = ProductType.objects.create(product=cls.pipe, type_name='Seamless')
+            cls.grade = ProductGrade.objects.create(product_type=cls.seamless, grade='A106')
+            cls.graded = ProductItem.objects.create(product=cls.pipe, product_type=cls.seamless, grade=cls.grade,
+                                                    size='1', product_code='P-1')
+            cls.typed = ProductItem.objects.create(product=cls.pipe, product_type=cls.seamless, size='2',
+                                                   product_code='P-2')
+            # The type shown comes from the grade
+            cls.grade_only = ProductItem.objects.create(product=cls.pipe, grade=cls.grade, size='3',
+                                                        product_code='P-3')
+            cls.plain = ProductItem.objects.create(product=cls.pipe, size='4', product_code='P-4')
+            cls.flange = ProductItem.objects.create(product=Product.objects.create(name='Flange'), size='1',
+                                                    product_code='F-1')
+
+    def names(self):
+        return dict(ProductItem.objects.values_list('pk', 'full_name'))
+
+    def rename(self, row, **fields):
+        for name, value in fields.items():
+            setattr(row, name, value)
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            row.save()
+
+    def assertNames(self, expected):
+        self.assertEqual(self.names(), {item.pk: name for item, name in expected.items()})
+        for item in ProductItem.objects.select_related('product', 'product_type', 'grade__product_type'):
+            self.assertEqual(item.search_key, normalize_search(f"{item.build_full_name()} {item.product_code}"))
+            # The search index follows
+            self.assertEqual(sorted(ProductSearchToken.objects.filter(product_item=item).values_list(
+                'token', flat=True)), sorted(item_tokens(item)))
+
+    def test_product_rename(self):
+        self.rename(self.pipe, name='Tube')
+        self.assertNames({
+            self.graded: 'Tube - Seamless - A106 - Size 1', self.typed: 'Tube - Seamless - Size 2',
+            self.grade_only: 'Tube - Seamless - A106 - Size 3', self.plain: 'Tube - Size 4',
+            self.flange: 'Flange - Size 1'})
+        self.assertEqual(ProductSearchToken.objects.filter(token='tube').count(), 4)
+        self.assertFalse(ProductSearchToken.objects.filter(token='pipe').exists())
+
+    def test_type_rename(self):
+        self.rename(self.seamless, type_name='ERW')
+        self.assertNames({
+            self.graded: 'Pipe - ERW - A106 - Size 1', self.typed: 'Pipe - ERW - Size 2',
+            self.grade_only: 'Pipe - ERW - A106 - Size 3', self.plain: 'Pipe - Size 4',
+            self.flange: 'Flange - Size 1'})
+
+    def test_grade_rename_and_move(self):
+        self.rename(self.grade, grade='A53')
+        welded = ProductType.objects.create(product=self.pipe, type_name='Welded')
+        self.rename(self.grade, product_type=welded)
+        # An item with a type of its own keeps showing it
+        self.assertNames({
+            self.graded: 'Pipe - Seamless - A53 - Size 1', self.typed: 'Pipe - Seamless - Size 2',
+            self.grade_only: 'Pipe - Welded - A53 - Size 3', self.plain: 'Pipe - Size 4',
+            self.flange: 'Flange - Size 1'})
+
+    def test_saving_without_a_rename_leaves_the_items_alone(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.rename(self.pipe, modified_by=None)
+            self.rename(self.grade, grade='A106')
+        # Not even read
+        table = ProductItem._meta.db_table
+        self.assertFalse([q['sql'] for q in queries if f'"{table}"' in q['sql']])
+
+    def test_items_are_renamed_in_batches(self):
+        ProductItem.objects.update(full_name='', search_key='')
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(refresh_item_names(ProductItem.objects.all(), batch_size=2), 5)
+        table = ProductItem._meta.db_table
+        self.assertEqual(len([q for q in queries if q['sql'].startswith(f'UPDATE "{table}"')]), 3)
+        self.assertEqual(self.names()[self.grade_only.pk], 'Pipe - Seamless - A106 - Size 3')
+        # Names already stored are left alone
+        self.assertEqual(refresh_item_names(ProductItem.objects.all(), batch_size=2), 0)
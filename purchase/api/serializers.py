@@ -1,9 +1,10 @@
 from rest_framework import serializers
 from django.db import transaction
-from products.api.serializers import ProductItemSerializer
 from banking.api.serializers import PaymentEntrySerializer
 from customer.api.serializers import PartySerializer
 from purchase.models import *
+from purchase.services import create_purchase_items, update_purchase_items
+from common.services import sync_extra_charges, sync_extra_purchases
 from banking.models import PaymentEntry, CashAccount
 from inventory.models import Stock
 from common.models import ExtraCharges, ExtraPurchase
@@ -22,7 +23,7 @@ class PurchaseItemSerializer(serializers.ModelSerializer):
     def get_item(self, obj):
         if obj.item:
             data = {'product_id': obj.item.id,
-                    'product_full_name': ProductItemSerializer().get_product_full_name(obj.item)}
+                    'product_full_name': obj.item.full_name}
             return data
         return None
 
@@ -38,12 +39,18 @@ class PurchaseItemSerializer(serializers.ModelSerializer):
 
 
 class ExtraChargesSerializer(serializers.ModelSerializer):
+    # Writable so updates can match the rows already stored
+    id = serializers.IntegerField(required=False)
+
     class Meta:
         model = ExtraCharges
         fields = ['id', 'amount', 'description', 'vat', 'created_at', 'modified_at', 'created_by']
 
 
 class ExtraPurchaseSerializer(serializers.ModelSerializer):
+    # Writable so updates can match the rows already stored
+    id = serializers.IntegerField(required=False)
+
     class Meta:
         model = ExtraPurchase
         fields = ['id', 'amount', 'description', 'vat', 'created_at', 'modified_at', 'created_by']
@@ -132,25 +139,7 @@ class PurchaseInvoiceCreateSerializer(serializers.ModelSerializer):
         with transaction.atomic():
             try:
                 invoice = PurchaseInvoice.objects.create(has_tax=has_tax, **validated_data)
-                for item in items_data:
-                    PurchaseItem.objects.create(
-                        invoice=invoice,
-                        item_id=item['item'],
-                        qty=item['qty'],
-                        unit_price_usd=item['unit_price_usd'],
-                        unit_price_aed=item['unit_price_aed'],
-                        shipping_per_unit_usd=item.get('shipping_per_unit_usd', 0),
-                        shipping_per_unit_aed=item.get('shipping_per_unit_aed', 0),
-                        shipping_total_usd=item.get('shipping_total_usd', 0),
-                        shipping_total_aed=item.get('shipping_total_aed', 0),
-                        factors=item.get('factors', ''),
-                        tax_id=item.get('tax'),
-                        amount_usd=item.get('amount_usd'),
-                        amount_aed=item.get('amount_aed'),
-                        vat_amount=item.get('vat_amount'),
-                        custom_duty_usd_enter=item.get('custom_duty_usd_enter', 0),
-                        custom_duty_aed_enter=item.get('custom_duty_aed_enter', 0)
-                    )
+                lines = create_purchase_items(invoice, items_data)
                 # create extra charges if any
                 for charge in extra_charges_data:
                     ExtraCharges.objects.create(
@@ -171,7 +160,7 @@ class PurchaseInvoiceCreateSerializer(serializers.ModelSerializer):
                         created_by=self.context['request'].user
                     )
                     invoice.extra_purchases.add(ep)
-                invoice.calculate_totals()
+                invoice.calculate_totals(items=lines)
             except Exception as e:
                 transaction.set_rollback(True)
                 raise e
@@ -218,126 +207,17 @@ class PurchaseInvoiceUpdateSerializer(serializers.ModelSerializer):
             instance.has_tax = has_tax
             instance.save()
 
+            lines = None
             if items_data is not None:
-                # Map existing PurchaseItems by their id
-                existing_items = {item.id: item for item in instance.purchase_items.all()}
-                sent_item_ids = [item.get("id") for item in items_data if item.get("id")]
-
-                print(existing_items, "existing_items")
-                print(sent_item_ids, "sent_item_ids")
-
-                # Delete removed items
-                for item_id in existing_items:
-                    if item_id not in sent_item_ids:
-                        existing_items[item_id].delete()
-
-                # Create or update items
-                for item_data in items_data:
-                    item_id = item_data.get('id', None)
-                    if item_id and item_id in existing_items:
-                        # Update existing item by PurchaseItem id
-                        item_instance = existing_items[item_id]
-                        for attr, value in item_data.items():
-                            if attr == 'id':
-                                continue
-                            if attr == 'item':
-                                setattr(item_instance, 'item_id', value)
-                            elif attr == 'tax':
-                                setattr(item_instance, 'tax_id', value)
-                            else:
-                                setattr(item_instance, attr, value)
-                        item_instance.save()
-                    else:
-                        # Create new item
-                        PurchaseItem.objects.create(
-                            invoice=instance,
-                            item_id=item_data.get('item'),
-                            qty=item_data.get('qty'),
-                            unit_price_usd=item_data.get('unit_price_usd'),
-                            unit_price_aed=item_data.get('unit_price_aed'),
-                            shipping_per_unit_usd=item_data.get('shipping_per_unit_usd', 0),
-                            shipping_per_unit_aed=item_data.get('shipping_per_unit_aed', 0),
-                            shipping_total_usd=item_data.get('shipping_total_usd', 0),
-                            shipping_total_aed=item_data.get('shipping_total_aed', 0),
-                            factors=item_data.get('factors', ''),
-                            tax_id=item_data.get('tax'),
-                            amount_usd=item_data.get('amount_usd'),
-                            amount_aed=item_data.get('amount_aed'),
-                            vat_amount=item_data.get('vat_amount'),
-                            custom_duty_usd_enter=item_data.get('custom_duty_usd_enter', 0),
-                            custom_duty_aed_enter=item_data.get('custom_duty_aed_enter', 0)
-                        )
+                lines = update_purchase_items(instance, items_data)
 
             if extra_charges_data is not None:
-                # Map existing ExtraCharges by their id
-                from common.models import ExtraCharges
-                existing_charges = {ec.id: ec for ec in ExtraCharges.objects.filter(
-                    content_type=ContentType.objects.get_for_model(PurchaseInvoice),
-                    object_id=instance.id
-                )}
-                sent_charge_ids = [ec.get("id") for ec in extra_charges_data if ec.get("id")]
-
-                # Delete removed extra charges
-                for ec_id in existing_charges:
-                    if ec_id not in sent_charge_ids:
-                        existing_charges[ec_id].delete()
-
-                # Create or update extra charges
-                for charge in extra_charges_data:
-                    ec_id = charge.get('id', None)
-                    if ec_id and ec_id in existing_charges:
-                        ec_instance = existing_charges[ec_id]
-                        for attr, value in charge.items():
-                            if attr == 'id':
-                                continue
-                            setattr(ec_instance, attr, value)
-                        ec_instance.save()
-                        # No need to re-add for GenericRelation
-                    else:
-                        ExtraCharges.objects.create(
-                            content_type=ContentType.objects.get_for_model(PurchaseInvoice),
-                            object_id=instance.id,
-                            amount=charge.get('amount'),
-                            description=charge.get('description', ''),
-                            vat=charge.get('vat', 0),
-                            created_by=self.context['request'].user
-                        )
-
-        if extra_purchases_data is not None:
-            existing_purchases = {ep.id: ep for ep in instance.extra_purchases.all()}
-            sent_purchase_ids = [ep.get("id") for ep in extra_purchases_data if ep.get("id")]
-
-            # Delete removed extra purchases
-            for ep_id in existing_purchases:
-                if ep_id not in sent_purchase_ids:
-                    ep = existing_purchases[ep_id]
-                    instance.extra_purchases.remove(ep)
-                    ep.delete()
-
-            # Create or update extra purchases
-            for purchase_data in extra_purchases_data:
-                ep_id = purchase_data.get('id', None)
-                if ep_id and ep_id in existing_purchases:
-                    ep_instance = existing_purchases[ep_id]
-                    for attr, value in purchase_data.items():
-                        if attr == 'id':
-                            continue
-                        setattr(ep_instance, attr, value)
-                    ep_instance.save()
-                    # Ensure the updated instance is still in the M2M relation
-                    if ep_instance not in instance.extra_purchases.all():
-                        instance.extra_purchases.add(ep_instance)
-                else:
-                    ep = ExtraPurchase.objects.create(
-                        purchase_invoice=instance,
-                        amount=purchase_data.get('amount'),
-                        description=purchase_data.get('description', ''),
-                        vat=purchase_data.get('vat', 0),
-                        created_by=self.context['request'].user
-                    )
-                    instance.extra_purchases.add(ep)
+                sync_extra_charges(instance, extra_charges_data, self.context['request'].user)
+
+            if extra_purchases_data is not None:
+                sync_extra_purchases(instance, extra_purchases_data, self.context['request'].user)
 
-        instance.calculate_totals()
+            instance.calculate_totals(items=lines)
 
         return instance
 
@@ -388,7 +268,7 @@ class PurchaseReturnItemSerializer(serializers.ModelSerializer):
         # --- Cash Transaction for Purchase Return ---
         try:
             purchase_invoice = instance.purchase_invoice
-            cash_account = CashAccount.objects.first()
+            cash_account = CashAccount.get_main()
             if cash_account and purchase_invoice:
                 # Deposit the returned amount to the cash account
                 amount = total_returned_amount
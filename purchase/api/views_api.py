@@ -13,7 +13,7 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from common.models import ExtraPurchase
 from purchase.api.serializers import ExtraPurchaseSerializer
-from django.db.models import Sum
+from django.db.models import Sum, Prefetch
 
 
 class PurchaseInvoiceViewSet(viewsets.ModelViewSet):
@@ -22,6 +22,17 @@ class PurchaseInvoiceViewSet(viewsets.ModelViewSet):
     filter_backends = [DjangoFilterBackend]
     filterset_class = PurchaseInvoiceFilter
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ['list', 'retrieve']:
+            # Everything PurchaseInvoiceSerializer nests, whatever the page or line count
+            queryset = queryset.select_related('party').prefetch_related(
+                Prefetch('purchase_items', queryset=PurchaseItem.objects.select_related('item')),
+                'extra_charges',
+                'extra_purchases',
+            )
+        return queryset
+
     def get_serializer_class(self):
         if self.action == 'create':
             return PurchaseInvoiceCreateSerializer
@@ -64,6 +75,7 @@ class PurchaseInvoiceViewSet(viewsets.ModelViewSet):
 class PurchaseItemViewSet(viewsets.ModelViewSet):
     queryset = PurchaseItem.objects.all()
     permission_classes = [permissions.IsAuthenticated]
+    cursor_ordering = '-created_at'
     filter_backends = [DjangoFilterBackend]
     filterset_class = PurchaseItemFilter
 
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.23 on 2026-10-18 06:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('purchase', '0014_purchaseinvoice_extra_purchases'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='purchaseitem',
+            index=models.Index(fields=['created_at', 'id'], name='purchaseitem_created_idx'),
+        ),
+    ]
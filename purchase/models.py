@@ -1,16 +1,20 @@
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 from decimal import Decimal
 from django.contrib.auth.models import User
-from inventory.models import Stock
+from base.models import LoadedDateMixin
+from inventory.models import StockMovement, LoadedQtyMixin
+from inventory.services import apply_stock_delta, movement_time, redate_stock_movements
 from products.models import ProductItem
 from customer.models import Party
 from common.models import Tax
+from common import tax_cache
 from django.contrib.contenttypes.fields import GenericRelation
 from common.models import ExtraPurchase  # <-- Add this import
 
 
-class PurchaseInvoice(models.Model):
+class PurchaseInvoice(LoadedDateMixin, models.Model):
+    loaded_date_field = 'purchase_date'
     STATUS_PENDING = 'pending'
     STATUS_IN_PROGRESS = 'in_progress'
     STATUS_APPROVED = 'approved'
@@ -69,29 +73,30 @@ class PurchaseInvoice(models.Model):
     def __str__(self):
         return f"Invoice {self.invoice_no}"
 
-    def calculate_totals(self):
+    def calculate_totals(self, items=None):
+        """Recompute and store the VAT, duty and totals; items are the lines when already in memory."""
+        if items is None:
+            items = list(self.purchase_items.all())
         # Sum item amounts (already includes unit price, shipping, and custom duty per your API logic)
-        total_usd = sum([item.amount_usd or Decimal('0') for item in self.purchase_items.all()])
-        total_aed = sum([item.amount_aed or Decimal('0') for item in self.purchase_items.all()])
+        total_usd = sum([item.amount_usd or Decimal('0') for item in items])
+        total_aed = sum([item.amount_aed or Decimal('0') for item in items])
 
         # Apply discount
         discounted_usd = max(total_usd - (self.discount_usd or Decimal('0')), Decimal('0'))
         discounted_aed = max(total_aed - (self.discount_aed or Decimal('0')), Decimal('0'))
 
         # VAT calculation (on discounted total, not including custom duty)
-        tax = Tax.objects.filter(active=True).first()
-        print(tax, "Tax obj ")
-        print(self.has_tax, "Has tax")
+        tax = tax_cache.get_active_tax()
         if tax and tax.vat_percent and self.has_tax:
-            vat_usd = sum([item.vat_amount or Decimal('0') for item in self.purchase_items.all()])
-            vat_aed = sum([item.vat_amount or Decimal('0') for item in self.purchase_items.all()])
+            vat_usd = sum([item.vat_amount or Decimal('0') for item in items])
+            vat_aed = sum([item.vat_amount or Decimal('0') for item in items])
         else:
             vat_usd = Decimal('0')
             vat_aed = Decimal('0')
 
         # Custom duty (sum of all items' custom_duty_usd_enter * qty)
-        custom_duty_usd = sum([(item.custom_duty_usd_enter or Decimal('0')) * item.qty for item in self.purchase_items.all()])
-        custom_duty_aed = sum([(item.custom_duty_aed_enter or Decimal('0')) * item.qty for item in self.purchase_items.all()])
+        custom_duty_usd = sum([(item.custom_duty_usd_enter or Decimal('0')) * item.qty for item in items])
+        custom_duty_aed = sum([(item.custom_duty_aed_enter or Decimal('0')) * item.qty for item in items])
 
         self.vat_amount_usd = vat_usd
         self.vat_amount_aed = vat_aed
@@ -111,25 +116,33 @@ class PurchaseInvoice(models.Model):
             custom_duty_usd=self.custom_duty_usd,
             custom_duty_aed=self.custom_duty_aed
         )
+        # update() sends no post_save, the purchase facts carry these totals
+        from report.signals import mark_facts_dirty
+        mark_facts_dirty('purchases', [self.purchase_date])
 
     def save(self, *args, **kwargs):
+        previous_date = self.get_previous_date()
         super().save(*args, **kwargs)
+        # The stock movements of the lines carry the invoice date
+        if previous_date is not None and movement_time(previous_date) != movement_time(self.purchase_date):
+            redate_stock_movements(StockMovement.TYPE_PURCHASE, self.purchase_items.values('pk'),
+                                   self.purchase_date)
 
+    @transaction.atomic
     def delete(self, *args, **kwargs):
+        moved_at = movement_time(self.purchase_date)
         # Restock inventory for each purchase item before deleting
         for purchase_item in self.purchase_items.all():
             # Restock: add back the qty to stock
-            stock = Stock.objects.filter(product_item=purchase_item.item).first()
-            if stock:
-                stock.quantity -= purchase_item.qty
-                stock.save()
+            apply_stock_delta(purchase_item.item_id, -purchase_item.qty, StockMovement.TYPE_PURCHASE,
+                              purchase_item.pk, create=False, moved_at=moved_at)
             # Optionally, handle related sale items if you want to update them
 
         self.purchase_items.all().delete()
         super().delete(*args, **kwargs)
 
 
-class PurchaseItem(models.Model):
+class PurchaseItem(LoadedQtyMixin, models.Model):
     invoice = models.ForeignKey(PurchaseInvoice, on_delete=models.CASCADE,
                                 related_name='purchase_items', null=True, blank=True)
     item = models.ForeignKey(ProductItem, on_delete=models.CASCADE)
@@ -174,6 +187,12 @@ class PurchaseItem(models.Model):
     tax = models.ForeignKey(Tax, on_delete=models.PROTECT,
                             related_name="purchase_items" , null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            # Order of the ?cursor= pages of purchase-items/
+            models.Index(fields=['created_at', 'id'], name='purchaseitem_created_idx'),
+        ]
+
 
 
     @property
@@ -184,13 +203,15 @@ class PurchaseItem(models.Model):
     @property
     def vat_amount_usd(self):
         """Calculate VAT in USD based on amount_usd and tax percent."""
-        vat_rate = self.tax.vat_percent if self.tax is not None else 0
+        tax = tax_cache.get_tax(self.tax_id)
+        vat_rate = tax.vat_percent if tax is not None else 0
         return (self.amount_usd or Decimal('0')) * (vat_rate / 100)
 
     @property
     def vat_amount_aed(self):
         """Calculate VAT in AED based on amount_aed and tax percent."""
-        vat_rate = self.tax.vat_percent if self.tax is not None else 0
+        tax = tax_cache.get_tax(self.tax_id)
+        vat_rate = tax.vat_percent if tax is not None else 0
         return (self.amount_aed or Decimal('0')) * (vat_rate / 100)
 
     def calculate_totals(self):
@@ -207,7 +228,8 @@ class PurchaseItem(models.Model):
         self.custom_duty_aed_total = (self.custom_duty_aed_enter or Decimal('0')) * self.qty
 
         # Calculate VAT per unit
-        vat_rate = self.tax.vat_percent if self.tax else Decimal('0')
+        tax = tax_cache.get_tax(self.tax_id)
+        vat_rate = tax.vat_percent if tax else Decimal('0')
         # Ensure all operands are Decimal for base_usd and base_aed
         base_usd = (Decimal(str(self.total_price_usd)) +
                     Decimal(str(self.shipping_total_usd)) +
@@ -227,37 +249,33 @@ class PurchaseItem(models.Model):
         self.vat_total_aed = self.vat_per_unit_aed * self.qty
 
 
+    def moved_at(self):
+        """Date of the stock movements of this line: its invoice's, now without one."""
+        return movement_time(self.invoice.purchase_date if self.invoice_id else None)
+
+    @transaction.atomic
     def save(self, *args, **kwargs):
         self.calculate_totals()
-        is_new = self.pk is None
-        previous_qty = 0
-
-        if not is_new:
-            try:
-                previous = PurchaseItem.objects.get(pk=self.pk)
-                previous_qty = previous.qty
-            except PurchaseItem.DoesNotExist:
-                previous_qty = 0
+        qty_difference = self.qty - self.get_previous_qty()
+        if (self.pk is not None and not self._state.adding and not kwargs.get('force_insert')
+                and kwargs.get('update_fields') is None):
+            # sold_qty only moves with apply_sold_qty_delta(s); writing the
+            # value loaded here would undo sales made since
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name != 'sold_qty']
 
         # Save the item first
         super().save(*args, **kwargs)
+        self._loaded_qty = self.qty
 
         # Update stock based on quantity changes
-        stock, _ = Stock.objects.get_or_create(product_item=self.item)
-        if is_new:
-            # Only add the new qty
-            stock.quantity += self.qty
-        else:
-            # Only add the difference
-            qty_difference = self.qty - previous_qty
-            stock.quantity += qty_difference
-        stock.save()
+        apply_stock_delta(self.item_id, qty_difference, StockMovement.TYPE_PURCHASE, self.pk,
+                          moved_at=self.moved_at() if qty_difference else None)
 
+    @transaction.atomic
     def delete(self, *args, **kwargs):
-        stock = Stock.objects.filter(product_item=self.item).first()
-        if stock:
-            stock.quantity -= self.qty
-            stock.save()
+        apply_stock_delta(self.item_id, -self.qty, StockMovement.TYPE_PURCHASE, self.pk, create=False,
+                          moved_at=self.moved_at())
         super().delete(*args, **kwargs)
 
     def __str__(self):
@@ -266,7 +284,8 @@ class PurchaseItem(models.Model):
 
 # Remove old PurchaseReturnItem model and add new models for multi-item returns
 
-class PurchaseReturnItem(models.Model):
+class PurchaseReturnItem(LoadedDateMixin, models.Model):
+    loaded_date_field = 'return_date'
     purchase_invoice = models.ForeignKey('PurchaseInvoice', on_delete=models.CASCADE, related_name='return_items')
     returned_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='+')
     return_date = models.DateTimeField(default=timezone.now)
@@ -276,48 +295,44 @@ class PurchaseReturnItem(models.Model):
 
     def save(self, *args, **kwargs):
         is_new = self.pk is None
+        previous_date = self.get_previous_date()
         super().save(*args, **kwargs)
-        # Stock update handled in entry save
+        # Stock update handled in entry save, its movements carry the return date
+        if previous_date is not None and movement_time(previous_date) != movement_time(self.return_date):
+            redate_stock_movements(StockMovement.TYPE_PURCHASE_RETURN, self.entries.values('pk'), self.return_date)
 
+    @transaction.atomic
     def delete(self, *args, **kwargs):
+        moved_at = movement_time(self.return_date)
         # Revert stock for all returned items
-        for entry in self.entries.all():
-            stock = Stock.objects.filter(product_item=entry.purchase_item.item).first()
-            if stock:
-                stock.quantity += entry.qty
-                stock.save()
+        for entry in self.entries.select_related('purchase_item'):
+            apply_stock_delta(entry.purchase_item.item_id, entry.qty, StockMovement.TYPE_PURCHASE_RETURN,
+                              entry.pk, create=False, moved_at=moved_at)
         self.entries.all().delete()
         super().delete(*args, **kwargs)
 
     def __str__(self):
         return f"Return for Invoice {self.purchase_invoice.id} ({self.entries.count()} items)"
 
-class PurchaseReturnItemEntry(models.Model):
+class PurchaseReturnItemEntry(LoadedQtyMixin, models.Model):
     purchase_return = models.ForeignKey(PurchaseReturnItem, on_delete=models.CASCADE, related_name='entries')
     purchase_item = models.ForeignKey('PurchaseItem', on_delete=models.CASCADE)
     qty = models.PositiveIntegerField()
     remarks = models.TextField(blank=True, null=True)
 
+    @transaction.atomic
     def save(self, *args, **kwargs):
-        is_new = self.pk is None
-        previous_qty = 0
-        if not is_new:
-            previous = PurchaseReturnItemEntry.objects.get(pk=self.pk)
-            previous_qty = previous.qty
+        qty_difference = self.qty - self.get_previous_qty()
         super().save(*args, **kwargs)
+        self._loaded_qty = self.qty
         # Update stock for the returned item
-        stock, _ = Stock.objects.get_or_create(product_item=self.purchase_item.item)
-        if is_new:
-            stock.quantity -= self.qty
-        else:
-            stock.quantity -= (self.qty - previous_qty)
-        stock.save()
+        apply_stock_delta(self.purchase_item.item_id, -qty_difference, StockMovement.TYPE_PURCHASE_RETURN, self.pk,
+                          moved_at=movement_time(self.purchase_return.return_date) if qty_difference else None)
 
+    @transaction.atomic
     def delete(self, *args, **kwargs):
-        stock = Stock.objects.filter(product_item=self.purchase_item.item).first()
-        if stock:
-            stock.quantity += self.qty
-            stock.save()
+        apply_stock_delta(self.purchase_item.item_id, self.qty, StockMovement.TYPE_PURCHASE_RETURN, self.pk, create=False,
+                          moved_at=movement_time(self.purchase_return.return_date))
         super().delete(*args, **kwargs)
 
     def __str__(self):
@@ -0,0 +1,102 @@
+from django.db import transaction
+from base.signals import post_bulk_save
+from base.utils import sync_rows
+from inventory.models import StockMovement
+from inventory.services import movement_time, apply_stock_deltas
+from purchase.models import PurchaseItem
+
+
+def _build_purchase_item(invoice, item):
+    line = PurchaseItem(
+        invoice=invoice,
+        item_id=item['item'],
+        qty=item['qty'],
+        unit_price_usd=item['unit_price_usd'],
+        unit_price_aed=item['unit_price_aed'],
+        shipping_per_unit_usd=item.get('shipping_per_unit_usd', 0),
+        shipping_per_unit_aed=item.get('shipping_per_unit_aed', 0),
+        shipping_total_usd=item.get('shipping_total_usd', 0),
+        shipping_total_aed=item.get('shipping_total_aed', 0),
+        factors=item.get('factors', ''),
+        tax_id=item.get('tax'),
+        amount_usd=item.get('amount_usd'),
+        amount_aed=item.get('amount_aed'),
+        vat_amount=item.get('vat_amount'),
+        custom_duty_usd_enter=item.get('custom_duty_usd_enter', 0),
+        custom_duty_aed_enter=item.get('custom_duty_aed_enter', 0)
+    )
+    line.calculate_totals()
+    return line
+
+
+@transaction.atomic
+def create_purchase_items(invoice, items_data):
+    """
+    Create the lines of a purchase invoice in bulk. Line totals are computed
+    in memory, the lines inserted with one bulk_create and stock moved once
+    per product, so the query count does not grow with the number of lines.
+
+    Args:
+        invoice: the saved PurchaseInvoice
+        items_data: validated PurchaseItemNestedSerializer data
+
+    Returns:
+        list: the created PurchaseItems
+    """
+    lines = [_build_purchase_item(invoice, item) for item in items_data]
+    PurchaseItem.objects.bulk_create(lines)
+    for line in lines:
+        line._loaded_qty = line.qty
+
+    apply_stock_deltas([(line.item_id, line.qty, line.pk) for line in lines], StockMovement.TYPE_PURCHASE,
+                       moved_at=movement_time(invoice.purchase_date))
+    post_bulk_save.send(sender=PurchaseItem, instances=lines, created=True)
+    return lines
+
+
+@transaction.atomic
+def update_purchase_items(invoice, items_data):
+    """
+    Bring the lines of a purchase invoice in line with the sent ones.
+    Unchanged lines are not written; new, changed and removed lines go in
+    with one bulk_create, one bulk_update and one delete, and stock moves by
+    the net change of each product.
+
+    Args:
+        invoice: the saved PurchaseInvoice
+        items_data: validated PurchaseItemNestedSerializer data, existing
+            lines carrying their 'id'
+
+    Returns:
+        list: every PurchaseItem of the invoice after the update
+    """
+    changes = sync_rows(
+        PurchaseItem,
+        {line.pk: line for line in invoice.purchase_items.all()},
+        items_data,
+        build=lambda item: _build_purchase_item(invoice, item),
+        prepare=lambda line: line.calculate_totals(),
+        attnames={'item': 'item_id', 'tax': 'tax_id'},
+    )
+
+    moved_at = movement_time(invoice.purchase_date)
+    stock = {}
+
+    def move(product_item_id, qty, source_id):
+        key = (product_item_id, source_id)
+        stock[key] = stock.get(key, 0) + qty
+
+    for line in changes.created:
+        move(line.item_id, line.qty, line.pk)
+    for line, before in changes.updated:
+        move(before['item_id'], -before['qty'], line.pk)
+        move(line.item_id, line.qty, line.pk)
+    for line in changes.rows:
+        line._loaded_qty = line.qty
+
+    apply_stock_deltas([(pid, qty, source_id) for (pid, source_id), qty in stock.items()],
+                       StockMovement.TYPE_PURCHASE, moved_at=moved_at)
+    # As PurchaseItem.delete, removed lines only reduce existing stock rows
+    apply_stock_deltas([(line.item_id, -line.qty, line.pk) for line in changes.removed],
+                       StockMovement.TYPE_PURCHASE, create=False, moved_at=moved_at)
+    return changes.rows
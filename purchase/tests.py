@@ -1,3 +1,124 @@
-from django.test import TestCase
+from decimal import Decimal
+from itertools import cycle, islice
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.db.models import Sum
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from common.models import Tax
+from customer.models import Party
+from inventory.models import Stock
+from products.models import Product, ProductType, ProductItem
+from purchase.models import PurchaseInvoice, PurchaseItem
+from report.models import PurchaseFact
 
-# Create your tests here.
+
+# Taxes are otherwise reloaded every CHECK_INTERVAL, a query depending on the clock
+@override_settings(SHARED_CACHE=True)
+class PurchaseInvoiceQueryTests(TestCase):
+    """Saving a purchase invoice costs the same number of queries for 1 line and for N."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tax = Tax.objects.create(vat_percent=Decimal('5'))
+        cls.user = User.objects.create(username='buyer')
+        cls.supplier = Party.objects.create(name='Supplier', type='supplier')
+        product = Product.objects.create(name='Pipe')
+        product_type = ProductType.objects.create(product=product, type_name='Seamless')
+        cls.items = [ProductItem.objects.create(product=product, product_type=product_type, size=str(size))
+                     for size in range(5)]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def lines(self, count, qty=10):
+        return [dict(item=item.pk, tax=self.tax.pk, qty=qty, unit_price_usd='2.50', unit_price_aed='9.18',
+                     amount_usd='25', amount_aed='91.8', vat_amount='4.59')
+                for item in islice(cycle(self.items), count)]
+
+    def send(self, method, url, data):
+        # The work deferred to the commit is counted too
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            response = getattr(self.client, method)(url, data, format='json')
+        self.assertLess(response.status_code, 300, response.content)
+        return response
+
+    def create(self, count):
+        number = PurchaseInvoice.objects.count() + 1
+        return self.send('post', '/api/purchase-invoices/', {
+            'invoice_no': f'B-{number}', 'party_id': self.supplier.pk, 'purchase_date': '2024-05-05',
+            'status': 'approved', 'items': self.lines(count)})
+
+    def update(self, count):
+        self.create(count)
+        invoice = PurchaseInvoice.objects.latest('pk')
+        lines = [dict(line, id=row.pk) for line, row in
+                 zip(self.lines(count, qty=12), invoice.purchase_items.order_by('pk'))]
+        with CaptureQueriesContext(connection) as queries:
+            self.send('put', f'/api/purchase-invoices/{invoice.pk}/', {
+                'invoice_no': invoice.invoice_no, 'party_id': self.supplier.pk, 'purchase_date': '2024-05-06',
+                'status': 'approved', 'items': lines})
+        return len(queries)
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_list_queries_do_not_grow_with_invoices(self):
+        self.create(2)
+        self.get('/api/purchase-invoices/')
+        with CaptureQueriesContext(connection) as queries:
+            self.get('/api/purchase-invoices/')
+        # The log of the queries is cleared by the next request
+        count = len(queries)
+        for _ in range(19):
+            self.create(2)
+        # A page holds 10 invoices, each with its lines, party and extra charges
+        with self.assertNumQueries(count):
+            page = self.get('/api/purchase-invoices/')
+        self.assertEqual(page['total'], 20)
+        self.assertEqual([len(invoice['purchase_items']) for invoice in page['data']], [2] * 10)
+
+    def test_retrieve_queries_do_not_grow_with_lines(self):
+        self.create(1)
+        one = PurchaseInvoice.objects.latest('pk')
+        self.create(50)
+        fifty = PurchaseInvoice.objects.latest('pk')
+        self.get(f'/api/purchase-invoices/{one.pk}/')
+        with CaptureQueriesContext(connection) as queries:
+            self.get(f'/api/purchase-invoices/{one.pk}/')
+        with self.assertNumQueries(len(queries)):
+            invoice = self.get(f'/api/purchase-invoices/{fifty.pk}/')
+        self.assertEqual(len(invoice['purchase_items']), 50)
+
+    def test_create_queries_do_not_grow_with_lines(self):
+        # The first save creates the stock rows of the items
+        self.create(5)
+        with CaptureQueriesContext(connection) as queries:
+            self.create(1)
+        with self.assertNumQueries(len(queries)):
+            self.create(5)
+        self.assertEqual(PurchaseItem.objects.count(), 11)
+        self.assertEqual(Stock.objects.get(product_item=self.items[0]).quantity, 30)
+
+    def test_update_queries_do_not_grow_with_lines(self):
+        self.update(5)
+        self.assertEqual(self.update(1), self.update(5))
+        self.assertEqual(Stock.objects.get(product_item=self.items[4]).quantity, 24)
+
+    def test_recalculated_totals_reach_the_facts(self):
+        self.create(2)
+        invoice = PurchaseInvoice.objects.latest('pk')
+        # A discount stored without signals, picked up by the next recalculation
+        PurchaseInvoice.objects.filter(pk=invoice.pk).update(discount_aed=Decimal('5'))
+        invoice.refresh_from_db()
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            invoice.calculate_totals()
+        invoice.refresh_from_db()
+
+        facts = PurchaseFact.objects.filter(date=invoice.purchase_date).aggregate(
+            total=Sum('total_with_vat_aed'), discount=Sum('discount_aed'))
+        self.assertEqual(facts, {'total': invoice.total_with_vat_aed, 'discount': Decimal('5')})
@@ -1,21 +1,24 @@
 from rest_framework.views import APIView
 from django.db.models import Sum
-from decimal import Decimal
 from rest_framework.response import Response
 from rest_framework import permissions
 from base.api.pagination import CustomPagination
 from collections import defaultdict
-from django.db.models import Q
+from django.db.models import Q, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from products.api.serializers import ProductItemSerializer
 from products.models import ProductItem
+from products.search import filter_product_items
 from purchase.models import PurchaseInvoice, PurchaseItem, PurchaseReturnItemEntry
 from sale.models import SaleInvoice, SaleItem, SaleReturnItemEntry
-from common.models import Expense, Wage
-from employee.models import SalaryEntry
 from inventory.models import Stock
+from report.models import FifoAllocation
 from report.helpers.balance_sheet import get_balance_sheet_report
 from report.helpers.montly_report import get_yearly_summary_report
 from report.helpers.profict_loss import get_profit_and_loss_report
+from report.helpers.purchase_sales import get_purchase_sales_report
+from report.helpers.tax_summary import get_tax_summary
+from report.cache import cached_report
 from rest_framework import status
 
 
@@ -24,50 +27,52 @@ class InventoryReportAPIView(APIView):
     pagination_class = CustomPagination
 
     def get(self, request):
+        return Response(cached_report('inventory', request, lambda: self.get_report(request)))
+
+    def get_report(self, request):
         # Get search query parameter
         search = request.query_params.get('search', '').strip()
 
-        # Start with all items
-        items = ProductItem.objects.all()
+        # Start with all items, joining everything the serializer walks
+        items = ProductItem.objects.select_related(
+            'stock', 'product', 'product_type__product',
+            'grade__product_type__product')
 
         # Apply search filters if search query is provided
         if search:
-            search_filter = Q()
-            search_filter |= Q(product__name__icontains=search)
-            search_filter |= Q(product_type__type_name__icontains=search)
-            search_filter |= Q(grade__grade__icontains=search)
-            search_filter |= Q(size__icontains=search)
-            search_filter |= Q(product_code__icontains=search)
-
-            items = items.filter(search_filter)
-
-        items = items.order_by('-stock__last_updated')
+            # Prefix match on the words of the name and code, through the token index
+            items = filter_product_items(search, items)
+
+        # Approved purchased / sold quantities as correlated sums so the
+        # whole page is fetched in one query
+        purchased = PurchaseItem.objects.filter(
+            item=OuterRef('pk'), invoice__status=PurchaseInvoice.STATUS_APPROVED
+        ).values('item').annotate(total=Sum('qty')).values('total')
+        sold = SaleItem.objects.filter(
+            item=OuterRef('pk'), invoice__status=SaleInvoice.STATUS_APPROVED
+        ).values('item').annotate(total=Sum('qty')).values('total')
+
+        items = items.annotate(
+            purchased=Coalesce(Subquery(purchased), 0),
+            sold=Coalesce(Subquery(sold), 0),
+        ).order_by('-stock__last_updated', '-pk')
+
+        # Paginate in the database, then serialize only the current page
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(items, request, view=self)
 
         result = []
-        for item in items:
-            # Use correct field name for Stock model
-            stock_obj = Stock.objects.filter(product_item=item).first()
-            stock = stock_obj.quantity if stock_obj else 0
-
-            purchased = PurchaseItem.objects.filter(item=item, invoice__status=PurchaseInvoice.STATUS_APPROVED).aggregate(total=Sum('qty'))['total'] or 0
-            sold = SaleItem.objects.filter(item=item, invoice__status=SaleInvoice.STATUS_APPROVED).aggregate(total=Sum('qty'))['total'] or 0
-
+        for item in page:
+            stock_obj = getattr(item, 'stock', None)
             result.append({
                 'item': ProductItemSerializer(item).data,
-                'purchased': purchased,
-                'sold': sold,
-                'stock': stock,
+                'purchased': item.purchased,
+                'sold': item.sold,
+                'stock': stock_obj.quantity if stock_obj else 0,
                 'stock_id': stock_obj.id if stock_obj else None
             })
 
-        # Apply pagination only if no search query
-        if not search:
-            paginator = self.pagination_class()
-            page = paginator.paginate_queryset(result, request)
-            if page is not None:
-                return paginator.get_paginated_response(page)
-
-        return Response(result)
+        return paginator.get_paginated_response(result).data
 
 
 
@@ -75,132 +80,11 @@ class PurchaseSalesReportAPIView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        # --- Parse date filters from query params ---
-        start_date = request.query_params.get('start_date')
-        end_date = request.query_params.get('end_date')
+        return Response(cached_report('purchase_sales', request, lambda: self.get_report(request)))
 
-        purchase_filters = {}
-        sales_filters = {}
-
-        if start_date:
-            purchase_filters['purchase_date__gte'] = start_date
-            sales_filters['sale_date__gte'] = start_date
-        if end_date:
-            purchase_filters['purchase_date__lte'] = end_date
-            sales_filters['sale_date__lte'] = end_date
-
-        # PURCHASES
-        purchase_invoices = PurchaseInvoice.objects.filter(
-            status=PurchaseInvoice.STATUS_APPROVED, **purchase_filters)
-        total_purchase_with_vat_usd = purchase_invoices.aggregate(total=Sum('total_with_vat_usd'))['total'] or Decimal('0')
-        total_purchase_with_vat_aed = purchase_invoices.aggregate(total=Sum('total_with_vat_aed'))['total'] or Decimal('0')
-        total_purchase_vat_usd = purchase_invoices.aggregate(total=Sum('vat_amount_usd'))['total'] or Decimal('0')
-        total_purchase_vat_aed = purchase_invoices.aggregate(total=Sum('vat_amount_aed'))['total'] or Decimal('0')
-        total_purchase_without_vat_usd = total_purchase_with_vat_usd - total_purchase_vat_usd
-        total_purchase_without_vat_aed = total_purchase_with_vat_aed - total_purchase_vat_aed
-
-        total_purchase_discount_usd = \
-        purchase_invoices.aggregate(total=Sum('discount_usd'))[
-            'total'] or Decimal('0')
-        total_purchase_discount_aed = \
-        purchase_invoices.aggregate(total=Sum('discount_aed'))[
-            'total'] or Decimal('0')
-
-        purchase_ids = list(purchase_invoices.values_list('id', flat=True))
-        purchase_shipping_usd = PurchaseItem.objects.filter(invoice_id__in=purchase_ids).aggregate(
-            total=Sum('shipping_per_unit_usd'))['total'] or Decimal('0')
-        purchase_shipping_aed = PurchaseItem.objects.filter(invoice_id__in=purchase_ids).aggregate(
-            total=Sum('shipping_per_unit_aed'))['total'] or Decimal('0')
-
-
-        # SALES
-        sales_invoices = SaleInvoice.objects.filter(
-            status=SaleInvoice.STATUS_APPROVED, **sales_filters)
-        total_sales_with_vat_usd = sales_invoices.aggregate(total=Sum('total_with_vat_usd'))['total'] or Decimal('0')
-        total_sales_with_vat_aed = sales_invoices.aggregate(total=Sum('total_with_vat_aed'))['total'] or Decimal('0')
-        total_sales_vat_usd = sales_invoices.aggregate(total=Sum('vat_amount_usd'))['total'] or Decimal('0')
-        total_sales_vat_aed = sales_invoices.aggregate(total=Sum('vat_amount_aed'))['total'] or Decimal('0')
-        total_sales_without_vat_usd = total_sales_with_vat_usd - total_sales_vat_usd
-        total_sales_without_vat_aed = total_sales_with_vat_aed - total_sales_vat_aed
-
-        sales_ids = list(sales_invoices.values_list('id', flat=True))
-        sales_shipping_usd = SaleItem.objects.filter(invoice_id__in=sales_ids).aggregate(
-            total=Sum('shipping_usd'))['total'] or Decimal('0')
-        sales_shipping_aed = SaleItem.objects.filter(invoice_id__in=sales_ids).aggregate(
-            total=Sum('shipping_aed'))['total'] or Decimal('0')
-
-        total_sales_discount_usd = sales_invoices.aggregate(total=Sum('discount_usd'))['total'] or Decimal('0')
-        total_sales_discount_aed = sales_invoices.aggregate(total=Sum('discount_aed'))['total'] or Decimal('0')
-
-        # EXPENSES & WAGES & SALARY (filtering by date if present)
-        expense_filters = {}
-        wage_filters = {}
-        salary_filters = {}
-        if start_date:
-            expense_filters['date__gte'] = start_date
-            wage_filters['date__gte'] = start_date
-            salary_filters['date__gte'] = start_date
-        if end_date:
-            expense_filters['date__lte'] = end_date
-            wage_filters['date__lte'] = end_date
-            salary_filters['date__lte'] = end_date
-
-        # Direct and Indirect Expenses
-        direct_expenses_usd = Expense.objects.filter(type__category='direct', **expense_filters).aggregate(total=Sum('amount_usd'))['total'] or Decimal('0')
-        direct_expenses_aed = Expense.objects.filter(type__category='direct', **expense_filters).aggregate(total=Sum('amount_aed'))['total'] or Decimal('0')
-        indirect_expenses_usd = Expense.objects.filter(type__category='indirect', **expense_filters).aggregate(total=Sum('amount_usd'))['total'] or Decimal('0')
-        indirect_expenses_aed = Expense.objects.filter(type__category='indirect', **expense_filters).aggregate(total=Sum('amount_aed'))['total'] or Decimal('0')
-
-        # Wages
-        total_wages_aed = Wage.objects.filter(**wage_filters).aggregate(total=Sum('amount_aed'))['total'] or Decimal('0')
-
-        # Salary
-        total_salary_usd = SalaryEntry.objects.filter(**salary_filters).aggregate(total=Sum('amount_usd'))['total'] or Decimal('0')
-        total_salary_aed = SalaryEntry.objects.filter(**salary_filters).aggregate(total=Sum('amount_aed'))['total'] or Decimal('0')
-
-        # For backward compatibility, keep all_expenses as sum of all
-        all_expenses_usd = direct_expenses_usd + indirect_expenses_usd + total_salary_usd
-        all_expenses_aed = direct_expenses_aed + indirect_expenses_aed + total_wages_aed + total_salary_aed
-
-        report = {
-            "purchase": {
-                "total_with_vat_usd": float(total_purchase_with_vat_usd),
-                "total_with_vat_aed": float(total_purchase_with_vat_aed),
-                "total_without_vat_usd": float(total_purchase_without_vat_usd),
-                "total_without_vat_aed": float(total_purchase_without_vat_aed),
-                "vat_usd": float(total_purchase_vat_usd),
-                "vat_aed": float(total_purchase_vat_aed),
-                "total_shipping_usd": float(purchase_shipping_usd),
-                "total_shipping_aed": float(purchase_shipping_aed),
-                "total_discount_usd": float(total_purchase_discount_usd),
-                "total_discount_aed": float(total_purchase_discount_aed),
-
-            },
-            "sales": {
-                "total_with_vat_usd": float(total_sales_with_vat_usd),
-                "total_with_vat_aed": float(total_sales_with_vat_aed),
-                "total_without_vat_usd": float(total_sales_without_vat_usd),
-                "total_without_vat_aed": float(total_sales_without_vat_aed),
-                "vat_usd": float(total_sales_vat_usd),
-                "vat_aed": float(total_sales_vat_aed),
-                "total_shipping_usd": float(sales_shipping_usd),
-                "total_shipping_aed": float(sales_shipping_aed),
-                "total_discount_usd": float(total_sales_discount_usd),
-                "total_discount_aed": float(total_sales_discount_aed),
-            },
-            "expenses": {
-                "direct_expenses_usd": float(direct_expenses_usd),
-                "direct_expenses_aed": float(direct_expenses_aed),
-                "indirect_expenses_usd": float(indirect_expenses_usd),
-                "indirect_expenses_aed": float(indirect_expenses_aed),
-                "total_wages_aed": float(total_wages_aed),
-                "total_salary_usd": float(total_salary_usd),
-                "total_salary_aed": float(total_salary_aed),
-                "all_expenses_usd": float(all_expenses_usd),
-                "all_expenses_aed": float(all_expenses_aed),
-            }
-        }
-        return Response(report)
+    def get_report(self, request):
+        return get_purchase_sales_report(
+            request.query_params.get('start_date'), request.query_params.get('end_date'))
 
 
 class ProductBatchSalesReportAPIView(APIView):
@@ -208,92 +92,75 @@ class ProductBatchSalesReportAPIView(APIView):
     pagination_class = CustomPagination
 
     def get(self, request):
-        products = ProductItem.objects.all()
-        report = []
+        product_id = request.query_params.get('product_id')
+        start_date = request.query_params.get('start_date')
+        end_date = request.query_params.get('end_date')
 
-        for product in products:
-            purchases = PurchaseItem.objects.filter(item=product,
-                                                    invoice__status=PurchaseInvoice.STATUS_APPROVED).order_by(
-                'invoice__purchase_date', 'id')
-            sales = SaleItem.objects.filter(item=product,
-                                            invoice__status=SaleInvoice.STATUS_APPROVED).order_by(
-                'invoice__sale_date', 'id')
-
-            # Prepare purchase batches with available quantity
-            purchase_batches = []
-            for p in purchases:
-                purchase_batches.append({'batch_id': p.id,
-                    'purchase_invoice': p.invoice.invoice_no,
-                    'purchase_date': p.invoice.purchase_date, 'qty': p.qty,
-                    'unit_price': p.unit_price_usd,
-                    # adjust currency as per need
-                    'shipping_per_unit': p.shipping_per_unit_usd,
-                    # optional include shipment cost
-                    'available': p.qty, 'factors': p.factors or '', })
-
-            batch_pointer = 0
-            sales_entries_by_batch = defaultdict(list)
-
-            # Iterate over sales and allocate qty FIFO to purchase batches
-            for s in sales:
-                sale_qty = s.qty
-                while sale_qty > 0 and batch_pointer < len(purchase_batches):
-                    batch = purchase_batches[batch_pointer]
-                    available_qty = batch['available']
-                    if available_qty == 0:
-                        batch_pointer += 1
-                        continue
-                    consume_qty = min(sale_qty, available_qty)
-
-                    # Calculate profit = (sale_price - purchase_price) * qty
-                    profit = (s.sale_price_usd - batch[
-                        'unit_price']) * consume_qty
-
-                    # Save sales mapped data under purchase batch
-                    sales_entries_by_batch[batch['batch_id']].append(
-                        {'sale_invoice': s.invoice.invoice_no,
-                            'sale_date': s.invoice.sale_date,
-                            'qty_sold': consume_qty,
-                            'sale_price_per_unit': s.sale_price_usd,
-                            'total_sale_amount': s.sale_price_usd * consume_qty,
-                            'profit': float(profit),
-                            'batch_balance_after_sale': available_qty - consume_qty, })
-
-                    batch['available'] -= consume_qty
-                    sale_qty -= consume_qty
-
-                    if batch['available'] == 0:
-                        batch_pointer += 1
-
-                # If sale_qty >0 here: sales qty more than available purchase - handle as needed
+        # Only the stored name of each item is shown
+        products = ProductItem.objects.order_by('id')
+        if product_id:
+            products = products.filter(id=product_id)
+
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(products, request, view=self)
+        page_ids = [product.id for product in page]
+
+        # Purchase batches with the qty already consumed by stored allocations
+        purchases = PurchaseItem.objects.filter(
+            item_id__in=page_ids, invoice__status=PurchaseInvoice.STATUS_APPROVED
+        ).select_related('invoice').annotate(
+            allocated=Coalesce(Sum('fifo_allocations__qty'), 0)
+        ).order_by('invoice__purchase_date', 'id')
+        batches_by_product = defaultdict(list)
+        for p in purchases:
+            batches_by_product[p.item_id].append(p)
+
+        allocations = FifoAllocation.objects.filter(
+            product_item_id__in=page_ids).select_related('sale_item__invoice')
+        if start_date:
+            allocations = allocations.filter(sale_date__gte=start_date)
+        if end_date:
+            allocations = allocations.filter(sale_date__lte=end_date)
+        sales_entries_by_batch = defaultdict(list)
+        for a in allocations:
+            sales_entries_by_batch[a.purchase_item_id].append({
+                'sale_invoice': a.sale_item.invoice.invoice_no,
+                'sale_date': a.sale_date,
+                'qty_sold': a.qty,
+                'sale_price_per_unit': a.sale_price,
+                'total_sale_amount': a.sale_price * a.qty,
+                'profit': float(a.profit),
+                'batch_balance_after_sale': a.batch_balance_after_sale,
+            })
 
+        report = []
+        for product in page:
             # Prepare report for each purchase batch
             batch_reports = []
             total_profit = 0
             closing_qty = 0
-            for batch in purchase_batches:
-                batch_id = batch['batch_id']
-                sales_for_batch = sales_entries_by_batch.get(batch_id, [])
+            for batch in batches_by_product[product.id]:
+                sales_for_batch = sales_entries_by_batch.get(batch.id, [])
                 batch_profit = sum(s['profit'] for s in sales_for_batch)
+                batch_balance = batch.qty - batch.allocated
                 batch_reports.append(
-                    {'purchase_invoice_no': batch['purchase_invoice'],
-                        'purchase_date': batch['purchase_date'],
-                        'purchase_qty': batch['qty'],
-                        'unit_price': float(batch['unit_price']),
-                        'shipping_per_unit': float(
-                            batch.get('shipping_per_unit', 0)),
-                        'factors': batch['factors'], 'sales': sales_for_batch,
+                    {'purchase_invoice_no': batch.invoice.invoice_no,
+                        'purchase_date': batch.invoice.purchase_date,
+                        'purchase_qty': batch.qty,
+                        'unit_price': float(batch.unit_price_usd),
+                        'shipping_per_unit': float(batch.shipping_per_unit_usd or 0),
+                        'factors': batch.factors or '', 'sales': sales_for_batch,
                         'batch_profit': float(batch_profit),
-                        'batch_balance': batch['available'], })
+                        'batch_balance': batch_balance, })
                 total_profit += batch_profit
-                closing_qty += batch['available']
+                closing_qty += batch_balance
 
             report.append(
                 {'product': str(product), 'batch_reports': batch_reports,
                     'total_profit': float(total_profit),
                     'closing_quantity': closing_qty, })
 
-        return Response(report)
+        return paginator.get_paginated_response(report)
 
 
 class TaxSummaryAPIView(APIView):
@@ -302,102 +169,13 @@ class TaxSummaryAPIView(APIView):
     def get(self, request):
         start_date = request.query_params.get('start_date')
         end_date = request.query_params.get('end_date')
+        period = request.query_params.get('period')
 
-        sale_invoice_filter = Q()
-        purchase_invoice_filter = Q()
-        sale_item_filter = Q()
-        purchase_item_filter = Q()
-        expense_filter = Q()
-        salary_filter = Q()
-
-        if start_date:
-            sale_invoice_filter &= Q(sale_date__gte=start_date)
-            purchase_invoice_filter &= Q(purchase_date__gte=start_date)
-            sale_item_filter &= Q(invoice__sale_date__gte=start_date)
-            purchase_item_filter &= Q(invoice__purchase_date__gte=start_date)
-            expense_filter &= Q(date__gte=start_date)
-            salary_filter &= Q(date__gte=start_date)
-        if end_date:
-            sale_invoice_filter &= Q(sale_date__lte=end_date)
-            purchase_invoice_filter &= Q(purchase_date__lte=end_date)
-            sale_item_filter &= Q(invoice__sale_date__lte=end_date)
-            purchase_item_filter &= Q(invoice__purchase_date__lte=end_date)
-            expense_filter &= Q(date__lte=end_date)
-            salary_filter &= Q(date__lte=end_date)
-
-        # VAT aggregation
-        total_sales_vat_usd = \
-        SaleInvoice.objects.filter(status=SaleInvoice.STATUS_APPROVED).filter(
-            sale_invoice_filter).aggregate(total=Sum('vat_amount_usd'))['total'] or Decimal('0')
-        total_sales_vat_aed = SaleInvoice.objects.filter(sale_invoice_filter).aggregate(
-            total=Sum('vat_amount_aed'))['total'] or Decimal('0')
-
-        total_purchase_vat_usd = PurchaseInvoice.objects.filter(
-            status=PurchaseInvoice.STATUS_APPROVED).filter(
-            purchase_invoice_filter).aggregate(total=Sum('vat_amount_usd'))['total'] or Decimal('0')
-        total_purchase_vat_aed = PurchaseInvoice.objects.filter(purchase_invoice_filter).aggregate(
-            total=Sum('vat_amount_aed'))['total'] or Decimal('0')
-
-        # Sales base amount (qty * price + shipping), carefully cast to Decimal
-        sales_items = SaleItem.objects.filter(
-            invoice__status=SaleInvoice.STATUS_APPROVED).filter(
-            sale_item_filter)
-        total_sales_base_usd = sum(
-            (Decimal(item.sale_price_usd) * item.qty) + Decimal(item.shipping_usd)
-            for item in sales_items
-        )
-        total_sales_base_aed = sum(
-            (Decimal(item.sale_price_aed) * item.qty) + Decimal(item.shipping_aed)
-            for item in sales_items
-        )
-
-        # Purchase base amount (qty * price + shipping)
-        purchase_items = PurchaseItem.objects.filter(
-            invoice__status=PurchaseInvoice.STATUS_APPROVED).filter(
-            purchase_item_filter)
-        total_purchase_base_usd = sum(
-            (Decimal(item.unit_price_usd) * item.qty) + (Decimal(item.shipping_per_unit_usd) * item.qty)
-            for item in purchase_items
-        )
-        total_purchase_base_aed = sum(
-            (Decimal(item.unit_price_aed) * item.qty) + (Decimal(item.shipping_per_unit_aed) * item.qty)
-            for item in purchase_items
-        )
-
-        # Expenses & Salary
-        total_expenses_usd = Expense.objects.filter(expense_filter).aggregate(
-            total=Sum('amount_usd'))['total'] or Decimal('0')
-        total_expenses_aed = Expense.objects.filter(expense_filter).aggregate(
-            total=Sum('amount_aed'))['total'] or Decimal('0')
-
-        total_salary_usd = SalaryEntry.objects.filter(salary_filter).aggregate(
-            total=Sum('amount_usd'))['total'] or Decimal('0')
-        total_salary_aed = SalaryEntry.objects.filter(salary_filter).aggregate(
-            total=Sum('amount_aed'))['total'] or Decimal('0')
-
-        # Corporate tax calculation (Decimal math)
-        corporate_tax_usd = total_sales_base_usd - (
-            total_purchase_base_usd + total_expenses_usd + total_salary_usd
-        )
-        corporate_tax_aed = total_sales_base_aed - (
-            total_purchase_base_aed + total_expenses_aed + total_salary_aed
-        )
-
-        # Build response, convert Decimals to float for JSON
-        data = {
-            "sales": {
-                "total_vat_usd": float(total_sales_vat_usd),
-                "total_vat_aed": float(total_sales_vat_aed),
-            },
-            "purchase": {
-                "total_vat_usd": float(total_purchase_vat_usd),
-                "total_vat_aed": float(total_purchase_vat_aed),
-            },
-            "corporate_tax": {
-                "usd": float(corporate_tax_usd),
-                "aed": float(corporate_tax_aed),
-            }
-        }
+        try:
+            data = cached_report('tax_summary', request,
+                                 lambda: get_tax_summary(start_date, end_date, period=period))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
         return Response(data)
 
 
@@ -508,7 +286,7 @@ class YearlySummaryReportAPIView(APIView):
             year = int(year)
         except ValueError:
             return Response({'error': 'year must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
-        data = get_yearly_summary_report(year)
+        data = cached_report('yearly_summary', request, lambda: get_yearly_summary_report(year))
         return Response(data)
 
 
@@ -520,7 +298,8 @@ class ProfitAndLossReportAPIView(APIView):
         end_date = request.query_params.get('end_date')
         if not start_date or not end_date:
             return Response({'error': 'start_date and end_date are required'}, status=status.HTTP_400_BAD_REQUEST)
-        data = get_profit_and_loss_report(start_date, end_date)
+        data = cached_report('profit_and_loss', request,
+                             lambda: get_profit_and_loss_report(start_date, end_date))
         return Response(data)
 
 
@@ -529,5 +308,5 @@ class BalanceSheetReportAPIView(APIView):
 
     def get(self, request):
         as_of_date = request.query_params.get('as_of_date')
-        data = get_balance_sheet_report(as_of_date)
+        data = cached_report('balance_sheet', request, lambda: get_balance_sheet_report(as_of_date))
         return Response(data)
@@ -0,0 +1,66 @@
+import hashlib
+import time
+from django.conf import settings
+from django.core.cache import cache
+
+# Data each report endpoint reads. A write in one domain only invalidates
+# the reports listing it.
+REPORT_DOMAINS = {
+    'inventory': ('products', 'stock', 'sales', 'purchases'),
+    'purchase_sales': ('sales', 'purchases', 'expenses', 'salary'),
+    'profit_and_loss': ('sales', 'purchases', 'expenses', 'salary'),
+    'balance_sheet': ('sales', 'purchases', 'expenses', 'salary', 'payments', 'cash', 'assets'),
+    'yearly_summary': ('sales', 'purchases'),
+    'tax_summary': ('sales', 'purchases', 'expenses', 'salary'),
+}
+
+VERSION_KEY = 'report:version:{}'
+
+
+def _new_version():
+    # Unique across cache evictions, so a reset never revives old entries
+    return int(time.time() * 1000)
+
+
+def get_versions(domains):
+    keys = [VERSION_KEY.format(domain) for domain in domains]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, _new_version(), timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump_versions(domains):
+    """Invalidate every cached report reading any of the given domains."""
+    for domain in domains:
+        key = VERSION_KEY.format(domain)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _new_version(), timeout=None)
+
+
+def get_cache_key(endpoint, request):
+    params = sorted((key, value) for key in request.query_params for value in request.query_params.getlist(key))
+    digest = hashlib.md5(repr((request.get_host(), params)).encode()).hexdigest()
+    versions = '.'.join(str(v) for v in get_versions(REPORT_DOMAINS[endpoint]))
+    return f'report:{endpoint}:{digest}:{versions}'
+
+
+def cached_report(endpoint, request, compute):
+    """
+    Return the cached data of a report for these query params, computing and
+    storing it with compute() when the data it reads has changed since.
+    Reports are always computed when REPORT_CACHE_TIMEOUT is 0.
+    """
+    timeout = getattr(settings, 'REPORT_CACHE_TIMEOUT', 0)
+    if not timeout:
+        return compute()
+    key = get_cache_key(endpoint, request)
+    data = cache.get(key)
+    if data is None:
+        data = compute()
+        cache.set(key, data, timeout=timeout)
+    return data
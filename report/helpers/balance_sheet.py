@@ -6,8 +6,9 @@ from purchase.models import PurchaseInvoice
 from customer.models import Party
 from decimal import Decimal
 from django.db.models import Sum
-from report.utils import get_sundry_debtors, get_sundry_creditors
-from report.helpers.profict_loss import get_profit_and_loss_report
+from report.helpers.period_close import (PERIOD_CLOSE_START, get_last_closed_period, get_sundry_debtors_as_of,
+                                         get_sundry_creditors_as_of, get_closing_stock_value_as_of)
+from report.helpers.profict_loss import get_profit_and_loss_components, get_profit_and_loss_totals
 
 
 def get_balance_sheet_report(as_of_date=None):
@@ -20,6 +21,11 @@ def get_balance_sheet_report(as_of_date=None):
     import datetime
     if not as_of_date:
         as_of_date = datetime.date.today()
+    elif isinstance(as_of_date, str):
+        as_of_date = datetime.datetime.strptime(as_of_date, "%Y-%m-%d").date()
+
+    # Closed periods up to the date are read from their snapshots
+    last_period = get_last_closed_period(as_of_date)
 
     # Total capital
     total_capital = CapitalAccount.objects.aggregate(total=Sum('balance'))['total'] or Decimal('0')
@@ -38,27 +44,11 @@ def get_balance_sheet_report(as_of_date=None):
         for a in fixed_assets_qs
     ]
 
-    # Closing stock (current assets)
-    from products.models import ProductItem
-    from purchase.models import PurchaseItem
-    def get_total_stock_value(as_of_date):
-        total = Decimal('0')
-        for item in ProductItem.objects.all():
-            from report.utils import get_closing_stock
-            qty = get_closing_stock(item, as_of_date)
-            if qty > 0:
-                latest_purchase = PurchaseItem.objects.filter(
-                    item=item,
-                    invoice__purchase_date__lte=as_of_date,
-                    invoice__status=PurchaseInvoice.STATUS_APPROVED
-                ).order_by('-invoice__purchase_date', '-pk').first()
-                price = latest_purchase.amount_aed if latest_purchase else Decimal('0')
-                total += qty * price
-        return total
-    closing_stock = get_total_stock_value(as_of_date)
+    # Closing stock (current assets), valued at the latest purchase price
+    closing_stock = get_closing_stock_value_as_of(as_of_date)
 
     # Sundry debtors (current assets)
-    sundry_debtors_total = get_sundry_debtors(as_of_date, currency='aed')
+    sundry_debtors_total = get_sundry_debtors_as_of(as_of_date, last_period)
     sundry_debtors_qs = Party.objects.filter(
         type='customer',
         sale_invoices__status=SaleInvoice.STATUS_APPROVED,
@@ -77,7 +67,7 @@ def get_balance_sheet_report(as_of_date=None):
     cash_in_bank = main_cash.cash_in_bank if main_cash else Decimal('0')
 
     # Current liabilities: amount payable (approved purchases not paid), sundry creditors
-    sundry_creditors_total = get_sundry_creditors(as_of_date, currency='aed')
+    sundry_creditors_total = get_sundry_creditors_as_of(as_of_date, last_period)
     sundry_creditors_qs = Party.objects.filter(
         type='supplier',
         purchase_invoices__status=PurchaseInvoice.STATUS_APPROVED,
@@ -144,8 +134,8 @@ def get_balance_sheet_report(as_of_date=None):
     total_salary_pending = total_salary_entry - total_salary_paid
 
     # Profit and loss total (net profit till date)
-    profit_loss = get_profit_and_loss_report('2000-01-01', as_of_date)
-    net_profit = profit_loss['profit']['net_profit']
+    profit_loss = get_profit_and_loss_components(PERIOD_CLOSE_START, as_of_date)
+    net_profit = get_profit_and_loss_totals(profit_loss)['net_profit']
 
     # Total sale VAT up to as_of_date
     total_sale_vat = SaleInvoice.objects.filter(
@@ -0,0 +1,361 @@
+from collections import defaultdict
+from datetime import time, timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum, F, Q, DecimalField
+from django.db.models.functions import TruncMonth
+from purchase.models import PurchaseInvoice, PurchaseItem, PurchaseReturnItemEntry
+from sale.models import SaleInvoice, SaleItem, SaleReturnItemEntry
+from common.models import Expense, Wage, ServiceFee, Commission, ExtraCharges
+from employee.models import SalaryEntry
+from report.models import SalesFact, PurchaseFact, ExpenseFact
+from report.utils import stock_qty_and_amount
+from report.helpers.period_close import get_stock_totals_as_of
+
+AMOUNT_FIELD = DecimalField(max_digits=20, decimal_places=2)
+MIDNIGHT = time(0)
+
+
+def use_fact_tables():
+    """True when settings.REPORT_BACKEND selects the fact tables over the live tables."""
+    return getattr(settings, 'REPORT_BACKEND', 'live') == 'facts'
+
+
+# --- Maintenance ---
+
+def _collect(rows, facts, key_fields, measures):
+    """Add grouped values() rows to facts keyed by (date, product_item, party, status)."""
+    for row in rows:
+        key = tuple(row[field] if field else None for field in key_fields)
+        fact = facts[key]
+        for measure, alias in measures.items():
+            fact[measure] = fact.get(measure, 0) + (row[alias] or 0)
+
+
+def _replace(model, dates, facts, build):
+    with transaction.atomic():
+        model.objects.filter(date__in=dates).delete()
+        model.objects.bulk_create([build(key, values) for key, values in facts.items()], batch_size=500)
+    return len(facts)
+
+
+def _fact_row(model):
+    def build(key, values):
+        day, product_item_id, party_id, status = key
+        return model(date=day, product_item_id=product_item_id, party_id=party_id,
+                     status=status, **values)
+    return build
+
+
+def refresh_sales_facts(dates):
+    """Recompute the SalesFact rows of the given dates from the sale tables."""
+    dates = sorted({d for d in dates if d})
+    if not dates:
+        return 0
+    facts = defaultdict(dict)
+
+    _collect(
+        SaleItem.objects.filter(invoice__sale_date__in=dates).order_by().values(
+            'invoice__sale_date', 'item_id', 'invoice__party_id', 'invoice__status'
+        ).annotate(
+            sum_qty=Sum('qty'),
+            sum_amount_usd=Sum(F('sale_price_usd') * F('qty'), output_field=AMOUNT_FIELD),
+            sum_amount_aed=Sum(F('sale_price_aed') * F('qty'), output_field=AMOUNT_FIELD),
+            sum_shipping_usd=Sum('shipping_usd'),
+            sum_shipping_aed=Sum('shipping_aed'),
+            sum_cost_aed=Sum(F('qty') * F('purchase_item__unit_price_aed'), output_field=AMOUNT_FIELD),
+        ),
+        facts, ('invoice__sale_date', 'item_id', 'invoice__party_id', 'invoice__status'),
+        {'qty': 'sum_qty', 'amount_usd': 'sum_amount_usd', 'amount_aed': 'sum_amount_aed',
+         'shipping_usd': 'sum_shipping_usd', 'shipping_aed': 'sum_shipping_aed',
+         'cost_aed': 'sum_cost_aed'},
+    )
+    _collect(
+        SaleInvoice.objects.filter(sale_date__in=dates).order_by().values(
+            'sale_date', 'party_id', 'status'
+        ).annotate(
+            sum_total_with_vat_usd=Sum('total_with_vat_usd'),
+            sum_total_with_vat_aed=Sum('total_with_vat_aed'),
+            sum_vat_usd=Sum('vat_amount_usd'),
+            sum_vat_aed=Sum('vat_amount_aed'),
+            sum_discount_usd=Sum('discount_usd'),
+            sum_discount_aed=Sum('discount_aed'),
+        ),
+        facts, ('sale_date', None, 'party_id', 'status'),
+        {'total_with_vat_usd': 'sum_total_with_vat_usd', 'total_with_vat_aed': 'sum_total_with_vat_aed',
+         'vat_usd': 'sum_vat_usd', 'vat_aed': 'sum_vat_aed',
+         'discount_usd': 'sum_discount_usd', 'discount_aed': 'sum_discount_aed'},
+    )
+    invoice_key = ('sales_invoice__sale_date', None, 'sales_invoice__party_id', 'sales_invoice__status')
+    for model, measure in ((ServiceFee, 'service_fee_aed'), (Commission, 'commission_aed')):
+        _collect(
+            model.objects.filter(sales_invoice__sale_date__in=dates).order_by().values(
+                *[field for field in invoice_key if field]
+            ).annotate(total=Sum('amount_aed')),
+            facts, invoice_key, {measure: 'total'},
+        )
+    extra_key = ('sale_invoices__sale_date', None, 'sale_invoices__party_id', 'sale_invoices__status')
+    _collect(
+        ExtraCharges.objects.filter(
+            content_type__model='saleinvoice', sale_invoices__sale_date__in=dates
+        ).order_by().values(*[field for field in extra_key if field]).annotate(total=Sum('amount')),
+        facts, extra_key, {'extra_charges': 'total'},
+    )
+    return_key = ('sale_return__return_date__date', 'sale_item__item_id',
+                  'sale_item__invoice__party_id', 'sale_item__invoice__status')
+    _collect(
+        SaleReturnItemEntry.objects.filter(sale_return__return_date__date__in=dates).order_by().values(
+            *return_key
+        ).annotate(
+            total=Sum('sale_item__amount_aed'),
+            at_midnight=Sum('sale_item__amount_aed', filter=Q(sale_return__return_date__time=MIDNIGHT)),
+        ),
+        facts, return_key, {'return_aed': 'total', 'return_midnight_aed': 'at_midnight'},
+    )
+    return _replace(SalesFact, dates, facts, _fact_row(SalesFact))
+
+
+def refresh_purchase_facts(dates):
+    """Recompute the PurchaseFact rows of the given dates from the purchase tables."""
+    dates = sorted({d for d in dates if d})
+    if not dates:
+        return 0
+    facts = defaultdict(dict)
+
+    line_key = ('invoice__purchase_date', 'item_id', 'invoice__party_id', 'invoice__status')
+    _collect(
+        PurchaseItem.objects.filter(invoice__purchase_date__in=dates).order_by().values(*line_key).annotate(
+            sum_qty=Sum('qty'),
+            sum_amount_usd=Sum(F('unit_price_usd') * F('qty'), output_field=AMOUNT_FIELD),
+            sum_amount_aed=Sum(F('unit_price_aed') * F('qty'), output_field=AMOUNT_FIELD),
+            sum_shipping_usd=Sum(F('shipping_per_unit_usd') * F('qty'), output_field=AMOUNT_FIELD),
+            sum_shipping_aed=Sum('shipping_total_aed'),
+            sum_shipping_per_unit_usd=Sum('shipping_per_unit_usd'),
+            sum_shipping_per_unit_aed=Sum('shipping_per_unit_aed'),
+            sum_custom_duty_aed=Sum('custom_duty_aed_total'),
+        ),
+        facts, line_key,
+        {'qty': 'sum_qty', 'amount_usd': 'sum_amount_usd', 'amount_aed': 'sum_amount_aed',
+         'shipping_usd': 'sum_shipping_usd', 'shipping_aed': 'sum_shipping_aed',
+         'shipping_per_unit_usd': 'sum_shipping_per_unit_usd',
+         'shipping_per_unit_aed': 'sum_shipping_per_unit_aed',
+         'custom_duty_aed': 'sum_custom_duty_aed'},
+    )
+    _collect(
+        PurchaseInvoice.objects.filter(purchase_date__in=dates).order_by().values(
+            'purchase_date', 'party_id', 'status'
+        ).annotate(
+            sum_total_with_vat_usd=Sum('total_with_vat_usd'),
+            sum_total_with_vat_aed=Sum('total_with_vat_aed'),
+            sum_vat_usd=Sum('vat_amount_usd'),
+            sum_vat_aed=Sum('vat_amount_aed'),
+            sum_discount_usd=Sum('discount_usd'),
+            sum_discount_aed=Sum('discount_aed'),
+        ),
+        facts, ('purchase_date', None, 'party_id', 'status'),
+        {'total_with_vat_usd': 'sum_total_with_vat_usd', 'total_with_vat_aed': 'sum_total_with_vat_aed',
+         'vat_usd': 'sum_vat_usd', 'vat_aed': 'sum_vat_aed',
+         'discount_usd': 'sum_discount_usd', 'discount_aed': 'sum_discount_aed'},
+    )
+    extra_key = ('purchase_invoices__purchase_date', None, 'purchase_invoices__party_id',
+                 'purchase_invoices__status')
+    _collect(
+        ExtraCharges.objects.filter(
+            content_type__model='purchaseinvoice', purchase_invoices__purchase_date__in=dates
+        ).order_by().values(*[field for field in extra_key if field]).annotate(total=Sum('amount')),
+        facts, extra_key, {'extra_charges': 'total'},
+    )
+    return_key = ('purchase_return__return_date__date', 'purchase_item__item_id',
+                  'purchase_item__invoice__party_id', 'purchase_item__invoice__status')
+    _collect(
+        PurchaseReturnItemEntry.objects.filter(purchase_return__return_date__date__in=dates).order_by().values(
+            *return_key
+        ).annotate(
+            total=Sum('purchase_item__amount_aed'),
+            at_midnight=Sum('purchase_item__amount_aed',
+                            filter=Q(purchase_return__return_date__time=MIDNIGHT)),
+        ),
+        facts, return_key, {'return_aed': 'total', 'return_midnight_aed': 'at_midnight'},
+    )
+    # Returns of purchase items without an invoice are filed under an empty status
+    facts = {key[:3] + (key[3] or '',): values for key, values in facts.items()}
+    return _replace(PurchaseFact, dates, facts, _fact_row(PurchaseFact))
+
+
+def refresh_expense_facts(dates):
+    """Recompute the ExpenseFact rows of the given dates from expenses, wages and salaries."""
+    dates = sorted({d for d in dates if d})
+    if not dates:
+        return 0
+    facts = []
+    for row in Expense.objects.filter(date__in=dates).order_by().values('date', 'type_id').annotate(
+            usd=Sum('amount_usd'), aed=Sum('amount_aed')):
+        facts.append(ExpenseFact(date=row['date'], kind=ExpenseFact.KIND_EXPENSE, expense_type_id=row['type_id'],
+                                 amount_usd=row['usd'] or 0, amount_aed=row['aed'] or 0))
+    for row in Wage.objects.filter(date__in=dates).order_by().values('date').annotate(aed=Sum('amount_aed')):
+        facts.append(ExpenseFact(date=row['date'], kind=ExpenseFact.KIND_WAGE, amount_aed=row['aed'] or 0))
+    for row in SalaryEntry.objects.filter(date__in=dates).order_by().values('date').annotate(
+            usd=Sum('amount_usd'), aed=Sum('amount_aed')):
+        facts.append(ExpenseFact(date=row['date'], kind=ExpenseFact.KIND_SALARY,
+                                 amount_usd=row['usd'] or 0, amount_aed=row['aed'] or 0))
+
+    with transaction.atomic():
+        ExpenseFact.objects.filter(date__in=dates).delete()
+        ExpenseFact.objects.bulk_create(facts, batch_size=500)
+    return len(facts)
+
+
+REFRESHERS = {
+    'sales': refresh_sales_facts,
+    'purchases': refresh_purchase_facts,
+    'expenses': refresh_expense_facts,
+}
+
+
+# --- Reports ---
+
+def _date_range(start_date=None, end_date=None):
+    date_range = Q()
+    if start_date:
+        date_range &= Q(date__gte=start_date)
+    if end_date:
+        date_range &= Q(date__lte=end_date)
+    return date_range
+
+
+def compute_profit_and_loss_components(start_date, end_date):
+    """Fact table counterpart of profict_loss.compute_profit_and_loss_components."""
+    approved = Q(status=SaleInvoice.STATUS_APPROVED)
+    sales = SalesFact.objects.filter(_date_range(start_date, end_date)).aggregate(
+        with_vat=Sum('total_with_vat_aed', filter=approved),
+        vat=Sum('vat_aed', filter=approved),
+        discount=Sum('discount_aed', filter=approved),
+        shipping=Sum('shipping_aed', filter=approved),
+        total_qty=Sum('qty', filter=approved),
+        total_cost=Sum('cost_aed', filter=approved),
+        service_fees=Sum('service_fee_aed'),
+        commission=Sum('commission_aed'),
+        extra_charges=Sum('extra_charges'),
+        # Returns are compared with midnight of the end date
+        returns=Sum('return_aed', filter=Q(date__lt=end_date)),
+        returns_at_end=Sum('return_midnight_aed', filter=Q(date=end_date)),
+    )
+    approved = Q(status=PurchaseInvoice.STATUS_APPROVED)
+    purchases = PurchaseFact.objects.filter(_date_range(start_date, end_date)).aggregate(
+        with_vat=Sum('total_with_vat_aed', filter=approved),
+        vat=Sum('vat_aed', filter=approved),
+        discount=Sum('discount_aed', filter=approved),
+        shipping=Sum('shipping_aed', filter=approved),
+        custom_duty=Sum('custom_duty_aed', filter=approved),
+        total_qty=Sum('qty', filter=approved),
+        total_amount=Sum('amount_aed', filter=approved),
+        extra_charges=Sum('extra_charges'),
+        returns=Sum('return_aed', filter=Q(date__lt=end_date)),
+        returns_at_end=Sum('return_midnight_aed', filter=Q(date=end_date)),
+    )
+    expense_facts = ExpenseFact.objects.filter(_date_range(start_date, end_date))
+    expenses = expense_facts.aggregate(
+        wages=Sum('amount_aed', filter=Q(kind=ExpenseFact.KIND_WAGE)),
+        salary=Sum('amount_aed', filter=Q(kind=ExpenseFact.KIND_SALARY)),
+        direct=Sum('amount_aed', filter=Q(kind=ExpenseFact.KIND_EXPENSE, expense_type__category='direct')),
+        indirect=Sum('amount_aed', filter=Q(kind=ExpenseFact.KIND_EXPENSE, expense_type__category='indirect')),
+    )
+    direct_expenses_typewise = {}
+    indirect_expenses_typewise = {}
+    for e in expense_facts.filter(
+            kind=ExpenseFact.KIND_EXPENSE, expense_type__category__in=['direct', 'indirect']
+    ).order_by().values('expense_type__category', 'expense_type__name').annotate(total=Sum('amount_aed')):
+        typewise = direct_expenses_typewise if e['expense_type__category'] == 'direct' else indirect_expenses_typewise
+        typewise[e['expense_type__name']] = e['total'] or Decimal('0')
+
+    def total(values, key):
+        return values[key] or Decimal('0')
+
+    opening_totals = get_stock_totals_as_of(start_date - timedelta(days=1))
+    purchased_qty, purchased_amount, sold_qty, sold_amount = opening_totals
+    opening_stock_qty, opening_stock_aed = stock_qty_and_amount(*opening_totals)
+    closing_stock_qty, closing_stock_aed = stock_qty_and_amount(
+        purchased_qty + (purchases['total_qty'] or 0),
+        purchased_amount + total(purchases, 'total_amount'),
+        sold_qty + (sales['total_qty'] or 0),
+        sold_amount + total(sales, 'total_cost'),
+    )
+
+    return {
+        'wages_aed': total(expenses, 'wages'),
+        'salary_aed': total(expenses, 'salary'),
+        'service_fees_aed': total(sales, 'service_fees'),
+        'commission_aed': total(sales, 'commission'),
+        'extra_charges_sales_aed': total(sales, 'extra_charges'),
+        'extra_charges_purchase_aed': total(purchases, 'extra_charges'),
+        'purchase_with_vat_aed': total(purchases, 'with_vat'),
+        'purchase_vat_aed': total(purchases, 'vat'),
+        'purchase_shipping_aed': total(purchases, 'shipping'),
+        'custom_duty_aed': total(purchases, 'custom_duty'),
+        'purchase_discount_aed': total(purchases, 'discount'),
+        'purchase_return_aed': total(purchases, 'returns') + total(purchases, 'returns_at_end'),
+        'sales_with_vat_aed': total(sales, 'with_vat'),
+        'sales_vat_aed': total(sales, 'vat'),
+        'sales_discount_aed': total(sales, 'discount'),
+        'sales_shipping_aed': total(sales, 'shipping'),
+        'sales_return_aed': total(sales, 'returns') + total(sales, 'returns_at_end'),
+        'direct_expenses_aed': total(expenses, 'direct'),
+        'indirect_expenses_aed': total(expenses, 'indirect'),
+        'direct_expenses_typewise': direct_expenses_typewise,
+        'indirect_expenses_typewise': indirect_expenses_typewise,
+        'opening_stock_qty': opening_stock_qty,
+        'opening_stock_aed': opening_stock_aed,
+        'closing_stock_qty': closing_stock_qty,
+        'closing_stock_aed': closing_stock_aed,
+    }
+
+
+def get_purchase_sales_totals(start_date=None, end_date=None):
+    """Fact table counterpart of purchase_sales.get_purchase_sales_totals."""
+    approved = Q(status=PurchaseInvoice.STATUS_APPROVED)
+    purchases = PurchaseFact.objects.filter(_date_range(start_date, end_date), approved).aggregate(
+        with_vat_usd=Sum('total_with_vat_usd'), with_vat_aed=Sum('total_with_vat_aed'),
+        vat_usd=Sum('vat_usd'), vat_aed=Sum('vat_aed'),
+        discount_usd=Sum('discount_usd'), discount_aed=Sum('discount_aed'),
+        shipping_usd=Sum('shipping_per_unit_usd'), shipping_aed=Sum('shipping_per_unit_aed'),
+    )
+    approved = Q(status=SaleInvoice.STATUS_APPROVED)
+    sales = SalesFact.objects.filter(_date_range(start_date, end_date), approved).aggregate(
+        with_vat_usd=Sum('total_with_vat_usd'), with_vat_aed=Sum('total_with_vat_aed'),
+        vat_usd=Sum('vat_usd'), vat_aed=Sum('vat_aed'),
+        discount_usd=Sum('discount_usd'), discount_aed=Sum('discount_aed'),
+        shipping_usd=Sum('shipping_usd'), shipping_aed=Sum('shipping_aed'),
+    )
+    is_expense = Q(kind=ExpenseFact.KIND_EXPENSE)
+    expenses = ExpenseFact.objects.filter(_date_range(start_date, end_date)).aggregate(
+        direct_usd=Sum('amount_usd', filter=is_expense & Q(expense_type__category='direct')),
+        direct_aed=Sum('amount_aed', filter=is_expense & Q(expense_type__category='direct')),
+        indirect_usd=Sum('amount_usd', filter=is_expense & Q(expense_type__category='indirect')),
+        indirect_aed=Sum('amount_aed', filter=is_expense & Q(expense_type__category='indirect')),
+        wages_aed=Sum('amount_aed', filter=Q(kind=ExpenseFact.KIND_WAGE)),
+        salary_usd=Sum('amount_usd', filter=Q(kind=ExpenseFact.KIND_SALARY)),
+        salary_aed=Sum('amount_aed', filter=Q(kind=ExpenseFact.KIND_SALARY)),
+    )
+    totals = {f'purchase_{key}': value for key, value in purchases.items()}
+    totals.update({f'sales_{key}': value for key, value in sales.items()})
+    totals.update(expenses)
+    return {key: value or Decimal('0') for key, value in totals.items()}
+
+
+def get_monthly_movements(year):
+    """
+    Approved purchases and sales of a year per month from the fact tables.
+
+    Returns:
+        tuple: ({(year, month): {'total_qty', 'total_amount'}},
+                {(year, month): {'total_qty', 'total_amount', 'total_cost'}})
+    """
+    def by_month(model, **aggregates):
+        rows = model.objects.filter(date__year=year, status='approved').annotate(
+            month=TruncMonth('date')).order_by().values('month').annotate(**aggregates)
+        return {(row['month'].year, row['month'].month): row for row in rows}
+
+    purchases = by_month(PurchaseFact, total_qty=Sum('qty'), total_amount=Sum('amount_aed'))
+    sales = by_month(SalesFact, total_qty=Sum('qty'), total_amount=Sum('amount_aed'), total_cost=Sum('cost_aed'))
+    return purchases, sales
@@ -0,0 +1,99 @@
+from collections import defaultdict
+from django.db import transaction
+from purchase.models import PurchaseInvoice, PurchaseItem
+from sale.models import SaleInvoice, SaleItem
+from report.models import FifoAllocation
+
+
+def allocate_fifo(purchases, sales):
+    """
+    Match sales against purchase batches first-in first-out.
+
+    Args:
+        purchases: approved PurchaseItems of one product, oldest first
+        sales: approved SaleItems of the same product, oldest first
+
+    Returns:
+        list: unsaved FifoAllocation rows in allocation order
+    """
+    batches = [{'purchase_item': p, 'available': p.qty} for p in purchases]
+    allocations = []
+    batch_pointer = 0
+
+    for s in sales:
+        sale_qty = s.qty
+        while sale_qty > 0 and batch_pointer < len(batches):
+            batch = batches[batch_pointer]
+            available_qty = batch['available']
+            if available_qty == 0:
+                batch_pointer += 1
+                continue
+            consume_qty = min(sale_qty, available_qty)
+            p = batch['purchase_item']
+
+            allocations.append(FifoAllocation(
+                product_item_id=s.item_id,
+                sale_item=s,
+                purchase_item=p,
+                qty=consume_qty,
+                unit_cost=p.unit_price_usd,
+                sale_price=s.sale_price_usd,
+                profit=(s.sale_price_usd - p.unit_price_usd) * consume_qty,
+                batch_balance_after_sale=available_qty - consume_qty,
+                sale_date=s.invoice.sale_date,
+                purchase_date=p.invoice.purchase_date,
+            ))
+
+            batch['available'] -= consume_qty
+            sale_qty -= consume_qty
+
+            if batch['available'] == 0:
+                batch_pointer += 1
+
+        # If sale_qty >0 here: sales qty more than available purchase, left unallocated
+
+    return allocations
+
+
+def compute_fifo_allocations(product_item_id):
+    """Replay FIFO for a single product straight from the invoice tables."""
+    purchases = PurchaseItem.objects.filter(
+        item_id=product_item_id, invoice__status=PurchaseInvoice.STATUS_APPROVED
+    ).select_related('invoice').order_by('invoice__purchase_date', 'id')
+    sales = SaleItem.objects.filter(
+        item_id=product_item_id, invoice__status=SaleInvoice.STATUS_APPROVED
+    ).select_related('invoice').order_by('invoice__sale_date', 'id')
+    return allocate_fifo(purchases, sales)
+
+
+def refresh_fifo_allocations(product_item_ids):
+    """
+    Recompute the stored allocations of the given products.
+
+    Purchases and sales for all products are loaded in two queries and the
+    old rows are replaced with one delete and one bulk insert.
+    """
+    product_item_ids = {pid for pid in product_item_ids if pid}
+    if not product_item_ids:
+        return 0
+
+    purchases_by_item = defaultdict(list)
+    for p in PurchaseItem.objects.filter(
+            item_id__in=product_item_ids, invoice__status=PurchaseInvoice.STATUS_APPROVED
+    ).select_related('invoice').order_by('invoice__purchase_date', 'id'):
+        purchases_by_item[p.item_id].append(p)
+
+    sales_by_item = defaultdict(list)
+    for s in SaleItem.objects.filter(
+            item_id__in=product_item_ids, invoice__status=SaleInvoice.STATUS_APPROVED
+    ).select_related('invoice').order_by('invoice__sale_date', 'id'):
+        sales_by_item[s.item_id].append(s)
+
+    allocations = []
+    for pid in product_item_ids:
+        allocations.extend(allocate_fifo(purchases_by_item[pid], sales_by_item[pid]))
+
+    with transaction.atomic():
+        FifoAllocation.objects.filter(product_item_id__in=product_item_ids).delete()
+        FifoAllocation.objects.bulk_create(allocations, batch_size=500)
+    return len(allocations)
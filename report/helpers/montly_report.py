@@ -1,9 +1,46 @@
-from datetime import date, timedelta
-from calendar import monthrange
+from datetime import date
 from purchase.models import PurchaseInvoice, PurchaseItem
 from sale.models import SaleInvoice, SaleItem
-from django.db.models import Sum, Q, F
+from django.db.models import Sum, F
+from django.db.models.functions import TruncMonth
 from decimal import Decimal
+from report.utils import get_stock_totals, stock_qty_and_amount
+from report.helpers import facts
+
+
+def _month_key(value):
+    # TruncMonth yields a date or datetime depending on the backend
+    return (value.year, value.month)
+
+
+def get_monthly_movements(year):
+    """
+    Approved purchases and sales of a year per month.
+
+    Returns:
+        tuple: ({(year, month): {'total_qty', 'total_amount'}},
+                {(year, month): {'total_qty', 'total_amount', 'total_cost'}})
+    """
+    if facts.use_fact_tables():
+        return facts.get_monthly_movements(year)
+
+    purchases_by_month = {
+        _month_key(row['month']): row for row in PurchaseItem.objects.filter(
+            invoice__status=PurchaseInvoice.STATUS_APPROVED,
+            invoice__purchase_date__year=year
+        ).annotate(month=TruncMonth('invoice__purchase_date')).order_by().values('month').annotate(
+            total_qty=Sum('qty'), total_amount=Sum('total_price_aed'))
+    }
+    sales_by_month = {
+        _month_key(row['month']): row for row in SaleItem.objects.filter(
+            invoice__status=SaleInvoice.STATUS_APPROVED,
+            invoice__sale_date__year=year
+        ).annotate(month=TruncMonth('invoice__sale_date')).order_by().values('month').annotate(
+            total_qty=Sum('qty'), total_amount=Sum('total_price_aed'),
+            total_cost=Sum(F('qty') * F('purchase_item__unit_price_aed')))
+    }
+    return purchases_by_month, sales_by_month
+
 
 def get_yearly_summary_report(year):
     """
@@ -16,39 +53,21 @@ def get_yearly_summary_report(year):
     Opening/closing stock is calculated as sum of all PurchaseItem.qty (including orphan items)
     minus sum of all SaleItem.qty (approved sales) up to the date.
     Stock amount is proportional to remaining qty of each purchase item.
+
+    The stock position at the end of the previous year is aggregated once and
+    every month is derived from it as a running sum over month-bucketed
+    purchases and sales, so the report costs a fixed number of queries.
     """
     year = int(year)
     monthly_data = []
 
-    # Helper: Get all purchase items up to a date (including orphan)
-    def get_total_stock_qty_and_amount(as_of_date):
-        purchases = PurchaseItem.objects.filter(
-            Q(invoice__status=PurchaseInvoice.STATUS_APPROVED, invoice__purchase_date__lte=as_of_date) |
-            Q(invoice__isnull=True)
-        )
-        total_purchased_qty = purchases.aggregate(total=Sum('qty'))['total'] or 0
-        total_purchased_amount = purchases.aggregate(total=Sum('total_price_aed'))['total'] or Decimal('0')
-
-        # Subtract all sales up to as_of_date
-        sales = SaleItem.objects.filter(
-            invoice__status=SaleInvoice.STATUS_APPROVED,
-            invoice__sale_date__lte=as_of_date
-        )
-        sales_qty = sales.aggregate(total=Sum('qty'))['total'] or 0
-        total_sales_amount = sales.aggregate(
-            total=Sum(F('qty') * F('purchase_item__unit_price_aed'))
-        )['total'] or Decimal('0')
-
-        # Stock and amount after sales
-        closing_qty = total_purchased_qty - sales_qty
-        closing_amount = Decimal('0')
-        if total_purchased_qty > 0:
-            closing_amount = total_purchased_amount - total_sales_amount
-        return closing_qty, closing_amount
-
-    # Get previous year closing as opening for this year
+    # Cumulative totals up to the previous year end (orphan purchase items included)
     prev_year_end = date(year - 1, 12, 31)
-    opening_stock, opening_stock_amount = get_total_stock_qty_and_amount(prev_year_end)
+    purchased_qty, purchased_amount, sold_qty, sold_amount = get_stock_totals(prev_year_end)
+    opening_stock, opening_stock_amount = stock_qty_and_amount(
+        purchased_qty, purchased_amount, sold_qty, sold_amount)
+
+    purchases_by_month, sales_by_month = get_monthly_movements(year)
 
     # For each month, opening = previous closing
     month_closing_qty = opening_stock
@@ -56,35 +75,26 @@ def get_yearly_summary_report(year):
 
     for m in range(1, 13):
         month_start = date(year, m, 1)
-        month_end = date(year, m, monthrange(year, m)[1])
-
-        # Opening stock for the month
-        opening_stock_month = month_closing_qty
-        opening_stock_amount_month = month_closing_amount
-
-        # Purchases in this month (approved invoices only)
-        purchases = PurchaseItem.objects.filter(
-            Q(invoice__status=PurchaseInvoice.STATUS_APPROVED, invoice__purchase_date__gte=month_start, invoice__purchase_date__lte=month_end)
-        )
-        purchase_qty = purchases.aggregate(total=Sum('qty'))['total'] or 0
-        purchase_amount = purchases.aggregate(total=Sum('total_price_aed'))['total'] or 0
-
-        # Sales in this month (approved invoices only)
-        sales = SaleItem.objects.filter(
-            invoice__status=SaleInvoice.STATUS_APPROVED,
-            invoice__sale_date__gte=month_start,
-            invoice__sale_date__lte=month_end
-        )
-        sales_qty = sales.aggregate(total=Sum('qty'))['total'] or 0
-        sales_amount = sales.aggregate(total=Sum('total_price_aed'))['total'] or 0
-
-        # Closing stock for the month
-        closing_stock, closing_stock_amount = get_total_stock_qty_and_amount(month_end)
+        purchases = purchases_by_month.get((year, m), {})
+        sales = sales_by_month.get((year, m), {})
+
+        purchase_qty = purchases.get('total_qty') or 0
+        purchase_amount = purchases.get('total_amount') or 0
+        sales_qty = sales.get('total_qty') or 0
+        sales_amount = sales.get('total_amount') or 0
+
+        # Roll the cumulative totals forward to the month end
+        purchased_qty += purchase_qty
+        purchased_amount += purchases.get('total_amount') or Decimal('0')
+        sold_qty += sales_qty
+        sold_amount += sales.get('total_cost') or Decimal('0')
+        closing_stock, closing_stock_amount = stock_qty_and_amount(
+            purchased_qty, purchased_amount, sold_qty, sold_amount)
 
         monthly_data.append({
             'month': month_start.strftime('%B'),
-            'opening_stock': opening_stock_month,
-            'opening_stock_amount': float(opening_stock_amount_month),
+            'opening_stock': month_closing_qty,
+            'opening_stock_amount': float(month_closing_amount),
             'purchase_qty': purchase_qty,
             'purchase_amount': float(purchase_amount),
             'sales_qty': sales_qty,
@@ -97,17 +107,13 @@ def get_yearly_summary_report(year):
         month_closing_qty = closing_stock
         month_closing_amount = closing_stock_amount
 
-    # Grand totals for the year
-    year_end = date(year, 12, 31)
-    closing_stock_year, closing_stock_amount_year = get_total_stock_qty_and_amount(year_end)
-
     return {
         'year': year,
         'monthly': monthly_data,
         'grand_totals': {
             'opening_stock': opening_stock,
             'opening_stock_amount': float(opening_stock_amount),
-            'closing_stock': closing_stock_year,
-            'closing_stock_amount': float(closing_stock_amount_year),
+            'closing_stock': month_closing_qty,
+            'closing_stock_amount': float(month_closing_amount),
         }
-    }
\ No newline at end of file
+    }
@@ -0,0 +1,145 @@
+from calendar import monthrange
+from datetime import date, timedelta
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Sum, Min
+from purchase.models import PurchaseInvoice
+from sale.models import SaleInvoice
+from common.models import Expense, Wage
+from employee.models import SalaryEntry
+from report.models import PeriodClose
+from report.utils import (get_stock_totals, get_stock_movements, get_sundry_debtors,
+                          get_sundry_creditors, get_closing_stock_valuation)
+
+# Reports covering "all history" start here; the first closed period does too.
+PERIOD_CLOSE_START = date(2000, 1, 1)
+
+
+def _month_end(value):
+    return date(value.year, value.month, monthrange(value.year, value.month)[1])
+
+
+def get_closed_periods(start_date, end_date):
+    """
+    Closed periods that cover [start_date, end_date] from its first day
+    without gaps, in order. Empty when no period starts on start_date.
+    """
+    chain = []
+    expected_start = start_date
+    for period in PeriodClose.objects.filter(
+            period_start__gte=start_date, period_end__lte=end_date).order_by('period_start'):
+        if period.period_start != expected_start:
+            break
+        chain.append(period)
+        expected_start = period.period_end + timedelta(days=1)
+    return chain
+
+
+def get_last_closed_period(as_of_date):
+    """The latest closed period ending on or before as_of_date, if any."""
+    return PeriodClose.objects.filter(period_end__lte=as_of_date).order_by('-period_end').first()
+
+
+def get_stock_totals_as_of(as_of_date, last_period=None):
+    """
+    Same result as report.utils.get_stock_totals, starting from the last
+    closed period instead of aggregating all history.
+    """
+    last_period = last_period or get_last_closed_period(as_of_date)
+    if not last_period:
+        return get_stock_totals(as_of_date)
+    if last_period.period_end == as_of_date:
+        return last_period.stock_totals
+    movements = get_stock_movements(last_period.period_end + timedelta(days=1), as_of_date)
+    return tuple(total + movement for total, movement in zip(last_period.stock_totals, movements))
+
+
+def get_sundry_debtors_as_of(as_of_date, last_period=None):
+    """Same result as get_sundry_debtors(as_of_date, 'aed'), starting from the last close."""
+    last_period = last_period or get_last_closed_period(as_of_date)
+    if not last_period:
+        return get_sundry_debtors(as_of_date, currency='aed')
+    return last_period.sundry_debtors + (SaleInvoice.objects.filter(
+        status=SaleInvoice.STATUS_APPROVED,
+        sale_date__gt=last_period.period_end,
+        sale_date__lte=as_of_date
+    ).aggregate(total=Sum('total_with_vat_aed'))['total'] or Decimal('0'))
+
+
+def get_sundry_creditors_as_of(as_of_date, last_period=None):
+    """Same result as get_sundry_creditors(as_of_date, 'aed'), starting from the last close."""
+    last_period = last_period or get_last_closed_period(as_of_date)
+    if not last_period:
+        return get_sundry_creditors(as_of_date, currency='aed')
+    return last_period.sundry_creditors + (PurchaseInvoice.objects.filter(
+        status=PurchaseInvoice.STATUS_APPROVED,
+        purchase_date__gt=last_period.period_end,
+        purchase_date__lte=as_of_date
+    ).aggregate(total=Sum('total_with_vat_aed'))['total'] or Decimal('0'))
+
+
+def get_closing_stock_value_as_of(as_of_date):
+    """Closing stock valued at the latest purchase price, from the snapshot when one ends that day."""
+    period = PeriodClose.objects.filter(period_end=as_of_date).first()
+    if period:
+        return period.closing_stock_value
+    return sum((row['value'] for row in get_closing_stock_valuation(as_of_date).values()), Decimal('0'))
+
+
+def _first_activity_date():
+    dates = [
+        PurchaseInvoice.objects.aggregate(first=Min('purchase_date'))['first'],
+        SaleInvoice.objects.aggregate(first=Min('sale_date'))['first'],
+        Expense.objects.aggregate(first=Min('date'))['first'],
+        Wage.objects.aggregate(first=Min('date'))['first'],
+        SalaryEntry.objects.aggregate(first=Min('date'))['first'],
+    ]
+    dates = [d for d in dates if d]
+    return min(dates) if dates else None
+
+
+def close_periods(through_date):
+    """
+    Close every month up to the month of through_date that is not closed yet.
+
+    The first period starts at PERIOD_CLOSE_START and runs to the end of the
+    month of the first recorded activity; after that each month is closed
+    separately.
+
+    Returns:
+        list: the created PeriodClose rows
+    """
+    from report.helpers.profict_loss import compute_profit_and_loss_components
+
+    through_end = _month_end(through_date)
+    last_period = PeriodClose.objects.order_by('-period_end').first()
+    if last_period:
+        period_start = last_period.period_end + timedelta(days=1)
+        period_end = _month_end(period_start)
+    else:
+        period_start = PERIOD_CLOSE_START
+        first_activity = _first_activity_date() or through_end
+        period_end = _month_end(max(first_activity, PERIOD_CLOSE_START))
+
+    created = []
+    while period_end <= through_end:
+        with transaction.atomic():
+            period = PeriodClose(period_start=period_start, period_end=period_end)
+            period.set_components(compute_profit_and_loss_components(period_start, period_end))
+            (period.purchased_qty, period.purchased_amount,
+             period.sold_qty, period.sold_amount) = get_stock_totals_as_of(period_end, last_period)
+            period.sundry_debtors = get_sundry_debtors_as_of(period_end, last_period)
+            period.sundry_creditors = get_sundry_creditors_as_of(period_end, last_period)
+            period.closing_stock_value = get_closing_stock_value_as_of(period_end)
+            period.save()
+        created.append(period)
+        last_period = period
+        period_start = period_end + timedelta(days=1)
+        period_end = _month_end(period_start)
+    return created
+
+
+def reopen_periods(from_date):
+    """Delete the snapshots of every period ending on or after from_date."""
+    deleted, _ = PeriodClose.objects.filter(period_end__gte=from_date).delete()
+    return deleted
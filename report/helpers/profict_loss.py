@@ -1,28 +1,51 @@
 from purchase.models import PurchaseInvoice, PurchaseItem
 from sale.models import SaleInvoice, SaleItem, SaleReturnItem, SaleReturnItemEntry
 from purchase.models import PurchaseReturnItemEntry, PurchaseReturnItem
-from common.models import Expense, Wage, Commission, ServiceFee, ExtraCharges,Asset, ExpenseType
+from common.models import Expense, Wage, Commission, ServiceFee, ExtraCharges
 from employee.models import SalaryEntry
-from inventory.models import Stock
-from products.models import ProductItem
+from report.utils import stock_qty_and_amount
+from report.helpers.period_close import get_closed_periods, get_stock_totals_as_of
+from report.helpers import facts
 from django.db.models import Sum, Q, F
 from decimal import Decimal
 from datetime import timedelta, date, datetime
 
 
+# Amounts that add up across consecutive periods
+FLOW_COMPONENTS = (
+    'wages_aed', 'salary_aed', 'service_fees_aed', 'commission_aed',
+    'extra_charges_sales_aed', 'extra_charges_purchase_aed',
+    'purchase_with_vat_aed', 'purchase_vat_aed', 'purchase_shipping_aed',
+    'custom_duty_aed', 'purchase_discount_aed', 'purchase_return_aed',
+    'sales_with_vat_aed', 'sales_vat_aed', 'sales_discount_aed',
+    'sales_shipping_aed', 'sales_return_aed',
+    'direct_expenses_aed', 'indirect_expenses_aed',
+)
+TYPEWISE_COMPONENTS = ('direct_expenses_typewise', 'indirect_expenses_typewise')
+STOCK_COMPONENTS = ('opening_stock_qty', 'opening_stock_aed', 'closing_stock_qty', 'closing_stock_aed')
 
-def get_profit_and_loss_report(start_date, end_date):
-    """
-    Returns a dict with profit and loss data for the given period.
-    Includes: purchase, sale, direct/indirect expenses (type-wise), opening/closing stock,
-    service fees, commission, wage, extra charges, salary, assets, liabilities.
+
+def _to_date(value):
+    if isinstance(value, str):
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    return value
+
+
+def compute_profit_and_loss_components(start_date, end_date):
     """
+    Aggregate the profit and loss components of a period from the
+    transaction tables.
 
-    # Convert string dates to date objects if necessary
-    if isinstance(start_date, str):
-        start_date = datetime.strptime(start_date, "%Y-%m-%d").date()
-    if isinstance(end_date, str):
-        end_date = datetime.strptime(end_date, "%Y-%m-%d").date()
+    Returns:
+        dict: Decimal amounts keyed by FLOW_COMPONENTS, {type name: Decimal}
+        breakdowns keyed by TYPEWISE_COMPONENTS and opening/closing stock
+
+    Reads the daily fact tables instead when REPORT_BACKEND is 'facts'.
+    """
+    start_date = _to_date(start_date)
+    end_date = _to_date(end_date)
+    if facts.use_fact_tables():
+        return facts.compute_profit_and_loss_components(start_date, end_date)
 
     # other amounts
     # Wages
@@ -48,163 +71,226 @@ def get_profit_and_loss_report(start_date, end_date):
         total=Sum('amount_aed'))['total'] or Decimal('0')
 
     # Extra Charges (for sales and purchases)
-    extra_charges_sales = \
-    ExtraCharges.objects.filter(content_type__model='saleinvoice',
-        sale_invoices__sale_date__gte=start_date,
-        sale_invoices__sale_date__lte=end_date).aggregate(total=Sum('amount'))[
-        'total'] or Decimal('0')
-    extra_charges_purchase = \
-    ExtraCharges.objects.filter(content_type__model='purchaseinvoice',
-        purchase_invoices__purchase_date__gte=start_date,
-        purchase_invoices__purchase_date__lte=end_date).aggregate(
-        total=Sum('amount'))['total'] or Decimal('0')
-    total_extra_charges_aed = extra_charges_sales + extra_charges_purchase
+    extra_charges = ExtraCharges.objects.aggregate(
+        sales=Sum('amount', filter=Q(content_type__model='saleinvoice',
+                                     sale_invoices__sale_date__gte=start_date,
+                                     sale_invoices__sale_date__lte=end_date)),
+        purchase=Sum('amount', filter=Q(content_type__model='purchaseinvoice',
+                                        purchase_invoices__purchase_date__gte=start_date,
+                                        purchase_invoices__purchase_date__lte=end_date)),
+    )
+    extra_charges_sales = extra_charges['sales'] or Decimal('0')
+    extra_charges_purchase = extra_charges['purchase'] or Decimal('0')
 
     # Purchases
-    purchase_invoices = PurchaseInvoice.objects.filter(
+    purchases = PurchaseInvoice.objects.filter(
         status=PurchaseInvoice.STATUS_APPROVED,
         purchase_date__gte=start_date,
         purchase_date__lte=end_date
+    ).aggregate(
+        with_vat=Sum('total_with_vat_aed'),
+        vat=Sum('vat_amount_aed'),
+        discount=Sum('discount_aed'),
     )
-    total_purchase_with_vat_aed = purchase_invoices.aggregate(total=Sum('total_with_vat_aed'))['total'] or Decimal('0')
-    total_purchase_vat_aed = purchase_invoices.aggregate(total=Sum('vat_amount_aed'))['total'] or Decimal('0')
-    purchase_ids = list(purchase_invoices.values_list('id', flat=True))
-    purchase_shipping_aed = PurchaseItem.objects.filter(invoice_id__in=purchase_ids).aggregate(
-        total=Sum('shipping_total_aed'))['total'] or Decimal('0')
-    custom_duty_aed = PurchaseItem.objects.filter(invoice_id__in=purchase_ids).aggregate(
-        total=Sum('custom_duty_aed_total'))['total'] or Decimal('0')
-    total_purchase_without_vat_aed = (total_purchase_with_vat_aed -
-                                      total_purchase_vat_aed -
-                                      purchase_shipping_aed - custom_duty_aed)
-    total_purchase_discount_aed = purchase_invoices.aggregate(total=Sum('discount_aed'))['total'] or Decimal('0')
-
+    total_purchase_with_vat_aed = purchases['with_vat'] or Decimal('0')
+    total_purchase_vat_aed = purchases['vat'] or Decimal('0')
+    total_purchase_discount_aed = purchases['discount'] or Decimal('0')
 
+    # Purchase lines: shipping, duty and the stock bought in the period
+    purchase_items = PurchaseItem.objects.filter(
+        invoice__status=PurchaseInvoice.STATUS_APPROVED,
+        invoice__purchase_date__gte=start_date,
+        invoice__purchase_date__lte=end_date
+    ).aggregate(
+        shipping=Sum('shipping_total_aed'),
+        custom_duty=Sum('custom_duty_aed_total'),
+        total_qty=Sum('qty'),
+        total_amount=Sum('total_price_aed'),
+    )
+    purchase_shipping_aed = purchase_items['shipping'] or Decimal('0')
+    custom_duty_aed = purchase_items['custom_duty'] or Decimal('0')
 
     # Sales
-    sales_invoices = SaleInvoice.objects.filter(
+    sales = SaleInvoice.objects.filter(
         status=SaleInvoice.STATUS_APPROVED,
         sale_date__gte=start_date,
         sale_date__lte=end_date
+    ).aggregate(
+        with_vat=Sum('total_with_vat_aed'),
+        vat=Sum('vat_amount_aed'),
+        discount=Sum('discount_aed'),
     )
-    total_sales_with_vat_aed = sales_invoices.aggregate(total=Sum('total_with_vat_aed'))['total'] or Decimal('0')
-    total_sales_vat_aed = sales_invoices.aggregate(total=Sum('vat_amount_aed'))['total'] or Decimal('0')
-    total_sales_without_vat_aed = (total_sales_with_vat_aed -
-                                   total_sales_vat_aed -
-                                   total_service_fees_aed)
-    total_sales_discount_aed = sales_invoices.aggregate(total=Sum('discount_aed'))['total'] or Decimal('0')
-    sales_ids = list(sales_invoices.values_list('id', flat=True))
-    sales_shipping_aed = SaleItem.objects.filter(invoice_id__in=sales_ids).aggregate(
-        total=Sum('shipping_aed'))['total'] or Decimal('0')
+    total_sales_with_vat_aed = sales['with_vat'] or Decimal('0')
+    total_sales_vat_aed = sales['vat'] or Decimal('0')
+    total_sales_discount_aed = sales['discount'] or Decimal('0')
 
-    # Expenses (type-wise for direct and indirect)
-    direct_expenses_qs = Expense.objects.filter(
-        type__category='direct',
-        date__gte=start_date,
-        date__lte=end_date
+    # Sale lines: shipping and the stock sold in the period at cost
+    sale_items = SaleItem.objects.filter(
+        invoice__status=SaleInvoice.STATUS_APPROVED,
+        invoice__sale_date__gte=start_date,
+        invoice__sale_date__lte=end_date
+    ).aggregate(
+        shipping=Sum('shipping_aed'),
+        total_qty=Sum('qty'),
+        total_cost=Sum(F('qty') * F('purchase_item__unit_price_aed')),
     )
-    indirect_expenses_qs = Expense.objects.filter(
-        type__category='indirect',
+    sales_shipping_aed = sale_items['shipping'] or Decimal('0')
+
+    # Expenses (type-wise for direct and indirect)
+    expenses_qs = Expense.objects.filter(
+        type__category__in=['direct', 'indirect'],
         date__gte=start_date,
         date__lte=end_date
     )
 
     # Aggregate totals
-    direct_expenses_aed = direct_expenses_qs.aggregate(total=Sum('amount_aed'))['total'] or Decimal('0')
-    indirect_expenses_aed = indirect_expenses_qs.aggregate(total=Sum('amount_aed'))['total'] or Decimal('0')
-
-    # Type-wise breakdowns
-    direct_expenses_typewise = list(
-        direct_expenses_qs.values('type__name').annotate(total=Sum('amount_aed'))
-    )
-    indirect_expenses_typewise = list(
-        indirect_expenses_qs.values('type__name').annotate(total=Sum('amount_aed'))
+    expenses = expenses_qs.aggregate(
+        direct=Sum('amount_aed', filter=Q(type__category='direct')),
+        indirect=Sum('amount_aed', filter=Q(type__category='indirect')),
     )
+    direct_expenses_aed = expenses['direct'] or Decimal('0')
+    indirect_expenses_aed = expenses['indirect'] or Decimal('0')
 
+    # Type-wise breakdowns
+    direct_expenses_typewise = {}
+    indirect_expenses_typewise = {}
+    for e in expenses_qs.values('type__category', 'type__name').annotate(total=Sum('amount_aed')):
+        typewise = direct_expenses_typewise if e['type__category'] == 'direct' else indirect_expenses_typewise
+        typewise[e['type__name']] = e['total'] or Decimal('0')
 
     # --- Opening/Closing Stock Calculation (same logic as get_yearly_summary_report) ---
-
-    def get_total_stock_qty_and_amount(as_of_date):
-        purchases = PurchaseItem.objects.filter(
-            Q(invoice__status=PurchaseInvoice.STATUS_APPROVED, invoice__purchase_date__lte=as_of_date) |
-            Q(invoice__isnull=True)
-        )
-        total_purchased_qty = purchases.aggregate(total=Sum('qty'))['total'] or 0
-        total_purchased_amount = purchases.aggregate(total=Sum('total_price_aed'))['total'] or Decimal('0')
-
-        sales = SaleItem.objects.filter(
-            invoice__status=SaleInvoice.STATUS_APPROVED,
-            invoice__sale_date__lte=as_of_date,
-        )
-        sales_qty = sales.aggregate(total=Sum('qty'))['total'] or 0
-        total_sales_amount = sales.aggregate(
-        total=Sum(F('qty') * F('purchase_item__unit_price_aed'))
-        )['total'] or Decimal('0')
-
-        closing_qty = total_purchased_qty - sales_qty
-        # Closing amount is purchase price minus sale price for remaining stock
-        closing_amount = Decimal('0')
-        if total_purchased_qty > 0:
-            closing_amount = total_purchased_amount - total_sales_amount
-        return closing_qty, closing_amount
-
     # Opening stock as of day before start_date
-    opening_stock_qty, opening_stock_aed = get_total_stock_qty_and_amount(start_date - timedelta(days=1))
-    # Closing stock as of end_date
-    closing_stock_qty, closing_stock_aed = get_total_stock_qty_and_amount(end_date)
-
-    # Assets
-    assets = Asset.objects.all()
-    assets_total = assets.aggregate(total=Sum('price'))['total'] or Decimal('0')
-    assets_list = [
-        {
-            'name': a.name,
-            'price': float(a.price),
-            'quantity': a.quantity,
-            'status': a.status,
-            'description': a.description
-        }
-        for a in assets
-    ]
-
-    # Liabilities (Sundry Creditors)
-    from customer.models import Party
-    creditors = Party.objects.filter(
-        type='supplier',
-        purchase_invoices__status=PurchaseInvoice.STATUS_APPROVED,
-        purchase_invoices__purchase_date__lte=end_date
-    ).annotate(
-        total_credit=Sum('purchase_invoices__total_with_vat_aed')
-    ).filter(total_credit__gt=0)
-    liabilities_total = sum([c.total_credit for c in creditors]) if creditors else Decimal('0')
-    liabilities_list = [
-        {
-            'party': c.name,
-            'amount': float(c.total_credit)
-        }
-        for c in creditors
-    ]
+    opening_totals = get_stock_totals_as_of(start_date - timedelta(days=1))
+    opening_stock_qty, opening_stock_aed = stock_qty_and_amount(*opening_totals)
+    # Closing stock as of end_date: opening plus the period's purchases and sales
+    purchased_qty, purchased_amount, sold_qty, sold_amount = opening_totals
+    closing_stock_qty, closing_stock_aed = stock_qty_and_amount(
+        purchased_qty + (purchase_items['total_qty'] or 0),
+        purchased_amount + (purchase_items['total_amount'] or Decimal('0')),
+        sold_qty + (sale_items['total_qty'] or 0),
+        sold_amount + (sale_items['total_cost'] or Decimal('0')),
+    )
 
     # --- Sales Return ---
-    sales_return_entries = SaleReturnItemEntry.objects.filter(
+    sales_return_aed = SaleReturnItemEntry.objects.filter(
         sale_return__return_date__gte=start_date,
         sale_return__return_date__lte=end_date
-    )
-    sales_return_aed = sales_return_entries.aggregate(
+    ).aggregate(
         total=Sum('sale_item__amount_aed')
     )['total'] or Decimal('0')
 
     # --- Purchase Return ---
-    purchase_return_entries = PurchaseReturnItemEntry.objects.filter(
+    purchase_return_aed = PurchaseReturnItemEntry.objects.filter(
         purchase_return__return_date__gte=start_date,
         purchase_return__return_date__lte=end_date
-    )
-    purchase_return_aed = purchase_return_entries.aggregate(
+    ).aggregate(
         total=Sum('purchase_item__amount_aed')
     )['total'] or Decimal('0')
 
+    return {
+        'wages_aed': total_wages_aed,
+        'salary_aed': total_salary_aed,
+        'service_fees_aed': total_service_fees_aed,
+        'commission_aed': total_commission_aed,
+        'extra_charges_sales_aed': extra_charges_sales,
+        'extra_charges_purchase_aed': extra_charges_purchase,
+        'purchase_with_vat_aed': total_purchase_with_vat_aed,
+        'purchase_vat_aed': total_purchase_vat_aed,
+        'purchase_shipping_aed': purchase_shipping_aed,
+        'custom_duty_aed': custom_duty_aed,
+        'purchase_discount_aed': total_purchase_discount_aed,
+        'purchase_return_aed': purchase_return_aed,
+        'sales_with_vat_aed': total_sales_with_vat_aed,
+        'sales_vat_aed': total_sales_vat_aed,
+        'sales_discount_aed': total_sales_discount_aed,
+        'sales_shipping_aed': sales_shipping_aed,
+        'sales_return_aed': sales_return_aed,
+        'direct_expenses_aed': direct_expenses_aed,
+        'indirect_expenses_aed': indirect_expenses_aed,
+        'direct_expenses_typewise': direct_expenses_typewise,
+        'indirect_expenses_typewise': indirect_expenses_typewise,
+        'opening_stock_qty': opening_stock_qty,
+        'opening_stock_aed': opening_stock_aed,
+        'closing_stock_qty': closing_stock_qty,
+        'closing_stock_aed': closing_stock_aed,
+    }
+
+
+def add_profit_and_loss_components(earlier, later):
+    """
+    Combine the components of two consecutive periods: amounts are summed,
+    opening stock comes from the earlier period and closing stock from the later.
+    """
+    combined = {key: earlier[key] + later[key] for key in FLOW_COMPONENTS}
+    for key in TYPEWISE_COMPONENTS:
+        typewise = dict(earlier[key])
+        for name, total in later[key].items():
+            typewise[name] = typewise.get(name, Decimal('0')) + total
+        combined[key] = typewise
+    combined['opening_stock_qty'] = earlier['opening_stock_qty']
+    combined['opening_stock_aed'] = earlier['opening_stock_aed']
+    combined['closing_stock_qty'] = later['closing_stock_qty']
+    combined['closing_stock_aed'] = later['closing_stock_aed']
+    return combined
+
+
+def get_profit_and_loss_components(start_date, end_date):
+    """
+    Profit and loss components of a period, taking closed periods from their
+    snapshots and aggregating only the days after the last of them.
+    """
+    start_date = _to_date(start_date)
+    end_date = _to_date(end_date)
+
+    components = None
+    live_start = start_date
+    for period in get_closed_periods(start_date, end_date):
+        closed = period.get_components()
+        components = add_profit_and_loss_components(components, closed) if components else closed
+        live_start = period.period_end + timedelta(days=1)
+
+    if live_start > end_date:
+        return components
+    live = compute_profit_and_loss_components(live_start, end_date)
+    return add_profit_and_loss_components(components, live) if components else live
+
+
+def get_profit_and_loss_totals(components):
+    """Derive net purchases, net sales, gross and net profit from the components."""
+    total_purchase_without_vat_aed = (components['purchase_with_vat_aed'] -
+                                      components['purchase_vat_aed'] -
+                                      components['purchase_shipping_aed'] - components['custom_duty_aed'])
+    total_sales_without_vat_aed = (components['sales_with_vat_aed'] -
+                                   components['sales_vat_aed'] -
+                                   components['service_fees_aed'])
+
     # Net Profit Calculation
-    gross_profit = (total_sales_without_vat_aed + closing_stock_aed) - (total_purchase_without_vat_aed + opening_stock_aed)
-    net_profit = gross_profit - (direct_expenses_aed + indirect_expenses_aed + total_wages_aed + total_salary_aed + total_commission_aed)
+    gross_profit = ((total_sales_without_vat_aed + components['closing_stock_aed']) -
+                    (total_purchase_without_vat_aed + components['opening_stock_aed']))
+    net_profit = gross_profit - (components['direct_expenses_aed'] + components['indirect_expenses_aed'] +
+                                 components['wages_aed'] + components['salary_aed'] +
+                                 components['commission_aed'])
+    return {
+        'purchase_without_vat_aed': total_purchase_without_vat_aed,
+        'sales_without_vat_aed': total_sales_without_vat_aed,
+        'gross_profit': gross_profit,
+        'net_profit': net_profit,
+    }
+
+
+def get_profit_and_loss_report(start_date, end_date):
+    """
+    Returns a dict with profit and loss data for the given period.
+    Includes: purchase, sale, direct/indirect expenses (type-wise), opening/closing stock,
+    service fees, commission, wage, extra charges, salary.
+    """
+
+    # Convert string dates to date objects if necessary
+    start_date = _to_date(start_date)
+    end_date = _to_date(end_date)
+
+    components = get_profit_and_loss_components(start_date, end_date)
+    totals = get_profit_and_loss_totals(components)
 
     # --- Return flat dict, no asset/liability sections ---
     return {
@@ -213,47 +299,48 @@ def get_profit_and_loss_report(start_date, end_date):
             'end_date': str(end_date)
         },
         'purchase': {
-            'total_with_vat_aed': float(total_purchase_with_vat_aed),
-            'total_without_vat_aed': float(total_purchase_without_vat_aed),
-            'vat_aed': float(total_purchase_vat_aed),
-            'discount_aed': float(total_purchase_discount_aed),
-            'total_shipping_aed': float(purchase_shipping_aed),
-            'purchase_return_aed': float(purchase_return_aed),
-            'total_custom_duty_aed': float(custom_duty_aed)
+            'total_with_vat_aed': float(components['purchase_with_vat_aed']),
+            'total_without_vat_aed': float(totals['purchase_without_vat_aed']),
+            'vat_aed': float(components['purchase_vat_aed']),
+            'discount_aed': float(components['purchase_discount_aed']),
+            'total_shipping_aed': float(components['purchase_shipping_aed']),
+            'purchase_return_aed': float(components['purchase_return_aed']),
+            'total_custom_duty_aed': float(components['custom_duty_aed'])
         },
         'sales': {
-            'total_with_vat_aed': float(total_sales_with_vat_aed),
-            'total_without_vat_aed': float(total_sales_without_vat_aed),
-            'vat_aed': float(total_sales_vat_aed),
-            'discount_aed': float(total_sales_discount_aed),
-            'shipping_aed': float(sales_shipping_aed),
-            'sales_return_aed': float(sales_return_aed),
+            'total_with_vat_aed': float(components['sales_with_vat_aed']),
+            'total_without_vat_aed': float(totals['sales_without_vat_aed']),
+            'vat_aed': float(components['sales_vat_aed']),
+            'discount_aed': float(components['sales_discount_aed']),
+            'shipping_aed': float(components['sales_shipping_aed']),
+            'sales_return_aed': float(components['sales_return_aed']),
         },
         'expenses': {
-            'direct_expenses_aed': float(direct_expenses_aed),
+            'direct_expenses_aed': float(components['direct_expenses_aed']),
             'direct_expenses_typewise': [
-                {'type': e['type__name'], 'total': float(e['total'] or 0)}
-                for e in direct_expenses_typewise
+                {'type': name, 'total': float(total)}
+                for name, total in components['direct_expenses_typewise'].items()
             ],
-            'indirect_expenses_aed': float(indirect_expenses_aed),
+            'indirect_expenses_aed': float(components['indirect_expenses_aed']),
             'indirect_expenses_typewise': [
-                {'type': e['type__name'], 'total': float(e['total'] or 0)}
-                for e in indirect_expenses_typewise
+                {'type': name, 'total': float(total)}
+                for name, total in components['indirect_expenses_typewise'].items()
             ],
-            'wages_aed': float(total_wages_aed),
-            'salary_aed': float(total_salary_aed),
-            'commission_aed': float(total_commission_aed),
-            'service_fees_aed': float(total_service_fees_aed),
-            'extra_charges_aed': float(total_extra_charges_aed),
+            'wages_aed': float(components['wages_aed']),
+            'salary_aed': float(components['salary_aed']),
+            'commission_aed': float(components['commission_aed']),
+            'service_fees_aed': float(components['service_fees_aed']),
+            'extra_charges_aed': float(components['extra_charges_sales_aed'] +
+                                       components['extra_charges_purchase_aed']),
         },
         'stock': {
-            'opening_stock_qty': opening_stock_qty,
-            'opening_stock_aed': float(opening_stock_aed),
-            'closing_stock_qty': closing_stock_qty,
-            'closing_stock_aed': float(closing_stock_aed),
+            'opening_stock_qty': components['opening_stock_qty'],
+            'opening_stock_aed': float(components['opening_stock_aed']),
+            'closing_stock_qty': components['closing_stock_qty'],
+            'closing_stock_aed': float(components['closing_stock_aed']),
         },
         'profit': {
-            'gross_profit': float(gross_profit),
-            'net_profit': float(net_profit),
+            'gross_profit': float(totals['gross_profit']),
+            'net_profit': float(totals['net_profit']),
         }
-    }
\ No newline at end of file
+    }
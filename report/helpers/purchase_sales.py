@@ -0,0 +1,117 @@
+from decimal import Decimal
+from django.db.models import Sum, Q
+from purchase.models import PurchaseInvoice, PurchaseItem
+from sale.models import SaleInvoice, SaleItem
+from common.models import Expense, Wage
+from employee.models import SalaryEntry
+from report.helpers import facts
+
+
+def get_purchase_sales_totals(start_date=None, end_date=None):
+    """
+    Approved purchase and sales totals with expenses, wages and salary for an
+    optional date range.
+
+    Returns:
+        dict: Decimal totals keyed purchase_*, sales_*, direct_*, indirect_*,
+        wages_aed and salary_*
+    """
+    if facts.use_fact_tables():
+        return facts.get_purchase_sales_totals(start_date, end_date)
+
+    purchase_filters = {}
+    sales_filters = {}
+    date_filters = {}
+    if start_date:
+        purchase_filters['purchase_date__gte'] = start_date
+        sales_filters['sale_date__gte'] = start_date
+        date_filters['date__gte'] = start_date
+    if end_date:
+        purchase_filters['purchase_date__lte'] = end_date
+        sales_filters['sale_date__lte'] = end_date
+        date_filters['date__lte'] = end_date
+
+    # PURCHASES
+    purchases = PurchaseInvoice.objects.filter(
+        status=PurchaseInvoice.STATUS_APPROVED, **purchase_filters
+    ).aggregate(
+        with_vat_usd=Sum('total_with_vat_usd'), with_vat_aed=Sum('total_with_vat_aed'),
+        vat_usd=Sum('vat_amount_usd'), vat_aed=Sum('vat_amount_aed'),
+        discount_usd=Sum('discount_usd'), discount_aed=Sum('discount_aed'),
+    )
+    purchases.update(PurchaseItem.objects.filter(
+        invoice__status=PurchaseInvoice.STATUS_APPROVED,
+        **{f'invoice__{key}': value for key, value in purchase_filters.items()}
+    ).aggregate(shipping_usd=Sum('shipping_per_unit_usd'), shipping_aed=Sum('shipping_per_unit_aed')))
+
+    # SALES
+    sales = SaleInvoice.objects.filter(
+        status=SaleInvoice.STATUS_APPROVED, **sales_filters
+    ).aggregate(
+        with_vat_usd=Sum('total_with_vat_usd'), with_vat_aed=Sum('total_with_vat_aed'),
+        vat_usd=Sum('vat_amount_usd'), vat_aed=Sum('vat_amount_aed'),
+        discount_usd=Sum('discount_usd'), discount_aed=Sum('discount_aed'),
+    )
+    sales.update(SaleItem.objects.filter(
+        invoice__status=SaleInvoice.STATUS_APPROVED,
+        **{f'invoice__{key}': value for key, value in sales_filters.items()}
+    ).aggregate(shipping_usd=Sum('shipping_usd'), shipping_aed=Sum('shipping_aed')))
+
+    # EXPENSES & WAGES & SALARY
+    expenses = Expense.objects.filter(**date_filters).aggregate(
+        direct_usd=Sum('amount_usd', filter=Q(type__category='direct')),
+        direct_aed=Sum('amount_aed', filter=Q(type__category='direct')),
+        indirect_usd=Sum('amount_usd', filter=Q(type__category='indirect')),
+        indirect_aed=Sum('amount_aed', filter=Q(type__category='indirect')),
+    )
+    expenses['wages_aed'] = Wage.objects.filter(**date_filters).aggregate(total=Sum('amount_aed'))['total']
+    expenses.update(SalaryEntry.objects.filter(**date_filters).aggregate(
+        salary_usd=Sum('amount_usd'), salary_aed=Sum('amount_aed')))
+
+    totals = {f'purchase_{key}': value for key, value in purchases.items()}
+    totals.update({f'sales_{key}': value for key, value in sales.items()})
+    totals.update(expenses)
+    return {key: value or Decimal('0') for key, value in totals.items()}
+
+
+def get_purchase_sales_report(start_date=None, end_date=None):
+    totals = get_purchase_sales_totals(start_date, end_date)
+
+    def section(prefix):
+        with_vat_usd = totals[f'{prefix}_with_vat_usd']
+        with_vat_aed = totals[f'{prefix}_with_vat_aed']
+        vat_usd = totals[f'{prefix}_vat_usd']
+        vat_aed = totals[f'{prefix}_vat_aed']
+        return {
+            "total_with_vat_usd": float(with_vat_usd),
+            "total_with_vat_aed": float(with_vat_aed),
+            "total_without_vat_usd": float(with_vat_usd - vat_usd),
+            "total_without_vat_aed": float(with_vat_aed - vat_aed),
+            "vat_usd": float(vat_usd),
+            "vat_aed": float(vat_aed),
+            "total_shipping_usd": float(totals[f'{prefix}_shipping_usd']),
+            "total_shipping_aed": float(totals[f'{prefix}_shipping_aed']),
+            "total_discount_usd": float(totals[f'{prefix}_discount_usd']),
+            "total_discount_aed": float(totals[f'{prefix}_discount_aed']),
+        }
+
+    # For backward compatibility, keep all_expenses as sum of all
+    all_expenses_usd = totals['direct_usd'] + totals['indirect_usd'] + totals['salary_usd']
+    all_expenses_aed = (totals['direct_aed'] + totals['indirect_aed'] +
+                        totals['wages_aed'] + totals['salary_aed'])
+
+    return {
+        "purchase": section('purchase'),
+        "sales": section('sales'),
+        "expenses": {
+            "direct_expenses_usd": float(totals['direct_usd']),
+            "direct_expenses_aed": float(totals['direct_aed']),
+            "indirect_expenses_usd": float(totals['indirect_usd']),
+            "indirect_expenses_aed": float(totals['indirect_aed']),
+            "total_wages_aed": float(totals['wages_aed']),
+            "total_salary_usd": float(totals['salary_usd']),
+            "total_salary_aed": float(totals['salary_aed']),
+            "all_expenses_usd": float(all_expenses_usd),
+            "all_expenses_aed": float(all_expenses_aed),
+        }
+    }
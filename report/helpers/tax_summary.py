@@ -0,0 +1,199 @@
+from decimal import Decimal
+from django.db.models import Sum, F, Q, DecimalField
+from django.db.models.functions import TruncMonth, TruncQuarter
+from purchase.models import PurchaseInvoice, PurchaseItem
+from sale.models import SaleInvoice, SaleItem
+from common.models import Expense
+from employee.models import SalaryEntry
+from report.models import SalesFact, PurchaseFact, ExpenseFact
+from report.helpers import facts
+
+PERIOD_FUNCTIONS = {
+    'month': TruncMonth,
+    'quarter': TruncQuarter,
+}
+
+AMOUNT_FIELD = DecimalField(max_digits=20, decimal_places=2)
+
+
+def _date_filter(field, start_date, end_date):
+    date_filter = Q()
+    if start_date:
+        date_filter &= Q(**{f'{field}__gte': start_date})
+    if end_date:
+        date_filter &= Q(**{f'{field}__lte': end_date})
+    return date_filter
+
+
+def _aggregate(queryset, date_field, period, **aggregates):
+    """
+    Aggregate a queryset as a whole, or grouped by the start of each period.
+
+    Returns:
+        dict: {period_start or None: {alias: total}}
+    """
+    if not period:
+        return {None: queryset.aggregate(**aggregates)}
+    rows = queryset.annotate(
+        period_start=PERIOD_FUNCTIONS[period](date_field)
+    ).order_by().values('period_start').annotate(**aggregates)
+    return {row.pop('period_start'): row for row in rows}
+
+
+def _period_label(period_start, period):
+    if period == 'quarter':
+        return f"{period_start.year}-Q{(period_start.month - 1) // 3 + 1}"
+    return period_start.strftime('%Y-%m')
+
+
+def _summary(sales_vat, purchase_vat, sales_base, purchase_base, expenses, salary):
+    def total(values, key):
+        return values.get(key) or Decimal('0')
+
+    # Corporate tax calculation (Decimal math)
+    corporate_tax_usd = total(sales_base, 'usd') - (
+        total(purchase_base, 'usd') + total(expenses, 'usd') + total(salary, 'usd')
+    )
+    corporate_tax_aed = total(sales_base, 'aed') - (
+        total(purchase_base, 'aed') + total(expenses, 'aed') + total(salary, 'aed')
+    )
+
+    # Convert Decimals to float for JSON
+    return {
+        "sales": {
+            "total_vat_usd": float(total(sales_vat, 'usd')),
+            "total_vat_aed": float(total(sales_vat, 'aed')),
+        },
+        "purchase": {
+            "total_vat_usd": float(total(purchase_vat, 'usd')),
+            "total_vat_aed": float(total(purchase_vat, 'aed')),
+        },
+        "corporate_tax": {
+            "usd": float(corporate_tax_usd),
+            "aed": float(corporate_tax_aed),
+        }
+    }
+
+
+def _live_tables(start_date, end_date, period):
+    # VAT aggregation. The AED totals have never been limited to approved
+    # invoices; kept that way so reported figures do not change.
+    sales_vat = _aggregate(
+        SaleInvoice.objects.filter(_date_filter('sale_date', start_date, end_date)),
+        'sale_date', period,
+        usd=Sum('vat_amount_usd', filter=Q(status=SaleInvoice.STATUS_APPROVED)),
+        aed=Sum('vat_amount_aed'),
+    )
+    purchase_vat = _aggregate(
+        PurchaseInvoice.objects.filter(_date_filter('purchase_date', start_date, end_date)),
+        'purchase_date', period,
+        usd=Sum('vat_amount_usd', filter=Q(status=PurchaseInvoice.STATUS_APPROVED)),
+        aed=Sum('vat_amount_aed'),
+    )
+
+    # Sales base amount (qty * price + shipping)
+    sales_base = _aggregate(
+        SaleItem.objects.filter(invoice__status=SaleInvoice.STATUS_APPROVED).filter(
+            _date_filter('invoice__sale_date', start_date, end_date)),
+        'invoice__sale_date', period,
+        usd=Sum(F('sale_price_usd') * F('qty') + F('shipping_usd'), output_field=AMOUNT_FIELD),
+        aed=Sum(F('sale_price_aed') * F('qty') + F('shipping_aed'), output_field=AMOUNT_FIELD),
+    )
+
+    # Purchase base amount (qty * price + qty * shipping)
+    purchase_base = _aggregate(
+        PurchaseItem.objects.filter(invoice__status=PurchaseInvoice.STATUS_APPROVED).filter(
+            _date_filter('invoice__purchase_date', start_date, end_date)),
+        'invoice__purchase_date', period,
+        usd=Sum((F('unit_price_usd') + F('shipping_per_unit_usd')) * F('qty'), output_field=AMOUNT_FIELD),
+        aed=Sum((F('unit_price_aed') + F('shipping_per_unit_aed')) * F('qty'), output_field=AMOUNT_FIELD),
+    )
+
+    # Expenses & Salary
+    expenses = _aggregate(
+        Expense.objects.filter(_date_filter('date', start_date, end_date)),
+        'date', period,
+        usd=Sum('amount_usd'), aed=Sum('amount_aed'),
+    )
+    salary = _aggregate(
+        SalaryEntry.objects.filter(_date_filter('date', start_date, end_date)),
+        'date', period,
+        usd=Sum('amount_usd'), aed=Sum('amount_aed'),
+    )
+
+    return sales_vat, purchase_vat, sales_base, purchase_base, expenses, salary
+
+
+def _fact_tables(start_date, end_date, period):
+    """Same tables as _live_tables, read from the daily fact tables."""
+    date_filter = _date_filter('date', start_date, end_date)
+    sales = SalesFact.objects.filter(date_filter)
+    purchases = PurchaseFact.objects.filter(date_filter)
+    expense_facts = ExpenseFact.objects.filter(date_filter)
+
+    # Invoice totals live on the rows without a product, lines on the rows
+    # with one; return-only rows must not add periods of their own.
+    sales_vat = _aggregate(
+        sales.filter(product_item__isnull=True), 'date', period,
+        usd=Sum('vat_usd', filter=Q(status=SaleInvoice.STATUS_APPROVED)),
+        aed=Sum('vat_aed'),
+    )
+    purchase_vat = _aggregate(
+        purchases.filter(product_item__isnull=True), 'date', period,
+        usd=Sum('vat_usd', filter=Q(status=PurchaseInvoice.STATUS_APPROVED)),
+        aed=Sum('vat_aed'),
+    )
+    sales_base = _aggregate(
+        sales.filter(status=SaleInvoice.STATUS_APPROVED).exclude(qty=0), 'date', period,
+        usd=Sum(F('amount_usd') + F('shipping_usd'), output_field=AMOUNT_FIELD),
+        aed=Sum(F('amount_aed') + F('shipping_aed'), output_field=AMOUNT_FIELD),
+    )
+    purchase_base = _aggregate(
+        purchases.filter(status=PurchaseInvoice.STATUS_APPROVED).exclude(qty=0), 'date', period,
+        usd=Sum(F('amount_usd') + F('shipping_usd'), output_field=AMOUNT_FIELD),
+        aed=Sum(F('amount_aed') + F('shipping_aed'), output_field=AMOUNT_FIELD),
+    )
+    expenses = _aggregate(
+        expense_facts.filter(kind=ExpenseFact.KIND_EXPENSE), 'date', period,
+        usd=Sum('amount_usd'), aed=Sum('amount_aed'),
+    )
+    salary = _aggregate(
+        expense_facts.filter(kind=ExpenseFact.KIND_SALARY), 'date', period,
+        usd=Sum('amount_usd'), aed=Sum('amount_aed'),
+    )
+    return sales_vat, purchase_vat, sales_base, purchase_base, expenses, salary
+
+
+def get_tax_summary(start_date=None, end_date=None, period=None):
+    """
+    VAT totals and corporate tax base for a date range, summed in the database.
+
+    Args:
+        start_date: Optional first date (inclusive)
+        end_date: Optional last date (inclusive)
+        period: None for one summary, or 'month'/'quarter' to split the range
+
+    Returns:
+        dict: the summary when period is None, otherwise
+        {'period': period, 'results': [summary with 'period' and 'start_date', ...]}
+    """
+    if period and period not in PERIOD_FUNCTIONS:
+        raise ValueError(f"period must be one of: {', '.join(PERIOD_FUNCTIONS)}")
+
+    if facts.use_fact_tables():
+        tables = _fact_tables(start_date, end_date, period)
+    else:
+        tables = _live_tables(start_date, end_date, period)
+    if not period:
+        return _summary(*(table[None] for table in tables))
+
+    period_starts = sorted(set().union(*tables))
+    results = []
+    for period_start in period_starts:
+        summary = _summary(*(table.get(period_start, {}) for table in tables))
+        results.append({
+            'period': _period_label(period_start, period),
+            'start_date': str(period_start),
+            **summary,
+        })
+    return {'period': period, 'results': results}
@@ -0,0 +1,31 @@
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from report.helpers.period_close import close_periods, reopen_periods
+
+
+class Command(BaseCommand):
+    help = "Close every month up to the given month (YYYY-MM) into period snapshots"
+
+    def add_arguments(self, parser):
+        parser.add_argument('month', help='Last month to close, as YYYY-MM')
+        parser.add_argument('--reopen', action='store_true',
+                            help='Delete the snapshots from the given month onwards instead')
+
+    def handle(self, *args, **options):
+        try:
+            month = datetime.strptime(options['month'], '%Y-%m').date()
+        except ValueError:
+            raise CommandError("Month must be given as YYYY-MM")
+
+        if options['reopen']:
+            deleted = reopen_periods(month)
+            self.stdout.write(self.style.SUCCESS(f"Reopened {deleted} periods"))
+            return
+
+        if month >= datetime.today().date().replace(day=1):
+            raise CommandError("Only months that have already ended can be closed")
+
+        created = close_periods(month)
+        for period in created:
+            self.stdout.write(f"Closed {period.period_start} to {period.period_end}")
+        self.stdout.write(self.style.SUCCESS(f"Closed {len(created)} periods"))
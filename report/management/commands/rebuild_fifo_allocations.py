@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from products.models import ProductItem
+from report.helpers.fifo import compute_fifo_allocations, refresh_fifo_allocations
+from report.models import FifoAllocation
+
+
+class Command(BaseCommand):
+    help = "Rebuild the FIFO allocation table from approved purchases and sales, then verify it"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=200,
+                            help='Number of products rebuilt per batch')
+        parser.add_argument('--check-only', action='store_true',
+                            help='Only compare the stored table with a fresh replay')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        product_ids = list(ProductItem.objects.order_by('id').values_list('id', flat=True))
+
+        if not options['check_only']:
+            FifoAllocation.objects.exclude(product_item_id__in=product_ids).delete()
+            total = 0
+            for start in range(0, len(product_ids), chunk_size):
+                chunk = product_ids[start:start + chunk_size]
+                total += refresh_fifo_allocations(chunk)
+                self.stdout.write(f"Rebuilt {min(start + chunk_size, len(product_ids))}/{len(product_ids)} products")
+            self.stdout.write(f"Stored {total} allocations")
+
+        mismatched = []
+        for start in range(0, len(product_ids), chunk_size):
+            chunk = product_ids[start:start + chunk_size]
+            stored = {}
+            for row in FifoAllocation.objects.filter(product_item_id__in=chunk).order_by('id').values_list(
+                    'product_item_id', 'sale_item_id', 'purchase_item_id', 'qty', 'profit'):
+                stored.setdefault(row[0], []).append(row[1:])
+            for pid in chunk:
+                expected = [(a.sale_item_id, a.purchase_item_id, a.qty, a.profit)
+                            for a in compute_fifo_allocations(pid)]
+                if stored.get(pid, []) != expected:
+                    mismatched.append(pid)
+
+        if mismatched:
+            self.stdout.write(self.style.ERROR(
+                f"{len(mismatched)} products differ from the replay: {mismatched[:50]}"))
+        else:
+            self.stdout.write(self.style.SUCCESS("FIFO allocations match the replay"))
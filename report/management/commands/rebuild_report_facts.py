@@ -0,0 +1,63 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db.models import Min, Max
+from django.db.models.functions import TruncDate
+from purchase.models import PurchaseInvoice, PurchaseReturnItem
+from sale.models import SaleInvoice, SaleReturnItem
+from common.models import Expense, Wage
+from employee.models import SalaryEntry
+from report.helpers.facts import REFRESHERS
+from report.models import SalesFact, PurchaseFact, ExpenseFact
+
+# Fact model and the (model, date field) sources of each fact table
+SOURCES = {
+    'sales': (SalesFact, [(SaleInvoice, 'sale_date'), (SaleReturnItem, 'return_date')]),
+    'purchases': (PurchaseFact, [(PurchaseInvoice, 'purchase_date'), (PurchaseReturnItem, 'return_date')]),
+    'expenses': (ExpenseFact, [(Expense, 'date'), (Wage, 'date'), (SalaryEntry, 'date')]),
+}
+
+
+def _date_range(sources):
+    firsts, lasts = [], []
+    for model, field in sources:
+        if model._meta.get_field(field).get_internal_type() == 'DateTimeField':
+            model_range = model.objects.aggregate(first=Min(TruncDate(field)), last=Max(TruncDate(field)))
+        else:
+            model_range = model.objects.aggregate(first=Min(field), last=Max(field))
+        if model_range['first']:
+            firsts.append(model_range['first'])
+            lasts.append(model_range['last'])
+    return (min(firsts), max(lasts)) if firsts else (None, None)
+
+
+class Command(BaseCommand):
+    help = "Rebuild the daily report fact tables from the transaction tables"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-days', type=int, default=31,
+                            help='Number of days rebuilt per batch')
+        parser.add_argument('--table', choices=list(SOURCES),
+                            help='Only rebuild this fact table')
+
+    def handle(self, *args, **options):
+        chunk_days = options['chunk_days']
+        tables = [options['table']] if options['table'] else list(SOURCES)
+
+        for table in tables:
+            fact_model, sources = SOURCES[table]
+            first, last = _date_range(sources)
+            if first is None:
+                fact_model.objects.all().delete()
+                self.stdout.write(f"No {table} to rebuild")
+                continue
+
+            fact_model.objects.exclude(date__gte=first, date__lte=last).delete()
+            total = 0
+            window_start = first
+            while window_start <= last:
+                window_end = min(window_start + timedelta(days=chunk_days - 1), last)
+                days = (window_end - window_start).days + 1
+                total += REFRESHERS[table]([window_start + timedelta(days=n) for n in range(days)])
+                self.stdout.write(f"Rebuilt {table} facts up to {window_end}")
+                window_start = window_end + timedelta(days=1)
+            self.stdout.write(self.style.SUCCESS(f"Stored {total} {table} fact rows"))
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.23 on 2026-10-18 05:11
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('sale', '0017_saleinvoice_payment_method'),
+        ('purchase', '0014_purchaseinvoice_extra_purchases'),
+        ('products', '0003_productitem_product_productitem_product_type_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FifoAllocation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('qty', models.PositiveIntegerField()),
+                ('unit_cost', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('sale_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('profit', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('batch_balance_after_sale', models.IntegerField(default=0)),
+                ('sale_date', models.DateField()),
+                ('purchase_date', models.DateField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('product_item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='fifo_allocations', to='products.productitem')),
+                ('purchase_item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='fifo_allocations', to='purchase.purchaseitem')),
+                ('sale_item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='fifo_allocations', to='sale.saleitem')),
+            ],
+            options={
+                'ordering': ['sale_date', 'sale_item_id', 'id'],
+                'indexes': [models.Index(fields=['product_item', 'sale_date'], name='fifo_product_sale_date_idx')],
+            },
+        ),
+    ]
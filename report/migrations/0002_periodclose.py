@@ -0,0 +1,33 @@
+# Generated by Django 4.2.23 on 2026-10-18 05:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('report', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PeriodClose',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period_start', models.DateField()),
+                ('period_end', models.DateField(unique=True)),
+                ('components', models.JSONField(default=dict)),
+                ('purchased_qty', models.BigIntegerField(default=0)),
+                ('purchased_amount', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('sold_qty', models.BigIntegerField(default=0)),
+                ('sold_amount', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('closing_stock_value', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('sundry_debtors', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('sundry_creditors', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['period_start'],
+            },
+        ),
+    ]
@@ -0,0 +1,91 @@
+# Generated by Django 4.2.23 on 2026-10-18 05:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_productitem_product_productitem_product_type_and_more'),
+        ('common', '0009_assetsale_party_assetsale_vat'),
+        ('customer', '0002_party_unique_trn_per_type'),
+        ('report', '0002_periodclose'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesFact',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('status', models.CharField(max_length=30)),
+                ('qty', models.BigIntegerField(default=0)),
+                ('amount_usd', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('amount_aed', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('shipping_usd', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('shipping_aed', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('cost_aed', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('total_with_vat_usd', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('total_with_vat_aed', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('vat_usd', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('vat_aed', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('discount_usd', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('discount_aed', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('service_fee_aed', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('commission_aed', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('extra_charges', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('return_aed', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('return_midnight_aed', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('party', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='customer.party')),
+                ('product_item', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='products.productitem')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['date', 'status'], name='sales_fact_date_status_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PurchaseFact',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('status', models.CharField(max_length=20)),
+                ('qty', models.BigIntegerField(default=0)),
+                ('amount_usd', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('amount_aed', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('shipping_usd', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('shipping_aed', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('shipping_per_unit_usd', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('shipping_per_unit_aed', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('custom_duty_aed', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('total_with_vat_usd', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('total_with_vat_aed', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('vat_usd', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('vat_aed', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('discount_usd', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('discount_aed', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('extra_charges', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('return_aed', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('return_midnight_aed', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('party', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='customer.party')),
+                ('product_item', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='products.productitem')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['date', 'status'], name='purchase_fact_date_status_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ExpenseFact',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('kind', models.CharField(choices=[('expense', 'Expense'), ('wage', 'Wage'), ('salary', 'Salary')], max_length=10)),
+                ('amount_usd', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('amount_aed', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('expense_type', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='common.expensetype')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['date', 'kind'], name='expense_fact_date_kind_idx')],
+            },
+        ),
+    ]
@@ -1,3 +1,190 @@
+from decimal import Decimal
 from django.db import models
 
-# Create your models here.
+
+class FifoAllocation(models.Model):
+    """
+    One FIFO match of an approved sale item against an approved purchase batch.
+    Maintained by report.signals and rebuilt by `rebuild_fifo_allocations`.
+    """
+    product_item = models.ForeignKey('products.ProductItem', on_delete=models.CASCADE,
+                                     related_name='fifo_allocations')
+    sale_item = models.ForeignKey('sale.SaleItem', on_delete=models.CASCADE,
+                                  related_name='fifo_allocations')
+    purchase_item = models.ForeignKey('purchase.PurchaseItem', on_delete=models.CASCADE,
+                                      related_name='fifo_allocations')
+    qty = models.PositiveIntegerField()
+    unit_cost = models.DecimalField(max_digits=10, decimal_places=2)
+    sale_price = models.DecimalField(max_digits=10, decimal_places=2)
+    profit = models.DecimalField(max_digits=14, decimal_places=2)
+    batch_balance_after_sale = models.IntegerField(default=0)
+    sale_date = models.DateField()
+    purchase_date = models.DateField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['sale_date', 'sale_item_id', 'id']
+        indexes = [
+            models.Index(fields=['product_item', 'sale_date'], name='fifo_product_sale_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.qty}x sale item #{self.sale_item_id} from batch #{self.purchase_item_id}"
+
+
+class PeriodClose(models.Model):
+    """
+    Snapshot of a closed accounting period. Periods form a contiguous chain
+    starting at PERIOD_CLOSE_START; reports add up the closed periods and only
+    aggregate the days after the last close. Created by `close_period` and
+    deleted by report.signals when an entry dated inside the period changes.
+    """
+    period_start = models.DateField()
+    period_end = models.DateField(unique=True)
+    # Profit and loss components of the period, Decimals stored as strings
+    components = models.JSONField(default=dict)
+    # Cumulative stock totals as of period_end
+    purchased_qty = models.BigIntegerField(default=0)
+    purchased_amount = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    sold_qty = models.BigIntegerField(default=0)
+    sold_amount = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    # Balance sheet figures as of period_end
+    closing_stock_value = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    sundry_debtors = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    sundry_creditors = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['period_start']
+
+    def __str__(self):
+        return f"Closed {self.period_start} to {self.period_end}"
+
+    @property
+    def stock_totals(self):
+        return self.purchased_qty, self.purchased_amount, self.sold_qty, self.sold_amount
+
+    def get_components(self):
+        """Profit and loss components with amounts converted back to Decimal."""
+        components = {}
+        for key, value in self.components.items():
+            if isinstance(value, dict):
+                components[key] = {name: Decimal(total) for name, total in value.items()}
+            elif isinstance(value, str):
+                components[key] = Decimal(value)
+            else:
+                components[key] = value
+        return components
+
+    def set_components(self, components):
+        self.components = {
+            key: ({name: str(total) for name, total in value.items()} if isinstance(value, dict)
+                  else str(value) if isinstance(value, Decimal) else value)
+            for key, value in components.items()
+        }
+
+
+def _amount():
+    return models.DecimalField(max_digits=18, decimal_places=2, default=0)
+
+
+class SalesFact(models.Model):
+    """
+    Daily sales totals per product item, party and invoice status.
+
+    Line amounts (qty, amounts, shipping, cost) sit on rows with a product
+    item, invoice amounts (totals, VAT, discount, fees, extra charges) on rows
+    without one. Returns are booked on the local date of the return.
+    Maintained by report.signals and rebuilt by `rebuild_report_facts`.
+    """
+    date = models.DateField()
+    product_item = models.ForeignKey('products.ProductItem', on_delete=models.CASCADE,
+                                     null=True, blank=True, related_name='+')
+    party = models.ForeignKey('customer.Party', on_delete=models.SET_NULL,
+                              null=True, blank=True, related_name='+')
+    status = models.CharField(max_length=30)
+    qty = models.BigIntegerField(default=0)
+    amount_usd = _amount()
+    amount_aed = _amount()
+    shipping_usd = _amount()
+    shipping_aed = _amount()
+    # qty valued at the unit price of the purchase item it was sold from
+    cost_aed = _amount()
+    total_with_vat_usd = _amount()
+    total_with_vat_aed = _amount()
+    vat_usd = _amount()
+    vat_aed = _amount()
+    discount_usd = _amount()
+    discount_aed = _amount()
+    service_fee_aed = _amount()
+    commission_aed = _amount()
+    extra_charges = _amount()
+    return_aed = _amount()
+    # Part of return_aed returned exactly at midnight, which date-bounded
+    # reports count in the period ending that day
+    return_midnight_aed = _amount()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['date', 'status'], name='sales_fact_date_status_idx'),
+        ]
+
+
+class PurchaseFact(models.Model):
+    """
+    Daily purchase totals per product item, party and invoice status, laid
+    out like SalesFact.
+    """
+    date = models.DateField()
+    product_item = models.ForeignKey('products.ProductItem', on_delete=models.CASCADE,
+                                     null=True, blank=True, related_name='+')
+    party = models.ForeignKey('customer.Party', on_delete=models.SET_NULL,
+                              null=True, blank=True, related_name='+')
+    status = models.CharField(max_length=20)
+    qty = models.BigIntegerField(default=0)
+    amount_usd = _amount()
+    amount_aed = _amount()
+    shipping_usd = _amount()
+    shipping_aed = _amount()
+    # Plain sums of the per-unit shipping, as shown by the purchase/sales report
+    shipping_per_unit_usd = _amount()
+    shipping_per_unit_aed = _amount()
+    custom_duty_aed = _amount()
+    total_with_vat_usd = _amount()
+    total_with_vat_aed = _amount()
+    vat_usd = _amount()
+    vat_aed = _amount()
+    discount_usd = _amount()
+    discount_aed = _amount()
+    extra_charges = _amount()
+    return_aed = _amount()
+    return_midnight_aed = _amount()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['date', 'status'], name='purchase_fact_date_status_idx'),
+        ]
+
+
+class ExpenseFact(models.Model):
+    """Daily expense, wage and salary totals; expenses are split per expense type."""
+    KIND_EXPENSE = 'expense'
+    KIND_WAGE = 'wage'
+    KIND_SALARY = 'salary'
+    KIND_CHOICES = [
+        (KIND_EXPENSE, 'Expense'),
+        (KIND_WAGE, 'Wage'),
+        (KIND_SALARY, 'Salary'),
+    ]
+
+    date = models.DateField()
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    expense_type = models.ForeignKey('common.ExpenseType', on_delete=models.CASCADE,
+                                     null=True, blank=True, related_name='+')
+    amount_usd = _amount()
+    amount_aed = _amount()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['date', 'kind'], name='expense_fact_date_kind_idx'),
+        ]
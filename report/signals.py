@@ -0,0 +1,358 @@
+from collections import defaultdict
+from datetime import date, datetime
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from base.signals import post_bulk_save
+from base.utils import defer_until_commit
+from purchase.models import PurchaseInvoice, PurchaseItem, PurchaseReturnItem, PurchaseReturnItemEntry
+from sale.models import SaleInvoice, SaleItem, SaleReturnItem, SaleReturnItemEntry
+from common.models import Expense, ExpenseType, Wage, ServiceFee, Commission, ExtraCharges, Asset
+from employee.models import SalaryEntry, SalaryPayment
+from banking.models import CashAccount, CashTransaction, PaymentEntry
+from core.models import CapitalAccount
+from inventory.models import Stock, StockMovement
+from products.models import Product, ProductType, ProductGrade, ProductItem
+
+# --- FIFO allocations ---
+
+def _refresh_fifo(product_item_ids):
+    from report.helpers.fifo import refresh_fifo_allocations
+    refresh_fifo_allocations(product_item_ids)
+
+
+def mark_fifo_dirty(product_item_ids):
+    defer_until_commit('fifo', product_item_ids, _refresh_fifo)
+
+
+@receiver(post_save, sender=SaleInvoice)
+def sale_invoice_changed(sender, instance, created=False, **kwargs):
+    if not created:
+        mark_fifo_dirty(instance.sale_items.values_list('item_id', flat=True))
+
+
+@receiver(post_save, sender=PurchaseInvoice)
+def purchase_invoice_changed(sender, instance, created=False, **kwargs):
+    if not created:
+        mark_fifo_dirty(instance.purchase_items.values_list('item_id', flat=True))
+
+
+@receiver([post_save, post_delete], sender=SaleReturnItemEntry)
+def sale_return_changed(sender, instance, **kwargs):
+    mark_fifo_dirty(SaleItem.objects.filter(pk=instance.sale_item_id).values_list('item_id', flat=True))
+
+
+@receiver([post_save, post_delete], sender=PurchaseReturnItemEntry)
+def purchase_return_changed(sender, instance, **kwargs):
+    mark_fifo_dirty(PurchaseItem.objects.filter(pk=instance.purchase_item_id).values_list('item_id', flat=True))
+
+
+# --- Period close snapshots ---
+
+# Models whose own date decides which closed periods they affect
+DATED_MODELS = {
+    model: model.loaded_date_field
+    for model in (PurchaseInvoice, SaleInvoice, PurchaseReturnItem, SaleReturnItem, Expense, Wage, SalaryEntry)
+}
+
+
+def _as_date(value):
+    if isinstance(value, datetime):
+        return (timezone.localtime(value) if timezone.is_aware(value) else value).date()
+    if isinstance(value, str):
+        return parse_date(value[:10])
+    return value
+
+
+def _related_date(instance, relation, field):
+    try:
+        related = getattr(instance, relation)
+    except ObjectDoesNotExist:
+        return None
+    return getattr(related, field, None) if related else None
+
+
+def _reopen_periods(dates):
+    from report.helpers.period_close import reopen_periods
+    reopen_periods(min(dates))
+
+
+def mark_periods_dirty(dates):
+    """Drop the closed periods ending on or after the earliest of the given dates."""
+    defer_until_commit('period_close', [_as_date(d) for d in dates], _reopen_periods)
+
+
+@receiver(pre_save)
+def remember_previous_date(sender, instance, raw=False, **kwargs):
+    if sender in DATED_MODELS and instance.pk and not raw:
+        # Moving an entry out of a closed period changes that period too.
+        # The date comes from the loaded row, read again only if it was not loaded.
+        instance._previous_period_date = instance.get_previous_date()
+
+
+@receiver([post_save, post_delete])
+def dated_entry_changed(sender, instance, **kwargs):
+    field = DATED_MODELS.get(sender)
+    if field:
+        mark_periods_dirty([getattr(instance, field), getattr(instance, '_previous_period_date', None)])
+
+
+@receiver([post_save, post_delete], sender=PurchaseReturnItemEntry)
+def purchase_return_entry_period_changed(sender, instance, **kwargs):
+    mark_periods_dirty([_related_date(instance, 'purchase_return', 'return_date')])
+
+
+@receiver([post_save, post_delete], sender=SaleReturnItemEntry)
+def sale_return_entry_period_changed(sender, instance, **kwargs):
+    mark_periods_dirty([_related_date(instance, 'sale_return', 'return_date')])
+
+
+@receiver([post_save, post_delete], sender=ServiceFee)
+@receiver([post_save, post_delete], sender=Commission)
+def sale_charge_period_changed(sender, instance, **kwargs):
+    mark_periods_dirty([_related_date(instance, 'sales_invoice', 'sale_date')])
+
+
+@receiver([post_save, post_delete], sender=ExtraCharges)
+def extra_charge_period_changed(sender, instance, **kwargs):
+    invoice = instance.content_object
+    mark_periods_dirty([getattr(invoice, 'sale_date', None) or getattr(invoice, 'purchase_date', None)])
+
+
+# --- Daily fact tables ---
+
+# Fact table (see report.helpers.facts.REFRESHERS) each dated model feeds
+FACT_TABLES = {
+    SaleInvoice: 'sales',
+    SaleReturnItem: 'sales',
+    PurchaseInvoice: 'purchases',
+    PurchaseReturnItem: 'purchases',
+    Expense: 'expenses',
+    Wage: 'expenses',
+    SalaryEntry: 'expenses',
+}
+
+# Cache domains of the reports reading each fact table
+FACT_CACHE_DOMAINS = {
+    'sales': ('sales',),
+    'purchases': ('purchases',),
+    'expenses': ('expenses', 'salary'),
+}
+
+
+def _refresh_facts(keys):
+    from report.helpers.facts import REFRESHERS
+    from report.cache import bump_versions
+    dates_by_table = defaultdict(set)
+    for table, day in keys:
+        dates_by_table[table].add(day)
+    for table, dates in dates_by_table.items():
+        REFRESHERS[table](dates)
+    # Reports cached while the rows were being rewritten are stale
+    bump_versions({domain for table in dates_by_table for domain in FACT_CACHE_DOMAINS[table]})
+
+
+def mark_facts_dirty(table, dates):
+    """Recompute the rows of a fact table for the given dates once the transaction commits."""
+    defer_until_commit('facts', [(table, _as_date(d)) for d in dates if d], _refresh_facts)
+
+
+def _return_dates(entries, relation):
+    return entries.values_list(f'{relation}__return_date', flat=True)
+
+
+@receiver([post_save, post_delete])
+def dated_fact_changed(sender, instance, created=False, **kwargs):
+    table = FACT_TABLES.get(sender)
+    if not table:
+        return
+    mark_facts_dirty(table, [getattr(instance, DATED_MODELS[sender]),
+                             getattr(instance, '_previous_period_date', None)])
+    # Returns are filed under the status and party of the returned invoice
+    if sender is SaleInvoice and not created and kwargs.get('signal') is post_save:
+        mark_facts_dirty('sales', _return_dates(
+            SaleReturnItemEntry.objects.filter(sale_item__invoice=instance), 'sale_return'))
+    elif sender is PurchaseInvoice and not created and kwargs.get('signal') is post_save:
+        mark_facts_dirty('purchases', _return_dates(
+            PurchaseReturnItemEntry.objects.filter(purchase_item__invoice=instance), 'purchase_return'))
+
+
+@receiver([post_save, post_delete], sender=SaleReturnItemEntry)
+def sale_return_entry_facts_changed(sender, instance, **kwargs):
+    mark_facts_dirty('sales', [_related_date(instance, 'sale_return', 'return_date')])
+
+
+@receiver([post_save, post_delete], sender=PurchaseReturnItemEntry)
+def purchase_return_entry_facts_changed(sender, instance, **kwargs):
+    mark_facts_dirty('purchases', [_related_date(instance, 'purchase_return', 'return_date')])
+
+
+@receiver([post_save, post_delete], sender=ServiceFee)
+@receiver([post_save, post_delete], sender=Commission)
+def sale_charge_facts_changed(sender, instance, **kwargs):
+    mark_facts_dirty('sales', [_related_date(instance, 'sales_invoice', 'sale_date')])
+
+
+@receiver([post_save, post_delete], sender=ExtraCharges)
+def extra_charge_facts_changed(sender, instance, **kwargs):
+    invoice = instance.content_object
+    if isinstance(invoice, SaleInvoice):
+        mark_facts_dirty('sales', [invoice.sale_date])
+    elif isinstance(invoice, PurchaseInvoice):
+        mark_facts_dirty('purchases', [invoice.purchase_date])
+
+
+# --- Invoice lines ---
+
+def _invoice_dates(model, lines, date_field, previous=()):
+    """
+    Dates of the invoices of lines, and of the invoices they were loaded
+    with (previous), one query for the invoices not already loaded.
+    """
+    invoice_field = model._meta.get_field('invoice')
+    dates = {}
+    missing = {values['invoice_id'] for values in previous if values['invoice_id'] is not None}
+    for line in lines:
+        if line.invoice_id is None:
+            continue
+        if invoice_field.is_cached(line) and line.invoice is not None:
+            dates[line.invoice_id] = getattr(line.invoice, date_field)
+        else:
+            missing.add(line.invoice_id)
+    missing -= dates.keys()
+    if missing:
+        dates.update(invoice_field.related_model.objects.filter(pk__in=missing).values_list('pk', date_field))
+    return list(dates.values())
+
+
+def sale_lines_changed(lines, created=False, previous=()):
+    """
+    FIFO lots, closed periods and sales facts of changed sale lines,
+    whatever their number. previous holds the values updated lines were
+    loaded with, so the item and invoice they left are refreshed too.
+    created is also set for deleted lines, which nothing refers to any more.
+    """
+    dates = _invoice_dates(SaleItem, lines, 'sale_date', previous)
+    mark_fifo_dirty([line.item_id for line in lines] + [values['item_id'] for values in previous])
+    mark_periods_dirty(dates)
+    mark_facts_dirty('sales', dates)
+    if not created:
+        # Returns are valued at the amount of the line, on their own date
+        return_dates = list(_return_dates(
+            SaleReturnItemEntry.objects.filter(sale_item_id__in=[line.pk for line in lines]), 'sale_return'))
+        mark_periods_dirty(return_dates)
+        mark_facts_dirty('sales', return_dates)
+
+
+def purchase_lines_changed(lines, created=False, previous=()):
+    """
+    FIFO lots, closed periods and facts of changed purchase lines, whatever
+    their number. previous holds the values updated lines were loaded
+    with, so the item and invoice they left are refreshed too.
+    created is also set for deleted lines, which nothing refers to any more.
+    """
+    dates = _invoice_dates(PurchaseItem, lines, 'purchase_date', previous)
+    mark_fifo_dirty([line.item_id for line in lines] + [values['item_id'] for values in previous])
+    mark_periods_dirty(dates)
+    if any(line.invoice_id is None for line in lines) or any(values['invoice_id'] is None for values in previous):
+        # Items without an invoice count towards stock at every date
+        mark_periods_dirty([date.min])
+    mark_facts_dirty('purchases', dates)
+    if created:
+        # Nothing has been returned or sold from a new batch yet
+        return
+    ids = [line.pk for line in lines]
+    return_dates = list(_return_dates(
+        PurchaseReturnItemEntry.objects.filter(purchase_item_id__in=ids), 'purchase_return'))
+    # The cost of the sales drawn from these purchases follows their unit price,
+    # whichever period they were made in, before the purchase date included
+    sale_dates = list(SaleItem.objects.filter(purchase_item_id__in=ids).values_list('invoice__sale_date', flat=True))
+    mark_periods_dirty(return_dates + sale_dates)
+    mark_facts_dirty('purchases', return_dates)
+    mark_facts_dirty('sales', sale_dates)
+
+
+# Handlers taking a whole batch of rows saved with bulk_create/bulk_update
+BATCH_HANDLERS = {
+    SaleItem: sale_lines_changed,
+    PurchaseItem: purchase_lines_changed,
+}
+
+
+@receiver([post_save, post_delete], sender=SaleItem)
+@receiver([post_save, post_delete], sender=PurchaseItem)
+def line_item_changed(sender, instance, created=False, bulk=False, **kwargs):
+    # Rows of a bulk save go to lines_bulk_saved as one batch
+    if bulk:
+        return
+    # The return entries of a deleted line are deleted with it and its sales
+    # unlinked first, they mark what they change themselves
+    deleted = kwargs.get('signal') is post_delete
+    BATCH_HANDLERS[sender]([instance], created or deleted)
+
+
+@receiver(post_bulk_save)
+def lines_bulk_saved(sender, instances, created=False, previous=(), **kwargs):
+    handler = BATCH_HANDLERS.get(sender)
+    if handler and instances:
+        handler(list(instances), created, previous)
+
+
+# --- Report cache ---
+
+# Cache domain (see report.cache.REPORT_DOMAINS) each model belongs to
+CACHE_DOMAINS = {
+    SaleInvoice: 'sales',
+    SaleItem: 'sales',
+    SaleReturnItem: 'sales',
+    SaleReturnItemEntry: 'sales',
+    ServiceFee: 'sales',
+    Commission: 'sales',
+    PurchaseInvoice: 'purchases',
+    PurchaseItem: 'purchases',
+    PurchaseReturnItem: 'purchases',
+    PurchaseReturnItemEntry: 'purchases',
+    Expense: 'expenses',
+    ExpenseType: 'expenses',
+    Wage: 'expenses',
+    ExtraCharges: 'expenses',
+    SalaryEntry: 'salary',
+    SalaryPayment: 'salary',
+    PaymentEntry: 'payments',
+    CashAccount: 'cash',
+    # Balance deltas are applied with update(), the ledger row marks the change
+    CashTransaction: 'cash',
+    Asset: 'assets',
+    CapitalAccount: 'assets',
+    Product: 'products',
+    ProductType: 'products',
+    ProductGrade: 'products',
+    ProductItem: 'products',
+    Stock: 'stock',
+    # Stock deltas are applied with update(), the movement marks the change
+    StockMovement: 'stock',
+}
+
+
+def _bump_report_cache(domains):
+    from report.cache import bump_versions
+    bump_versions(domains)
+
+
+@receiver([post_save, post_delete])
+def report_data_changed(sender, instance, **kwargs):
+    domain = CACHE_DOMAINS.get(sender)
+    if domain:
+        defer_until_commit('report_cache', [domain], _bump_report_cache)
+
+
+@receiver(post_bulk_save)
+def rows_bulk_saved(sender, instances, created=False, **kwargs):
+    # bulk_create/bulk_update skip post_save; replay it so every receiver
+    # sees the rows. bulk=True tells the ones with a batch handler to skip them.
+    for instance in instances:
+        post_save.send(sender=sender, instance=instance, created=created,
+                       update_fields=None, raw=False, using=instance._state.db, bulk=True)
@@ -1,3 +1,648 @@
-from django.test import TestCase
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from io import StringIO
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import transaction
+from django.db.models import Sum
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from common.models import Commission, Expense, ExpenseType, ServiceFee, Tax, Wage
+from customer.models import Party
+from employee.models import Account, SalaryEntry
+from inventory.models import Stock
+from inventory.services import set_stock
+from products.models import Product, ProductItem
+from purchase.models import PurchaseInvoice, PurchaseItem, PurchaseReturnItem, PurchaseReturnItemEntry
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from report.helpers.fifo import compute_fifo_allocations
+from report.helpers.period_close import PERIOD_CLOSE_START, close_periods, reopen_periods
+from report.helpers.montly_report import get_yearly_summary_report
+from report.helpers.profict_loss import (
+    add_profit_and_loss_components, compute_profit_and_loss_components, get_profit_and_loss_report)
+from report.helpers.purchase_sales import get_purchase_sales_report, get_purchase_sales_totals
+from report.helpers.tax_summary import get_tax_summary
+from report.models import FifoAllocation, PeriodClose
+from report.utils import (
+    get_closing_stock, get_closing_stock_many, get_closing_stock_valuation, get_latest_purchase_price_many,
+    get_opening_stock, get_opening_stock_many)
+from sale.models import SaleInvoice, SaleItem, SaleReturnItem, SaleReturnItemEntry
 
-# Create your tests here.
+APPROVED, PENDING = 'approved', 'pending'
+
+
+class ReportTestCase(TestCase):
+    """
+    A small hand-built ledger across 2023-2025 whose report figures are
+    worked out in the tests. Amounts are in AED, the cost of a sale is its
+    qty at the unit price of the purchase item it was sold from.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.supplier = Party.objects.create(name='Supplier', type='supplier')
+        cls.customer = Party.objects.create(name='Customer', type='customer')
+        # The search index and the fact tables are refreshed on commit
+        with cls.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            product = Product.objects.create(name='Pipe')
+            cls.a = ProductItem.objects.create(product=product, size='A')
+            cls.b = ProductItem.objects.create(product=product, size='B')
+            cls.build()
+
+    @classmethod
+    def purchase(cls, day, status, *lines, **fields):
+        """Lines are (item, qty, unit price[, {other PurchaseItem fields}])."""
+        invoice = PurchaseInvoice.objects.create(invoice_no=f'P-{day}', party=cls.supplier, purchase_date=day,
+                                                 status=status, has_tax=False, **fields)
+        items = [cls.purchase_item(invoice, item, qty, price, **(extra[0] if extra else {}))
+                 for item, qty, price, *extra in lines]
+        invoice.calculate_totals()
+        return items
+
+    @classmethod
+    def purchase_item(cls, invoice, item, qty, price, **fields):
+        return PurchaseItem.objects.create(
+            invoice=invoice, item=item, qty=qty, unit_price_usd=price, unit_price_aed=price,
+            amount_usd=price * qty, amount_aed=price * qty, **fields)
+
+    @classmethod
+    def sale(cls, day, status, *lines, has_tax=False, fee=None, **fields):
+        """Lines are (item, purchase item, qty, unit price[, {other SaleItem fields}])."""
+        invoice = SaleInvoice.objects.create(party=cls.customer, sale_date=day, status=status, has_tax=has_tax,
+                                             **fields)
+        for item, lot, qty, price, *extra in lines:
+            SaleItem.objects.create(invoice=invoice, item=item, purchase_item=lot, qty=qty, sale_price_usd=price,
+                                    sale_price_aed=price, amount_usd=price * qty, amount_aed=price * qty,
+                                    **(extra[0] if extra else {}))
+        if fee:
+            ServiceFee.objects.create(sales_invoice=invoice, amount_usd=fee, amount_aed=fee)
+        invoice.calculate_totals()
+        return invoice
+
+    @classmethod
+    def build(cls):
+        a, b = cls.a, cls.b
+        D = Decimal
+        Tax.objects.create(vat_percent=D(5))
+        # Stock brought into 2024: 13 purchased for 56, 2 sold at a cost of 10
+        a0, = cls.purchase(date(2023, 12, 10), APPROVED, (a, 10, D(5)))
+        cls.purchase_item(None, a, 3, D(2))
+        cls.sale(date(2023, 12, 20), APPROVED, (a, a0, 2, D(8)))
+        # January: 25 purchased for 130, 5 sold for 35 at a cost of 20.
+        # The purchase carries 10 of duty, 5 of shipping and a discount of 10,
+        # the sale a discount of 5 and 5% VAT on the rest
+        a1, b1 = cls.purchase(date(2024, 1, 15), APPROVED,
+                              (a, 20, D(4), {'custom_duty_aed_enter': D('0.5')}),
+                              (b, 5, D(10), {'shipping_per_unit_aed': D(1), 'shipping_per_unit_usd': D(1)}),
+                              discount_aed=D(10))
+        cls.sale(date(2024, 1, 25), APPROVED, (a, a1, 5, D(7)), has_tax=True, discount_aed=D(5))
+        # February: 4 sold for 54 at a cost of 30, one line without a purchase
+        # item, with 2 of shipping and a service fee of 6
+        cls.sale(date(2024, 2, 10), APPROVED,
+                 (b, b1, 3, D(15), {'shipping_aed': D(2), 'shipping_usd': D(2)}), (a, None, 1, D(9)), fee=D(6))
+        cls.sale(date(2024, 2, 14), PENDING, (a, a1, 4, D(8)))
+        # March: 4 purchased for 48, 2 sold for 40 at a cost of 24, with a commission of 4
+        cls.purchase(date(2024, 3, 5), PENDING, (b, 7, D(9)))
+        b3, = cls.purchase(date(2024, 3, 20), APPROVED, (b, 4, D(12)))
+        march_sale = cls.sale(date(2024, 3, 31), APPROVED, (b, b3, 2, D(20)))
+        Commission.objects.create(sales_invoice=march_sale, amount_usd=D(4), amount_aed=D(4))
+        # After the year
+        cls.sale(date(2025, 1, 5), APPROVED, (a, a1, 1, D(7)))
+
+        freight = ExpenseType.objects.create(name='Freight', category='direct')
+        rent = ExpenseType.objects.create(name='Rent', category='indirect')
+        Expense.objects.create(type=rent, amount_aed=D(50), amount_usd=D(14), date=date(2023, 12, 1))
+        Expense.objects.create(type=freight, amount_aed=D(12), amount_usd=D(3), date=date(2024, 2, 1))
+        Expense.objects.create(type=rent, amount_aed=D(100), amount_usd=D(27), date=date(2024, 3, 1))
+        Wage.objects.create(amount_aed=D(20), date=date(2024, 1, 31))
+        SalaryEntry.objects.create(account=Account.objects.create(name='Clerk'), amount_aed=D(300),
+                                   amount_usd=D(80), entry_type='salary', date=date(2024, 3, 31))
+
+
+class YearlySummaryReportTests(ReportTestCase):
+    MONTHS = ['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September',
+              'October', 'November', 'December']
+    # month: (opening qty, opening amount, purchase qty, purchase amount, sales qty, sales amount,
+    #         closing qty, closing amount)
+    EXPECTED = {
+        'January': (11, 46, 25, 130, 5, 35, 31, 156),
+        'February': (31, 156, 0, 0, 4, 54, 27, 126),
+        'March': (27, 126, 4, 48, 2, 40, 29, 150),
+    }
+    QUIET_MONTH = (29, 150, 0, 0, 0, 0, 29, 150)
+
+    def assertSummary(self):
+        report = get_yearly_summary_report(2024)
+        self.assertEqual(report['year'], 2024)
+        self.assertEqual([row['month'] for row in report['monthly']], self.MONTHS)
+        for row in report['monthly']:
+            self.assertEqual(
+                (row['opening_stock'], row['opening_stock_amount'], row['purchase_qty'], row['purchase_amount'],
+                 row['sales_qty'], row['sales_amount'], row['closing_stock'], row['closing_stock_amount']),
+                self.EXPECTED.get(row['month'], self.QUIET_MONTH), row['month'])
+        self.assertEqual(report['grand_totals'], {'opening_stock': 11, 'opening_stock_amount': 46,
+                                                  'closing_stock': 29, 'closing_stock_amount': 150})
+
+    def test_every_month_from_the_live_tables(self):
+        with self.assertNumQueries(4):
+            self.assertSummary()
+
+    @override_settings(REPORT_BACKEND='facts')
+    def test_every_month_from_the_fact_tables(self):
+        self.assertSummary()
+
+
+class InventoryReportTests(ReportTestCase):
+    def setUp(self):
+        # Reports may be cached, every request here starts from an empty cache
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='storekeeper'))
+
+    def get_rows(self, params, queries=2):
+        # One query counts the items, one reads the page with its sums
+        with self.assertNumQueries(queries):
+            response = self.client.get('/api/inventory-report/', params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return {row['item']['id']: (row['purchased'], row['sold'], row['stock']) for row in response.json()['data']}
+
+    def test_purchased_sold_and_stock_of_every_item(self):
+        # Approved invoices of any date; the stock also moved with the pending ones
+        self.assertEqual(self.get_rows({}), {self.a.pk: (30, 9, 20), self.b.pk: (9, 5, 11)})
+
+    def test_search_keeps_the_query_count(self):
+        self.assertEqual(self.get_rows({'search': 'pipe b'}), {self.b.pk: (9, 5, 11)})
+
+
+    def test_reports_are_computed_on_every_request_without_a_shared_cache(self):
+        self.assertEqual(self.get_rows({})[self.a.pk], (30, 9, 20))
+        # Not signalled, as a write seen only by another worker's cache
+        Stock.objects.filter(product_item=self.a).update(quantity=5)
+        self.assertEqual(self.get_rows({})[self.a.pk], (30, 9, 5))
+
+    @override_settings(REPORT_CACHE_TIMEOUT=60)
+    def test_cached_reports_are_dropped_by_writes(self):
+        self.get_rows({})
+        Stock.objects.filter(product_item=self.a).update(quantity=5)
+        self.assertEqual(self.get_rows({}, queries=0)[self.a.pk], (30, 9, 20))
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            set_stock(self.a, 7)
+        self.assertEqual(self.get_rows({})[self.a.pk], (30, 9, 7))
+
+
+class PurchaseSalesReportTests(ReportTestCase):
+    """The first quarter of 2024: the approved invoices of January to March and their expenses."""
+    EXPECTED = {
+        # P-2024-01-15 at 130 less a discount of 10 and P-2024-03-20 at 48, no VAT;
+        # shipping sums the per unit amounts
+        'purchase': {
+            'total_with_vat_usd': 178.0, 'total_with_vat_aed': 168.0,
+            'total_without_vat_usd': 178.0, 'total_without_vat_aed': 168.0,
+            'vat_usd': 0.0, 'vat_aed': 0.0,
+            'total_shipping_usd': 1.0, 'total_shipping_aed': 1.0,
+            'total_discount_usd': 0.0, 'total_discount_aed': 10.0,
+        },
+        # 35 less a discount of 5 plus 5% VAT (36.75 in USD, without a discount),
+        # 54 with a service fee of 6 and 40
+        'sales': {
+            'total_with_vat_usd': 136.75, 'total_with_vat_aed': 131.5,
+            'total_without_vat_usd': 135.0, 'total_without_vat_aed': 130.0,
+            'vat_usd': 1.75, 'vat_aed': 1.5,
+            'total_shipping_usd': 2.0, 'total_shipping_aed': 2.0,
+            'total_discount_usd': 0.0, 'total_discount_aed': 5.0,
+        },
+        'expenses': {
+            'direct_expenses_usd': 3.0, 'direct_expenses_aed': 12.0,
+            'indirect_expenses_usd': 27.0, 'indirect_expenses_aed': 100.0,
+            'total_wages_aed': 20.0,
+            'total_salary_usd': 80.0, 'total_salary_aed': 300.0,
+            'all_expenses_usd': 110.0, 'all_expenses_aed': 432.0,
+        },
+    }
+
+    def test_totals_from_the_live_tables(self):
+        # Invoices and lines of purchases and sales, expenses, wages and salary
+        with self.assertNumQueries(7):
+            report = get_purchase_sales_report(date(2024, 1, 1), date(2024, 3, 31))
+        self.assertEqual(report, self.EXPECTED)
+
+    @override_settings(REPORT_BACKEND='facts')
+    def test_totals_from_the_fact_tables(self):
+        self.assertEqual(get_purchase_sales_report(date(2024, 1, 1), date(2024, 3, 31)), self.EXPECTED)
+
+    def test_totals_without_dates(self):
+        # Every approved invoice and expense: 50 + 120 + 48 purchased, 16 + 131.5 + 7 sold
+        totals = get_purchase_sales_totals()
+        self.assertEqual((totals['purchase_with_vat_aed'], totals['sales_with_vat_aed'], totals['indirect_aed']),
+                         (Decimal(218), Decimal('154.5'), Decimal(150)))
+
+
+class ProfitAndLossReportTests(ReportTestCase):
+    """The first quarter of 2024 with the stock of the yearly summary."""
+    EXPECTED = {
+        'period': {'start_date': '2024-01-01', 'end_date': '2024-03-31'},
+        # 168 less 5 of shipping and 10 of duty
+        'purchase': {
+            'total_with_vat_aed': 168.0, 'total_without_vat_aed': 153.0, 'vat_aed': 0.0, 'discount_aed': 10.0,
+            'total_shipping_aed': 5.0, 'purchase_return_aed': 0.0, 'total_custom_duty_aed': 10.0,
+        },
+        # 131.5 less 1.5 of VAT and the service fee of 6
+        'sales': {
+            'total_with_vat_aed': 131.5, 'total_without_vat_aed': 124.0, 'vat_aed': 1.5, 'discount_aed': 5.0,
+            'shipping_aed': 2.0, 'sales_return_aed': 0.0,
+        },
+        'expenses': {
+            'direct_expenses_aed': 12.0, 'direct_expenses_typewise': [{'type': 'Freight', 'total': 12.0}],
+            'indirect_expenses_aed': 100.0, 'indirect_expenses_typewise': [{'type': 'Rent', 'total': 100.0}],
+            'wages_aed': 20.0, 'salary_aed': 300.0, 'commission_aed': 4.0, 'service_fees_aed': 6.0,
+            'extra_charges_aed': 0.0,
+        },
+        'stock': {'opening_stock_qty': 11, 'opening_stock_aed': 46.0,
+                  'closing_stock_qty': 29, 'closing_stock_aed': 150.0},
+        # (124 + 150) - (153 + 46), less 12 + 100 + 20 + 300 + 4
+        'profit': {'gross_profit': 75.0, 'net_profit': -361.0},
+    }
+
+    def test_report_from_the_live_tables(self):
+        # The closed periods, then 16 aggregates of the components
+        with self.assertNumQueries(17):
+            report = get_profit_and_loss_report('2024-01-01', '2024-03-31')
+        self.assertEqual(report, self.EXPECTED)
+
+    @override_settings(REPORT_BACKEND='facts')
+    def test_report_from_the_fact_tables(self):
+        self.assertEqual(get_profit_and_loss_report('2024-01-01', '2024-03-31'), self.EXPECTED)
+
+    def test_components_add_up_across_months(self):
+        quarter = compute_profit_and_loss_components(date(2024, 1, 1), date(2024, 3, 31))
+        months = add_profit_and_loss_components(
+            add_profit_and_loss_components(
+                compute_profit_and_loss_components(date(2024, 1, 1), date(2024, 1, 31)),
+                compute_profit_and_loss_components(date(2024, 2, 1), date(2024, 2, 29))),
+            compute_profit_and_loss_components(date(2024, 3, 1), date(2024, 3, 31)))
+        self.assertEqual(months, quarter)
+
+
+def replay_batch_report():
+    """The batch sales report as the view computed it before the allocations were stored."""
+    report = []
+    for product in ProductItem.objects.order_by('id'):
+        purchases = PurchaseItem.objects.filter(item=product, invoice__status=APPROVED).order_by(
+            'invoice__purchase_date', 'id')
+        sales = SaleItem.objects.filter(item=product, invoice__status=APPROVED).order_by('invoice__sale_date', 'id')
+        batches = [{'item': p, 'available': p.qty, 'sales': []} for p in purchases]
+        pointer = 0
+        for s in sales:
+            sale_qty = s.qty
+            while sale_qty > 0 and pointer < len(batches):
+                batch = batches[pointer]
+                available_qty = batch['available']
+                if available_qty == 0:
+                    pointer += 1
+                    continue
+                consume_qty = min(sale_qty, available_qty)
+                batch['sales'].append({
+                    'sale_invoice': s.invoice.invoice_no, 'sale_date': s.invoice.sale_date, 'qty_sold': consume_qty,
+                    'sale_price_per_unit': s.sale_price_usd, 'total_sale_amount': s.sale_price_usd * consume_qty,
+                    'profit': float((s.sale_price_usd - batch['item'].unit_price_usd) * consume_qty),
+                    'batch_balance_after_sale': available_qty - consume_qty})
+                batch['available'] -= consume_qty
+                sale_qty -= consume_qty
+                if batch['available'] == 0:
+                    pointer += 1
+        batch_reports = [{
+            'purchase_invoice_no': batch['item'].invoice.invoice_no,
+            'purchase_date': batch['item'].invoice.purchase_date,
+            'purchase_qty': batch['item'].qty,
+            'unit_price': float(batch['item'].unit_price_usd),
+            'shipping_per_unit': float(batch['item'].shipping_per_unit_usd or 0),
+            'factors': batch['item'].factors or '', 'sales': batch['sales'],
+            'batch_profit': float(sum(s['profit'] for s in batch['sales'])),
+            'batch_balance': batch['available']} for batch in batches]
+        report.append({'product': str(product), 'batch_reports': batch_reports,
+                       'total_profit': float(sum(b['batch_profit'] for b in batch_reports)),
+                       'closing_quantity': sum(b['batch_balance'] for b in batch_reports)})
+    return json.loads(JSONRenderer().render(report))
+
+
+class FifoAllocationTests(ReportTestCase):
+    """The stored allocations and the batch sales report against a fresh replay of the invoices."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='storekeeper'))
+
+    def stored(self):
+        return {item.pk: list(FifoAllocation.objects.filter(product_item=item).order_by('id').values_list(
+            'sale_item_id', 'purchase_item_id', 'qty', 'profit', 'batch_balance_after_sale'))
+            for item in (self.a, self.b)}
+
+    def assertMatchesReplay(self):
+        self.assertEqual(self.stored(), {item.pk: [
+            (a.sale_item_id, a.purchase_item_id, a.qty, a.profit, a.batch_balance_after_sale)
+            for a in compute_fifo_allocations(item.pk)] for item in (self.a, self.b)})
+        response = self.client.get('/api/product-batch-sales-report/')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['total'], 2)
+        self.assertEqual(response.json()['data'], replay_batch_report())
+
+    def test_allocations_match_the_replay(self):
+        # Every approved sale of A comes from the 10 bought in December 2023
+        self.assertEqual(
+            [(qty, balance) for _, _, qty, _, balance in self.stored()[self.a.pk]], [(2, 8), (5, 3), (1, 2), (1, 1)])
+        self.assertMatchesReplay()
+
+    def test_after_sales_and_returns(self):
+        lot = PurchaseItem.objects.filter(item=self.b).order_by('id').last()
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            invoice = self.sale(date(2024, 3, 25), APPROVED,
+                                (self.b, lot, 4, Decimal(18)), (self.a, None, 30, Decimal(9)))
+        self.assertMatchesReplay()
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            sale_return = SaleReturnItem.objects.create(
+                sale_invoice=invoice, return_date=timezone.make_aware(datetime(2024, 4, 1)))
+            SaleReturnItemEntry.objects.create(sale_return=sale_return, sale_item=invoice.sale_items.first(), qty=2)
+        self.assertMatchesReplay()
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            sale_return.delete()
+        self.assertMatchesReplay()
+
+    def test_after_edits(self):
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            # A larger line, then the pending invoices approved and moved earlier
+            line = SaleItem.objects.get(invoice__sale_date=date(2025, 1, 5))
+            line.qty = 6
+            line.save()
+            for invoice in SaleInvoice.objects.filter(status=PENDING):
+                invoice.status, invoice.sale_date = APPROVED, date(2024, 1, 20)
+                invoice.save()
+        self.assertMatchesReplay()
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            for invoice in PurchaseInvoice.objects.filter(status=PENDING):
+                invoice.status, invoice.purchase_date = APPROVED, date(2024, 1, 1)
+                invoice.save()
+            SaleItem.objects.get(invoice__sale_date=date(2024, 1, 25)).delete()
+        self.assertMatchesReplay()
+
+    def test_rebuild_command(self):
+        FifoAllocation.objects.filter(product_item=self.a).delete()
+        out = StringIO()
+        call_command('rebuild_fifo_allocations', check_only=True, stdout=out)
+        self.assertIn(f'1 products differ from the replay: [{self.a.pk}]', out.getvalue())
+        call_command('rebuild_fifo_allocations', chunk_size=1, stdout=out)
+        self.assertIn('FIFO allocations match the replay', out.getvalue())
+        self.assertMatchesReplay()
+
+
+class PeriodCloseTests(ReportTestCase):
+    """Closed months against the same figures aggregated from the invoices."""
+
+    def closed(self):
+        return [(p.period_start, p.period_end) for p in PeriodClose.objects.order_by('period_start')]
+
+    def assertSameAsLive(self, start_date='2024-01-01', end_date='2024-03-31'):
+        closed = get_profit_and_loss_report(start_date, end_date)
+        with transaction.atomic():
+            reopen_periods(PERIOD_CLOSE_START)
+            live = get_profit_and_loss_report(start_date, end_date)
+            transaction.set_rollback(True)
+        self.assertEqual(closed, live)
+        return closed
+
+    def test_close_every_month(self):
+        created = close_periods(date(2024, 3, 15))
+        self.assertEqual([(p.period_start, p.period_end) for p in created], [
+            (PERIOD_CLOSE_START, date(2023, 12, 31)), (date(2024, 1, 1), date(2024, 1, 31)),
+            (date(2024, 2, 1), date(2024, 2, 29)), (date(2024, 3, 1), date(2024, 3, 31))])
+        self.assertEqual(close_periods(date(2024, 3, 31)), [])
+        # The quarter is read from its three snapshots
+        with self.assertNumQueries(1):
+            report = get_profit_and_loss_report('2024-01-01', '2024-03-31')
+        self.assertEqual(report, ProfitAndLossReportTests.EXPECTED)
+        self.assertEqual(self.assertSameAsLive('2024-02-01', '2024-06-30')['stock']['closing_stock_qty'], 29)
+
+    def test_editing_an_entry_reopens_its_period_and_the_later_ones(self):
+        close_periods(date(2024, 3, 31))
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            expense = Expense.objects.get(date=date(2024, 2, 1))
+            expense.amount_aed = Decimal(15)
+            expense.save()
+        self.assertEqual(self.closed(), [(PERIOD_CLOSE_START, date(2023, 12, 31)),
+                                         (date(2024, 1, 1), date(2024, 1, 31))])
+        close_periods(date(2024, 3, 31))
+        self.assertEqual(self.assertSameAsLive()['expenses']['direct_expenses_aed'], 15.0)
+
+    def test_moving_an_entry_out_of_a_period_reopens_it(self):
+        close_periods(date(2024, 3, 31))
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            invoice = SaleInvoice.objects.get(sale_date=date(2024, 1, 25))
+            invoice.sale_date = date(2024, 3, 2)
+            invoice.save()
+        self.assertEqual(self.closed(), [(PERIOD_CLOSE_START, date(2023, 12, 31))])
+        close_periods(date(2024, 3, 31))
+        self.assertSameAsLive()
+
+    def test_unit_price_edit_reopens_the_periods_of_its_sales(self):
+        # A sale in January drawn from the lot bought on March 20
+        lot = PurchaseItem.objects.get(invoice__purchase_date=date(2024, 3, 20))
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            self.sale(date(2024, 1, 28), APPROVED, (self.b, lot, 1, Decimal(20)))
+        close_periods(date(2024, 3, 31))
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            lot.unit_price_aed = Decimal(14)
+            lot.save()
+        self.assertEqual(self.closed(), [(PERIOD_CLOSE_START, date(2023, 12, 31))])
+        close_periods(date(2024, 3, 31))
+        self.assertSameAsLive()
+        # A January opening the cost of that sale left out would not match
+        self.assertSameAsLive('2024-02-01', '2024-03-31')
+
+    def test_unit_price_edit_reopens_the_periods_of_its_returns(self):
+        lot = PurchaseItem.objects.get(invoice__purchase_date=date(2024, 3, 20))
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            purchase_return = PurchaseReturnItem.objects.create(
+                purchase_invoice=lot.invoice, return_date=timezone.make_aware(datetime(2024, 3, 25)))
+            PurchaseReturnItemEntry.objects.create(purchase_return=purchase_return, purchase_item=lot, qty=1)
+        close_periods(date(2024, 3, 31))
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            lot.amount_aed = Decimal(40)
+            lot.save()
+        self.assertEqual(self.closed(), [(PERIOD_CLOSE_START, date(2023, 12, 31)),
+                                         (date(2024, 1, 1), date(2024, 1, 31)),
+                                         (date(2024, 2, 1), date(2024, 2, 29))])
+        close_periods(date(2024, 3, 31))
+        self.assertEqual(self.assertSameAsLive()['purchase']['purchase_return_aed'], 40.0)
+
+    def test_close_period_command(self):
+        out = StringIO()
+        call_command('close_period', '2024-03', stdout=out)
+        self.assertIn('Closed 4 periods', out.getvalue())
+        call_command('close_period', '2024-02', reopen=True, stdout=out)
+        self.assertIn('Reopened 2 periods', out.getvalue())
+        self.assertEqual(self.closed()[-1], (date(2024, 1, 1), date(2024, 1, 31)))
+        with self.assertRaisesMessage(CommandError, 'Month must be given as YYYY-MM'):
+            call_command('close_period', 'March')
+        with self.assertRaisesMessage(CommandError, 'Only months that have already ended can be closed'):
+            call_command('close_period', timezone.now().strftime('%Y-%m'))
+
+
+def replay_tax_summary(start_date=None, end_date=None):
+    """The tax summary as the view computed it before the helper, one aggregate or loop per figure."""
+    def dated(queryset, field):
+        if start_date:
+            queryset = queryset.filter(**{f'{field}__gte': start_date})
+        if end_date:
+            queryset = queryset.filter(**{f'{field}__lte': end_date})
+        return queryset
+
+    def total(queryset, field):
+        return queryset.aggregate(total=Sum(field))['total'] or Decimal('0')
+
+    sale_invoices = dated(SaleInvoice.objects.all(), 'sale_date')
+    purchase_invoices = dated(PurchaseInvoice.objects.all(), 'purchase_date')
+    sale_items = dated(SaleItem.objects.filter(invoice__status=APPROVED), 'invoice__sale_date')
+    purchase_items = dated(PurchaseItem.objects.filter(invoice__status=APPROVED), 'invoice__purchase_date')
+    costs = {currency: total(dated(Expense.objects.all(), 'date'), f'amount_{currency}')
+             + total(dated(SalaryEntry.objects.all(), 'date'), f'amount_{currency}') for currency in ('usd', 'aed')}
+    sales_base = {currency: sum(getattr(i, f'sale_price_{currency}') * i.qty + getattr(i, f'shipping_{currency}')
+                                for i in sale_items) for currency in ('usd', 'aed')}
+    purchase_base = {currency: sum((getattr(i, f'unit_price_{currency}') + getattr(i, f'shipping_per_unit_{currency}'))
+                                   * i.qty for i in purchase_items) for currency in ('usd', 'aed')}
+    return {
+        'sales': {'total_vat_usd': float(total(sale_invoices.filter(status=APPROVED), 'vat_amount_usd')),
+                  'total_vat_aed': float(total(sale_invoices, 'vat_amount_aed'))},
+        'purchase': {'total_vat_usd': float(total(purchase_invoices.filter(status=APPROVED), 'vat_amount_usd')),
+                     'total_vat_aed': float(total(purchase_invoices, 'vat_amount_aed'))},
+        'corporate_tax': {currency: float(sales_base[currency] - purchase_base[currency] - costs[currency])
+                          for currency in ('usd', 'aed')},
+    }
+
+
+class TaxSummaryTests(ReportTestCase):
+    RANGES = [(None, None), ('2024-01-01', '2024-03-31'), ('2024-02-01', None), (None, '2023-12-31')]
+
+    @classmethod
+    def build(cls):
+        super().build()
+        # VAT of a pending invoice: the AED total has always counted it, the USD one not
+        lot = PurchaseItem.objects.filter(item=cls.b).order_by('id').last()
+        cls.sale(date(2024, 2, 20), PENDING, (cls.b, lot, 1, Decimal(20)), has_tax=True)
+
+    def test_totals_match_the_old_view(self):
+        for start_date, end_date in self.RANGES:
+            with self.subTest(start_date=start_date, end_date=end_date):
+                self.assertEqual(get_tax_summary(start_date, end_date), replay_tax_summary(start_date, end_date))
+
+    @override_settings(REPORT_BACKEND='facts')
+    def test_totals_from_the_fact_tables(self):
+        for start_date, end_date in self.RANGES:
+            with self.subTest(start_date=start_date, end_date=end_date):
+                self.assertEqual(get_tax_summary(start_date, end_date), replay_tax_summary(start_date, end_date))
+
+    def test_vat_of_invoices_not_approved(self):
+        self.assertEqual(get_tax_summary('2024-02-01', '2024-02-29')['sales'],
+                         {'total_vat_usd': 0.0, 'total_vat_aed': 1.0})
+        self.assertEqual(get_tax_summary('2024-01-01', '2024-03-31')['sales'],
+                         {'total_vat_usd': 1.75, 'total_vat_aed': 2.5})
+
+    def assertPeriods(self, period, expected):
+        """expected maps each period label to its (start_date, end_date)."""
+        summary = get_tax_summary(period=period)
+        self.assertEqual(summary['period'], period)
+        self.assertEqual([(row['period'], row['start_date']) for row in summary['results']],
+                         [(label, start_date) for label, (start_date, _) in expected.items()])
+        for row in summary['results']:
+            start_date, end_date = expected[row.pop('period')]
+            row.pop('start_date')
+            self.assertEqual(row, replay_tax_summary(start_date, end_date), start_date)
+
+    def test_monthly(self):
+        self.assertPeriods('month', {
+            '2023-12': ('2023-12-01', '2023-12-31'), '2024-01': ('2024-01-01', '2024-01-31'),
+            '2024-02': ('2024-02-01', '2024-02-29'), '2024-03': ('2024-03-01', '2024-03-31'),
+            '2025-01': ('2025-01-01', '2025-01-31'),
+        })
+
+    def test_quarterly(self):
+        self.assertPeriods('quarter', {
+            '2023-Q4': ('2023-10-01', '2023-12-31'), '2024-Q1': ('2024-01-01', '2024-03-31'),
+            '2025-Q1': ('2025-01-01', '2025-03-31'),
+        })
+
+    @override_settings(REPORT_BACKEND='facts')
+    def test_quarterly_from_the_fact_tables(self):
+        self.test_quarterly()
+
+    def test_api(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create(username='accountant'))
+        response = client.get('/api/tax-summary/', {'start_date': '2024-01-01', 'end_date': '2024-03-31'})
+        self.assertEqual(response.json(), replay_tax_summary('2024-01-01', '2024-03-31'))
+        response = client.get('/api/tax-summary/', {'period': 'quarter'})
+        self.assertEqual(response.json(), get_tax_summary(period='quarter'))
+        response = client.get('/api/tax-summary/', {'period': 'week'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'period must be one of: month, quarter'})
+
+
+class StockHelperTests(ReportTestCase):
+    """The bulk stock helpers against the per item queries they replaced."""
+    DATES = [date(2023, 12, 1), date(2023, 12, 20), date(2024, 1, 15), date(2024, 2, 14), date(2024, 3, 20),
+             date(2024, 12, 31), date(2025, 6, 1)]
+
+    @classmethod
+    def build(cls):
+        super().build()
+        # A second lot of B on the same invoice as the March one, its price is the latest
+        cls.purchase_item(PurchaseInvoice.objects.get(purchase_date=date(2024, 3, 20)), cls.b, 1, Decimal(13))
+        cls.c = ProductItem.objects.create(product=cls.a.product, size='C')
+
+    def latest_price(self, item, as_of_date):
+        latest_purchase = PurchaseItem.objects.filter(
+            item=item, invoice__purchase_date__lte=as_of_date, invoice__status=APPROVED
+        ).order_by('-invoice__purchase_date', '-pk').first()
+        return latest_purchase.amount_aed if latest_purchase else Decimal('0')
+
+    def test_opening_and_closing_stock(self):
+        items = ProductItem.objects.order_by('pk')
+        for day in self.DATES:
+            for with_null_invoice in (False, True):
+                with self.subTest(day=day, with_null_invoice=with_null_invoice):
+                    self.assertEqual(get_opening_stock_many(None, day, with_null_invoice),
+                                     {item.pk: get_opening_stock(item, day, with_null_invoice) for item in items})
+                    self.assertEqual(get_closing_stock_many(None, day, with_null_invoice),
+                                     {item.pk: get_closing_stock(item, day, with_null_invoice) for item in items})
+
+    def test_items_given_in_any_form(self):
+        day = date(2024, 2, 14)
+        expected = {self.a.pk: get_closing_stock(self.a, day), self.c.pk: 0}
+        for items in (ProductItem.objects.filter(pk__in=[self.a.pk, self.c.pk]), [self.a, self.c],
+                      [self.a.pk, self.c.pk]):
+            with self.assertNumQueries(2 if isinstance(items, list) else 3):
+                self.assertEqual(get_closing_stock_many(items, day), expected)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_opening_stock_many([], day), {})
+            self.assertEqual(get_latest_purchase_price_many([], day), {})
+
+    def test_latest_purchase_price(self):
+        items = list(ProductItem.objects.order_by('pk'))
+        for day in self.DATES:
+            with self.subTest(day=day):
+                with self.assertNumQueries(1):
+                    prices = get_latest_purchase_price_many(items, day)
+                self.assertEqual(prices, {item.pk: self.latest_price(item, day) for item in items})
+        self.assertEqual(prices[self.b.pk], Decimal(13))
+
+    def test_closing_stock_valuation(self):
+        for day in self.DATES:
+            with self.subTest(day=day):
+                expected = {}
+                for item in ProductItem.objects.all():
+                    qty = get_closing_stock(item, day)
+                    if qty > 0:
+                        price = self.latest_price(item, day)
+                        expected[item.pk] = {'qty': qty, 'price': price, 'value': qty * price}
+                self.assertEqual(get_closing_stock_valuation(day), expected)
@@ -1,8 +1,10 @@
 from decimal import Decimal
-from django.db.models import Sum, Q
+from django.db.models import Sum, Q, F, OuterRef, Subquery
+from django.db.models.query import QuerySet
 from purchase.models import PurchaseInvoice, PurchaseItem
 from sale.models import SaleInvoice, SaleItem
 from customer.models import Party
+from products.models import ProductItem
 
 
 def get_opening_stock(item, start_date, with_null_invoice=False):
@@ -73,6 +75,226 @@ def get_closing_stock(item, end_date, with_null_invoice=False):
     return purchased - sold
 
 
+def _item_ids(items):
+    if items is None:
+        return list(ProductItem.objects.values_list('pk', flat=True))
+    if isinstance(items, QuerySet):
+        return list(items.values_list('pk', flat=True))
+    return [getattr(item, 'pk', item) for item in items]
+
+
+def _stock_many(items, purchase_filter, sale_filter, with_null_invoice):
+    """
+    Net purchased minus sold qty per item with one grouped query per table.
+    Mirrors the filters of get_opening_stock/get_closing_stock.
+    """
+    item_ids = _item_ids(items)
+    result = {item_id: 0 for item_id in item_ids}
+    if not item_ids:
+        return result
+
+    if with_null_invoice:
+        purchases = PurchaseItem.objects.filter(
+            (Q(invoice__status=PurchaseInvoice.STATUS_APPROVED) | Q(invoice__isnull=True)),
+            **purchase_filter
+        )
+        sales = SaleItem.objects.filter(
+            (Q(invoice__status=SaleInvoice.STATUS_APPROVED) | Q(invoice__isnull=True)),
+            **sale_filter
+        )
+    else:
+        purchases = PurchaseItem.objects.filter(
+            invoice__status=PurchaseInvoice.STATUS_APPROVED,
+            **purchase_filter
+        )
+        sales = SaleItem.objects.filter(
+            invoice__status=SaleInvoice.STATUS_APPROVED,
+            **sale_filter
+        )
+
+    for row in purchases.filter(item_id__in=item_ids).order_by().values('item_id').annotate(total=Sum('qty')):
+        result[row['item_id']] += row['total'] or 0
+    for row in sales.filter(item_id__in=item_ids).order_by().values('item_id').annotate(total=Sum('qty')):
+        result[row['item_id']] -= row['total'] or 0
+    return result
+
+
+def get_opening_stock_many(items, start_date, with_null_invoice=False):
+    """
+    Bulk version of get_opening_stock.
+
+    Args:
+        items: ProductItem queryset, list of ProductItems or ids; None for all items
+        start_date: Stock is calculated before this date
+        with_null_invoice: Include items without an invoice
+
+    Returns:
+        dict: {product_item_id: qty}
+    """
+    return _stock_many(
+        items,
+        {'invoice__purchase_date__lt': start_date},
+        {'invoice__sale_date__lt': start_date},
+        with_null_invoice,
+    )
+
+
+def get_closing_stock_many(items, end_date, with_null_invoice=False):
+    """
+    Bulk version of get_closing_stock.
+
+    Args:
+        items: ProductItem queryset, list of ProductItems or ids; None for all items
+        end_date: Stock is calculated up to and including this date
+        with_null_invoice: Include items without an invoice
+
+    Returns:
+        dict: {product_item_id: qty}
+    """
+    return _stock_many(
+        items,
+        {'invoice__purchase_date__lte': end_date},
+        {'invoice__sale_date__lte': end_date},
+        with_null_invoice,
+    )
+
+
+def get_latest_purchase_price_many(items, as_of_date):
+    """
+    Get the amount_aed of the latest approved purchase of each item as of a date.
+
+    Args:
+        items: ProductItem queryset, list of ProductItems or ids; None for all items
+        as_of_date: Only purchases up to this date are considered
+
+    Returns:
+        dict: {product_item_id: price}, Decimal('0') when never purchased
+    """
+    item_ids = _item_ids(items)
+    if not item_ids:
+        return {}
+    latest_price = PurchaseItem.objects.filter(
+        item=OuterRef('pk'),
+        invoice__purchase_date__lte=as_of_date,
+        invoice__status=PurchaseInvoice.STATUS_APPROVED
+    ).order_by('-invoice__purchase_date', '-pk').values('amount_aed')[:1]
+    return {
+        pk: price or Decimal('0')
+        for pk, price in ProductItem.objects.filter(pk__in=item_ids).annotate(
+            latest_price=Subquery(latest_price)
+        ).values_list('pk', 'latest_price')
+    }
+
+
+def get_closing_stock_valuation(as_of_date, items=None):
+    """
+    Value closing stock at the latest approved purchase price.
+
+    Args:
+        as_of_date: Date to value stock as of
+        items: ProductItem queryset, list of ProductItems or ids; None for all items
+
+    Returns:
+        dict: {product_item_id: {'qty': qty, 'price': price, 'value': qty * price}}
+        for items with positive closing stock
+    """
+    closing = get_closing_stock_many(items, as_of_date)
+    in_stock = [item_id for item_id, qty in closing.items() if qty > 0]
+    prices = get_latest_purchase_price_many(in_stock, as_of_date)
+    return {
+        item_id: {
+            'qty': closing[item_id],
+            'price': prices[item_id],
+            'value': closing[item_id] * prices[item_id],
+        }
+        for item_id in in_stock
+    }
+
+
+def get_stock_totals(as_of_date):
+    """
+    Get cumulative purchase and sale totals across all products as of a date.
+
+    Purchases count approved invoices up to the date plus orphan items
+    without an invoice; sales count approved invoices up to the date and
+    are valued at the cost of the purchase item they were sold from.
+
+    Args:
+        as_of_date: Date to calculate totals as of
+
+    Returns:
+        tuple: (purchased_qty, purchased_amount, sold_qty, sold_amount)
+    """
+    purchases = PurchaseItem.objects.filter(
+        Q(invoice__status=PurchaseInvoice.STATUS_APPROVED, invoice__purchase_date__lte=as_of_date) |
+        Q(invoice__isnull=True)
+    ).aggregate(total_qty=Sum('qty'), total_amount=Sum('total_price_aed'))
+
+    sales = SaleItem.objects.filter(
+        invoice__status=SaleInvoice.STATUS_APPROVED,
+        invoice__sale_date__lte=as_of_date
+    ).aggregate(total_qty=Sum('qty'), total_amount=Sum(F('qty') * F('purchase_item__unit_price_aed')))
+
+    return (purchases['total_qty'] or 0, purchases['total_amount'] or Decimal('0'),
+            sales['total_qty'] or 0, sales['total_amount'] or Decimal('0'))
+
+
+def get_stock_movements(start_date, end_date):
+    """
+    Get purchase and sale totals of approved invoices dated within a period.
+    Added to get_stock_totals of the day before start_date, gives the totals
+    as of end_date.
+
+    Args:
+        start_date: First day of the period
+        end_date: Last day of the period
+
+    Returns:
+        tuple: (purchased_qty, purchased_amount, sold_qty, sold_amount)
+    """
+    purchases = PurchaseItem.objects.filter(
+        invoice__status=PurchaseInvoice.STATUS_APPROVED,
+        invoice__purchase_date__gte=start_date,
+        invoice__purchase_date__lte=end_date
+    ).aggregate(total_qty=Sum('qty'), total_amount=Sum('total_price_aed'))
+
+    sales = SaleItem.objects.filter(
+        invoice__status=SaleInvoice.STATUS_APPROVED,
+        invoice__sale_date__gte=start_date,
+        invoice__sale_date__lte=end_date
+    ).aggregate(total_qty=Sum('qty'), total_amount=Sum(F('qty') * F('purchase_item__unit_price_aed')))
+
+    return (purchases['total_qty'] or 0, purchases['total_amount'] or Decimal('0'),
+            sales['total_qty'] or 0, sales['total_amount'] or Decimal('0'))
+
+
+def get_total_stock_qty_and_amount(as_of_date):
+    """
+    Get total stock quantity and amount across all products as of a date.
+
+    Args:
+        as_of_date: Date to calculate stock as of
+
+    Returns:
+        tuple: (closing_qty, closing_amount)
+    """
+    return stock_qty_and_amount(*get_stock_totals(as_of_date))
+
+
+def stock_qty_and_amount(purchased_qty, purchased_amount, sold_qty, sold_amount):
+    """
+    Derive closing stock from cumulative purchase and sale totals.
+
+    Returns:
+        tuple: (closing_qty, closing_amount); the amount is zero while
+        nothing has been purchased
+    """
+    closing_amount = Decimal('0')
+    if purchased_qty > 0:
+        closing_amount = purchased_amount - sold_amount
+    return purchased_qty - sold_qty, closing_amount
+
+
 def get_sundry_debtors(as_of_date, currency='aed'):
     """
     Get total amount owed by customers (debtors) as of a specific date.
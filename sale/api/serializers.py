@@ -1,11 +1,13 @@
 from rest_framework import serializers
 from django.db import transaction
-from products.api.serializers import ProductItemSerializer
 from customer.api.serializers import PartySerializer
 from common.api.serializers import (ServiceFeeSerializer,
     ServiceFeeNestedSerializer, CommissionSerializer)
 from banking.api.serializers import PaymentEntrySerializer
+from base.api.serializers import PrefetchedPrimaryKeyRelatedField, PrefetchingListSerializer
 from sale.models import *
+from sale.services import create_sale_items, update_sale_items
+from common.services import sync_extra_charges
 from purchase.models import PurchaseItem
 from banking.models import PaymentEntry, CashAccount
 from common.models import ServiceFee,Commission, ExtraCharges
@@ -24,8 +26,7 @@ class SaleItemSerializer(serializers.ModelSerializer):
     def get_item(self, obj):
         if obj.item:
             data = {'product_id': obj.item.id,
-                    'product_full_name': ProductItemSerializer().get_product_full_name(
-                        obj.item),
+                    'product_full_name': obj.item.full_name,
                     'product_unit': obj.item.unit}
             return data
         return None
@@ -34,7 +35,7 @@ class SaleItemSerializer(serializers.ModelSerializer):
         if obj.purchase_item:
             return {
                 'id': obj.purchase_item.id,
-                'item': ProductItemSerializer().get_product_full_name(obj.purchase_item.item),
+                'item': obj.purchase_item.item.full_name,
                 'qty': obj.purchase_item.qty,
                 'unit_price_usd': obj.purchase_item.unit_price_usd,
                 'unit_price_aed': obj.purchase_item.unit_price_aed
@@ -43,14 +44,14 @@ class SaleItemSerializer(serializers.ModelSerializer):
 
 class SaleItemNestedSerializer(serializers.Serializer):
     id = serializers.IntegerField(required=False)
-    item = serializers.PrimaryKeyRelatedField(queryset=ProductItem.objects.all())
+    item = PrefetchedPrimaryKeyRelatedField(queryset=ProductItem.objects.all())
     qty = serializers.IntegerField()
     sale_price_usd = serializers.DecimalField(max_digits=12, decimal_places=2)
     sale_price_aed = serializers.DecimalField(max_digits=12, decimal_places=2)
     shipping_usd = serializers.DecimalField(max_digits=12, decimal_places=2, required=False, default=0)
     shipping_aed = serializers.DecimalField(max_digits=12, decimal_places=2, required=False, default=0)
     # Unified field for both input (ID) and output (details)
-    purchase_item = serializers.PrimaryKeyRelatedField(
+    purchase_item = PrefetchedPrimaryKeyRelatedField(
         queryset=PurchaseItem.objects.all(), required=False, allow_null=True
     )
     delivery_status = serializers.ChoiceField(
@@ -62,8 +63,14 @@ class SaleItemNestedSerializer(serializers.Serializer):
     amount_aed = serializers.DecimalField(max_digits=12, decimal_places=2)
     vat_amount = serializers.DecimalField(max_digits=12, decimal_places=2)
 
+    class Meta:
+        list_serializer_class = PrefetchingListSerializer
+
 
 class ExtraChargesSerializer(serializers.ModelSerializer):
+    # Writable so updates can match the charges already stored
+    id = serializers.IntegerField(required=False)
+
     class Meta:
         model = ExtraCharges
         fields = ['id', 'amount', 'description', 'vat', 'created_at', 'modified_at', 'created_by']
@@ -158,20 +165,7 @@ class SaleInvoiceCreateSerializer(serializers.ModelSerializer):
         extra_charges_data = validated_data.pop('extra_charges', [])
 
         invoice = SaleInvoice.objects.create(**validated_data)
-        for item in items_data:
-            SaleItem.objects.create(
-                invoice=invoice,
-                item=item['item'],
-                qty=item['qty'],
-                sale_price_usd=item['sale_price_usd'],
-                sale_price_aed=item['sale_price_aed'],
-                shipping_usd=item.get('shipping_usd', 0),
-                shipping_aed=item.get('shipping_aed', 0),
-                purchase_item=item.get('purchase_item'),
-                amount_usd=item.get('amount_usd'),
-                amount_aed=item.get('amount_aed'),
-                vat_amount=item.get('vat_amount')
-            )
+        lines = create_sale_items(invoice, items_data)
 
         # create service_fee if applicable
         if has_service_fee and service_fee_data:
@@ -181,7 +175,7 @@ class SaleInvoiceCreateSerializer(serializers.ModelSerializer):
         if has_commission and commission_data:
             Commission.objects.create(sales_invoice=invoice, **commission_data)
 
-        invoice.calculate_totals()
+        invoice.calculate_totals(items=lines)
 
         # create payment entries
         for payment in payments_data:
@@ -249,43 +243,9 @@ class SaleInvoiceUpdateSerializer(serializers.ModelSerializer):
             instance.is_payment_started = is_payment_started  # <-- Update this field
             instance.save()
 
+            lines = None
             if items_data is not None:
-                existing_ids = [item.id for item in instance.sale_items.all()]
-                sent_ids = [item.get('id') for item in items_data if item.get('id')]
-
-                # Delete removed items
-                for id in existing_ids:
-                    if id not in sent_ids:
-                        SaleItem.objects.filter(id=id).delete()
-
-                for item_data in items_data:
-                    item_id = item_data.get('id', None)
-                    if item_id:
-                        item_instance = SaleItem.objects.get(id=item_id, invoice=instance)
-                        for attr, value in item_data.items():
-                            if attr == 'id':
-                                continue
-                            if attr == 'item':
-                                setattr(item_instance, 'item_id', value.id if hasattr(value, 'id') else value)
-                            elif attr == 'purchase_item':
-                                setattr(item_instance, 'purchase_item_id', value.id if hasattr(value, 'id') else value)
-                            else:
-                                setattr(item_instance, attr, value)
-                        item_instance.save()
-                    else:
-                        SaleItem.objects.create(
-                            invoice=instance,
-                            item=item_data['item'],
-                            qty=item_data['qty'],
-                            sale_price_usd=item_data['sale_price_usd'],
-                            sale_price_aed=item_data['sale_price_aed'],
-                            shipping_usd=item_data.get('shipping_usd', 0),
-                            shipping_aed=item_data.get('shipping_aed', 0),
-                            purchase_item=item_data.get('purchase_item'),
-                            amount_usd=item_data.get('amount_usd'),
-                            amount_aed=item_data.get('amount_aed'),
-                            vat_amount=item_data.get('vat_amount')
-                        )
+                lines = update_sale_items(instance, items_data)
             # Handle service fee
             if has_service_fee and service_fee_data:
                 service_fee_qs = ServiceFee.objects.filter(
@@ -315,22 +275,9 @@ class SaleInvoiceUpdateSerializer(serializers.ModelSerializer):
                 Commission.objects.filter(sales_invoice=instance).delete()
 
             if extra_charges_data is not None:
-                # Remove old, add new
-                ExtraCharges.objects.filter(
-                    content_type=ContentType.objects.get_for_model(SaleInvoice),
-                    object_id=instance.id
-                ).delete()
-                for charge in extra_charges_data:
-                    ExtraCharges.objects.create(
-                        content_type=ContentType.objects.get_for_model(SaleInvoice),
-                        object_id=instance.id,
-                        amount=charge.get('amount'),
-                        description=charge.get('description', ''),
-                        vat=charge.get('vat', 0),
-                        created_by=self.context['request'].user
-                    )
+                sync_extra_charges(instance, extra_charges_data, self.context['request'].user)
 
-            instance.calculate_totals()
+            instance.calculate_totals(items=lines)
         return instance
 
 
@@ -370,7 +317,7 @@ class SaleReturnItemSerializer(serializers.ModelSerializer):
         try:
             sale_invoice = instance.sale_invoice
             # Use the first/main cash account
-            cash_account = CashAccount.objects.first()
+            cash_account = CashAccount.get_main()
             if cash_account and sale_invoice:
                 # Withdraw the returned amount from the cash account
                 # You may want to use sale_invoice.total_with_vat_aed or similar
@@ -16,15 +16,30 @@ from inventory.models import Stock
 from django.utils import timezone
 from rest_framework.decorators import api_view
 from sale.utils import generate_perfoma_invoice_number
-from django.db.models import Sum
+from django.db.models import Sum, Prefetch
 
 
 class SaleInvoiceViewSet(viewsets.ModelViewSet):
     queryset = SaleInvoice.objects.all().order_by('-modified_at')
     permission_classes = [permissions.IsAuthenticated]
+    # ?cursor= pages keep their rows when invoices are edited meanwhile
+    cursor_ordering = '-created_at'
     filter_backends = [DjangoFilterBackend]
     filterset_class = SaleInvoiceFilter
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ['list', 'retrieve']:
+            # Everything SaleInvoiceSerializer nests, whatever the page or line count
+            queryset = queryset.select_related('party').prefetch_related(
+                Prefetch('sale_items', queryset=SaleItem.objects.select_related(
+                    'item', 'purchase_item__item')),
+                'service_fees',
+                'commissions',
+                'extra_charges',
+            )
+        return queryset
+
     def get_serializer_class(self):
         if self.action == 'create':
             return SaleInvoiceCreateSerializer
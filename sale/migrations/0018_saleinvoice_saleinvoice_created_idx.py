@@ -0,0 +1,17 @@
+# Generated by Django 4.2.23 on 2026-10-18 06:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sale', '0017_saleinvoice_payment_method'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='saleinvoice',
+            index=models.Index(fields=['created_at', 'id'], name='saleinvoice_created_idx'),
+        ),
+    ]
@@ -3,16 +3,21 @@ from django.db import transaction as db_transaction
 from django.utils import timezone
 from decimal import Decimal
 from django.contrib.auth.models import User
+from base.models import LoadedDateMixin
 from products.models import ProductItem
 from customer.models import Party
-from inventory.models import Stock
+from inventory.models import StockMovement, LoadedQtyMixin
+from inventory.services import apply_stock_delta, apply_sold_qty_delta, movement_time, redate_stock_movements
 from .utils import (generate_quotation_number, generate_perfoma_invoice_number,
                     generate_invoice_number)
 from django.contrib.contenttypes.fields import GenericRelation
 from common.models import ExtraCharges
+from common import tax_cache
+from core.models import DocumentSequence
 
 
-class SaleInvoice(models.Model):
+class SaleInvoice(LoadedDateMixin, models.Model):
+    loaded_date_field = 'sale_date'
     STATUS_SALES_TEAM_PENDING = 'sales_team_pending'
     STATUS_SALES_TEAM_APPROVED = 'sales_team_approved'
     STATUS_PRODUCTION_PENDING = 'production_pending'
@@ -68,16 +73,25 @@ class SaleInvoice(models.Model):
     sale_note = models.TextField(blank=True, null=True)
     payment_method = models.CharField(max_length=100, blank=True, null=True)
 
-    def calculate_totals(self):
-        from common.models import Tax
-        total_usd = sum(item.amount_usd for item in self.sale_items.all())
-        total_aed = sum(item.amount_aed for item in self.sale_items.all())
+    class Meta:
+        indexes = [
+            # Order of the ?cursor= pages of sale-invoices/
+            models.Index(fields=['created_at', 'id'], name='saleinvoice_created_idx'),
+        ]
+
+    def calculate_totals(self, items=None):
+        """Recompute and store the VAT and totals; items are the lines when already in memory."""
+        if items is None:
+            items = list(self.sale_items.all())
+        total_usd = sum(item.amount_usd for item in items)
+        total_aed = sum(item.amount_aed for item in items)
 
         # Sum service fee amounts if any
+        service_fees = list(self.service_fees.all())
         service_fee_usd = sum(
-            fee.amount_usd for fee in self.service_fees.all())
+            fee.amount_usd for fee in service_fees)
         service_fee_aed = sum(
-            fee.amount_aed for fee in self.service_fees.all())
+            fee.amount_aed for fee in service_fees)
 
         # Total before discount includes service fees
         total_usd += service_fee_usd
@@ -89,7 +103,7 @@ class SaleInvoice(models.Model):
         discounted_aed = max(total_aed - (self.discount_aed or Decimal('0')),
                              Decimal('0'))
 
-        tax = Tax.objects.filter(active=True).first()
+        tax = tax_cache.get_active_tax()
         vat_usd = discounted_usd * (tax.vat_percent / 100) if tax and self.has_tax else Decimal('0')
         vat_aed = discounted_aed * (tax.vat_percent / 100) if tax and self.has_tax else Decimal('0')
 
@@ -101,32 +115,38 @@ class SaleInvoice(models.Model):
         SaleInvoice.objects.filter(pk=self.pk).update(vat_amount_usd=vat_usd,
             total_with_vat_usd=self.total_with_vat_usd, vat_amount_aed=vat_aed,
             total_with_vat_aed=self.total_with_vat_aed)
+        # update() sends no post_save, the sales facts carry these totals
+        from report.signals import mark_facts_dirty
+        mark_facts_dirty('sales', [self.sale_date])
 
 
 
+    @db_transaction.atomic
     def save(self, *args, **kwargs):
+        previous_date = self.get_previous_date()
         super().save(*args, **kwargs)
         generate_invoice_number(self)
         generate_quotation_number(self)
+        # The stock movements of the lines carry the invoice date
+        if previous_date is not None and movement_time(previous_date) != movement_time(self.sale_date):
+            redate_stock_movements(StockMovement.TYPE_SALE, self.sale_items.values('pk'), self.sale_date)
 
 
     def __str__(self):
         return f"Invoice {self.invoice_no}"
 
+    @db_transaction.atomic
     def delete(self, *args, **kwargs):
+        moved_at = movement_time(self.sale_date)
         # Restock inventory for each sale item before deleting
         for sale_item in self.sale_items.all():
-            stock = Stock.objects.filter(product_item=sale_item.item).first()
-            if stock:
-                stock.quantity += sale_item.qty
-                stock.save()
-            if sale_item.purchase_item:
-                sale_item.purchase_item.sold_qty -= sale_item.qty
-                sale_item.purchase_item.save()
+            apply_stock_delta(sale_item.item_id, sale_item.qty, StockMovement.TYPE_SALE, sale_item.pk, create=False,
+                              moved_at=moved_at)
+            apply_sold_qty_delta(sale_item.purchase_item_id, -sale_item.qty)
         self.sale_items.all().delete()
         super().delete(*args, **kwargs)
 
-class SaleItem(models.Model):
+class SaleItem(LoadedQtyMixin, models.Model):
     DELIVERY_STATUS_DELIVERED = 'delivered'
     DELIVERY_STATUS_NOT_DELIVERED = 'not_delivered'
     DELIVERY_STATUS_CHOICES = [
@@ -179,56 +199,49 @@ class SaleItem(models.Model):
         default=DELIVERY_STATUS_NOT_DELIVERED
     )
 
-    def calculate_totals(self):
+    @staticmethod
+    def get_vat_percent(invoice):
+        tax = tax_cache.get_active_tax()
+        return tax.vat_percent if tax and invoice.has_tax else Decimal('0')
+
+    def calculate_totals(self, vat_percent=None):
         # Calculate total prices
         self.total_price_usd = (self.sale_price_usd or Decimal('0')) * self.qty
         self.total_price_aed = (self.sale_price_aed or Decimal('0')) * self.qty
 
-        from common.models import Tax
-        tax = Tax.objects.filter(active=True).first()
-        vat_percent = tax.vat_percent if tax and self.invoice.has_tax else Decimal('0')
+        if vat_percent is None:
+            vat_percent = self.get_vat_percent(self.invoice)
 
         self.vat_per_unit_usd = (self.sale_price_usd or Decimal('0')) * (vat_percent / 100)
         self.vat_per_unit_aed = (self.sale_price_aed or Decimal('0')) * (vat_percent / 100)
         self.vat_total_usd = self.vat_per_unit_usd * self.qty
         self.vat_total_aed = self.vat_per_unit_aed * self.qty
 
+    def moved_at(self):
+        """Date of the stock movements of this line: its invoice's."""
+        return movement_time(self.invoice.sale_date)
+
+    @db_transaction.atomic
     def save(self, *args, **kwargs):
         self.calculate_totals()
-        is_new = self.pk is None
-        previous_qty = 0
-        if not is_new:
-            previous = SaleItem.objects.get(pk=self.pk)
-            previous_qty = previous.qty
+        qty_difference = self.qty - self.get_previous_qty()
 
         super().save(*args, **kwargs)
+        self._loaded_qty = self.qty
 
-        stock, _ = Stock.objects.get_or_create(product_item=self.item)
-        if is_new:
-            stock.quantity -= self.qty
-        else:
-            stock.quantity -= (self.qty - previous_qty)
-        stock.save()
+        apply_stock_delta(self.item_id, -qty_difference, StockMovement.TYPE_SALE, self.pk,
+                          moved_at=self.moved_at() if qty_difference else None)
 
         # Update sold_qty in related PurchaseItem
-        if self.purchase_item:
-            if is_new:
-                self.purchase_item.sold_qty += self.qty
-            else:
-                qty_difference = self.qty - previous_qty
-                self.purchase_item.sold_qty += qty_difference
-            self.purchase_item.save()
+        apply_sold_qty_delta(self.purchase_item_id, qty_difference)
 
+    @db_transaction.atomic
     def delete(self, *args, **kwargs):
-        stock = Stock.objects.filter(product_item=self.item).first()
-        if stock:
-            stock.quantity += self.qty
-            stock.save()
+        apply_stock_delta(self.item_id, self.qty, StockMovement.TYPE_SALE, self.pk, create=False,
+                          moved_at=self.moved_at())
 
         # Decrease sold_qty in related PurchaseItem
-        if self.purchase_item:
-            self.purchase_item.sold_qty -= self.qty
-            self.purchase_item.save()
+        apply_sold_qty_delta(self.purchase_item_id, -self.qty)
 
         super().delete(*args, **kwargs)
 
@@ -245,7 +258,8 @@ class SaleItem(models.Model):
 
 # Remove old SaleReturnItem model and add new models for multi-item returns
 
-class SaleReturnItem(models.Model):
+class SaleReturnItem(LoadedDateMixin, models.Model):
+    loaded_date_field = 'return_date'
     sale_invoice = models.ForeignKey('SaleInvoice', on_delete=models.CASCADE, related_name='return_items')
     returned_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='+')
     return_date = models.DateTimeField(default=timezone.now)
@@ -255,64 +269,48 @@ class SaleReturnItem(models.Model):
 
     def save(self, *args, **kwargs):
         is_new = self.pk is None
+        previous_date = self.get_previous_date()
         super().save(*args, **kwargs)
-        # Stock update handled in entry save
+        # Stock update handled in entry save, its movements carry the return date
+        if previous_date is not None and movement_time(previous_date) != movement_time(self.return_date):
+            redate_stock_movements(StockMovement.TYPE_SALE_RETURN, self.entries.values('pk'), self.return_date)
 
+    @db_transaction.atomic
     def delete(self, *args, **kwargs):
-        from inventory.models import Stock
-        for entry in self.entries.all():
-            stock = Stock.objects.filter(product_item=entry.sale_item.item).first()
-            if stock:
-                stock.quantity -= entry.qty
-                stock.save()
+        moved_at = movement_time(self.return_date)
+        for entry in self.entries.select_related('sale_item'):
+            apply_stock_delta(entry.sale_item.item_id, -entry.qty, StockMovement.TYPE_SALE_RETURN,
+                              entry.pk, create=False, moved_at=moved_at)
             # Increase sold_qty in related PurchaseItem when return record is deleted
-            if entry.sale_item.purchase_item:
-                entry.sale_item.purchase_item.sold_qty += entry.qty
-                entry.sale_item.purchase_item.save()
+            apply_sold_qty_delta(entry.sale_item.purchase_item_id, entry.qty)
         self.entries.all().delete()
         super().delete(*args, **kwargs)
 
     def __str__(self):
         return f"Return for Invoice {self.sale_invoice.id} ({self.entries.count()} items)"
 
-class SaleReturnItemEntry(models.Model):
+class SaleReturnItemEntry(LoadedQtyMixin, models.Model):
     sale_return = models.ForeignKey(SaleReturnItem, on_delete=models.CASCADE, related_name='entries')
     sale_item = models.ForeignKey('SaleItem', on_delete=models.CASCADE)
     qty = models.PositiveIntegerField()
     remarks = models.TextField(blank=True, null=True)
 
+    @db_transaction.atomic
     def save(self, *args, **kwargs):
-        is_new = self.pk is None
-        previous_qty = 0
-        if not is_new:
-            previous = SaleReturnItemEntry.objects.get(pk=self.pk)
-            previous_qty = previous.qty
+        qty_difference = self.qty - self.get_previous_qty()
         super().save(*args, **kwargs)
-        from inventory.models import Stock
-        stock, _ = Stock.objects.get_or_create(product_item=self.sale_item.item)
-        if is_new:
-            stock.quantity += self.qty
-        else:
-            stock.quantity += (self.qty - previous_qty)
-        stock.save()
+        self._loaded_qty = self.qty
+        apply_stock_delta(self.sale_item.item_id, qty_difference, StockMovement.TYPE_SALE_RETURN, self.pk,
+                          moved_at=movement_time(self.sale_return.return_date) if qty_difference else None)
         # Decrease sold_qty in related PurchaseItem when items are returned
-        if self.sale_item.purchase_item:
-            if is_new:
-                self.sale_item.purchase_item.sold_qty -= self.qty
-            else:
-                self.sale_item.purchase_item.sold_qty -= (self.qty - previous_qty)
-            self.sale_item.purchase_item.save()
+        apply_sold_qty_delta(self.sale_item.purchase_item_id, -qty_difference)
 
+    @db_transaction.atomic
     def delete(self, *args, **kwargs):
-        from inventory.models import Stock
-        stock = Stock.objects.filter(product_item=self.sale_item.item).first()
-        if stock:
-            stock.quantity -= self.qty
-            stock.save()
+        apply_stock_delta(self.sale_item.item_id, -self.qty, StockMovement.TYPE_SALE_RETURN, self.pk, create=False,
+                          moved_at=movement_time(self.sale_return.return_date))
         # Increase sold_qty in related PurchaseItem when return record is deleted
-        if self.sale_item.purchase_item:
-            self.sale_item.purchase_item.sold_qty += self.qty
-            self.sale_item.purchase_item.save()
+        apply_sold_qty_delta(self.sale_item.purchase_item_id, self.qty)
         super().delete(*args, **kwargs)
 
     def __str__(self):
@@ -328,27 +326,9 @@ class DeliveryNote(models.Model):
     def __str__(self):
         return f"Delivery Note for Invoice {self.sale_invoice.invoice_no}"
 
+    @db_transaction.atomic
     def save(self, *args, **kwargs):
         if not self.DO_id:
-            prefix = 'DO-'
-            # Get the last DO_id to determine the next number
-            last_delivery = DeliveryNote.objects.filter(
-                DO_id__startswith=prefix
-            ).order_by('-DO_id').first()
-
-            if last_delivery and last_delivery.DO_id:
-                try:
-                    # Extract number from last DO_id (e.g., "DO15" -> 15)
-                    last_number = int(last_delivery.DO_id[len(prefix):])  # Remove
-                    # "DO" prefix
-                    next_number = last_number + 1
-                except (ValueError, IndexError):
-                    # If parsing fails, start from 1
-                    next_number = 200
-            else:
-                # No previous delivery notes, start from 1
-                next_number = 200
-
-            self.DO_id = f'{prefix}{next_number}'
+            self.DO_id = DocumentSequence.next_number(DocumentSequence.DELIVERY_NOTE)
 
         super().save(*args, **kwargs)
@@ -0,0 +1,108 @@
+from django.db import transaction
+from base.signals import post_bulk_save
+from base.utils import sync_rows
+from inventory.models import StockMovement
+from inventory.services import movement_time, apply_stock_deltas, apply_sold_qty_deltas
+from sale.models import SaleItem
+
+
+def _build_sale_item(invoice, item, vat_percent):
+    line = SaleItem(
+        invoice=invoice,
+        item=item['item'],
+        qty=item['qty'],
+        sale_price_usd=item['sale_price_usd'],
+        sale_price_aed=item['sale_price_aed'],
+        shipping_usd=item.get('shipping_usd', 0),
+        shipping_aed=item.get('shipping_aed', 0),
+        purchase_item=item.get('purchase_item'),
+        amount_usd=item.get('amount_usd'),
+        amount_aed=item.get('amount_aed'),
+        vat_amount=item.get('vat_amount')
+    )
+    line.calculate_totals(vat_percent)
+    return line
+
+
+@transaction.atomic
+def create_sale_items(invoice, items_data):
+    """
+    Create the lines of a sale invoice in bulk. Line totals are computed in
+    memory, the lines inserted with one bulk_create and stock and sold_qty
+    moved once per product and purchase batch, so the query count does not
+    grow with the number of lines.
+
+    Args:
+        invoice: the saved SaleInvoice
+        items_data: validated SaleItemNestedSerializer data
+
+    Returns:
+        list: the created SaleItems
+    """
+    vat_percent = SaleItem.get_vat_percent(invoice)
+    lines = [_build_sale_item(invoice, item, vat_percent) for item in items_data]
+    SaleItem.objects.bulk_create(lines)
+    for line in lines:
+        line._loaded_qty = line.qty
+
+    apply_stock_deltas([(line.item_id, -line.qty, line.pk) for line in lines], StockMovement.TYPE_SALE,
+                       moved_at=movement_time(invoice.sale_date))
+    apply_sold_qty_deltas((line.purchase_item_id, line.qty) for line in lines)
+    post_bulk_save.send(sender=SaleItem, instances=lines, created=True)
+    return lines
+
+
+@transaction.atomic
+def update_sale_items(invoice, items_data):
+    """
+    Bring the lines of a sale invoice in line with the sent ones. Unchanged
+    lines are not written; new, changed and removed lines go in with one
+    bulk_create, one bulk_update and one delete, and stock and sold_qty move
+    by the net change of each product and purchase batch.
+
+    Args:
+        invoice: the saved SaleInvoice
+        items_data: validated SaleItemNestedSerializer data, existing lines
+            carrying their 'id'
+
+    Returns:
+        list: every SaleItem of the invoice after the update
+    """
+    vat_percent = SaleItem.get_vat_percent(invoice)
+    changes = sync_rows(
+        SaleItem,
+        {line.pk: line for line in invoice.sale_items.all()},
+        items_data,
+        build=lambda item: _build_sale_item(invoice, item, vat_percent),
+        prepare=lambda line: line.calculate_totals(vat_percent),
+        attnames={'item': 'item_id', 'purchase_item': 'purchase_item_id'},
+    )
+
+    moved_at = movement_time(invoice.sale_date)
+    stock = {}
+    sold = []
+
+    def move(product_item_id, qty, source_id):
+        key = (product_item_id, source_id)
+        stock[key] = stock.get(key, 0) + qty
+
+    for line in changes.created:
+        move(line.item_id, -line.qty, line.pk)
+        sold.append((line.purchase_item_id, line.qty))
+    for line, before in changes.updated:
+        # Put back what the line took before and take what it takes now
+        move(before['item_id'], before['qty'], line.pk)
+        move(line.item_id, -line.qty, line.pk)
+        sold += [(before['purchase_item_id'], -before['qty']), (line.purchase_item_id, line.qty)]
+    for line in changes.removed:
+        sold.append((line.purchase_item_id, -line.qty))
+    for line in changes.rows:
+        line._loaded_qty = line.qty
+
+    apply_stock_deltas([(pid, qty, source_id) for (pid, source_id), qty in stock.items()],
+                       StockMovement.TYPE_SALE, moved_at=moved_at)
+    # Removed lines only restock products that still have a stock row, as SaleItem.delete
+    apply_stock_deltas([(line.item_id, line.qty, line.pk) for line in changes.removed],
+                       StockMovement.TYPE_SALE, create=False, moved_at=moved_at)
+    apply_sold_qty_deltas(sold)
+    return changes.rows
@@ -1,3 +1,129 @@
-from django.test import TestCase
+from decimal import Decimal
+from itertools import cycle, islice
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.db.models import Sum
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from common.models import Tax
+from customer.models import Party
+from products.models import Product, ProductType, ProductItem
+from purchase.models import PurchaseInvoice, PurchaseItem
+from report.models import SalesFact
+from sale.models import SaleInvoice, SaleItem
 
-# Create your tests here.
+
+# Taxes are otherwise reloaded every CHECK_INTERVAL, a query depending on the clock
+@override_settings(SHARED_CACHE=True)
+class SaleInvoiceQueryTests(TestCase):
+    """Saving a sale invoice costs the same number of queries for 1 line and for N."""
+
+    @classmethod
+    def setUpTestData(cls):
+        Tax.objects.create(vat_percent=Decimal('5'))
+        cls.user = User.objects.create(username='seller')
+        cls.customer = Party.objects.create(name='Customer', type='customer')
+        supplier = Party.objects.create(name='Supplier', type='supplier')
+        product = Product.objects.create(name='Pipe')
+        product_type = ProductType.objects.create(product=product, type_name='Seamless')
+        purchase = PurchaseInvoice.objects.create(invoice_no='P-1', party=supplier, purchase_date='2024-05-01',
+                                                  status='approved')
+        cls.lots = []
+        for size in range(5):
+            item = ProductItem.objects.create(product=product, product_type=product_type, size=str(size))
+            cls.lots.append(PurchaseItem.objects.create(
+                invoice=purchase, item=item, qty=100, unit_price_usd=Decimal('2'), unit_price_aed=Decimal('7.34'),
+                amount_usd=Decimal('200'), amount_aed=Decimal('734'), vat_amount=Decimal('36.7')))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def lines(self, count, qty=1):
+        return [dict(item=lot.item_id, purchase_item=lot.pk, qty=qty, sale_price_usd='3', sale_price_aed='11.01',
+                     amount_usd='3', amount_aed='11.01', vat_amount='0.55')
+                for lot in islice(cycle(self.lots), count)]
+
+    def send(self, method, url, data):
+        # The work deferred to the commit is counted too
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            response = getattr(self.client, method)(url, data, format='json')
+        self.assertLess(response.status_code, 300, response.content)
+        return response
+
+    def create(self, count):
+        return self.send('post', '/api/sale-invoices/', {
+            'party_id': self.customer.pk, 'sale_date': '2024-05-06', 'status': 'approved',
+            'items': self.lines(count)})
+
+    def update(self, count):
+        self.create(count)
+        invoice = SaleInvoice.objects.latest('pk')
+        lines = [dict(line, id=row.pk) for line, row in
+                 zip(self.lines(count, qty=2), invoice.sale_items.order_by('pk'))]
+        with CaptureQueriesContext(connection) as queries:
+            self.send('put', f'/api/sale-invoices/{invoice.pk}/', {
+                'party_id': self.customer.pk, 'sale_date': '2024-05-07', 'status': 'approved', 'items': lines})
+        return len(queries)
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_list_queries_do_not_grow_with_invoices(self):
+        self.create(2)
+        self.get('/api/sale-invoices/')
+        with CaptureQueriesContext(connection) as queries:
+            self.get('/api/sale-invoices/')
+        # The log of the queries is cleared by the next request
+        count = len(queries)
+        for _ in range(19):
+            self.create(2)
+        # A page holds 10 invoices, each with its lines, party and extra charges
+        with self.assertNumQueries(count):
+            page = self.get('/api/sale-invoices/')
+        self.assertEqual(page['total'], 20)
+        self.assertEqual([len(invoice['sale_items']) for invoice in page['data']], [2] * 10)
+
+    def test_retrieve_queries_do_not_grow_with_lines(self):
+        self.create(1)
+        one = SaleInvoice.objects.latest('pk')
+        self.create(50)
+        fifty = SaleInvoice.objects.latest('pk')
+        self.get(f'/api/sale-invoices/{one.pk}/')
+        with CaptureQueriesContext(connection) as queries:
+            self.get(f'/api/sale-invoices/{one.pk}/')
+        with self.assertNumQueries(len(queries)):
+            invoice = self.get(f'/api/sale-invoices/{fifty.pk}/')
+        self.assertEqual(len(invoice['sale_items']), 50)
+
+    def test_create_queries_do_not_grow_with_lines(self):
+        # The first save creates the stock rows of the items
+        self.create(5)
+        with CaptureQueriesContext(connection) as queries:
+            self.create(1)
+        with self.assertNumQueries(len(queries)):
+            self.create(5)
+        self.assertEqual(SaleItem.objects.count(), 11)
+        self.assertEqual(PurchaseItem.objects.get(pk=self.lots[0].pk).sold_qty, 3)
+
+    def test_update_queries_do_not_grow_with_lines(self):
+        self.update(5)
+        self.assertEqual(self.update(1), self.update(5))
+        self.assertEqual(PurchaseItem.objects.get(pk=self.lots[4].pk).sold_qty, 4)
+
+    def test_recalculated_totals_reach_the_facts(self):
+        self.create(2)
+        invoice = SaleInvoice.objects.latest('pk')
+        # A discount stored without signals, picked up by the next recalculation
+        SaleInvoice.objects.filter(pk=invoice.pk).update(discount_aed=Decimal('5'))
+        invoice.refresh_from_db()
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            invoice.calculate_totals()
+        invoice.refresh_from_db()
+
+        facts = SalesFact.objects.filter(date=invoice.sale_date).aggregate(
+            total=Sum('total_with_vat_aed'), discount=Sum('discount_aed'))
+        self.assertEqual(facts, {'total': invoice.total_with_vat_aed, 'discount': Decimal('5')})
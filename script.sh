@@ -9,8 +9,15 @@ cd /home/backend/erp
 echo "⚠️Navigating to project directory..."
 git pull origin master
 
-echo "🛠 Running script..."
-python python3 scripts.py
+echo "🛠 Checking cash balances against the ledger..."
+# Records the opening balance of new accounts, never overwrites a balance
+if ! python manage.py rebuild_cash_balances --record-opening --check; then
+    echo "❌ Cash balances differ from the ledger, see above"
+    exit 1
+fi
+
+echo "🔎 Rebuilding search index..."
+python manage.py rebuild_search_index
 
 echo "✅ script run complete!"
 
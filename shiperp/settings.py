@@ -109,6 +109,22 @@ DATABASES = {
         'PASSWORD': os.getenv('DB_PASSWORD', ''),
         'HOST': os.getenv('DB_HOST', ''), 'PORT': os.getenv('DB_PORT', ''), }}
 
+# Cache, also used for report results. Use a backend shared by all workers
+# (file, memcached, redis) when running more than one process.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+# Writes invalidate cached reports through versions kept in the cache, which
+# a per-process cache does not share with the other workers: report results
+# are only cached with a shared backend
+SHARED_CACHE = CACHES['default']['BACKEND'].rsplit('.', 2)[-2] not in ('locmem', 'dummy')
+REPORT_CACHE_TIMEOUT = int(os.getenv('REPORT_CACHE_TIMEOUT', 3600 if SHARED_CACHE else 0))
+# 'live' reads the transaction tables, 'facts' the daily report fact tables
+REPORT_BACKEND = os.getenv('REPORT_BACKEND', 'live')
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
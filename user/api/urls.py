@@ -44,5 +44,6 @@ urlpatterns = [
     # path('reminders/', RemindersAPIView.as_view(), name='reminders'),
     path('cash-account/', CashAccountAPIView.as_view(), name='cash-account'),
     path('check-approve/', CheckApproveAPIView.as_view(), name='check-approve'),
+    path('check-approve/bulk/', CheckApproveBulkAPIView.as_view(), name='check-approve-bulk'),
     path('reminders/', RemindersAPIView.as_view(), name='reminders'),
 ]